@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# 4-4-2 因子的面板化计算引擎
+#
+# 输入为 日期×股票 的收盘价矩阵，对一个或多个截面日期 (at_date) 一次性算出
+# 六个原始因子、MAD 去极值、稳健标准化与综合得分，供 factor_selection.select
+# 以及 reg_selfbuild / reg_backtrade 的批量调仓使用。
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+__all__ = ['FactorEngine']
+
+
+class FactorEngine:
+    """
+    面板化因子引擎。
+
+    技术面因子的口径与原逐只计算完全一致：每只股票取截至 at_date 的最近 (mdays + sdays)
+    根 K 线、去掉缺失值后至少要有 mdays 根，然后
+        R_Mom_Short = 现价 / 倒数第 sdays 根 - 1
+        R_Mom_Mid   = 现价 / 倒数第 mdays 根 - 1
+        R_Vol       = 最近 sdays 个日收益率的总体标准差
+        R_Bias      = |现价 - sdays 均线| / sdays 均线
+    "去掉缺失值"通过对每个窗口做一次稳定排序、把有效值压到窗口末尾来实现，
+    所以停牌导致的空缺不会破坏向量化。窗口张量 (日期 × 股票 × 窗口长度) 按 MAX_CELLS 分块构造，
+    只取被查询的 at_date，整段回测的内存占用与日期数无关。
+
+    基本面因子来自财务时点仓库 (FinancialStore)，按 at_date 做 as-of 查询：
+        R_PE  = 现价 / EPS（EPS 缺失或 <= 0 记 999）
+        R_ROE = equity_roe，缺失时用 EPS / BPS × 100，仍缺失记 -99
+    """
+
+    FACTORS = ('R_PE', 'R_ROE', 'R_Mom_Short', 'R_Mom_Mid', 'R_Vol', 'R_Bias')
+    FIN_TABLE = 'PershareIndex'
+    FIN_FIELDS = ['s_fa_eps_basic', 'equity_roe', 's_fa_bps']
+    MAX_CELLS = 4_000_000       # 单块窗口张量的元素上限（float64 约 32 MB，排序索引同量级）
+
+    def __init__(self, close: pd.DataFrame, fin_store=None, sdays: int = 20, mdays: int = 60):
+        self.close = close.sort_index()
+        self.codes = list(self.close.columns)
+        self.fin_store = fin_store
+        self.sdays = sdays
+        self.mdays = mdays
+
+    # ------------------------------------------------------------------ #
+    #  原始因子
+    # ------------------------------------------------------------------ #
+    def _rows(self, at_dates) -> np.ndarray:
+        """每个 at_date 对应的收盘价矩阵行号（取 <= at_date 的最后一行，之前没有数据为 -1）"""
+        idx = pd.DatetimeIndex(pd.to_datetime([str(d) for d in at_dates]))
+        dates = pd.DatetimeIndex(pd.to_datetime(self.close.index.astype(str)))
+        return dates.searchsorted(idx, side='right') - 1
+
+    def technical(self, at_dates) -> dict:
+        """返回 {因子: (D, C) 数组} 以及 'price'（现价）、'valid'（数据是否足够）"""
+        n = self.mdays + self.sdays
+        values = self.close.to_numpy(dtype=float)
+        T, C = values.shape
+        rows = self._rows(at_dates)
+
+        # 前面补 n-1 行 NaN，让每个 at_date 都能取到完整长度的窗口；窗口视图不占内存，按块取出再计算
+        windows = None
+        if T:
+            padded = np.vstack([np.full((n - 1, C), np.nan), values])
+            windows = sliding_window_view(padded, n, axis=0)       # (T, C, n)，第 t 个窗口截至第 t 行
+        step = max(1, self.MAX_CELLS // max(C * n, 1))
+        parts = [self._technical_chunk(windows, rows[i:i + step], C, n) for i in range(0, len(rows), step)]
+        if not parts:
+            parts = [self._technical_chunk(None, rows, C, n)]
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def _technical_chunk(self, windows, rows: np.ndarray, C: int, n: int) -> dict:
+        """一块 at_date 的技术面因子，rows 为对应的收盘价矩阵行号"""
+        sdays, mdays = self.sdays, self.mdays
+        if windows is not None:
+            win = np.where((rows >= 0)[:, None, None], windows[np.maximum(rows, 0)], np.nan)
+        else:
+            win = np.full((len(rows), C, n), np.nan)
+
+        # 稳定排序：缺失值在前，有效值保持原顺序压到末尾，等价于逐只 dropna()
+        valid = ~np.isnan(win)
+        order = np.argsort(valid, axis=2, kind='stable')
+        packed = np.take_along_axis(win, order, axis=2)
+        count = valid.sum(axis=2)
+
+        cur = packed[..., -1]
+        ok = (count >= mdays) & (cur > 0)
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)      # 整个窗口缺失时 nanstd 的提示
+            mom_short = cur / packed[..., -sdays] - 1
+            mom_mid = cur / packed[..., -mdays] - 1
+            rets = packed[..., 1:] / packed[..., :-1] - 1
+            vol = np.nanstd(rets[..., -sdays:], axis=2)
+            ma = packed[..., -sdays:].mean(axis=2)
+            bias = np.abs((cur - ma) / ma)
+
+        out = {'R_Mom_Short': mom_short, 'R_Mom_Mid': mom_mid, 'R_Vol': vol, 'R_Bias': bias}
+        out = {k: np.where(ok, v, np.nan) for k, v in out.items()}
+        out['price'] = np.where(ok, cur, np.nan)
+        out['valid'] = ok
+        return out
+
+    def fundamental(self, at_dates, price: np.ndarray) -> dict:
+        """按每个 at_date 做时点查询，返回 {'R_PE', 'R_ROE'}: (D, C) 数组"""
+        D, C = price.shape
+        if self.fin_store is None:
+            return {'R_PE': np.full((D, C), 999.0), 'R_ROE': np.full((D, C), -99.0)}
+        eps = self.fin_store.panel(self.codes, self.FIN_TABLE, 's_fa_eps_basic', at_dates).to_numpy()
+        roe = self.fin_store.panel(self.codes, self.FIN_TABLE, 'equity_roe', at_dates).to_numpy()
+        bps = self.fin_store.panel(self.codes, self.FIN_TABLE, 's_fa_bps', at_dates).to_numpy()
+
+        eps = np.nan_to_num(eps, nan=0.0)
+        with np.errstate(all='ignore'):
+            pe = np.where(eps > 0, price / eps, 999.0)
+            roe_alt = np.where(bps > 0, eps / bps * 100, -99.0)
+        roe = np.where(~np.isnan(roe) & (roe != -99), roe, roe_alt)
+        return {'R_PE': pe, 'R_ROE': roe}
+
+    def raw(self, at_dates) -> dict:
+        """六个原始因子：{因子: DataFrame(index=at_dates, columns=codes)}，数据不足的格子为 NaN"""
+        at_dates = [str(d) for d in at_dates]
+        tech = self.technical(at_dates)
+        fund = self.fundamental(at_dates, tech['price'])
+        ok = tech['valid']
+        arrays = dict(tech)
+        arrays.update({k: np.where(ok, v, np.nan) for k, v in fund.items()})
+        return {f: pd.DataFrame(arrays[f], index=at_dates, columns=self.codes) for f in self.FACTORS}
+
+    # ------------------------------------------------------------------ #
+    #  截面处理（沿最后一维 = 股票）
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def winsorize_mad(a: np.ndarray, n: float = 3, axis: int = -1) -> np.ndarray:
+        """MAD 去极值：超过 中位数 ± n × 1.4826 × MAD 的值拉回边界"""
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            med = np.nanmedian(a, axis=axis, keepdims=True)
+            mad = np.nanmedian(np.abs(a - med), axis=axis, keepdims=True)
+        threshold = n * 1.4826 * mad
+        return np.clip(a, med - threshold, med + threshold)
+
+    @staticmethod
+    def zscore_mad(a: np.ndarray, axis: int = -1) -> np.ndarray:
+        """稳健标准化：(x - 中位数) / (1.4826 × MAD)，MAD 为 0 时取 1e-6"""
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            med = np.nanmedian(a, axis=axis, keepdims=True)
+            mad = np.nanmedian(np.abs(a - med), axis=axis, keepdims=True)
+        mad = np.where(mad == 0, 1e-6, mad)
+        return (a - med) / (1.4826 * mad)
+
+    # ------------------------------------------------------------------ #
+    #  打分
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def dynamic_weights(sentiment: int) -> dict:
+        """根据环境返回 4-4-2 微调权重（牛市 1 调高动量，熊市 2 调高风控）"""
+        if sentiment == 1:
+            return {'momentum': 0.5, 'fundamental': 0.3, 'risk': 0.2}
+        if sentiment == 2:
+            return {'momentum': 0.3, 'fundamental': 0.3, 'risk': 0.4}
+        return {'momentum': 0.4, 'fundamental': 0.4, 'risk': 0.2}
+
+    @staticmethod
+    def combine(z: dict, usesector: bool, weights) -> dict:
+        """
+        由标准分合成分项得分与总分。weights 为单个权重字典，或与日期数相同的字典列表。
+        PE / Vol / Bias 越低越好取负号，ROE / 动量越高越好取正号。
+        """
+        if not usesector:
+            fund = 0.3 * (-z['R_PE']) + 0.7 * z['R_ROE']
+            risk = 0.7 * (-z['R_Vol']) + 0.3 * (-z['R_Bias'])
+        else:
+            fund = 0.5 * (-z['R_PE']) + 0.5 * z['R_ROE']
+            risk = 0.5 * (-z['R_Vol']) + 0.5 * (-z['R_Bias'])
+        mom = 0.6 * z['R_Mom_Short'] + 0.4 * z['R_Mom_Mid']
+
+        if isinstance(weights, dict):
+            w_f, w_m, w_r = weights['fundamental'], weights['momentum'], weights['risk']
+        else:
+            w_f = np.array([w['fundamental'] for w in weights], dtype=float)[:, None]
+            w_m = np.array([w['momentum'] for w in weights], dtype=float)[:, None]
+            w_r = np.array([w['risk'] for w in weights], dtype=float)[:, None]
+        total = w_f * fund + w_m * mom + w_r * risk
+        return {'score_fund': fund, 'score_mom': mom, 'score_risk': risk, 'Total_Score': total}
+
+    def scores(self, at_dates, sentiments=3, usesector: bool = False) -> pd.DataFrame:
+        """
+        一次算出所有 at_dates 的综合得分：DataFrame(index=at_dates, columns=codes)，
+        数据不足的股票为 NaN。sentiments 可为单个值或与 at_dates 等长的序列。
+        """
+        at_dates = [str(d) for d in at_dates]
+        raw = self.raw(at_dates)
+        stack = np.stack([raw[f].to_numpy() for f in self.FACTORS])      # (6, D, C)
+        z = self.zscore_mad(self.winsorize_mad(stack, n=3))
+        z = {f: z[i] for i, f in enumerate(self.FACTORS)}
+
+        if np.ndim(sentiments) == 0:
+            weights = self.dynamic_weights(int(sentiments))
+        else:
+            weights = [self.dynamic_weights(int(s)) for s in sentiments]
+        total = self.combine(z, usesector, weights)['Total_Score']
+        return pd.DataFrame(total, index=at_dates, columns=self.codes)
+
+    def select(self, at_dates, sentiments=3, top_n: int = 10, usesector: bool = False) -> dict:
+        """返回 {at_date: 按总分降序的前 top_n 只股票代码}"""
+        scores = self.scores(at_dates, sentiments, usesector)
+        values = scores.to_numpy()
+        filled = np.where(np.isnan(values), -np.inf, values)
+        order = np.argsort(-filled, axis=1, kind='stable')[:, :top_n]
+        codes = np.asarray(self.codes, dtype=object)
+        result = {}
+        for i, d in enumerate(scores.index):
+            picks = order[i][np.isfinite(filled[i, order[i]])]
+            result[d] = codes[picks].tolist()
+        return result
@@ -19,20 +19,25 @@ import sys
 import os
 import datetime
 import pandas as pd
-import numpy as np
 from xtquant import xtdata
 
 _parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _parent_dir not in sys.path:
     sys.path.append(_parent_dir)
 from utils.stockmgr import StockMgr
+from utils.barstore import BarStore
+from utils.financialstore import FinancialStore
+from utils.instrumentmgr import InstrumentMgr
+from factor_engine import FactorEngine
 
 # 权重配置
 W_FUND = 0.4  # 基本面
 W_MOM  = 0.4  # 动量
 W_RISK = 0.2  # 风控
 
-__all__ = ['select']
+__all__ = ['select', 'select_batch']
+
+_FIN_STORE = FinancialStore()
 
 # ================= 2. 工具函数 =================
 
@@ -87,20 +92,29 @@ def check_and_download_data(stock_list, mdays = 60):
         for stock in stock_list:
              xtdata.download_financial_data([stock])
 
-# ================= 3. 核心计算逻辑 (已修复转置问题) =================
+# ================= 3. 核心计算逻辑 (面板化，见 factor_engine.py) =================
+def _lookback_start(at_date: str, sdays: int, mdays: int) -> str:
+    """覆盖 (mdays + sdays) 个交易日所需的自然日起点（按 2 倍留余量）"""
+    dt_obj = datetime.datetime.strptime(str(at_date)[:8], '%Y%m%d')
+    return (dt_obj - datetime.timedelta(days=(mdays + sdays) * 2)).strftime('%Y%m%d')
+
+
+def _ensure_financials(stock_list, earliest_date: str):
+    """财务时点仓库：至少覆盖 earliest_date 前一年内公告的报告"""
+    fin_start = (datetime.datetime.strptime(str(earliest_date)[:8], '%Y%m%d')
+                 - datetime.timedelta(days=400)).strftime('%Y%m%d')
+    _FIN_STORE.ensure(stock_list, FactorEngine.FIN_TABLE, FactorEngine.FIN_FIELDS, start_time=fin_start)
+    return _FIN_STORE
+
+
 def calculate_factors(stock_list, at_date: str, sdays = 20, mdays = 60, ):
     """
     计算因子核心函数 (Updated)
     逻辑: 40%基本面 + 40%动量 + 20%风控
+    返回 index=代码、columns=六个原始因子 的 DataFrame，行情不足的股票不出现在结果中。
     """
     print(f">> 开始计算 {at_date} {len(stock_list)} 只股票的因子...")
 
-        # 1. 将字符串转为 datetime 对象
-    dt_obj = datetime.datetime.strptime(at_date, '%Y%m%d')
-    # 2. 使用 timedelta 增加一天
-    lookback_day_obj = dt_obj + datetime.timedelta(days= - (mdays + sdays))
-    # 3. 将新的日期对象转回字符串
-    lookback_dt_str = lookback_day_obj.strftime('%Y%m%d')
     # ================= 1. 获取行情数据 (Technical) =================
     # 获取收盘价，用于计算动量、波动率、乖离率以及估值(PE)
     market_data = xtdata.get_market_data_ex(
@@ -111,132 +125,27 @@ def calculate_factors(stock_list, at_date: str, sdays = 20, mdays = 60, ):
         count= mdays +sdays,
         dividend_type='front' # 前复权
     )
-    
-    # ================= 2. 获取财务数据 (Fundamental) =================
-    # 使用 PershareIndex 表
-    financial_data = xtdata.get_financial_data(
-        stock_list, 
-        table_list=['PershareIndex'], 
-        report_type='announce_time' # 避免未来函数
-    )
-
-    # ================= 3. 逐个股票计算因子 =================
-    data_dict = {
-        'code': [],
-        'R_PE': [],   # 估值 (基本面)
-        'R_ROE': [],  # 质量 (基本面)
-        'R_Mom_Short': [],  # 动量20 (技术面)
-        'R_Mom_Mid': [],  # 动量60 (技术面)
-        'R_Vol': [],  # 波动 (风控)
-        'R_Bias': []  # 乖离 (风控)
-    }
-
-    for stock in stock_list:
-        try:
-            # --- A. 技术面计算 ---
-            
-            # 安全获取该股序列
-            if stock not in market_data: continue
-            closes_series = market_data[stock]['close']
-            
-            # 转 numpy 数组并清洗 NaN
-            closes = closes_series.dropna().values
-            
-            # 长度不够无法计算 MA20
-            if len(closes) < mdays: continue
-            
-            current_price = closes[-1]
-            if current_price <= 0: continue # 停牌或数据错误
-
-            # 1. 动量 (Momentum): 20日涨幅
-            # 逻辑: 过去20天涨了多少
-            mom_short = current_price / closes[-sdays] - 1
-            mom_mid = current_price / closes[-mdays] - 1
-
-            # 2. 波动率 (Volatility): 20日收益率标准差
-            # 逻辑: 涨跌越平稳越好
-            returns = np.diff(closes) / closes[:-1]
-            vol = np.std(returns[-sdays:])
-
-            # 3. 乖离率 (Bias): 偏离20日均线的程度
-            # 逻辑: 防止追高，取绝对值看偏离度
-            ma = np.mean(closes[-sdays:])
-            bias = abs((current_price - ma) / ma)
-
-            # --- B. 基本面计算 (基于 financial_data) ---
-            
-            fin_df = financial_data.get(stock)['PershareIndex']
-            
-            # 初始化默认“烂”分
-            pe = 999.0   # PE越小越好，给个大数
-            roe = -99.0  # ROE越大越好，给个小数
-            
-            # [修复3] 严谨判断：非None、非空字典、非空DataFrame
-            if fin_df is not None and isinstance(fin_df, pd.DataFrame) and not fin_df.empty:
-                last_report = fin_df.iloc[-1]
-                
-                # [修复4] 使用您提供的准确字段名
-                # s_fa_eps_basic: 基本每股收益
-                # equity_roe:     净资产收益率
-                # s_fa_bps:       每股净资产 (备用)
-                
-                eps = last_report.get('s_fa_eps_basic', 0)
-                real_roe = last_report.get('equity_roe', -99) # 优先用现成字段
-                
-                # --- 计算 PE (市盈率) ---
-                # 处理空值和亏损
-                if pd.isna(eps): eps = 0
-                
-                if eps > 0:
-                    pe = current_price / eps
-                else:
-                    pe = 999.0 # 亏损股，估值打分极差
-                
-                # --- 计算 ROE (净资产收益率) ---
-                if pd.notna(real_roe) and real_roe != -99:
-                    # 如果数据库里有 equity_roe，直接用
-                    roe = real_roe
-                else:
-                    # 备用方案：手动算 EPS / BPS
-                    bps = last_report.get('s_fa_bps', 0)
-                    if bps > 0:
-                        roe = (eps / bps) * 100 # 统一为百分比量级
-                    else:
-                        roe = -99
-            
-            # --- C. 存入结果 ---
-            data_dict['code'].append(stock)
-            data_dict['R_PE'].append(pe)
-            data_dict['R_ROE'].append(roe)
-            data_dict['R_Mom_Short'].append(mom_short)
-            data_dict['R_Mom_Mid'].append(mom_mid)
-            data_dict['R_Vol'].append(vol)
-            data_dict['R_Bias'].append(bias)
-
-        except Exception as e:
-            # 仅在调试时打印错误，防止刷屏
-            # print(f"Skipped {stock}: {e}")
-            pass
-
-    # 转换为 DataFrame 并设置 index
-    df_result = pd.DataFrame(data_dict)
-    if not df_result.empty:
-        df_result.set_index('code', inplace=True)
-        
-    return df_result
+    close = pd.DataFrame({s: market_data[s]['close'] for s in stock_list
+                          if s in market_data and not market_data[s].empty})
+    if close.empty:
+        return pd.DataFrame(columns=list(FactorEngine.FACTORS))
+
+    # ================= 2. 财务数据 (Fundamental) =================
+    # PershareIndex 按公告日做时点查询，避免未来函数
+    fin_store = _ensure_financials(list(close.columns), at_date)
+
+    # ================= 3. 整个股票池一次计算 =================
+    engine = FactorEngine(close, fin_store, sdays, mdays)
+    raw = engine.raw([at_date])
+    df_result = pd.DataFrame({f: raw[f].iloc[0] for f in FactorEngine.FACTORS})
+    df_result.index.name = 'code'
+    return df_result.dropna()
 
 # ================= 4. 打分与排序 =================
 
 def get_dynamic_weights(sentiment):
     """根据环境返回 4-4-2 微调权重"""
-    W_FUND = 0.4
-    W_MOM  = 0.4
-    W_RISK = 0.2
-    if sentiment == 1: # 牛市：进攻，调高动量
-        return {'momentum': 0.5, 'fundamental': 0.3, 'risk': 0.2}
-    if sentiment == 2: # 熊市：防御，调高风控
-        return {'momentum': 0.3, 'fundamental': 0.3, 'risk': 0.4}
-    return {'momentum': W_MOM, 'fundamental': W_FUND, 'risk': W_RISK} # 震荡/默认
+    return FactorEngine.dynamic_weights(sentiment)
 
 
 def filter_outliers_mad(df, columns, n=3):
@@ -245,20 +154,7 @@ def filter_outliers_mad(df, columns, n=3):
     逻辑：把超过 中位数 +/- n * (1.4826 * MAD) 的数据强制拉回边界
     """
     df_fix = df.copy()
-    for col in columns:
-        x = df_fix[col]
-        median = x.median()  # 中位数
-        # 计算 MAD: |x - median| 的中位数
-        mad = (x - median).abs().median()
-        
-        # 1.4826 是为了使 MAD 在正态分布下等价于标准差
-        threshold = n * (1.4826 * mad)
-        
-        low = median - threshold
-        high = median + threshold
-        
-        # 缩尾处理
-        df_fix[col] = x.clip(low, high)
+    df_fix[columns] = FactorEngine.winsorize_mad(df[columns].to_numpy(dtype=float), n=n, axis=0)
     return df_fix
 
 def standardize_mad(df):
@@ -266,16 +162,8 @@ def standardize_mad(df):
     基于中位数的稳健标准化 (Robust Standardization)
     代替原来的 (x - mean) / std
     """
-    # 同样使用中位数和 MAD 来进行标准化
-    df_z = df.copy()
-    for col in df.columns:
-        median = df[col].median()
-        mad = (df[col] - median).abs().median()
-        # 防止 mad 为 0 导致除法错误
-        if mad == 0: mad = 1e-6
-        
-        df_z[col] = (df[col] - median) / (1.4826 * mad)
-    return df_z
+    return pd.DataFrame(FactorEngine.zscore_mad(df.to_numpy(dtype=float), axis=0),
+                        index=df.index, columns=df.columns)
 
 
 def scoring(df, usesector, sentiment: int):
@@ -353,7 +241,7 @@ def select (stock_pool, sector, at_date: str, top_n = 10, download = True, sdays
     if not df_result.empty:
         print("\n[选股结果 Top 10]")
         # 打印展示列：总分、PE(估值)、ROE(质量)、Mom(动量)
-        names = [xtdata.get_instrument_detail(code).get('InstrumentName', '未知') for code in df_result.index]
+        names = list(InstrumentMgr.names(list(df_result.index), default='未知').values())
         df_result.insert(0, 'name', names)
         if output:
             print(df_result[['name', 'R_PE', 'R_ROE', 'R_Mom_Short','R_Mom_Mid', 'R_Vol', 'R_Bias', 'score_fund', 'score_mom', 'score_risk', 'Total_Score']])
@@ -361,6 +249,29 @@ def select (stock_pool, sector, at_date: str, top_n = 10, download = True, sdays
     return []
 
 
+
+# == Batch entry for regression ========
+# 一次为多个调仓日选股：收盘价矩阵从本地列式仓库加载一次，所有日期的因子、去极值、
+# 标准化和打分在 FactorEngine 中一次完成。
+# 参数：
+# at_dates: 调仓日列表 ('YYYYMMDD')
+# sentiments: 与 at_dates 等长的市场状态序列（或单个值）
+# 返回：{at_date: [按总分降序的前 top_n 只代码]}
+def select_batch(stock_pool, at_dates, sentiments = 3, top_n = 10, sdays = 20, mdays = 60, usesector = False):
+    at_dates = [str(d)[:8] for d in at_dates]
+    if not at_dates or not stock_pool:
+        return {}
+    start = _lookback_start(min(at_dates), sdays, mdays)
+
+    bar_store = BarStore()
+    bar_store.ensure(stock_pool, start_time=start, fields=['close'])
+    close = bar_store.load_field('close', stock_pool, start_time=start, as_of=max(at_dates))
+    close = close.loc[:, close.notna().any()]
+
+    fin_store = _ensure_financials(list(close.columns), min(at_dates))
+    engine = FactorEngine(close, fin_store, sdays, mdays)
+    return engine.select(at_dates, sentiments, top_n=top_n, usesector=usesector)
+
 #================= 主程序入口 =================
 if __name__ == '__main__':    
     print("=== 启动 xtquant 原生选股策略 ===")
@@ -4,10 +4,12 @@ import matplotlib.pyplot as plt
 import pandas as pd
 from datetime import datetime
 from xtquant import xtdata
-from factor_selection import select
+from factor_selection import select_batch
 import sys, os; sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.marketmgr import MarketMgr
 
+REBALANCE_FREQ = 5       # 5天调仓一次
+
 STOCK_POOL = ['301308.SZ', '603986.SH', '002920.SZ', '002555.SZ', '601919.SH', '601857.SH', '601788.SH', '600887.SH']
 # , 
 #                           '601898.SH', '600886.SH', '600900.SH', '688981.SH', '688126.SH', '002371.SZ', '002202.SZ', '601633.SH', 
@@ -26,14 +28,14 @@ class QMT_Stock_Comm(bt.CommInfoBase):
 # ================= 2. 核心策略类 =================
 class QMT_Selective_StopLoss_Strategy(bt.Strategy):
     params = (
-        ('rebalance_freq', 5),
+        ('rebalance_freq', REBALANCE_FREQ),
         ('buyin_count', 6),
         ('slippage', 0.0005),
         ('stop_loss_pct', 0.10), # 10% 止损
+        ('targets', None),       # {调仓日: 选股列表}，由 select_batch 预先批量算好
     )
 
     def __init__(self):
-        self.count = 0
         self.stock_pool = STOCK_POOL
         self.stocks = {d._name: d for d in self.datas if d._name != '000300.SH'}
 
@@ -58,15 +60,10 @@ class QMT_Selective_StopLoss_Strategy(bt.Strategy):
                     print(f"[{dt_str}] !! 止损卖出: {code}, 跌幅:{(curr_price/cost_price-1)*100:.2f}%")
 
         # --- 2. 调仓逻辑 (每5天触发) ---
-        if self.count % self.p.rebalance_freq == 0:
-            # A. 选股
-            sentiment = MarketMgr.get_market_sentiment('000300.SH', dt_str)
-            try:
-                selected_df = select(stock_pool=self.stock_pool, at_date=dt_str, sector=False, 
-                                     top_n=10, download=False, sentiment=sentiment, output=False)
-                top_targets = selected_df.index.tolist()[:self.p.buyin_count]
-            except:
-                top_targets = []
+        # 按基准 K 线序号计数，与 run_regression 预先算好的调仓日 trade_days[::rebalance_freq] 对齐
+        if (len(self.data) - 1) % self.p.rebalance_freq == 0:
+            # A. 选股（预先批量算好的当日结果）
+            top_targets = (self.p.targets or {}).get(dt_str, [])[:self.p.buyin_count]
 
             # B. 卖出逻辑 (排名淘汰)
             for d in self.datas:
@@ -102,8 +99,6 @@ class QMT_Selective_StopLoss_Strategy(bt.Strategy):
                         self.buy(data=d, size=size)
                         print(f"[{dt_str}] 买入补位: {code}, 数量: {size}")
 
-        self.count += 1
-
 # ================= 3. 运行配置 =================
 def run_regression():
     cerebro = bt.Cerebro()
@@ -134,7 +129,14 @@ def run_regression():
             data = bt.feeds.PandasData(dataframe=df, name=code)
             cerebro.adddata(data)
 
-    cerebro.addstrategy(QMT_Selective_StopLoss_Strategy)
+    # 只对调仓日批量选股（与 reg_selfbuild 相同），策略内按日期直接查表
+    trade_days = df_bench.index.strftime('%Y%m%d').tolist()
+    rebalance_days = trade_days[::REBALANCE_FREQ]
+    sentiments = MarketMgr.get_market_sentiment_series(bench_code, trade_days[0], trade_days[-1])
+    sentiments = sentiments.reindex(rebalance_days).fillna(3).astype(int)
+    targets = select_batch(STOCK_POOL, rebalance_days, sentiments.tolist(), top_n=10)
+
+    cerebro.addstrategy(QMT_Selective_StopLoss_Strategy, targets=targets)
 
     cerebro.addanalyzer(bt.analyzers.TimeDrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
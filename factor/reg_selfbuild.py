@@ -5,7 +5,7 @@ from xtquant import xtdata
 import datetime
 import matplotlib.pyplot as plt
 import platform
-from factor_selection import select  # 请确保 select 已支持 end_time 参数
+from factor_selection import select_batch
 import sys, os; sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.marketmgr import MarketMgr
 from utils.utilities import DateMgr
@@ -60,6 +60,12 @@ def run_professional_backtest():
     history_log = []
     total_fees = 0.0
     
+    # 所有调仓日一次批量选股（市场状态、因子、打分均为整段向量计算）
+    rebalance_days = trading_days[::REBALANCE_FREQ]
+    sentiments = MarketMgr.get_market_sentiment_series(BENCHMARK, START_DATE, END_DATE)
+    sentiments = sentiments.reindex(rebalance_days).fillna(3).astype(int)
+    targets = select_batch(STOCK_POOL, rebalance_days, sentiments.tolist(), top_n=10)
+
     print(f"开始回测：账户资金 {INIT_CASH} 元，每 {REBALANCE_FREQ} 天调仓...")
 
     for i, dt_str in enumerate(trading_days):
@@ -80,13 +86,10 @@ def run_professional_backtest():
         # B. 调仓逻辑（严格每5个交易日触发）
         if i % REBALANCE_FREQ == 0:
             # --- 选股逻辑 (规避未来函数) ---
-            # 传入当前的 dt_str，让 select 函数只用今天之前的数据
-            try:
-                selected_df = select(stock_pool=STOCK_POOL, at_date=dt_str, sector= False, top_n=10, download=False, 
-                                     sentiment=MarketMgr.get_market_sentiment(BENCHMARK, dt_str), output= False)
-                top_targets = selected_df.index.tolist()[:BUYIN_COUNT]
-            except Exception as e:
-                print(f"[{dt_str}] 选股出错: {e}")
+            # 批量选股时每个调仓日只用截至当天的行情与已公告财报
+            top_targets = targets.get(dt_str, [])[:BUYIN_COUNT]
+            if not top_targets:
+                print(f"[{dt_str}] 选股结果为空，跳过调仓")
                 continue
 
             # --- 1. 卖出逻辑 (排名淘汰) ---
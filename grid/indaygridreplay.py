@@ -0,0 +1,157 @@
+# coding=utf-8
+"""
+日内深跌抄底 / 动态止盈策略 (indaygridsimandtradev0.2.py) 的分钟线回放与参数扫描
+
+直接驱动实盘同一份 RobustStrategy.run_logic：本地分钟线（或分笔）仓库按 K 线逐根推送给 TickHub，
+报单走 SimTrader（实盘分支的持仓 / 当日委托 / 挂单查询全部由模拟账户回答），
+移动止盈、ATR 止损、深跌抄底、每日额度与单票占比等规则与实盘完全一致，不再按 LOOP_INTERVAL 实时等待。
+多只股票 × 多组参数通过 SweepRunner 分配到多个进程并行回放。
+
+数据准备（股票池和风控指数都要有分钟线，ATR 需要日线）：
+    BarStore(period='1d').ensure(codes + ['000001.SH'], '20230101')
+    BarStore(period='1m').ensure(codes + ['000001.SH'], '20240101')
+
+运行方式：
+    python indaygridreplay.py        # 按下方配置扫描，结果写入 gridreplay.csv
+"""
+
+import os
+import sys
+import importlib.util
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from utils.replay import ReplayRunner
+from utils.sweeprunner import SweepRunner
+
+# ==================== 回放配置 ====================
+START_DATE = '20240101'
+END_DATE = None              # None = 本地数据的最后一天
+CASH = 100000.0              # 单个回放账户的初始资金（需满足 BUY_QUOTA / 总资产 <= SINGLE_STOCK_LIMIT_PCT）
+QUOTE = '1m'                 # 1m / 5m / tick：回放使用的盘中仓库
+PER_STOCK = True             # True: 每只股票单独一个账户回放（可并行）；False: 整个股票池共用一个账户
+WORKERS = None               # None = 全部 CPU 核心
+OUT_CSV = os.path.join(current_dir, 'gridreplay.csv')
+
+# 需要扫描的策略参数（键为策略文件中的模块级参数名，值为候选列表）
+PARAM_SPACE = {
+    'BUY_DIP_PCT': [-0.05, -0.06, -0.07],
+    'REBOUND_PCT': [0.003, 0.005],
+    'TRAILING_DRAWDOWN': [0.005, 0.01],
+}
+# =================================================
+
+STRATEGY_FILE = os.path.join(current_dir, 'indaygridsimandtradev0.2.py')
+MODULE_NAME = 'indaygridsimandtrade_v02'
+PARAM_NAMES = ('MAX_DAILY_BUY_AMOUNT', 'SINGLE_STOCK_LIMIT_PCT', 'HOLD_PROFIT_PCT', 'HOLD_LOSS_PCT',
+               'TRAILING_DRAWDOWN', 'BUY_DIP_PCT', 'REBOUND_PCT', 'ATR_PERIOD', 'BENCHMARK_RISK_THRESH',
+               'BUY_QUOTA', 'HUADIAN')
+# 卖出说明的前缀 -> 统计列名
+EXIT_REASONS = {'总仓止盈': 'take_profit', '总仓止损': 'stop_loss', '移动止盈': 'trailing', 'ATR止损': 'atr_stop'}
+
+
+def load_strategy(params: dict = None):
+    """按文件加载策略模块（文件名带版本号，不能直接 import），并用 params 覆盖模块级参数"""
+    unknown = set(params or {}) - set(PARAM_NAMES)
+    if unknown:
+        raise KeyError(f"未知的策略参数: {sorted(unknown)}，可选: {PARAM_NAMES}")
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, STRATEGY_FILE)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = mod          # 注册后 ReplayRunner 才能替换它的 datetime / time / XtQuantTrader
+    spec.loader.exec_module(mod)
+    for k, v in (params or {}).items():
+        setattr(mod, k, v)
+    return mod
+
+
+def load_watchlist() -> list:
+    """默认股票池：与实盘一致，取 siminput.csv 中的 stock_code 列"""
+    path = os.path.join(current_dir, 'siminput.csv')
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'stock_code': str})
+    codes = [str(c).strip() for c in df['stock_code'].dropna()]
+    return list(dict.fromkeys(c if '.' in c else (f"{c}.SH" if c.startswith('6') else f"{c}.SZ") for c in codes))
+
+
+def replay(stocks, start=START_DATE, end=END_DATE, params: dict = None, cash: float = CASH,
+           holdings: dict = None, quote: str = QUOTE, name: str = 'grid', quiet: bool = True,
+           showprogress: bool = True) -> dict:
+    """
+    在一个模拟账户里回放一组股票，返回 ReplayRunner.run 的结果。
+    holdings 为开始前已有的持仓 {code: (股数, 成本价)}，对应实盘 siminput.csv 里的持仓。
+    """
+    mod = load_strategy(params)
+    mod.SIMULATION = False                  # 走实盘分支：持仓 / 委托查询由 SimTrader 回答
+    stocks = list(stocks)
+    with ReplayRunner(name, start, end, cash=cash, quote=quote, quiet=quiet) as rp:
+        rp.patch(mod, 'LOG_FILE_REAL', os.path.join(rp.workdir, 'tradelog.csv'))
+        rp.patch(mod.PositionManager, 'load_input_csv_stocks', lambda pos_mgr: list(stocks))
+        rp.patch(mod.RobustStrategy, 'print_dashboard', lambda strategy, *args: None)   # 看板会清屏，回放时不显示
+        rp.hold(holdings or {})
+        strategy = mod.RobustStrategy()
+        strategy.prepare()
+        return rp.run(strategy.step, showprogress=showprogress)
+
+
+def summarize(res: dict) -> dict:
+    """回放结果 -> 一行指标"""
+    stats = res['stats']
+    trades = res['trades']
+    sells = trades[trades['order_type'] == 24]['strategy_name'].str.replace('策略:', '', regex=False)
+    row = {
+        'total_return': stats['total_return'],
+        'ann_return': stats['ann_return'],
+        'max_drawdown': stats['max_drawdown'],
+        'sharpe': stats['sharpe'],
+        'buy_count': int((trades['order_type'] == 23).sum()),
+        'sell_count': int(len(sells)),
+        'total_cost': stats['total_cost'],
+    }
+    for prefix, col in EXIT_REASONS.items():
+        row[col] = int(sells.str.startswith(prefix).sum())
+    return row
+
+
+def evaluate(params: dict, data: dict) -> dict:
+    """
+    SweepRunner 评估函数：params['stocks'] 为逗号分隔的代码，可选 start / end / cash，
+    其余键为策略参数。每个工作进程用自己的回放目录，互不干扰。
+    """
+    p = dict(params)
+    stocks = [c.strip() for c in str(p.pop('stocks')).split(',') if c.strip()]
+    start, end, cash = p.pop('start', START_DATE), p.pop('end', END_DATE), p.pop('cash', CASH)
+    res = replay(stocks, start, end, p, cash=cash, name=f'grid_{os.getpid()}', showprogress=False)
+    return summarize(res)
+
+
+def main():
+    stocks = load_watchlist()
+    space = {'stocks': stocks if PER_STOCK else [','.join(stocks)], **PARAM_SPACE}
+    tasks = SweepRunner.grid(space)
+    print(f">> 日内策略回放: {len(stocks)} 只股票, {len(tasks)} 个任务, 区间 {START_DATE} ~ {END_DATE or '最新'}")
+
+    runner = SweepRunner(evaluate, workers=WORKERS)
+    df = runner.run_all(tasks, out_csv=OUT_CSV)
+    if 'error' in df.columns and df['error'].notna().any():
+        failed = df['error'].notna()
+        print(f"--> {failed.sum()} 个任务失败，例如: {df.loc[failed, 'error'].iloc[0]}")
+        df = df[~failed]
+    if df.empty:
+        return
+
+    keys = list(PARAM_SPACE)
+    if keys:
+        table = df.groupby(keys).agg(total_return=('total_return', 'mean'), max_drawdown=('max_drawdown', 'min'),
+                                     sharpe=('sharpe', 'mean'), buy_count=('buy_count', 'sum'))
+        table = table.sort_values('total_return', ascending=False)
+    else:
+        table = df
+    print("\n" + "=" * 30 + " 参数组汇总（按股票平均） " + "=" * 30)
+    print(table.head(20).to_string(float_format=lambda v: f"{v:.4f}"))
+    print(f"\n明细已写入 {OUT_CSV}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,16 @@ import numpy as np
 from xtquant import xttrader, xtconstant, xtdata
 from xtquant.xttrader import XtQuantTrader
 from xtquant.xttype import StockAccount
+import sys
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from utils.tickhub import TickHub
+from utils.instrumentmgr import InstrumentMgr
+from utils.accountcache import CachedTrader
+from utils.orderindex import OrderIndex
+from utils.eventlog import EventLog
 
 # ==================== 用户配置区域 ====================
 # [核心开关] True=模拟模式(读CSV), False=实盘模式(读账户)
@@ -132,8 +142,7 @@ class PositionManager:
                 vol = pos['volume']
                 cost = pos['cost']
                 # 获取当前价格计算市值
-                tick = xtdata.get_full_tick([stock_code])
-                curr_price = tick[stock_code]['lastPrice'] if (tick and stock_code in tick) else cost
+                curr_price = TickHub.instance().price(stock_code) or cost
                 return vol, cost, vol * curr_price
             return 0, 0.0, 0.0
         else:
@@ -160,9 +169,9 @@ class PositionManager:
         if SIMULATION:
             # 模拟模式下，假设资金无限或固定，这里主要返回持仓市值
             total_mkt_value = 0.0
+            prices = TickHub.instance().prices(list(self.sim_positions.keys()))
             for s, info in self.sim_positions.items():
-                tick = xtdata.get_full_tick([s])
-                price = tick[s]['lastPrice'] if (tick and s in tick) else info['cost']
+                price = prices.get(s, info['cost'])
                 total_mkt_value += info['volume'] * price
             return 10000000.0, 10000000.0 + total_mkt_value 
         else:
@@ -204,8 +213,12 @@ class RobustStrategy:
     def __init__(self):
         import random
         session_id = int(random.randint(100000, 999999))
-        self.trader = XtQuantTrader(MINI_QMT_PATH, session_id)
         self.acc = StockAccount(ACCOUNT_ID)
+        # 每个 tick 的持仓 / 资金查询走推送维护的缓存，不再逐次走 IPC
+        self.trader = CachedTrader(XtQuantTrader(MINI_QMT_PATH, session_id), self.acc)
+        # 当日委托索引：由委托回报维护 + 定期对账，每只股票的风控检查都是内存查找
+        self.orders = OrderIndex(self.trader, self.acc)
+        self.trader.register_callback(self.orders)
         
         # 初始化日期状态
         self.current_date_str = datetime.datetime.now(BJ_TZ).strftime("%Y-%m-%d")
@@ -222,29 +235,8 @@ class RobustStrategy:
     def get_daily_buy_amount(self):
         if SIMULATION:
             return self.sim_daily_buy
-        
-        # 实盘：查询当日委托，计算已占用资金
-        try:
-            orders = self.trader.query_stock_orders(self.acc, cancelable_only=False)
-            total_buy = 0.0
-            today_str = datetime.datetime.now().strftime("%Y%m%d")
-            
-            for o in orders:
-                order_date_str = ""
-                ts = o.order_time 
-                if ts > 0:
-                    order_date_str = datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d")
-
-                if order_date_str == today_str and o.order_type == xtconstant.STOCK_BUY:
-                    amt = o.price * o.order_volume
-                    # 如果市价单price为0，尝试用成交金额
-                    if amt == 0 and o.trade_amount > 0:
-                        amt = o.trade_amount
-                    total_buy += amt
-            return total_buy
-        except Exception as e:
-            print(f"!!! 查询当日委托失败: {e}")
-            return 9999999.0 # 查失败则风控拉满，暂停买入
+        # 实盘：当日买入委托金额（OrderIndex 内存累计，对账失败时风控拉满，暂停买入）
+        return self.orders.daily_buy_amount()
 
     # [新增] 核心风控：检查今日是否已操作过 (严格限制每天一次)
     def has_traded_today(self, stock_code, action_type):
@@ -256,35 +248,13 @@ class RobustStrategy:
             key = f"{stock_code}_{action_type}"
             return key in self.sim_today_traded_cache
 
-        # 2. 实盘模式：查当日委托记录
-        try:
-            orders = self.trader.query_stock_orders(self.acc, cancelable_only=False)
-            today_str = datetime.datetime.now().strftime("%Y%m%d")
-            
-            for o in orders:
-                order_date_str = ""
-                ts = o.order_time 
-                if ts > 0:
-                    order_date_str = datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d")
-                if not order_date_str == today_str: continue
-                if o.stock_code == stock_code and o.order_type == action_type:
-                    # 只要下过单(哪怕废单)，严格执行纪律，今天不再操作
-                    return True 
-            return False
-        except:
-            return True # 查不到数据就保守风控
+        # 2. 实盘模式：查当日委托索引 (只要下过单(哪怕废单)，严格执行纪律，今天不再操作；查不到数据就保守风控)
+        return self.orders.has_traded_today(stock_code, action_type)
 
-    # [新增] 检查是否存在未成交挂单 (防止5秒循环内重复报单)
+    # [新增] 检查是否存在未成交挂单 (防止同一轮循环内重复报单)
     def has_open_order(self, stock_code, action_type):
         if SIMULATION: return False
-        try:
-            orders = self.trader.query_stock_orders(self.acc, cancelable_only=True)
-            for o in orders:
-                if o.stock_code == stock_code and o.order_type == action_type:
-                    return True
-        except:
-            pass
-        return False
+        return self.orders.has_open_order(stock_code, action_type)
 
     def check_date_rotation(self):
         now_date = datetime.datetime.now(BJ_TZ).strftime("%Y-%m-%d")
@@ -294,6 +264,7 @@ class RobustStrategy:
             # 重置每日状态
             self.sim_daily_buy = 0.0
             self.sim_today_traded_cache.clear()
+            self.atr_map.clear()  # ATR 按新的日线重新计算，否则长时间运行会一直沿用启动当天的值
             self.pos_mgr.download_historical_data(self.pos_mgr.get_all_positions_codes())
 
     def log_trade_csv(self, stock, action_str, volume, price, cost, pnl):
@@ -356,9 +327,11 @@ class RobustStrategy:
                 self.sim_daily_buy += amount
         else:
             # [实盘下单] (此处保留注释，用户需手动开启)
-            self.trader.order_stock(
+            order_id = self.trader.order_stock(
                self.acc, stock, action_type, int(volume), xtconstant.FIX_PRICE, trade_price, f"策略:{remark}", "0"
             )
+            self.orders.on_submit(order_id, stock, action_type, int(volume), trade_price)
+            self.trader.cache.invalidate()      # 自己下的单立即作废持仓 / 资金缓存，不等推送
             print(f"[实盘] 委托已发送(演示): {stock} {action_str} {trade_price:.2f}")
 
         # 5. 写日志
@@ -370,7 +343,7 @@ class RobustStrategy:
         返回: (是否暴跌风险, 大盘涨跌幅)
         """
         try:
-            tick = xtdata.get_full_tick([BENCHMARK_INDEX])
+            tick = TickHub.instance().get_ticks([BENCHMARK_INDEX])
             if not tick or BENCHMARK_INDEX not in tick:
                 return False, 0.0
             
@@ -500,6 +473,7 @@ class RobustStrategy:
         # 为了版面整洁，可以按涨跌幅排序显示
         # sorted_stocks = sorted(stock_list, key=lambda s: ticks[s]['lastPrice'] if s in ticks else 0, reverse=True)
         
+        names = InstrumentMgr.names(stock_list)
         for stock in stock_list:
             if stock not in ticks: continue
             tick = ticks[stock]
@@ -509,11 +483,8 @@ class RobustStrategy:
             # 计算涨跌
             pct = (price - pre) / pre if pre > 0 else 0
             
-            # 获取名称 (兼容写法)
-            detail = xtdata.get_instrument_detail(stock)
-            name = "--"
-            if detail:
-                name = detail.get('InstrumentName', '--') if isinstance(detail, dict) else getattr(detail, 'InstrumentName', '--')
+            # 获取名称（当日合约快照，只在首次刷新时拉取一次）
+            name = names[stock]
             
             # 获取 ATR 值 (用于显示波动率)
             atr_val = self.atr_map.get(stock, 0)
@@ -536,30 +507,43 @@ class RobustStrategy:
         os.system('cls' if os.name == 'nt' else 'clear') 
         print("\n".join(lines))
 
-    def start(self):
+    def prepare(self):
+        """连接交易端、初始化持仓管理器并订阅行情，成功返回 True"""
         mode_str = "模拟盘(Input/Current CSV)" if SIMULATION else "实盘(QMT账户 + Input CSV)"
         print(f">>> [启动策略] 模式: {mode_str}")
         self.trader.start()
         res = self.trader.connect()
         if res != 0:
             print(f"!!! 连接失败: {res}")
-            return
-        
+            return False
+        # 订阅账户推送：CachedTrader 的持仓 / 资金缓存与 OrderIndex 的委托状态都靠这些推送保持最新
+        sub = self.trader.subscribe(self.acc)
+        if sub != 0:
+            print(f"!!! 订阅账户推送失败: {sub}，持仓 / 委托状态将依赖定时对账刷新")
+
         # 初始化持仓管理器
         self.pos_mgr = PositionManager(self.trader, self.acc)
         monitor_stocks = self.pos_mgr.get_all_positions_codes()
         self.lastest_init_stocks = set(monitor_stocks)
         self.pos_mgr.download_historical_data(monitor_stocks)
-        xtdata.subscribe_quote(BENCHMARK_INDEX, period='tick', count=1)
+        TickHub.instance().subscribe([BENCHMARK_INDEX] + list(monitor_stocks))
+        return True
 
+    def step(self):
+        """主循环的一轮：日期轮转 + 策略逻辑（回放时由 indaygridreplay.py 按 K 线逐根调用）"""
+        try:
+            self.check_date_rotation()
+            self.run_logic()
+        except Exception as e:
+            import traceback
+            print(f"!!! 全局运行异常: {e}")
+            traceback.print_exc()
+
+    def start(self):
+        if not self.prepare():
+            return
         while True:
-            try:
-                self.check_date_rotation()
-                self.run_logic()
-            except Exception as e:
-                import traceback
-                print(f"!!! 全局运行异常: {e}")
-                traceback.print_exc()
+            self.step()
             time.sleep(LOOP_INTERVAL)
 
     def run_logic(self):
@@ -571,6 +555,9 @@ class RobustStrategy:
             print("非交易时间...", end="\r")
             return
 
+        if not SIMULATION:
+            self.orders.reconcile()   # 未到对账间隔时直接返回
+
         is_crash, m_pct = self.check_benchmark_risk()
         
         # 刷新股票池
@@ -587,8 +574,8 @@ class RobustStrategy:
             return
 
         self.calculate_atr_data(stock_list)
-        for s in stock_list: xtdata.subscribe_quote(s, period='tick', count=1)
-        ticks = xtdata.get_full_tick(stock_list)
+        # 已订阅的代码由 TickHub 去重，这里只是内存读取最新快照
+        ticks = TickHub.instance().get_ticks(stock_list)
         
         # [改进] 实时获取当日额度
         daily_used = self.get_daily_buy_amount()
@@ -688,5 +675,6 @@ class RobustStrategy:
                 continue
 
 if __name__ == '__main__':
+    EventLog.setup()
     strategy = RobustStrategy()
     strategy.start()
\ No newline at end of file
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+多策略宿主启动器：在一个进程里运行多个策略插件，共用一个交易会话、TickHub、下载水位和调度器。
+
+各策略的独立账本、状态文件与单实例锁不变；插件协议与共享方式见 utils/strategyhost.py。
+
+用法：
+    python host.py                                  # DEBUG：加载全部策略，各跑一次（不报单）
+    python host.py -m REAL                          # 实盘：进入调度循环
+    python host.py -m REAL -p kj202536,kj202590     # 只加载部分策略
+"""
+
+import os
+import sys
+import argparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from utils.strategyhost import StrategyHost
+from utils.eventlog import EventLog
+
+
+class Config:
+    account_id = '47601131'                                     # 【必改】资金账号
+    qmt_path = r'D:\光大证券金阳光QMT实盘\userdata_mini'        # 【必改】极简模式路径
+    plugins = ['kj202509', 'kj202512', 'kj202536', 'kj202579', 'kj202590']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='金阳光 QMT 极简模式多策略宿主')
+    parser.add_argument('-m', '--mode', type=str, default='DEBUG', help='运行模式: REAL 或 DEBUG（默认 DEBUG）')
+    parser.add_argument('-p', '--plugins', type=str, default=','.join(Config.plugins),
+                        help='要加载的策略，逗号分隔（默认全部）')
+    args = parser.parse_args()
+    EventLog.setup(tag='[实盘]' if args.mode == 'REAL' else '[调试]')
+
+    if args.mode == 'REAL':
+        print('>>> 当前处于 [REAL 实盘模式]：所有已加载策略都将真实下单，请注意风险！')
+        DEBUG = False
+    else:
+        print('>>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。')
+        DEBUG = True
+
+    host = StrategyHost(Config.qmt_path, Config.account_id, debug=DEBUG,
+                        record_file=os.path.join(current_dir, 'host_schedule.json'))
+    try:
+        if not host.connect():
+            sys.exit(1)
+        for name in [p.strip() for p in args.plugins.split(',') if p.strip()]:
+            host.load(name)
+        if not host.plugins:
+            print('>>> 没有可运行的策略，退出。')
+            sys.exit(2)
+        print('>> 进入主事件循环，按 Ctrl+C 终止运行。')
+        host.run()
+    except KeyboardInterrupt:
+        print('\n>> 收到手动停止信号，正在断开连接退出程序...')
+    finally:
+        host.close()
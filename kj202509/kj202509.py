@@ -4,6 +4,7 @@ import os
 import time
 import datetime
 import argparse
+import logging
 import pandas as pd
 from xtquant import xtdata
 from xtquant.xttrader import XtQuantTrader, XtQuantTraderCallback
@@ -18,20 +19,38 @@ from utils.utilities import StrategyLedger, StateManager
 from utils.stockmgr import StockMgr
 from utils.marketmgr import MarketMgr
 from utils.trademgr import TradeMgr
+from utils.tickhub import TickHub
+from utils.instrumentmgr import InstrumentMgr
+from utils.scheduler import Scheduler
+from utils.ordertracker import OrderTracker
+from utils.orderexecutor import OrderExecutor
+from utils.stoploss import StopLossEngine
+from utils.eventlog import EventLog, get_logger
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 DEBUG = True
+LOG = get_logger('kj202509')
 
 # ================= 1. 交易回调类 =================
 class MyCallback(XtQuantTraderCallback):
     def on_disconnected(self):
-        print("!! 警告：与 QMT 极简模式终端连接断开 !!")
+        LOG.warning("!! 警告：与 QMT 极简模式终端连接断开 !!")
 
     def on_stock_order(self, order):
-        print(f">> 委托回报: 代码:{order.stock_code}, 状态:{order.order_status}, 报单价格:{order.price}")
+        LOG.event('order', '>> 委托回报', code=order.stock_code, status=order.order_status, price=order.price)
+        OrderTracker.instance().on_stock_order(order)
 
     def on_stock_trade(self, trade):
-        print(f">> 成交回报: 代码:{trade.stock_code}, 成交量:{trade.traded_volume}, 成交价:{trade.traded_price}")
+        LOG.event('trade', '>> 成交回报', code=trade.stock_code, volume=trade.traded_volume, price=trade.traded_price)
+        OrderTracker.instance().on_stock_trade(trade)
+
+    def on_order_error(self, order_error):
+        LOG.event('order_error', '>> 委托失败', level=logging.ERROR,
+                  order_id=order_error.order_id, reason=order_error.error_msg)
+        OrderTracker.instance().on_order_error(order_error)
+
+    def on_order_stock_async_response(self, response):
+        OrderTracker.instance().on_order_stock_async_response(response)
 
 # ================= 2. 策略核心逻辑类 =================
 class AllWeatherStrategy:
@@ -47,6 +66,7 @@ class AllWeatherStrategy:
         self.benchmark_small = '000852.SH'              # 小盘动量基准
         self.foreign_etf = ['518880.SH', '513100.SH']  # 防御外盘ETF：黄金、纳指
         self.rebalance_day = 1                         # 每月几号之后才允许调仓（自然日，首个满足条件的交易日触发）
+        self.stop_loss_pct = 0.08                      # 个股跌破成本此比例止损
 
         # --- 核心时间节点 ---
         self.stop_loss_time = "14:45:00"
@@ -66,8 +86,9 @@ class AllWeatherStrategy:
             }
         )
         self.ledger = StrategyLedger(os.path.join(_base, 'strategy_09_holdings.json'))
+        self.executor = OrderExecutor(trader, account)
 
-        print(">> 策略初始化完成，等待行情与时间触发...")
+        LOG.info(">> 策略初始化完成，等待行情与时间触发...")
 
     # --- 类型化状态属性，读写自动持久化 ---
 
@@ -124,7 +145,7 @@ class AllWeatherStrategy:
     # =========================================================
 
     def handlebar(self):
-        """每秒调用一次，按时间节点分发至各模块"""
+        """由调度器在各时间节点唤醒（DEBUG 下直接调用一次），按时间节点分发至各模块"""
         now = datetime.datetime.now(BEIJING_TZ)
         current_time = now.strftime("%H:%M:%S")
         current_date = now.strftime("%Y%m%d")
@@ -156,40 +177,40 @@ class AllWeatherStrategy:
 
     def _check_monkey_market(self, current_date):
         """模块 0：判断市场是否处于猴市，决定是否暂停策略"""
-        print(f"执行市场环境 (猴市) 巡检...")
+        LOG.info(f"执行市场环境 (猴市) 巡检...")
         if MarketMgr.is_monkey_market():
-            print(">> ⚠️ 猴市警报：当前市场处于宽幅无序震荡，极易双边打脸！")
+            LOG.warning(">> ⚠️ 猴市警报：当前市场处于宽幅无序震荡，极易双边打脸！")
             self.is_paused = True
             if self.current_style != 'DEFENSE':
-                print(">> 自动拦截：强制切换至外盘 ETF 防御模式，并挂起策略！")
+                LOG.info(">> 自动拦截：强制切换至外盘 ETF 防御模式，并挂起策略！")
                 self.current_style = 'DEFENSE'
                 self.buy_defense_etf()
         else:
             if self.is_paused:
-                print(">> ✅ 市场趋势已明朗，解除猴市预警，恢复策略运行。")
+                LOG.info(">> ✅ 市场趋势已明朗，解除猴市预警，恢复策略运行。")
             self.is_paused = False
         self.monkey_check_date = current_date
 
     def _monthly_rebalance(self, current_month):
         """模块 1：计算复合平滑动量，决定风格并调仓"""
-        print(f"执行月度动量研判与调仓...")
+        LOG.info(f"执行月度动量研判与调仓...")
         try:
             start_date = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=30)).strftime("%Y%m%d")
-            print('start download index data')
+            LOG.debug('start download index data')
             StockMgr.download_history([self.benchmark_big, self.benchmark_small], start_time=start_date, period='1d')
-            print('index data downloaded')
+            LOG.debug('index data downloaded')
             big_data = xtdata.get_market_data(['close'], [self.benchmark_big], '1d', count=21, dividend_type='front')
             small_data = xtdata.get_market_data(['close'], [self.benchmark_small], '1d', count=21, dividend_type='front')
 
             if not ('close' in big_data and 'close' in small_data and not big_data['close'].empty and not small_data['close'].empty):
-                print("!! 基准指数数据获取为空，本次月度调仓跳过，下次循环重试。")
+                LOG.warning("!! 基准指数数据获取为空，本次月度调仓跳过，下次循环重试。")
                 return
 
             big_close = big_data['close'].iloc[0]
             small_close = small_data['close'].iloc[0]
 
             if len(big_close) < 21 or len(small_close) < 21:
-                print("!! 历史数据不足21条，本次月度调仓跳过，下次循环重试。")
+                LOG.warning("!! 历史数据不足21条，本次月度调仓跳过，下次循环重试。")
                 return
 
             big_momentum = 0.5 * (big_close.iloc[-1] / big_close.iloc[-11] - 1) * 100 \
@@ -203,21 +224,21 @@ class AllWeatherStrategy:
 
             if big_momentum < 0 and small_momentum < 0:
                 self.current_style = 'DEFENSE'
-                print(">> 动量皆负，A股泥沙俱下，切换至外盘 ETF 防御模式！")
+                LOG.info(">> 动量皆负，A股泥沙俱下，切换至外盘 ETF 防御模式！")
                 self.buy_defense_etf()
             elif big_momentum >= small_momentum:
                 self.current_style = 'BIG'
-                print(">> 大盘动量占优，精选大盘白马股！")
+                LOG.info(">> 大盘动量占优，精选大盘白马股！")
                 self.buy_a_shares('BIG')
             else:
                 self.current_style = 'SMALL'
-                print(">> 小盘动量占优，精选高质微盘股！")
+                LOG.info(">> 小盘动量占优，精选高质微盘股！")
                 self.buy_a_shares('SMALL')
 
             self.monthly_adjusted_month = current_month
 
         except Exception as e:
-            print(f"!! 月度调仓异常: {e}，本月标记已锁定，不再重试，下月重新执行。")
+            LOG.error(f"!! 月度调仓异常: {e}，本月标记已锁定，不再重试，下月重新执行。")
             self.monthly_adjusted_month = current_month
 
     def _weekly_circuit_breaker(self, now, current_week):
@@ -225,7 +246,7 @@ class AllWeatherStrategy:
         if not DEBUG and now.weekday() != 4:
             return  # 非周五不执行，也不更新标记，等到周五再触发
 
-        print(f"执行周度熔断审查...")
+        LOG.info(f"执行周度熔断审查...")
         benchmark = self.benchmark_big if self.current_style == 'BIG' else self.benchmark_small
         start_date = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=30)).strftime("%Y%m%d")
         StockMgr.download_history([self.benchmark_big, self.benchmark_small], start_time=start_date, period='1d')
@@ -236,67 +257,77 @@ class AllWeatherStrategy:
             ma20 = closes.mean()
             current_price = closes.iloc[-1]
             if current_price < ma20 and self.current_style != 'DEFENSE':
-                print(f"!! 警报：{benchmark} 跌破20日均线，触发周度熔断，提前防御 !!")
+                LOG.warning(f"!! 警报：{benchmark} 跌破20日均线，触发周度熔断，提前防御 !!")
                 self.current_style = 'DEFENSE'
                 self.buy_defense_etf()
 
         self.weekly_check_week = current_week
 
     def _daily_stop_loss(self, current_date):
-        """模块 3：扫描持仓，对跌破成本8%的个股执行止损"""
-        positions = self.trader.query_stock_positions(self.account)
-        if positions:
-            for pos in positions:
-                stock = pos.stock_code
-                if not self.ledger.is_in_ledger(stock):
-                    continue
-                if pos.volume <= 0 or pos.can_use_volume <= 0:
-                    continue
-
-                xtdata.subscribe_quote(stock, period='tick', count=1)
-                tick = xtdata.get_full_tick([stock])
-                if stock not in tick:
-                    continue
-
-                current_price = tick[stock]['lastPrice']
-                cost_price = pos.open_price
-                if current_price < cost_price * 0.92:
-                    print(f"!! 止损触发 !! [{stock}] 现价 {current_price} 跌破成本 {cost_price} 达 8%")
-                    seq = -1
-                    if not DEBUG:
-                        seq = self.trader.order_stock(
-                            self.account, stock, xtconstant.STOCK_SELL,
-                            pos.can_use_volume, xtconstant.LATEST_PRICE, 0, 'strategy_stop_loss', '09: 止损卖出'
-                        )
-                    if seq != -1:
-                        self.ledger.remove(stock)
-                    print(">> 提示：止损后腾出资金空仓保留，不向下摊平。")
+        """模块 3：扫描持仓，对跌破成本8%的个股执行止损（实盘由 StopLossEngine 逐 tick 监控，这里是每日兜底）"""
+        positions = [pos for pos in self.trader.query_stock_positions(self.account) or []
+                     if self.ledger.is_in_ledger(pos.stock_code) and pos.volume > 0 and pos.can_use_volume > 0]
+        prices = TickHub.instance().prices([pos.stock_code for pos in positions])
+        legs = []
+        for pos in positions:
+            stock = pos.stock_code
+            current_price = prices.get(stock, 0)
+            if current_price <= 0:
+                continue
+
+            cost_price = pos.open_price
+            if current_price < cost_price * (1 - self.stop_loss_pct):
+                LOG.event('stoploss', '!! 止损触发 !!', level=logging.WARNING,
+                          code=stock, price=current_price, cost=cost_price, pct=self.stop_loss_pct)
+                legs.append(OrderExecutor.leg(stock, xtconstant.STOCK_SELL, pos.can_use_volume,
+                                              'strategy_stop_loss', '09: 止损卖出'))
+        for r in self._send(legs):
+            if r['ok']:
+                self.ledger.remove(r['stock_code'])
+        if legs:
+            LOG.info(">> 提示：止损后腾出资金空仓保留，不向下摊平。")
 
         self.stop_loss_date = current_date
 
+    def stoploss_exit(self, stock, volume, price, reason) -> bool:
+        """StopLossEngine 触发时的退出：与每日止损同一委托备注，报单成功即移出账本"""
+        legs = [OrderExecutor.leg(stock, xtconstant.STOCK_SELL, volume, 'strategy_stop_loss', '09: 止损卖出')]
+        ok = any(r['ok'] for r in self._send(legs))
+        if ok:
+            self.ledger.remove(stock)
+        return ok
+
+    def register_stoploss(self, engine):
+        """把账本持仓登记到实时止损引擎（跌破成本 stop_loss_pct 即卖出）"""
+        engine.register('kj202509', holdings=self.ledger.get_all, exit=self.stoploss_exit,
+                        fixed=self.stop_loss_pct)
+
     # =========================================================
     # 业务辅助方法
     # =========================================================
 
+    def _send(self, legs: list) -> list:
+        """同一份价格快照算好的一篮子委托并发发出；DEBUG 下不报单，全部视为未发出（账本不变）"""
+        if DEBUG:
+            return [dict(leg, ok=False, order_id=-1) for leg in legs]
+        return self.executor.submit(legs)
+
     def buy_defense_etf(self):
         """核心业务 1：清仓A股，等权买入外盘ETF避险"""
-        print(f">> 开始执行防御模式：清仓A股，准备买入 ETF {self.foreign_etf}")
+        LOG.info(f">> 开始执行防御模式：清仓A股，准备买入 ETF {self.foreign_etf}")
 
         # 1. 卖出本策略持有的、非目标 ETF 的持仓
         positions = self.trader.query_stock_positions(self.account)
+        legs = [
+            OrderExecutor.leg(pos.stock_code, xtconstant.STOCK_SELL, pos.can_use_volume, 'strategy_clear', '09: 清仓避险')
+            for pos in positions or []
+            if pos.can_use_volume > 0 and pos.stock_code not in self.foreign_etf and self.ledger.is_in_ledger(pos.stock_code)
+        ]
         sold_targets = {}
-        if positions:
-            for pos in positions:
-                if pos.can_use_volume > 0 and pos.stock_code not in self.foreign_etf and self.ledger.is_in_ledger(pos.stock_code):
-                    seq = -1
-                    if not DEBUG:
-                        seq = self.trader.order_stock(
-                            self.account, pos.stock_code, xtconstant.STOCK_SELL,
-                            pos.can_use_volume, xtconstant.LATEST_PRICE, 0, 'strategy_clear', '09: 清仓避险'
-                        )
-                    if seq != -1:
-                        self.ledger.remove(pos.stock_code)
-                        sold_targets[pos.stock_code] = pos.market_value
+        for r in self._send(legs):
+            if r['ok']:
+                self.ledger.remove(r['stock_code'])
+                sold_targets[r['stock_code']] = r['order_id']
 
         if not DEBUG and sold_targets:
             TradeMgr.wait_for_sells(self.trader, self.account, sold_targets, timeout=120, interval=5)
@@ -304,77 +335,68 @@ class AllWeatherStrategy:
         # 2. 获取最新可用资金
         asset = self.trader.query_stock_asset(self.account)
         if not asset:
-            print("!! 获取资产失败，放弃本次 ETF 买入 !!")
+            LOG.error("!! 获取资产失败，放弃本次 ETF 买入 !!")
             return
 
         available_cash = asset.cash
         budget = min(available_cash, self.total_budget)
-        print(f">> 当前账户可用资金: {available_cash:.2f}，本次使用预算: {budget:.2f}")
+        LOG.info(f">> 当前账户可用资金: {available_cash:.2f}，本次使用预算: {budget:.2f}")
 
         # 3. 等权买入 ETF
         if budget > 1000:
             target_value_per_etf = budget / len(self.foreign_etf)
+            etf_prices = TickHub.instance().prices(self.foreign_etf)
+            legs = []
             for etf in self.foreign_etf:
-                xtdata.subscribe_quote(etf, period='tick', count=1)
-                tick = xtdata.get_full_tick([etf])
-                if etf in tick:
-                    price = tick[etf]['lastPrice']
+                if etf in etf_prices:
+                    price = etf_prices[etf]
                     if price > 0:
                         volume = int(target_value_per_etf / price / 100) * 100
                         if volume >= 100:
-                            seq = -1
-                            if not DEBUG:
-                                seq = self.trader.order_stock(
-                                    self.account, etf, xtconstant.STOCK_BUY,
-                                    volume, xtconstant.LATEST_PRICE, 0, 'strategy_buy_etf', '09: 买入外盘ETF'
-                                )
-                            if seq != -1:
-                                self.ledger.add(etf)
-                            print(f">> 发送委托: 买入 {etf}, 数量: {volume}股, 预估耗资: {volume*price:.2f}")
+                            legs.append(OrderExecutor.leg(etf, xtconstant.STOCK_BUY, volume, 'strategy_buy_etf', '09: 买入外盘ETF'))
+                            LOG.event('buy', '>> 发送委托: 买入', code=etf, volume=volume, price=price, amount=round(volume * price, 2))
+            for r in self._send(legs):
+                if r['ok']:
+                    self.ledger.add(r['stock_code'])
 
     def buy_a_shares(self, style):
         """核心业务 2：基本面选股，剔除劣质股后等权建仓A股"""
-        print(f">> 开始执行 {style} 风格建仓逻辑...")
+        LOG.info(f">> 开始执行 {style} 风格建仓逻辑...")
 
         # 1. 获取候选股票池
         index_code = '000300.SH' if style == 'BIG' else '000852.SH'
         pool = StockMgr.query_stocks_in_sector(index_code)
         if not pool:
-            print("!! 获取板块成分股失败，请检查QMT终端左下角【数据下载】是否下载了板块数据 !!")
+            LOG.error("!! 获取板块成分股失败，请检查QMT终端左下角【数据下载】是否下载了板块数据 !!")
             return
 
         # 2. 剔除ST、退市股
-        valid_pool = [
-            code for code in pool
-            if (lambda d: d and 'ST' not in d.get('InstrumentName', '') and '退' not in d.get('InstrumentName', ''))(xtdata.get_instrument_detail(code))
-        ]
-        print(f">> 剔除ST等风险股后，候选池剩余: {len(valid_pool)} 只")
+        valid_pool = InstrumentMgr.filter_st(pool)
+        LOG.info(f">> 剔除ST等风险股后，候选池剩余: {len(valid_pool)} 只")
 
         # 3. 基本面清洗
         target_list = self._filter_fundamentals(valid_pool, style)
         if not target_list:
-            print("!! 基本面选股结果为空，放弃本次 A 股建仓，维持原状。 !!")
+            LOG.warning("!! 基本面选股结果为空，放弃本次 A 股建仓，维持原状。 !!")
             return
-        print(f">> 最终锁定强基本面标的: {target_list}")
+        LOG.info(f">> 最终锁定强基本面标的: {target_list}")
 
         # 4.1 卖出不在 target_list 中的持仓
         positions = self.trader.query_stock_positions(self.account)
         hold_codes = []
-        sold_targets = {}
+        legs = []
         if positions:
             for pos in positions:
                 if self.ledger.is_in_ledger(pos.stock_code):
                     hold_codes.append(pos.stock_code)
                 if self.ledger.is_in_ledger(pos.stock_code) and pos.stock_code not in target_list and pos.can_use_volume > 0:
-                    seq = -1
-                    if not DEBUG:
-                        seq = self.trader.order_stock(
-                            self.account, pos.stock_code, xtconstant.STOCK_SELL,
-                            pos.can_use_volume, xtconstant.LATEST_PRICE, 0, 'strategy_sell_a', '09: 不符风格卖出'
-                        )
-                    if seq != -1:
-                        self.ledger.remove(pos.stock_code)
-                        sold_targets[pos.stock_code] = pos.market_value
+                    legs.append(OrderExecutor.leg(pos.stock_code, xtconstant.STOCK_SELL, pos.can_use_volume,
+                                                  'strategy_sell_a', '09: 不符风格卖出'))
+        sold_targets = {}
+        for r in self._send(legs):
+            if r['ok']:
+                self.ledger.remove(r['stock_code'])
+                sold_targets[r['stock_code']] = r['order_id']
         if not DEBUG and sold_targets:
             TradeMgr.wait_for_sells(self.trader, self.account, sold_targets, timeout=120, interval=5)
 
@@ -389,23 +411,19 @@ class AllWeatherStrategy:
 
         if buy_targets and budget > 2000:
             cash_per_stock = budget * 0.98 / len(buy_targets)
+            target_prices = TickHub.instance().prices(buy_targets)
+            legs = []
             for code in buy_targets:
-                xtdata.subscribe_quote(code, period='tick', count=1)
-                tick = xtdata.get_full_tick([code])
-                if code in tick:
-                    price = tick[code]['lastPrice']
+                if code in target_prices:
+                    price = target_prices[code]
                     if price > 0:
                         volume = int(cash_per_stock / price / 100) * 100
                         if volume >= 100:
-                            seq = -1
-                            if not DEBUG:
-                                seq = self.trader.order_stock(
-                                    self.account, code, xtconstant.STOCK_BUY,
-                                    volume, xtconstant.LATEST_PRICE, 0, 'strategy_buy_a', f'09: 建仓{style}'
-                                )
-                            if seq != -1:
-                                self.ledger.add(code)
-                            print(f">> 发送委托: 买入 {code}, 数量: {volume}股, 预估耗资: {volume*price:.2f}")
+                            legs.append(OrderExecutor.leg(code, xtconstant.STOCK_BUY, volume, 'strategy_buy_a', f'09: 建仓{style}'))
+                            LOG.event('buy', '>> 发送委托: 买入', code=code, volume=volume, price=price, amount=round(volume * price, 2))
+            for r in self._send(legs):
+                if r['ok']:
+                    self.ledger.add(r['stock_code'])
 
     def _filter_fundamentals(self, pool, style):
         """核心防雷区：基本面清洗，解决幸存者偏差，强制校验扣非净利润"""
@@ -423,11 +441,11 @@ class AllWeatherStrategy:
                     }
 
             if not rows:
-                print(">> 警告：未能获取任何有效财务数据，请确认是否在QMT下载了财务数据！将默认返回前3只股票...")
+                LOG.warning(">> 警告：未能获取任何有效财务数据，请确认是否在QMT下载了财务数据！将默认返回前3只股票...")
                 return pool[:self.stock_num]
 
             df = pd.DataFrame.from_dict(rows, orient='index').dropna()
-            print(df.head(5))
+            LOG.debug(f"\n{df.head(5)}")
 
             if df.empty:
                 return pool[:self.stock_num]
@@ -441,25 +459,43 @@ class AllWeatherStrategy:
                 df = df[df['roe'] > 15]
                 df = df.sort_values(by='market_cap', ascending=True)
 
-            print(df.head(5))
+            LOG.debug(f"\n{df.head(5)}")
             return df.index.tolist()[:self.stock_num]
 
         except Exception as e:
-            print(f">> 基本面数据处理出错: {e}，返回默认前3只。")
+            LOG.error(f">> 基本面数据处理出错: {e}，返回默认前3只。")
             return pool[:self.stock_num]
 
 
+# 各模块时间节点：调度器只在这些时刻唤醒 handlebar，是否执行由 handlebar 内部的时间 / 状态判断决定
+def trigger_times(strategy):
+    return ("09:31:00", "09:35:00", strategy.circuit_breaker_time, strategy.stop_loss_time)
+
+
+def setup(host):
+    """StrategyHost 插件入口：共用宿主的交易会话与调度器（见 utils/strategyhost.py）"""
+    global DEBUG
+    DEBUG = host.debug
+    strategy = AllWeatherStrategy(host.trader, host.account)
+    strategy.register_stoploss(host.stoploss)
+    host.add_callback(MyCallback())
+    host.on_debug(strategy.handlebar)
+    for at in trigger_times(strategy):
+        host.scheduler.daily(f'kj202509.handlebar_{at}', at, strategy.handlebar)
+
+
 # ================= 3. 主函数执行入口 =================
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="金阳光 QMT 极简模式策略启动器")
     parser.add_argument('-m', '--mode', type=str, help='运行模式: REAL 或 DEBUG')
     args = parser.parse_args()
+    EventLog.setup(tag='[实盘]' if args.mode == 'REAL' else '[调试]')
 
     if args.mode == 'REAL':
-        print(">>> 当前处于 [REAL 实盘模式]：请注意风险！")
+        LOG.info(">>> 当前处于 [REAL 实盘模式]：请注意风险！")
         DEBUG = False
     else:
-        print(">>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。")
+        LOG.info(">>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。")
         DEBUG = True
 
     # ---------------- 必须修改的配置 ----------------
@@ -478,19 +514,29 @@ if __name__ == '__main__':
     connect_result = trader.connect()
 
     if connect_result == 0:
-        print(f'>> 极简模式连接成功，正在订阅资金账号: {account_id}')
+        LOG.info(f'>> 极简模式连接成功，正在订阅资金账号: {account_id}')
         trader.subscribe(acc)
     else:
-        print('>> 极简模式连接失败，请检查 QMT 极简模式是否开启并登录，以及路径是否正确！')
+        LOG.error('>> 极简模式连接失败，请检查 QMT 极简模式是否开启并登录，以及路径是否正确！')
         exit()
 
     strategy = AllWeatherStrategy(trader, acc)
+    stoploss = StopLossEngine(trader, acc)
+    strategy.register_stoploss(stoploss)
 
-    print(">> 进入主事件循环，按 Ctrl+C 终止运行。")
+    LOG.info(">> 进入主事件循环，按 Ctrl+C 终止运行。")
     try:
-        while True:
+        if DEBUG:
+            # DEBUG 下 handlebar 忽略时间节点与状态，所有模块跑一遍即可
             strategy.handlebar()
-            time.sleep(3)
+        else:
+            stoploss.start()        # 盘中逐 tick 止损，14:45 的日内止损作为兜底
+            # 只在各模块的时间节点唤醒 handlebar，其余时间休眠；每个节点每个交易日触发一次
+            sched = Scheduler(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategy_09_schedule.json'))
+            for at in trigger_times(strategy):
+                sched.daily(f'handlebar_{at}', at, strategy.handlebar)
+            sched.run_forever()
     except KeyboardInterrupt:
-        print("\n>> 收到手动停止信号，正在断开连接退出程序...")
+        LOG.info(">> 收到手动停止信号，正在断开连接退出程序...")
+        stoploss.stop()
         trader.stop()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+09号策略 - 实盘代码回放
+直接用 kj202509.py 中的 AllWeatherStrategy（与实盘同一份代码）在本地 BarStore 上逐日回放，
+报单由 SimTrader 按虚拟时钟下的行情撮合，不需要打开 QMT 终端。
+回放前请先用 DownloadMgr 把指数、ETF 和股票池的日线同步到 localdata/bars/。
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kj202509
+from utils.replay import ReplayRunner
+
+# ================= 可配置参数 =================
+START_DATE = '20220101'
+END_DATE   = None           # None = 本地数据的最后一天
+CASH       = 60000
+QUOTE      = 'close'        # close: 按当日收盘价撮合；open: 按开盘价撮合（盘中看不到当日收盘价）
+
+
+def main():
+    kj202509.DEBUG = False   # 走实盘分支（真实时间判断 + 报单），报单由 SimTrader 接管
+    with ReplayRunner('kj202509', START_DATE, END_DATE, cash=CASH, quote=QUOTE) as rp:
+        strategy = kj202509.AllWeatherStrategy(rp.trader, rp.account)
+        res = rp.run(strategy.handlebar)
+
+    stats = res['stats']
+    print("\n" + "=" * 30 + " 回放结果 " + "=" * 30)
+    print(f"区间: {res['nav'].index[0].date()} — {res['nav'].index[-1].date()}")
+    print(f"总收益: {stats['total_return']:.2%}  年化: {stats['ann_return']:.2%}  "
+          f"最大回撤: {stats['max_drawdown']:.2%}  夏普: {stats['sharpe']:.2f}")
+    print(f"成交 {stats['trade_count']} 笔，交易成本 {stats['total_cost']:,.2f} 元")
+    if not res['positions'].empty:
+        print(res['positions'][['stock_code', 'volume', 'avg_price', 'market_value']].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
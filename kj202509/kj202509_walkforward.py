@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+kj202509 风格切换策略 - 滚动训练 / 样本外检验
+每个检验窗口之前的 TRAIN_MONTHS 个月上并行扫描熔断均线、动量周期、猴市巡检开关与选股数量，
+取最优参数在下一窗口样本外运行，拼接所有样本外区间得到净值；最后给出截至最新交易日训练出的参数。
+选股结果在每个进程内按 (风格, 日期) 缓存，不随参数重复查询财务仓库。
+窗口结果缓存在 localdata/walkforward/kj202509/，重跑只需计算新增的窗口。
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kj202509_regression import prepare_data, backtest
+from utils.sweeprunner import SweepRunner
+from utils.walkforward import WalkForward
+
+# ================= 可配置参数 =================
+DATA_START   = '20200101'   # 滚动检验的数据起点（需覆盖第一个训练窗口）
+TEST_START   = '20230101'   # 第一个样本外窗口的起始月份
+TRAIN_MONTHS = 24           # 训练窗口长度（月）
+TEST_MONTHS  = 1            # 样本外窗口长度（月），即重新调参的频率
+ANCHORED     = False        # True: 训练窗口从数据起点开始不断扩展
+OBJECTIVE    = 'sharpe'     # sharpe / ann_return / total_return / calmar
+WORKERS      = None         # None = 全部 CPU 核心
+VERSION      = '1'          # 回测逻辑改动后修改此值，使所有窗口缓存失效
+
+PARAM_SPACE = {
+    'ma_days': [10, 20, 30],
+    'mom_long': [20, 40],
+    'monkey': [True, False],
+    'stock_num': [3, 5],
+}
+
+
+def main():
+    data = prepare_data(DATA_START)
+    params = SweepRunner.grid(PARAM_SPACE)
+    wf = WalkForward('kj202509', backtest, data, params, objective=OBJECTIVE,
+                     workers=WORKERS, version=VERSION)
+    res = wf.run(data['index'].index, TRAIN_MONTHS, TEST_MONTHS, ANCHORED, test_start=TEST_START)
+
+    stats = res['stats']
+    print("\n" + "=" * 30 + " 滚动窗口明细 " + "=" * 30)
+    print(res['windows'].to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print("=" * 74)
+    print(f"样本外区间: {res['nav'].index[0].date()} — {res['nav'].index[-1].date()}")
+    print(f"样本外总收益: {stats['total_return']:.2%}  年化: {stats['ann_return']:.2%}  "
+          f"最大回撤: {stats['max_drawdown']:.2%}  夏普: {stats['sharpe']:.2f}")
+    print(f"下月建议参数: {res['next_params']}")
+
+
+if __name__ == '__main__':
+    main()
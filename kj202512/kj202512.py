@@ -22,7 +22,6 @@ import os
 import sys
 import time
 import argparse
-import logging
 import datetime
 from datetime import timezone, timedelta
 from xtquant.xttrader import XtQuantTrader
@@ -47,12 +46,13 @@ DEBUG = (_args.mode.upper() != 'REAL')
 # ── 日志：每条消息都带模式标签，明确区分调试/实盘 ────────────────
 _MODE_TAG = '[调试]' if DEBUG else '[实盘]'
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format=f'%(asctime)s {_MODE_TAG} [%(name)s] %(levelname)s  %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-)
-LOG = logging.getLogger('kj202512-MAIN')
+from utils.eventlog import EventLog, get_logger
+from utils.timing import Timing
+
+if __name__ == '__main__':
+    # 独立运行时由本入口配置日志；作为宿主插件加载时沿用 host.py 的配置
+    EventLog.setup(level='DEBUG', tag=_MODE_TAG)
+LOG = get_logger('kj202512-MAIN')
 
 # ── 导入四个子策略类：直接按文件名 import，避免循环引用 ───────────
 # 不使用 from kj202512.kj202512_etf import … 的原因：
@@ -62,25 +62,14 @@ from kj202512_etf  import ETFStrategy
 from kj202512_pb   import PBStrategy
 from kj202512_xsz  import XSZStrategy
 from kj202512_dama import DaMaStrategy
+from kj202512_base import TraderCallback
+from utils.scheduler import Scheduler
+from utils.accountcache import CachedTrader
+from utils.stoploss import StopLossEngine
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 
 
-# ────────────────────────────────────────────────────
-# QMT 回调
-# ────────────────────────────────────────────────────
-
-class MainCallback:
-    def on_disconnected(self):
-        LOG.error("!! 与 QMT 终端连接断开，请检查极简模式是否仍在运行 !!")
-
-    def on_stock_order(self, order):
-        LOG.info(f"[委托回报] {order.stock_code}  状态:{order.order_status}  价格:{order.price}")
-
-    def on_stock_trade(self, trade):
-        LOG.info(f"[成交回报] {trade.stock_code}  数量:{trade.traded_volume}  价格:{trade.traded_price}")
-
-
 # ────────────────────────────────────────────────────
 # 主策略编排器
 # ────────────────────────────────────────────────────
@@ -95,6 +84,11 @@ class StrategyOrchestrator:
     # DEBUG 模式下每隔 N 分钟打印一次"心跳"，确认系统仍在运行
     _HEARTBEAT_INTERVAL = 10 * 60   # 10 分钟（秒）
 
+    # 各子策略时间窗口的起点：调度器只在这些时刻唤醒 handlebar，窗口判断仍由子策略自己完成
+    TRIGGER_TIMES = ('09:31:00', '09:35:00', '10:30:00', '14:00:00', '14:30:00', '14:45:00', '14:50:00')
+    # 盘前数据同步（菜场大妈的分红事件表等），调仓路径只读本地数据
+    PREPARE_TIME = '09:00:00'
+
     def __init__(self, trader: XtQuantTrader, account, debug: bool):
         self.debug = debug
         self._last_heartbeat = 0.0
@@ -124,8 +118,22 @@ class StrategyOrchestrator:
         LOG.info(f"已加载 {len(self.strategies)} 个子策略: {names}")
         LOG.info("进入事件循环...")
 
+    def register_stoploss(self, engine):
+        """启用止损的子策略（PB / 小市值 / 大妈）登记到实时止损引擎；ETF 的止损是切换国债，仍由巡检处理"""
+        for strategy in self.strategies:
+            strategy.register_stoploss(engine)
+
+    def prepare_data(self):
+        """盘前依次同步各子策略的本地数据，单个子策略失败不影响其他子策略"""
+        for strategy in self.strategies:
+            try:
+                with Timing.span(f'prepare.kj202512.{strategy.name}'):
+                    strategy.prepare_data()
+            except Exception as e:
+                LOG.exception(f"[{strategy.name}] 盘前数据同步异常: {e}")
+
     def handlebar(self):
-        """每轮循环依次驱动各子策略，对应聚宽平台的定时调度"""
+        """依次驱动各子策略，对应聚宽平台的定时调度（由调度器在 TRIGGER_TIMES 唤醒）"""
         # DEBUG 心跳：每 10 分钟提示一次当前仍处于调试模式
         if self.debug:
             now_ts = time.time()
@@ -135,12 +143,25 @@ class StrategyOrchestrator:
 
         for strategy in self.strategies:
             try:
-                strategy.handlebar()
+                with Timing.span(f'handlebar.kj202512.{strategy.name}'):
+                    strategy.handlebar()
             except Exception as e:
                 # 单个子策略异常不影响其他子策略继续运行
                 LOG.exception(f"[{strategy.name}] handlebar 异常，已跳过本轮: {e}")
 
 
+def setup(host):
+    """StrategyHost 插件入口：4 个子策略共用宿主的交易会话与调度器（见 utils/strategyhost.py）"""
+    orchestrator = StrategyOrchestrator(host.trader, host.account, debug=host.debug)
+    orchestrator.register_stoploss(host.stoploss)
+    host.add_callback(TraderCallback(LOG))
+    host.on_debug(orchestrator.prepare_data)
+    host.on_debug(orchestrator.handlebar)
+    host.scheduler.daily('kj202512.prepare_data', StrategyOrchestrator.PREPARE_TIME, orchestrator.prepare_data)
+    for at in StrategyOrchestrator.TRIGGER_TIMES:
+        host.scheduler.daily(f'kj202512.handlebar_{at}', at, orchestrator.handlebar)
+
+
 # ────────────────────────────────────────────────────
 # 主程序入口
 # ────────────────────────────────────────────────────
@@ -168,10 +189,11 @@ if __name__ == '__main__':
     # ────────────────────────────────────────────────
 
     session_id = int(time.time())
-    trader = XtQuantTrader(qmt_path, session_id)
     acc    = StockAccount(account_id)
+    # 持仓 / 资产查询由推送维护的缓存回答，止损、调仓等高频读取不再逐次走 IPC
+    trader = CachedTrader(XtQuantTrader(qmt_path, session_id), acc)
 
-    trader.register_callback(MainCallback())
+    trader.register_callback(TraderCallback(LOG))
     trader.start()
 
     if trader.connect() == 0:
@@ -182,12 +204,23 @@ if __name__ == '__main__':
         sys.exit(1)
 
     orchestrator = StrategyOrchestrator(trader, acc, debug=DEBUG)
+    stoploss = StopLossEngine(trader, acc)
+    orchestrator.register_stoploss(stoploss)
 
     LOG.info("主事件循环已启动，按 Ctrl+C 退出")
     try:
-        while True:
+        if DEBUG:
+            # DEBUG 启动时先完整跑一轮（部分子策略在 debug 下忽略时间窗口）
+            orchestrator.prepare_data()
             orchestrator.handlebar()
-            time.sleep(3)
+        else:
+            stoploss.start()        # 盘中逐 tick 止损，14:45 的止损巡检作为兜底
+        sched = Scheduler(os.path.join(current_dir, 'kj202512_schedule.json'))
+        sched.daily('prepare_data', StrategyOrchestrator.PREPARE_TIME, orchestrator.prepare_data)
+        for at in StrategyOrchestrator.TRIGGER_TIMES:
+            sched.daily(f'handlebar_{at}', at, orchestrator.handlebar)
+        sched.run_forever()
     except KeyboardInterrupt:
         LOG.info("收到停止信号，断开连接，退出程序...")
+        stoploss.stop()
         trader.stop()
@@ -13,7 +13,6 @@ import os
 import sys
 import time
 import datetime
-import logging
 import numpy as np
 import pandas as pd
 from datetime import timezone, timedelta
@@ -28,24 +27,54 @@ if parent_dir not in sys.path:
 from utils.utilities import StrategyLedger, StateManager, BlacklistManager, MessagePusher
 from utils.stockmgr import StockMgr
 from utils.trademgr import TradeMgr
+from utils.orderexecutor import OrderExecutor
+from utils.ordertracker import OrderTracker
+from utils.tickhub import TickHub
+from utils.instrumentmgr import InstrumentMgr
+from utils.financialstore import FinancialStore
+from utils.eventlog import get_logger
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 
 # ─────────────────────────────────────────────
 # 日志工具
 # ─────────────────────────────────────────────
-_LOG = logging.getLogger('kj202512-base')
+_LOG = get_logger('kj202512-base')
 
-def make_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-    if not logger.handlers:
-        logger.setLevel(logging.DEBUG)
-        fmt = logging.Formatter('%(asctime)s [%(name)s] %(levelname)s  %(message)s',
-                                datefmt='%Y-%m-%d %H:%M:%S')
-        sh = logging.StreamHandler()
-        sh.setFormatter(fmt)
-        logger.addHandler(sh)
-    return logger
+def make_logger(name: str):
+    """子策略 logger：输出经 utils.eventlog 异步写到控制台和 localdata/logs/<入口脚本名>.jsonl"""
+    return get_logger(name)
+
+
+# ─────────────────────────────────────────────
+# QMT 回调
+# ─────────────────────────────────────────────
+class TraderCallback:
+    """
+    主入口与各子策略独立运行时共用的交易回调：打印回报，并把委托应答 / 委托 / 成交 / 失败回报转发给 OrderTracker。
+    批量下单（Strategy._send → OrderExecutor）与 wait_for_sells 都依赖这些转发，缺了会等满应答超时、拿不到委托号。
+    """
+
+    def __init__(self, log=None):
+        self.log = log or _LOG
+
+    def on_disconnected(self):
+        self.log.error("!! 与 QMT 终端连接断开，请检查极简模式是否仍在运行 !!")
+
+    def on_stock_order(self, order):
+        self.log.info(f"[委托回报] {order.stock_code}  状态:{order.order_status}  价格:{order.price}")
+        OrderTracker.instance().on_stock_order(order)
+
+    def on_stock_trade(self, trade):
+        self.log.info(f"[成交回报] {trade.stock_code}  数量:{trade.traded_volume}  价格:{trade.traded_price}")
+        OrderTracker.instance().on_stock_trade(trade)
+
+    def on_order_error(self, order_error):
+        self.log.error(f"[委托失败] 委托号:{order_error.order_id}  原因:{order_error.error_msg}")
+        OrderTracker.instance().on_order_error(order_error)
+
+    def on_order_stock_async_response(self, response):
+        OrderTracker.instance().on_order_stock_async_response(response)
 
 
 # ─────────────────────────────────────────────
@@ -72,55 +101,20 @@ def _not_kcbj(code: str) -> bool:
 
 def filter_st(stock_list: list) -> list:
     """过滤 ST / *ST / 退市风险股"""
-    result = []
-    for code in stock_list:
-        d = xtdata.get_instrument_detail(code)
-        if d:
-            name = d.get('InstrumentName', '')
-            if 'ST' not in name and '退' not in name and '*' not in name:
-                result.append(code)
-    return result
+    return InstrumentMgr.filter_st(stock_list)
 
 
 def filter_new_stock(stock_list: list, min_days: int) -> list:
-    """过滤上市不足 min_days 天的次新股"""
-    today = datetime.datetime.now(BEIJING_TZ).date()
-    result = []
-    for code in stock_list:
-        d = xtdata.get_instrument_detail(code)
-        if d:
-            open_date_str = d.get('OpenDate', '')
-            if open_date_str:
-                try:
-                    open_date = datetime.datetime.strptime(str(open_date_str), '%Y%m%d').date()
-                    if (today - open_date).days >= min_days:
-                        result.append(code)
-                except Exception:
-                    result.append(code)  # 无法解析则不过滤
-    return result
+    """过滤上市不足 min_days 天的次新股（上市日期为空的一并剔除）"""
+    return InstrumentMgr.filter_new(stock_list, min_days, keep_unknown=False)
 
 
 def filter_st_and_new(stock_list: list, min_days: int) -> list:
-    """一次遍历同时过滤 ST 和次新股，减少一半 get_instrument_detail 调用"""
-    today = datetime.datetime.now(BEIJING_TZ).date()
-    result = []
-    for code in stock_list:
-        d = xtdata.get_instrument_detail(code)
-        if not d:
-            continue
-        name = d.get('InstrumentName', '')
-        if 'ST' in name or '退' in name or '*' in name:
-            continue
-        open_date_str = d.get('OpenDate', '')
-        if open_date_str:
-            try:
-                open_date = datetime.datetime.strptime(str(open_date_str), '%Y%m%d').date()
-                if (today - open_date).days < min_days:
-                    continue
-            except Exception:
-                pass
-        result.append(code)
-    return result
+    """同时过滤 ST 和次新股，两个掩码共用同一张当日合约快照"""
+    if not stock_list:
+        return []
+    mask = InstrumentMgr.st_mask(stock_list) & InstrumentMgr.new_mask(stock_list, min_days)
+    return [c for c, ok in zip(stock_list, mask) if ok]
 
 
 def filter_suspended(stock_list: list) -> list:
@@ -138,73 +132,42 @@ def filter_suspended(stock_list: list) -> list:
 
 
 def get_latest_prices(stock_list: list) -> dict:
-    """订阅并获取最新 tick 价格，返回 {code: price}，每批 5 只"""
+    """从进程内 TickHub 读取最新价格，返回 {code: price}（首次用到的代码自动订阅推送）"""
     if not stock_list:
         return {}
-    result = {}
-    batch_size = 5
-    total = len(stock_list)
-    for i in range(0, total, batch_size):
-        batch = stock_list[i:i + batch_size]
-        for code in batch:
-            xtdata.subscribe_quote(code, period='tick', count=1)
-        tick = xtdata.get_full_tick(batch)
-        result.update({code: tick[code].get('lastPrice', 0) for code in batch if code in tick})
-        done = min(i + batch_size, total)
-        print(f"获取 tick 进度：{done}/{total}")
-    return result
+    return TickHub.instance().prices(stock_list)
 
 
 def filter_limit_up(stock_list: list, holdings: list, prices: dict) -> list:
     """过滤涨停股（已持仓的保留，避免换仓选出同价股）"""
-    result = []
-    for code in stock_list:
-        if code in holdings:
-            result.append(code)
-            continue
-        d = xtdata.get_instrument_detail(code)
-        if d:
-            high_limit = d.get('UpStopPrice', 0)
-            price = prices.get(code, 0)
-            if high_limit > 0 and price >= high_limit:
-                continue  # 涨停不买
-        result.append(code)
-    return result
+    if not stock_list:
+        return []
+    hit = InstrumentMgr.limit_mask(stock_list, prices, side='up')
+    held = set(holdings)
+    return [c for c, h in zip(stock_list, hit) if c in held or not h]  # 涨停不买
 
 
 def filter_limit_down(stock_list: list, holdings: list, prices: dict) -> list:
     """过滤跌停股（已持仓的保留）"""
-    result = []
-    for code in stock_list:
-        if code in holdings:
-            result.append(code)
-            continue
-        d = xtdata.get_instrument_detail(code)
-        if d:
-            low_limit = d.get('DownStopPrice', 0)
-            price = prices.get(code, 0)
-            if low_limit > 0 and price <= low_limit:
-                continue  # 跌停不买
-        result.append(code)
-    return result
+    if not stock_list:
+        return []
+    hit = InstrumentMgr.limit_mask(stock_list, prices, side='down')
+    held = set(holdings)
+    return [c for c, h in zip(stock_list, hit) if c in held or not h]  # 跌停不买
+
 
+_FIN_STORE = FinancialStore()
 
-def get_financial_batch(stocks: list, tables: list, start_time: str) -> dict:
-    """分批调用 get_financial_data（每批 200 只），合并结果"""
+
+def get_financial_latest(stocks: list, tables: dict, start_time: str, back: int = 0) -> dict:
+    """
+    从本地时点财务仓库读取每只股票已公告的最新一期（back=1 为上一期）。
+    tables = {表名: [字段]}，返回 {表名: DataFrame(index=stocks)}；仓库每天只向 xtdata 增量同步一次。
+    """
     result = {}
-    chunk_size = 200
-    for i in range(0, len(stocks), chunk_size):
-        chunk = stocks[i:i + chunk_size]
-        try:
-            data = xtdata.get_financial_data(
-                chunk, table_list=tables,
-                start_time=start_time, report_type='announce_time'
-            )
-            result.update(data)
-        except Exception as e:
-            batch_no = i // chunk_size + 1
-            total_batches = (len(stocks) - 1) // chunk_size + 1
-            _LOG.warning(f"[get_financial_batch] 第 {batch_no}/{total_batches} 批查询失败: {e}")
+    for table, fields in tables.items():
+        _FIN_STORE.ensure(stocks, table, fields, start_time=start_time)
+        result[table] = _FIN_STORE.as_of(stocks, table, fields, back=back)
     return result
 
 
@@ -259,6 +222,7 @@ class Strategy:
         })
         self.ledger = StrategyLedger(ledger_file)
         self.pusher = MessagePusher()
+        self.executor = OrderExecutor(trader, account)
 
     # ── 状态属性 ──────────────────────────────
 
@@ -318,6 +282,11 @@ class Strategy:
     def limit_check_1450_date(self, v: str):
         self.state.set('limit_check_1450_date', v)
 
+    # ── 盘前数据同步 ──────────────────────────
+
+    def prepare_data(self):
+        """盘前同步选股用到的本地数据（由调度器在开盘前调用）；默认无事可做，需要慢速同步的子策略覆盖"""
+
     # ── 止损相关 ──────────────────────────────
 
     def _in_stoploss_silence(self) -> bool:
@@ -327,7 +296,7 @@ class Strategy:
         return (datetime.datetime.now(BEIJING_TZ).date() - sl).days < self.STOPLOSS_SILENCE_DAYS
 
     def check_stoploss(self):
-        """检查持仓是否触发止损，触发则清仓并进入静默期（静默期内仍继续巡检）"""
+        """检查持仓是否触发止损，触发则清仓并进入静默期（静默期内仍继续巡检；实盘盘中由 StopLossEngine 逐 tick 监控）"""
         if not self.use_stoploss:
             return
         positions = self.trader.query_stock_positions(self.account)
@@ -361,6 +330,26 @@ class Strategy:
                 extra_msg=f"静默期至 {(datetime.datetime.now(BEIJING_TZ) + datetime.timedelta(days=self.STOPLOSS_SILENCE_DAYS)).strftime('%Y-%m-%d')}"
             )
 
+    def register_stoploss(self, engine):
+        """启用止损的子策略把账本持仓登记到实时止损引擎（跌幅达 STOPLOSS_LEVEL 即卖出）"""
+        if self.use_stoploss:
+            engine.register(f'kj202512_{self.name}', holdings=self.ledger.get_all,
+                            exit=self._stoploss_exit, fixed=self.STOPLOSS_LEVEL)
+
+    def _stoploss_exit(self, code, volume, price, reason) -> bool:
+        """StopLossEngine 触发时的退出：与 check_stoploss 相同的清仓、静默期与推送"""
+        self.log.warning(f"[止损] {code} 盘中现价{price:.2f} 跌幅达 {self.STOPLOSS_LEVEL:.0%}（{reason}）")
+        if code not in self._sell_stocks([code], tag='止损清仓'):
+            return False
+        self.stoploss_date = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+        self.log.warning(f"[止损] 触发止损，进入 {self.STOPLOSS_SILENCE_DAYS} 天静默期")
+        self.pusher.send_strategy_report(
+            self.name,
+            sells=[f"{code} 止损卖出"],
+            extra_msg=f"静默期至 {(datetime.datetime.now(BEIJING_TZ) + datetime.timedelta(days=self.STOPLOSS_SILENCE_DAYS)).strftime('%Y-%m-%d')}"
+        )
+        return True
+
     def sell_when_limit_up_opened(self):
         """14:00 / 14:50 巡检：昨日涨停今日涨停打开则卖出"""
         positions = self.trader.query_stock_positions(self.account)
@@ -390,12 +379,11 @@ class Strategy:
             return
 
         prices = get_latest_prices(yesterday_limit_up)
+        snap = InstrumentMgr.snapshot(yesterday_limit_up)
         to_sell = []
-        for code in yesterday_limit_up:
-            d = xtdata.get_instrument_detail(code)
-            if not d:
+        for code, valid, high_lim in zip(yesterday_limit_up, snap['valid'], snap['up_stop']):
+            if not valid:
                 continue
-            high_lim = d.get('UpStopPrice', 0)
             cur = prices.get(code, 0)
             if high_lim > 0 and cur < high_lim:
                 to_sell.append(code)
@@ -407,29 +395,32 @@ class Strategy:
     # ── 通用买卖逻辑 ─────────────────────────
 
     def _sell_stocks(self, codes: list, tag: str = '卖出') -> dict:
-        """卖出指定股票列表，返回 {code: pre_sell_market_value}"""
-        
-        sold = {}
+        """卖出指定股票列表，返回 {code: 卖单委托号}（DEBUG 下不报单，委托号为 -1）"""
         positions = self.trader.query_stock_positions(self.account)
         pos_map = {p.stock_code: p for p in positions} if positions else {}
+        legs = []
         for code in codes:
             pos = pos_map.get(code)
             if pos is None or pos.can_use_volume <= 0:
                 continue
             self.log.info(f"[{tag}] → 卖出 {code}  数量:{pos.can_use_volume}  "
                           f"市值:{pos.market_value:.0f}")
-            seq = -1
-            if not self.debug:
-                seq = self.trader.order_stock(
-                    self.account, code, xtconstant.STOCK_SELL,
-                    pos.can_use_volume, xtconstant.LATEST_PRICE, 0,
-                    f'kj202512_{self.name}', tag
-                )
-            if self.debug or seq != -1:
-                self.ledger.remove(code)
-                sold[code] = pos.market_value
+            legs.append(OrderExecutor.leg(code, xtconstant.STOCK_SELL, pos.can_use_volume,
+                                          f'kj202512_{self.name}', tag))
+
+        sold = {}
+        for r in self._send(legs):
+            if r['ok']:
+                self.ledger.remove(r['stock_code'])
+                sold[r['stock_code']] = r['order_id']
         return sold
 
+    def _send(self, legs: list) -> list:
+        """并发发出一篮子委托；DEBUG 下不报单，全部视为成功（委托号 -1），账本照常更新"""
+        if self.debug:
+            return [dict(leg, ok=True, order_id=-1) for leg in legs]
+        return self.executor.submit(legs)
+
     def _buy_stocks(self, target_list: list, max_hold: int):
         """按等权买入 target_list 前 max_hold 只（扣除已持仓及其市值）"""
         positions = self.trader.query_stock_positions(self.account)
@@ -462,7 +453,9 @@ class Strategy:
         self.log.info(f"[买入] 可用现金:{asset.cash:.0f}  已持仓市值:{hold_mv:.0f}  "
                       f"剩余预算:{budget:.0f}  标的数:{len(buy_list)}  每只:{per_stock:.0f}")
 
+        # 同一份快照给所有腿定价，再一次性并发发出
         prices = get_latest_prices(buy_list)
+        legs = []
         for code in buy_list:
             price = prices.get(code, 0)
             if price <= 0:
@@ -474,15 +467,11 @@ class Strategy:
                 continue
             self.log.info(f"[买入] → {code}  价格:{price:.2f}  数量:{volume}  "
                           f"预估金额:{volume * price:.0f}")
-            seq = -1
-            if not self.debug:
-                seq = self.trader.order_stock(
-                    self.account, code, xtconstant.STOCK_BUY,
-                    volume, xtconstant.LATEST_PRICE, 0,
-                    f'kj202512_{self.name}', '调仓买入'
-                )
-            if self.debug or seq != -1:
-                self.ledger.add(code)
+            legs.append(OrderExecutor.leg(code, xtconstant.STOCK_BUY, volume, f'kj202512_{self.name}', '调仓买入'))
+
+        for r in self._send(legs):
+            if r['ok']:
+                self.ledger.add(r['stock_code'])
 
     def adjust(self, target_list: list, max_hold: int):
         """
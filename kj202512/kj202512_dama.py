@@ -27,7 +27,6 @@ import datetime
 import argparse
 import pandas as pd
 from datetime import timezone, timedelta
-from xtquant import xtdata, xtconstant
 from xtquant.xttrader import XtQuantTrader
 from xtquant.xttype import StockAccount
 
@@ -37,13 +36,17 @@ for _p in (current_dir, parent_dir):
     if _p not in sys.path:
         sys.path.insert(0, _p)
 
+from utils.eventlog import EventLog
 from kj202512_base import (
-    Strategy, make_logger, get_universe, filter_st_and_new,
+    Strategy, TraderCallback, make_logger, get_universe, filter_st_and_new,
     filter_suspended, filter_limit_up, filter_limit_down,
-    get_latest_prices, get_financial_batch, get_trading_day_of_month, BEIJING_TZ
+    get_latest_prices, get_trading_day_of_month, BEIJING_TZ
 )
+from utils.instrumentmgr import InstrumentMgr
+from utils.dividendstore import DividendStore
 
 LOG = make_logger('kj202512-DaMa')
+DIV_STORE = DividendStore()
 
 TRIGGER_TRADING_DAY = 15   # 每月第几个交易日触发调仓
 
@@ -58,6 +61,7 @@ class DaMaStrategy(Strategy):
     MAX_HOLD       = 1        # 最大持仓数
     HIGH_DIV_PCT   = 0.25     # 高股息：取全市场前 25%
     MAX_PRICE      = 18.0      # 价格上限（元）
+    DIV_REFRESH_DAYS = 7      # 分红事件表的刷新周期（天）
 
     def __init__(self, trader, account, debug: bool):
         _base = current_dir
@@ -89,20 +93,31 @@ class DaMaStrategy(Strategy):
                 LOG.info(f"===== [菜场大妈] 月度调仓（本月第 {td} 个交易日） =====")
                 self._run_monthly(month)
 
-        # 14:00 & 14:50 — 涨停打开巡检（时间段 + 日期守卫，防止 sleep(3) 漏点）
-        if self.debug or ('14:00:00' <= t < '14:03:00' and self.limit_check_14_date != today):
+        # 14:00 & 14:50 — 涨停打开巡检（到点之后、当天未做过即执行：调度顺延几分钟也不会漏掉）
+        if self.debug or ('14:00:00' <= t < '14:50:00' and self.limit_check_14_date != today):
             self.sell_when_limit_up_opened()
             self.limit_check_14_date = today
 
-        if self.debug or ('14:50:00' <= t < '14:53:00' and self.limit_check_1450_date != today):
+        if self.debug or ('14:50:00' <= t < '15:00:00' and self.limit_check_1450_date != today):
             self.sell_when_limit_up_opened()
             self.limit_check_1450_date = today
 
         # 14:45 — 止损巡检（每天一次）
-        if self.debug or (t >= '14:45:00' and t <= '14:55:00' and self.trade_date != today):
+        if self.debug or ('14:45:00' <= t < '15:00:00' and self.trade_date != today):
             self.check_stoploss()
             self.trade_date = today
 
+    # ── 盘前数据同步 ─────────────────────────
+
+    def prepare_data(self):
+        """
+        盘前增量同步分红事件表。get_divid_factors 只能逐只调用，全市场约 5000 次，
+        放在调度器的盘前任务里做，月度选股只读本地表。
+        """
+        universe = filter_st_and_new(get_universe(), 365)
+        LOG.info(f"[菜场大妈] 盘前同步分红事件表（{len(universe)} 只，刷新周期 {self.DIV_REFRESH_DAYS} 天）...")
+        DIV_STORE.ensure(universe, max_age_days=self.DIV_REFRESH_DAYS, showprogress=True)
+
     # ── 核心逻辑 ─────────────────────────────
 
     def _run_monthly(self, month: int):
@@ -141,44 +156,27 @@ class DaMaStrategy(Strategy):
         LOG.info("[菜场大妈] 获取最新价格...")
         prices = get_latest_prices(universe)
 
-        # ── Step 3: 批量财务数据（DPS + 市值）──
-        LOG.info("[菜场大妈] 批量获取财务数据（PershareIndex）...")
-        fin = get_financial_batch(universe, tables=['PershareIndex'], start_time='20230101')
-        LOG.info(f"成功获取财务数据: {len(fin)} 只")
+        # ── Step 3: 近一年每股分红（本地分红事件表，按代码分组求和）──
+        # PershareIndex 无 DPS 字段，分红来自 get_divid_factors 的 interest 列（每股现金红利）；
+        # 事件表由盘前任务 prepare_data 同步，这里只读
+        stale = DIV_STORE.stale(universe, max_age_days=self.DIV_REFRESH_DAYS)
+        if len(stale) == len(universe):
+            LOG.warning("[菜场大妈] 分红事件表尚未同步（盘前任务未运行），跳过本次选股")
+            return []
+        if stale:
+            LOG.warning(f"[菜场大妈] {len(stale)} 只代码的分红数据超过 {self.DIV_REFRESH_DAYS} 天未同步，按已有数据计算")
+        dps = DIV_STORE.ttm_dps(universe, days=365)
 
         # ── Step 4: 计算股息率，筛选前 25% ────
-        # PershareIndex 无 DPS 字段，用 get_divid_factors 逐只取近一年现金红利
-        # get_divid_factors(code) 返回 DataFrame，index 为除权日，interest 列为每股现金红利
-        cutoff = (datetime.date.today() - datetime.timedelta(days=365)).strftime('%Y%m%d')
-        total = len(universe)
-
-        div_rows = []
-        for idx, code in enumerate(universe):
-            dps, div_yield = 0.0, 0.0
-            try:
-                dd = xtdata.get_divid_factors(code)
-                if dd is not None and not dd.empty and 'interest' in dd.columns:
-                    recent = dd[dd.index >= cutoff]
-                    dps = float(recent['interest'].dropna().sum())
-            except Exception:
-                pass
-
-            price = prices.get(code, 0)
-            if dps > 0 and price > 0:
-                div_yield = dps / price
-                div_rows.append({'code': code, 'div_yield': div_yield})
-
-            if (idx + 1) % 5 == 0 or (idx + 1) == total:
-                if div_yield > 0:
-                    print(f"[{idx+1}/{total}] {code}  dps={dps:.4f}  yield={div_yield:.4%}")
-                else:
-                    print(f"[{idx+1}/{total}] {code}  无分红")
+        price = pd.Series(prices, dtype=float).reindex(universe).fillna(0)
+        valid = (dps > 0) & (price > 0)
+        df_div = pd.DataFrame({'div_yield': dps[valid] / price[valid]})
+        LOG.info(f"[菜场大妈] 有分红股票: {len(df_div)} / {len(universe)} 只")
 
-        if not div_rows:
+        if df_div.empty:
             LOG.warning("[菜场大妈] 无有效股息率数据，跳过")
             return []
 
-        df_div = pd.DataFrame(div_rows).set_index('code')
         df_div = df_div.sort_values('div_yield', ascending=False)
         top_n  = max(1, int(self.HIGH_DIV_PCT * len(df_div)))
         high_div_codes = list(df_div.index[:top_n])
@@ -222,38 +220,19 @@ class DaMaStrategy(Strategy):
 
     def _get_market_caps(self, codes: list, prices: dict) -> dict:
         """估算市值 = 当前价 × 总股本"""
-        caps = {}
-        for code in codes:
-            price = prices.get(code, 0)
-            if price <= 0:
-                caps[code] = float('inf')
-                continue
-            d = xtdata.get_instrument_detail(code)
-            total_shares = d.get('TotalVolume', 0) if d else 0
-            caps[code] = price * total_shares if total_shares > 0 else float('inf')
-        return caps
+        return InstrumentMgr.market_caps(codes, prices)
 
 
 # ────────────────────────────────────────────────────
 # 主程序入口
 # ────────────────────────────────────────────────────
 
-class MyCallback:
-    def on_disconnected(self):
-        LOG.error("!! 与 QMT 终端连接断开 !!")
-
-    def on_stock_order(self, order):
-        LOG.info(f"委托回报: {order.stock_code} 状态:{order.order_status} 价格:{order.price}")
-
-    def on_stock_trade(self, trade):
-        LOG.info(f"成交回报: {trade.stock_code} 数量:{trade.traded_volume} 价格:{trade.traded_price}")
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='kj202512 菜场大妈高股息子策略')
     parser.add_argument('-m', '--mode', type=str, default='DEBUG',
                         help='运行模式: REAL 或 DEBUG（默认DEBUG）')
     args = parser.parse_args()
+    EventLog.setup(level='DEBUG', tag='[实盘]' if args.mode.upper() == 'REAL' else '[调试]')
     DEBUG = True
 
     if args.mode.upper() == 'REAL':
@@ -271,7 +250,7 @@ if __name__ == '__main__':
     trader = XtQuantTrader(qmt_path, session_id)
     acc = StockAccount(account_id)
 
-    cb = MyCallback()
+    cb = TraderCallback(LOG)
     trader.register_callback(cb)
     trader.start()
 
@@ -283,6 +262,7 @@ if __name__ == '__main__':
         sys.exit(1)
 
     strategy = DaMaStrategy(trader, acc, debug=DEBUG)
+    strategy.prepare_data()
 
     LOG.info("进入主事件循环，Ctrl+C 退出")
     try:
@@ -25,12 +25,11 @@ kj202512_etf.py — ETF 轮动子策略（独立运行）
 
 import os
 import sys
-import math
 import time
 import datetime
 import argparse
 import numpy as np
-from scipy import stats
+import pandas as pd
 from datetime import timezone, timedelta
 from xtquant import xtdata, xtconstant
 from xtquant.xttrader import XtQuantTrader
@@ -42,10 +41,13 @@ for _p in (current_dir, parent_dir):
     if _p not in sys.path:
         sys.path.insert(0, _p)
 
+from utils.eventlog import EventLog
 from kj202512_base import (
-    Strategy, make_logger, get_latest_prices, BEIJING_TZ
+    Strategy, TraderCallback, make_logger, get_latest_prices, BEIJING_TZ
 )
 from utils.stockmgr import StockMgr
+from utils.rsrs import RSRS
+from utils.momentum import Momentum
 
 LOG = make_logger('kj202512-ETF')
 DEBUG = True
@@ -110,12 +112,12 @@ class ETFStrategy(Strategy):
             self._run_daily(today)
 
         # 14:30 — ETF 止损巡检（日期守卫，每天只查一次）
-        if (self.debug or '14:30:00' <= t < '14:33:00') and self.limit_check_14_date != today:
+        if (self.debug or '14:30:00' <= t < '15:00:00') and self.limit_check_14_date != today:
             self._check_etf_stoploss()
             self.limit_check_14_date = today
 
-        # 14:50 — 涨停打开巡检（日期守卫，防止 3 秒轮询重复触发）
-        if (self.debug or '14:50:00' <= t < '14:53:00') and self.limit_check_1450_date != today:
+        # 14:50 — 涨停打开巡检（到点之后、当天未做过即执行，日期守卫防止重复触发）
+        if (self.debug or '14:50:00' <= t < '15:00:00') and self.limit_check_1450_date != today:
             self.sell_when_limit_up_opened()
             self.limit_check_1450_date = today
 
@@ -198,12 +200,9 @@ class ETFStrategy(Strategy):
                       - datetime.timedelta(days=(self.RSRS_M + self.RSRS_N) * 2)).strftime('%Y%m%d')
         StockMgr.download_history(self.ETF_POOL, start_time=start_rsrs, period='1d')
 
-        scores = {}
-        for etf in self.ETF_POOL:
-            score = self._calc_score(etf)
-            if score is not None:
-                scores[etf] = score
-                LOG.info(f"  {etf} 动量分数: {score:.4f}")
+        scores = self._calc_scores(self.ETF_POOL)
+        for etf, score in scores.items():
+            LOG.info(f"  {etf} 动量分数: {score:.4f}")
 
         if not scores:
             LOG.warning("[ETF轮动] 所有ETF分数计算失败，返回空列表")
@@ -222,9 +221,10 @@ class ETFStrategy(Strategy):
 
         # RSRS 过滤（国债 511010.SH 免于 RSRS 检测，作为防御保底）
         BOND_ETF = '511010.SH'
+        rsrs_passed = self._rsrs_filter([e for e in ranked if e != BOND_ETF])
         filtered = []
         for etf in ranked:
-            if etf == BOND_ETF or self._rsrs_pass(etf):
+            if etf == BOND_ETF or rsrs_passed.get(etf, True):
                 filtered.append(etf)
             else:
                 LOG.info(f"  {etf} RSRS 不通过，排除")
@@ -237,95 +237,73 @@ class ETFStrategy(Strategy):
 
         return filtered
 
-    def _calc_score(self, etf: str) -> float | None:
-        """计算单只 ETF 的复合动量分数（双周期加权 + 长期反转惩罚）"""
+    def _calc_scores(self, etfs: list) -> dict:
+        """整个 ETF 池一次计算复合动量分数（双周期加权 + 长期反转惩罚），数据不足的 ETF 不出现在结果中"""
         try:
-            data_l = xtdata.get_market_data_ex(['close'], [etf], period='1d',
-                                                count=self.L_DAYS)
-            if etf not in data_l or data_l[etf]['close'].empty:
-                return None
-            all_closes = np.log(data_l[etf]['close'].values.astype(float))
-            if len(all_closes) < self.L_DAYS:
-                return None
-
-            def _momentum(closes):
-                x = np.arange(len(closes))
-                slope, intercept, _, _, _ = stats.linregress(x, closes)
-                ann_ret = math.pow(math.exp(slope), 250) - 1
-                y_hat = slope * x + intercept
-                ss_res = np.sum((closes - y_hat) ** 2)
-                ss_tot = np.var(closes, ddof=1) * (len(closes) - 1)
-                r2 = 1 - ss_res / ss_tot if ss_tot > 0 else 0
-                return ann_ret * r2
+            data_l = xtdata.get_market_data_ex(['close'], etfs, period='1d', count=self.L_DAYS)
+            closes = Momentum.stack_tail({e: data_l[e]['close'].values for e in etfs if e in data_l},
+                                         self.L_DAYS)
+            if closes.empty:
+                return {}
 
             # 短期（25日）× 0.6 + 中期（60日）× 0.4
-            score_short = _momentum(all_closes[-self.M_DAYS:])
-            score_mid   = _momentum(all_closes[-self.MID_DAYS:])
+            score_short = Momentum.latest(closes, self.M_DAYS)['score']
+            score_mid   = Momentum.latest(closes, self.MID_DAYS)['score']
             score = 0.6 * score_short + 0.4 * score_mid
 
             # 长期（200日）反转惩罚 × 1/6
-            score -= _momentum(all_closes) / 6
+            score -= Momentum.latest(closes, self.L_DAYS)['score'] / 6
 
-            LOG.debug(f"  {etf} score_25d={score_short:.4f} score_60d={score_mid:.4f} "
-                      f"final={score:.4f}")
-            return score
+            for etf in score.index:
+                LOG.debug(f"  {etf} score_25d={score_short[etf]:.4f} score_60d={score_mid[etf]:.4f} "
+                          f"final={score[etf]:.4f}")
+            return {etf: float(v) for etf, v in score.dropna().items()}
 
         except Exception as e:
-            LOG.warning(f"[ETF分数] {etf} 计算异常: {e}")
-            return None
+            LOG.warning(f"[ETF分数] 计算异常: {e}")
+            return {}
 
-    def _rsrs_pass(self, etf: str) -> bool:
-        """RSRS 择时：当前 18 日斜率 > (历史均值 - 0.5σ)"""
+    def _rsrs_filter(self, etfs: list) -> dict:
+        """RSRS 择时：当前 18 日斜率 > (历史均值 - 0.5σ)，整个 ETF 池一次向量化计算，返回 {etf: 是否通过}"""
+        if not etfs:
+            return {}
         try:
             total = self.RSRS_N + self.RSRS_M
-            data = xtdata.get_market_data_ex(['high', 'low'], [etf], period='1d', count=total)
-            if etf not in data:
-                return True  # 数据不足时放行
-            df = data[etf]
-            highs = df['high'].values.astype(float)
-            lows  = df['low'].values.astype(float)
-            if len(highs) < self.RSRS_N + 2:
-                return True
-
-            slopes = []
-            for i in range(len(highs) - self.RSRS_N + 1):
-                s, _, _, _, _ = stats.linregress(lows[i:i + self.RSRS_N],
-                                                  highs[i:i + self.RSRS_N])
-                slopes.append(s)
-
-            current_slope = slopes[-1]
-            history = slopes[:-1]
-            threshold = np.mean(history) - 0.5 * np.std(history)
-            result = current_slope > threshold
-            LOG.info(f"  {etf} RSRS slope={current_slope:.4f}  threshold={threshold:.4f}  "
-                     f"通过={'✓' if result else '✗'}")
+            data = xtdata.get_market_data_ex(['high', 'low'], etfs, period='1d', count=total)
+            # 数据不足的 ETF 默认放行
+            result = {etf: True for etf in etfs}
+            codes = [e for e in etfs if e in data and len(data[e]) >= self.RSRS_N + 2]
+            if not codes:
+                return result
+
+            highs = pd.DataFrame({e: data[e]['high'] for e in codes}).astype(float)
+            lows  = pd.DataFrame({e: data[e]['low'] for e in codes}).astype(float)
+            current, mean, std = RSRS.latest(highs.values, lows.values, self.RSRS_N, self.RSRS_M)
+
+            for i, etf in enumerate(codes):
+                if np.isnan(current[i]):
+                    continue
+                threshold = mean[i] - 0.5 * std[i]
+                result[etf] = bool(current[i] > threshold)
+                LOG.info(f"  {etf} RSRS slope={current[i]:.4f}  threshold={threshold:.4f}  "
+                         f"通过={'✓' if result[etf] else '✗'}")
             return result
 
         except Exception as e:
-            LOG.warning(f"[RSRS] {etf} 计算异常: {e}，默认放行")
-            return True
+            LOG.warning(f"[RSRS] 计算异常: {e}，默认放行")
+            return {etf: True for etf in etfs}
 
 
 # ────────────────────────────────────────────────────
 # 主程序入口
 # ────────────────────────────────────────────────────
 
-class MyCallback:
-    def on_disconnected(self):
-        LOG.error("!! 与 QMT 终端连接断开 !!")
-
-    def on_stock_order(self, order):
-        LOG.info(f"委托回报: {order.stock_code} 状态:{order.order_status} 价格:{order.price}")
-
-    def on_stock_trade(self, trade):
-        LOG.info(f"成交回报: {trade.stock_code} 数量:{trade.traded_volume} 价格:{trade.traded_price}")
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='kj202512 ETF轮动子策略')
     parser.add_argument('-m', '--mode', type=str, default='DEBUG',
                         help='运行模式: REAL 或 DEBUG（默认DEBUG）')
     args = parser.parse_args()
+    EventLog.setup(level='DEBUG', tag='[实盘]' if args.mode.upper() == 'REAL' else '[调试]')
 
     if args.mode.upper() == 'REAL':
         LOG.info(">>> [实盘模式] 注意风险！")
@@ -342,7 +320,7 @@ if __name__ == '__main__':
     trader = XtQuantTrader(qmt_path, session_id)
     acc = StockAccount(account_id)
 
-    cb = MyCallback()
+    cb = TraderCallback(LOG)
     trader.register_callback(cb)
     trader.start()
 
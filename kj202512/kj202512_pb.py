@@ -23,8 +23,9 @@ import sys
 import time
 import datetime
 import argparse
+import numpy as np
+import pandas as pd
 from datetime import timezone, timedelta
-from xtquant import xtdata, xtconstant
 from xtquant.xttrader import XtQuantTrader
 from xtquant.xttype import StockAccount
 
@@ -34,26 +35,22 @@ for _p in (current_dir, parent_dir):
     if _p not in sys.path:
         sys.path.insert(0, _p)
 
+from utils.eventlog import EventLog
 from kj202512_base import (
-    Strategy, make_logger, get_universe, filter_st,
+    Strategy, TraderCallback, make_logger, get_universe, filter_st,
     filter_suspended, filter_new_stock, filter_limit_up, filter_limit_down,
-    get_latest_prices, get_financial_batch, BEIJING_TZ
+    get_latest_prices, get_financial_latest, BEIJING_TZ
 )
+from utils.instrumentmgr import InstrumentMgr
 
 LOG = make_logger('kj202512-PB')
 DEBUG = True
 
 def _filter_finance(stock_list: list) -> list:
     """排除银行、证券、保险、信托等金融行业（其 PB<1 是行业常态，无选股意义）"""
-    result = []
-    for code in stock_list:
-        d = xtdata.get_instrument_detail(code)
-        if d:
-            name = d.get('InstrumentName', '')
-            if any(kw in name for kw in ('银行', '证券', '保险', '信托', '期货')):
-                continue
-        result.append(code)
-    return result
+    names = InstrumentMgr.names(stock_list, default='')
+    return [code for code in stock_list
+            if not any(kw in names[code] for kw in ('银行', '证券', '保险', '信托', '期货'))]
 
 
 # ────────────────────────────────────────────────────
@@ -103,17 +100,17 @@ class PBStrategy(Strategy):
             LOG.info("===== [PB策略] 月度调仓 =====")
             self._run_monthly(month)
 
-        # 14:00 & 14:50 — 涨停打开巡检（时间段 + 日期守卫，防止 sleep(3) 跳过）
-        if '14:00:00' <= t < '14:03:00' and self.limit_check_14_date != today:
+        # 14:00 & 14:50 — 涨停打开巡检（到点之后、当天未做过即执行：调度顺延几分钟也不会漏掉）
+        if '14:00:00' <= t < '14:50:00' and self.limit_check_14_date != today:
             self.sell_when_limit_up_opened()
             self.limit_check_14_date = today
 
-        if '14:50:00' <= t < '14:53:00' and self.limit_check_1450_date != today:
+        if '14:50:00' <= t < '15:00:00' and self.limit_check_1450_date != today:
             self.sell_when_limit_up_opened()
             self.limit_check_1450_date = today
 
         # 14:45 — 止损巡检
-        if t >= '14:45:00' and t <= '14:55:00' and self.trade_date != today:
+        if '14:45:00' <= t < '15:00:00' and self.trade_date != today:
             self.check_stoploss()
             self.trade_date = today  # 止损检查每天一次
 
@@ -153,79 +150,42 @@ class PBStrategy(Strategy):
             return []
 
         # ── Step 2: 财务数据过滤 ──────────────
-        LOG.info("[PB策略] 批量获取财务数据（PershareIndex / Income）...")
+        LOG.info("[PB策略] 同步财务数据仓库（PershareIndex / Income）...")
         fin_start = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=730)).strftime('%Y%m%d')
-        fin = get_financial_batch(
-            universe,
-            tables=['PershareIndex', 'Income'],
-            start_time=fin_start
-        )
-        LOG.info(f"成功获取财务数据: {len(fin)} 只")
+        fin = get_financial_latest(universe, {
+            'PershareIndex': ['equity_roe', 's_fa_eps_basic', 's_fa_bps'],
+            'Income':        ['net_profit_incl_min_int_inc_after'],
+        }, start_time=fin_start)
+        inc_prev = get_financial_latest(universe, {'Income': ['net_profit_incl_min_int_inc_after']},
+                                        start_time=fin_start, back=1)['Income']
+        ps, inc = fin['PershareIndex'], fin['Income']
+        LOG.info(f"成功获取财务数据: {int(((ps['ann_date'] > 0) & (inc['ann_date'] > 0)).sum())} 只")
 
         # 获取最新价格（用于计算 PB）
         LOG.info("[PB策略] 获取最新价格...")
         prices = get_latest_prices(universe)
-
-        candidates = []
-        for code in universe:
-            try:
-                stock_fin = fin.get(code)
-                if not stock_fin:
-                    continue
-
-                pershare = stock_fin.get('PershareIndex')
-                income   = stock_fin.get('Income')
-                if pershare is None or income is None:
-                    continue
-                if pershare.empty or income.empty:
-                    continue
-
-                last_ps = pershare.iloc[-1]
-                last_in = income.iloc[-1]
-
-                # ROE（代替 ROA，xtquant 财务数据中 ROA 无直接字段）
-                roe = last_ps.get('equity_roe', None)
-                if roe is None or roe <= 15:
-                    continue
-
-                # EPS > 0
-                eps = last_ps.get('s_fa_eps_basic', None)
-                if eps is None or eps <= 0:
-                    continue
-
-                # 账面价值（BPS）
-                bps = last_ps.get('s_fa_bps', None)
-                if bps is None or bps <= 0:
-                    continue
-
-                # PB 计算
-                price = prices.get(code, 0)
-                if price <= 0:
-                    continue
-                pb = price / bps
-                if pb >= 0.98:
-                    continue
-
-                # 经营性现金流 > 0（用净利润替代，xtquant Income 表字段）
-                net_profit = last_in.get('net_profit_incl_min_int_inc_after', None)
-                if net_profit is None or net_profit <= 0:
-                    continue
-
-                # 营业利润同比 > 0（比较最近两期）
-                if len(income) >= 2:
-                    prev_profit = income.iloc[-2].get('net_profit_incl_min_int_inc_after', 0)
-                    if prev_profit <= 0 or net_profit <= prev_profit:
-                        continue
-
-                candidates.append({
-                    'code': code,
-                    'pb':   pb,
-                    'roe':  roe,
-                    'eps':  eps,
-                })
-
-            except Exception:
-                continue
+        price = pd.Series(prices, dtype=float).reindex(universe).fillna(0)
+
+        roe, eps, bps = ps['equity_roe'], ps['s_fa_eps_basic'], ps['s_fa_bps']
+        net_profit  = inc['net_profit_incl_min_int_inc_after']
+        prev_profit = inc_prev['net_profit_incl_min_int_inc_after'].fillna(0)
+        with np.errstate(all='ignore'):
+            pb = price / bps
+
+        mask = (
+            (ps['ann_date'] > 0) & (inc['ann_date'] > 0)
+            & (roe > 15)                      # ROE（代替 ROA，xtquant 财务数据中 ROA 无直接字段）
+            & (eps > 0)                       # EPS > 0
+            & (bps > 0) & (price > 0)         # 账面价值（BPS）与现价有效
+            & (pb < 0.98)                     # 破净
+            & (net_profit > 0)                # 经营性现金流 > 0（用净利润替代，xtquant Income 表字段）
+            # 营业利润同比 > 0（比较最近两期；只有一期数据时不检查）
+            & ((inc_prev['ann_date'] <= 0) | ((prev_profit > 0) & (net_profit > prev_profit)))
+        )
+        candidates = [
+            {'code': code, 'pb': pb[code], 'roe': roe[code], 'eps': eps[code]}
+            for code in mask.index[mask.to_numpy()]
+        ]
 
         LOG.info(f"[PB策略] 通过财务过滤: {len(candidates)} 只")
 
@@ -258,22 +218,12 @@ class PBStrategy(Strategy):
 # 主程序入口
 # ────────────────────────────────────────────────────
 
-class MyCallback:
-    def on_disconnected(self):
-        LOG.error("!! 与 QMT 终端连接断开 !!")
-
-    def on_stock_order(self, order):
-        LOG.info(f"委托回报: {order.stock_code} 状态:{order.order_status} 价格:{order.price}")
-
-    def on_stock_trade(self, trade):
-        LOG.info(f"成交回报: {trade.stock_code} 数量:{trade.traded_volume} 价格:{trade.traded_price}")
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='kj202512 PB低估值子策略')
     parser.add_argument('-m', '--mode', type=str, default='DEBUG',
                         help='运行模式: REAL 或 DEBUG（默认DEBUG）')
     args = parser.parse_args()
+    EventLog.setup(level='DEBUG', tag='[实盘]' if args.mode.upper() == 'REAL' else '[调试]')
 
     if args.mode.upper() == 'REAL':
         LOG.info(">>> [实盘模式] 注意风险！")
@@ -290,7 +240,7 @@ if __name__ == '__main__':
     trader = XtQuantTrader(qmt_path, session_id)
     acc = StockAccount(account_id)
 
-    cb = MyCallback()
+    cb = TraderCallback(LOG)
     trader.register_callback(cb)
     trader.start()
 
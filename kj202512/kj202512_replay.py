@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+kj202512_replay.py — 多策略分仓实盘代码回放
+
+直接用 kj202512.py 中的 StrategyOrchestrator（与实盘同一份 ETF / PB / 小市值 / 菜场大妈子策略代码）
+在本地 BarStore 上逐日回放：SimTrader 接管报单与持仓查询，各子策略的 state / ledger 文件
+写在 localdata/replay/kj202512/，不会改动实盘的 *_state.json / *_holdings.json。
+
+PB / 小市值 / 菜场大妈依赖财报与分红数据，回放前请先同步 FinancialStore / DividendStore，
+以及 InstrumentMgr 的合约快照（ST、上市日期等过滤要用）。
+
+运行方式：
+  python kj202512_replay.py
+"""
+
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir  = os.path.dirname(current_dir)
+for _p in (current_dir, parent_dir):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+import kj202512
+from utils.replay import ReplayRunner
+
+# ── 回放参数 ──────────────────────────────────────────
+START_DATE = '20220101'
+END_DATE   = None       # None = 本地数据的最后一天
+CASH       = 80000      # 与四个子策略的预算合计一致
+# ────────────────────────────────────────────────────
+
+
+def main():
+    with ReplayRunner('kj202512', START_DATE, END_DATE, cash=CASH) as rp:
+        # debug=False：走实盘分支（时间窗口、冷却期、日期守卫全部生效），报单由 SimTrader 接管
+        orchestrator = kj202512.StrategyOrchestrator(rp.trader, rp.account, debug=False)
+        res = rp.run(orchestrator.handlebar)
+
+    stats = res['stats']
+    print("\n" + "=" * 30 + " 回放结果 " + "=" * 30)
+    print(f"区间: {res['nav'].index[0].date()} — {res['nav'].index[-1].date()}")
+    print(f"总收益: {stats['total_return']:.2%}  年化: {stats['ann_return']:.2%}  "
+          f"最大回撤: {stats['max_drawdown']:.2%}  夏普: {stats['sharpe']:.2f}")
+    print(f"成交 {stats['trade_count']} 笔，交易成本 {stats['total_cost']:,.2f} 元")
+    if not res['trades'].empty:
+        print("\n各子策略成交笔数:")
+        print(res['trades'].groupby('strategy_name').size().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -56,12 +56,14 @@ for _p in (current_dir, parent_dir):
     if _p not in sys.path:
         sys.path.insert(0, _p)
 
+from utils.eventlog import EventLog
 from kj202512_base import (
-    Strategy, make_logger, get_universe, filter_st_and_new,
+    Strategy, TraderCallback, make_logger, get_universe, filter_st_and_new,
     filter_suspended, filter_limit_up, filter_limit_down,
-    get_latest_prices, get_financial_batch, BEIJING_TZ
+    get_latest_prices, get_financial_latest, BEIJING_TZ
 )
-from utils.stockmgr import StockMgr
+from utils.downloadmgr import DownloadMgr
+from utils.instrumentmgr import InstrumentMgr
 
 LOG = make_logger('kj202512-XSZ')
 DEBUG = True
@@ -106,7 +108,7 @@ class XSZStrategy(Strategy):
         wday  = now.weekday()  # 0=周一
 
         # 09:31 — 空仓月检查（若当月为 4 月且有仓位则清仓）
-        if t >= '09:31:00' and t <= '09:34:00' and month in EMPTY_MONTHS:
+        if '09:31:00' <= t < '15:00:00' and month in EMPTY_MONTHS:      # 本月已清仓由 _close_for_empty_month 自己防重入
             self._close_for_empty_month()
 
         # 09:35 — 周一选股调仓（非空仓月、非止损静默期）
@@ -118,18 +120,18 @@ class XSZStrategy(Strategy):
             LOG.info("===== [小市值] 每周调仓 =====")
             self._run_weekly(week)
 
-        # 14:00 — 涨停打开巡检（第一次）
-        if '14:00:00' <= t <= '14:02:00' and self.limit_check_14_date != today:
+        # 14:00 — 涨停打开巡检（第一次；到点之后、当天未做过即执行，调度顺延也不会漏掉）
+        if '14:00:00' <= t < '14:50:00' and self.limit_check_14_date != today:
             self.sell_when_limit_up_opened()
             self.limit_check_14_date = today
 
         # 14:50 — 涨停打开巡检（第二次）
-        if '14:50:00' <= t <= '14:52:00' and self.limit_check_1450_date != today:
+        if '14:50:00' <= t < '15:00:00' and self.limit_check_1450_date != today:
             self.sell_when_limit_up_opened()
             self.limit_check_1450_date = today
 
         # 14:45 — 止损巡检（每天一次）
-        if t >= '14:45:00' and t <= '14:55:00' and self.trade_date != today:
+        if '14:45:00' <= t < '15:00:00' and self.trade_date != today:
             self.check_stoploss()
             self.trade_date = today
 
@@ -177,17 +179,20 @@ class XSZStrategy(Strategy):
             LOG.warning("[小市值] 候选股不足 50，跳过调仓")
             return []
 
-        # ── Step 2: 批量财务数据 ──────────────
-        LOG.info("[小市值] 批量获取财务数据...")
-        fin = get_financial_batch(
-            universe,
-            tables=['PershareIndex', 'Income', 'Balance'],
-            start_time='20230101'
-        )
+        # ── Step 2: 财务数据（本地时点仓库，最新一期 + 上一期）──
+        LOG.info("[小市值] 同步财务数据仓库...")
+        fin_start = '20230101'
+        fin = get_financial_latest(universe, {
+            'PershareIndex': ['equity_roe', 's_fa_eps_basic'],
+            'Income':        ['net_profit_incl_min_int_inc_after', 'total_operating_revenue'],
+            'Balance':       ['total_liab', 'total_assets'],
+        }, start_time=fin_start)
+        inc_prev = get_financial_latest(universe, {'Income': ['net_profit_incl_min_int_inc_after']},
+                                        start_time=fin_start, back=1)['Income']
 
         # ── Step 2b: 批量获取252日价格动量 ───────
         LOG.info("[小市值] 批量获取价格动量数据（252日）...")
-        StockMgr.download_history(universe, start_time='20240601', period='1d')
+        DownloadMgr.download(universe, start_time='20240601', period='1d')
         price_data = xtdata.get_market_data_ex(['close'], universe, period='1d', count=253)
         price_mom_map = {}
         for code in universe:
@@ -203,70 +208,35 @@ class XSZStrategy(Strategy):
                 continue
         LOG.info(f"[小市值] 获得价格动量数据: {len(price_mom_map)} 只")
 
-        # ── Step 3: 构建因子 DataFrame ────────
-        rows = {}
-        for code in universe:
-            try:
-                stock_fin = fin.get(code)
-                if not stock_fin:
-                    continue
-                ps = stock_fin.get('PershareIndex')
-                inc = stock_fin.get('Income')
-                bal = stock_fin.get('Balance')
-                if ps is None or inc is None or ps.empty or inc.empty:
-                    continue
-
-                last_ps  = ps.iloc[-1]
-                last_inc = inc.iloc[-1]
-
-                roe = last_ps.get('equity_roe', None)
-                eps = last_ps.get('s_fa_eps_basic', None)
-                if roe is None or eps is None:
-                    continue
-
-                net_profit = last_inc.get('net_profit_incl_min_int_inc_after', 0) or 0
-                revenue    = last_inc.get('total_operating_revenue', 1) or 1
-                net_margin = net_profit / revenue if revenue != 0 else 0
-
-                # 负债率（D/A）
-                da_ratio = 0.5
-                if bal is not None and not bal.empty:
-                    last_bal  = bal.iloc[-1]
-                    total_liab   = last_bal.get('total_liab', None)
-                    total_assets = last_bal.get('total_assets', None)
-                    if total_liab is not None and total_assets and total_assets > 0:
-                        da_ratio = total_liab / total_assets
-
-                # 净利润同比增速（处理由亏转盈/持续亏损情形）
-                profit_growth = 0.0
-                if len(inc) >= 2:
-                    prev_profit = inc.iloc[-2].get('net_profit_incl_min_int_inc_after', 0) or 0
-                    if prev_profit > 0:
-                        profit_growth = (net_profit - prev_profit) / abs(prev_profit)
-                    elif net_profit > 0:
-                        profit_growth = 1.0   # 由亏转盈，视作高增速
-                    else:
-                        profit_growth = -0.5  # 持续亏损，视作负增速
-
-                # 价格动量（252日收益率，反转效应：负值/低值更好）
-                price_mom = price_mom_map.get(code, np.nan)
-
-                rows[code] = {
-                    'roe':          roe,
-                    'eps':          eps,
-                    'net_margin':   net_margin,
-                    'da_ratio':     da_ratio,
-                    'profit_growth': profit_growth,
-                    'price_mom':    price_mom,
-                }
-            except Exception:
-                continue
-
-        if not rows:
+        # ── Step 3: 构建因子 DataFrame（整列向量运算）──
+        ps, inc, bal = fin['PershareIndex'], fin['Income'], fin['Balance']
+        df = ps.loc[(ps['ann_date'] > 0) & (inc['ann_date'] > 0), ['equity_roe', 's_fa_eps_basic']]
+        df = df.rename(columns={'equity_roe': 'roe', 's_fa_eps_basic': 'eps'})
+        if df.empty:
             LOG.warning("[小市值] 财务数据构建失败，跳过")
             return []
+        codes = df.index
+
+        net_profit = inc.loc[codes, 'net_profit_incl_min_int_inc_after'].fillna(0)
+        revenue    = inc.loc[codes, 'total_operating_revenue']
+        df['net_margin'] = net_profit / revenue.where(revenue != 0)     # 营收缺失 / 为 0 记 NaN，下方整行剔除
+
+        # 负债率（D/A），缺失时取 0.5
+        liab, assets = bal.loc[codes, 'total_liab'], bal.loc[codes, 'total_assets']
+        df['da_ratio'] = (liab / assets).where(liab.notna() & (assets > 0), 0.5)
+
+        # 净利润同比增速（处理由亏转盈/持续亏损情形；只有一期数据时记 0）
+        has_prev    = inc_prev.loc[codes, 'ann_date'] > 0
+        prev_profit = inc_prev.loc[codes, 'net_profit_incl_min_int_inc_after'].fillna(0)
+        df['profit_growth'] = np.select(
+            [~has_prev, prev_profit > 0, net_profit > 0],
+            [0.0, (net_profit - prev_profit) / prev_profit.abs().replace(0, 1), 1.0],  # 由亏转盈视作高增速
+            default=-0.5,                                                                # 持续亏损视作负增速
+        )
+
+        # 价格动量（252日收益率，反转效应：负值/低值更好）
+        df['price_mom'] = pd.Series(price_mom_map, dtype=float).reindex(codes)
 
-        df = pd.DataFrame.from_dict(rows, orient='index')
         # price_mom 允许缺失（历史数据不足的股票），其余因子必须完整
         df = df.dropna(subset=['roe', 'eps', 'net_margin', 'da_ratio', 'profit_growth'])
         LOG.info(f"[小市值] 有效财务数据: {len(df)} 只")
@@ -332,39 +302,19 @@ class XSZStrategy(Strategy):
 
     def _get_market_caps(self, codes: list) -> dict:
         """估算市值 = 当前价 × 总股本"""
-        prices = get_latest_prices(codes)
-        caps = {}
-        for code in codes:
-            price = prices.get(code, 0)
-            if price <= 0:
-                caps[code] = float('inf')
-                continue
-            d = xtdata.get_instrument_detail(code)
-            total_shares = d.get('TotalVolume', 0) if d else 0
-            caps[code] = price * total_shares if total_shares > 0 else float('inf')
-        return caps
+        return InstrumentMgr.market_caps(codes, get_latest_prices(codes))
 
 
 # ────────────────────────────────────────────────────
 # 主程序入口
 # ────────────────────────────────────────────────────
 
-class MyCallback:
-    def on_disconnected(self):
-        LOG.error("!! 与 QMT 终端连接断开 !!")
-
-    def on_stock_order(self, order):
-        LOG.info(f"委托回报: {order.stock_code} 状态:{order.order_status} 价格:{order.price}")
-
-    def on_stock_trade(self, trade):
-        LOG.info(f"成交回报: {trade.stock_code} 数量:{trade.traded_volume} 价格:{trade.traded_price}")
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='kj202512 小市值多因子子策略')
     parser.add_argument('-m', '--mode', type=str, default='DEBUG',
                         help='运行模式: REAL 或 DEBUG（默认DEBUG）')
     args = parser.parse_args()
+    EventLog.setup(level='DEBUG', tag='[实盘]' if args.mode.upper() == 'REAL' else '[调试]')
 
     if args.mode.upper() == 'REAL':
         LOG.info(">>> [实盘模式] 注意风险！")
@@ -381,7 +331,7 @@ if __name__ == '__main__':
     trader = XtQuantTrader(qmt_path, session_id)
     acc = StockAccount(account_id)
 
-    cb = MyCallback()
+    cb = TraderCallback(LOG)
     trader.register_callback(cb)
     trader.start()
 
@@ -12,9 +12,7 @@ import datetime
 import os, sys
 import argparse
 from datetime import timezone, timedelta
-import numpy as np
 import pandas as pd
-from scipy import stats
 from xtquant import xtdata,xtconstant
 from xtquant.xttrader import XtQuantTrader, XtQuantTraderCallback
 
@@ -30,6 +28,12 @@ if parent_dir not in sys.path:
 from utils.utilities import MessagePusher, StrategyVolumeLedger, SingleInstanceLock
 from utils.marketmgr import MarketMgr
 from utils.stockmgr import StockMgr
+from utils.momentum import Momentum
+from utils.tickhub import TickHub
+from utils.scheduler import Scheduler
+from utils.ordertracker import OrderTracker
+from utils.trademgr import TradeMgr
+from utils.eventlog import EventLog
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 DEBUG = False
@@ -57,7 +61,15 @@ class Strategy36Callback(XtQuantTraderCallback):
     def on_disconnected(self):
         print(">>> 警告：与 QMT 交易服务器连接断开")
 
+    def on_stock_order(self, order):
+        OrderTracker.instance().on_stock_order(order)
+
+    def on_order_error(self, order_error):
+        print(f">>> 委托失败: 委托号 {order_error.order_id}，原因: {order_error.error_msg}")
+        OrderTracker.instance().on_order_error(order_error)
+
     def on_stock_trade(self, trade):
+        OrderTracker.instance().on_stock_trade(trade)
         strategy_name = getattr(trade, 'strategy_name', '')
         stock_code = getattr(trade, 'stock_code', '')
         traded_volume = int(getattr(trade, 'traded_volume', 0) or 0)
@@ -241,28 +253,26 @@ def filter_audit_opinion(pool):
     except:
         return etfs
 
-def get_momentum_score(code):
-    """动量质量评分 = (年化收益率 / 年化波动率) × R²（平滑夏普比率）"""
-    data = xtdata.get_market_data_ex(['close'], [code], period='1d', count=Config.rank_days)[code]
-    prices = data['close'].values
-    if len(prices) < Config.rank_days: return -999
-
-    y = np.log(prices)
-    x = np.arange(len(y))
-    slope, _, r_val, _, _ = stats.linregress(x, y)
-    annualized_return = np.exp(slope * 250) - 1
-    annualized_vol = np.diff(y).std() * np.sqrt(250) + 1e-9
-    return float((annualized_return / annualized_vol) * (r_val ** 2))
+def get_momentum_scores(codes):
+    """动量质量评分 = (年化收益率 / 年化波动率) × R²（平滑夏普比率），整个资产池一次计算；数据不足记 -999"""
+    data = xtdata.get_market_data_ex(['close'], codes, period='1d', count=Config.rank_days)
+    closes = Momentum.stack_tail({c: data[c]['close'].values for c in codes if c in data}, Config.rank_days)
+    scores = Momentum.latest(closes, Config.rank_days)['sharpe_score'] if not closes.empty else pd.Series(dtype=float)
+    return {c: float(scores.get(c, -999)) for c in codes}
 
 # ======================== 3. 交易执行引擎 ========================
 
 class RobotTrader:
-    def __init__(self, ledger=None):
-        self.trader = XtQuantTrader(Config.qmt_path, Config.session_id)
-        self.acc = XtStockAccount(Config.acc_id)
+    def __init__(self, ledger=None, trader=None, account=None):
         self.pusher = MessagePusher()
         self.ledger = ledger or StrategyVolumeLedger(os.path.join(current_dir, 'kj202536_holdings.json'))
-        self.trader.register_callback(Strategy36Callback(self.ledger))
+        self.callback = Strategy36Callback(self.ledger)
+        if trader is None:
+            # 单独运行：自建交易会话；由 StrategyHost 托管时共用宿主的会话，回调由宿主分发
+            trader = XtQuantTrader(Config.qmt_path, Config.session_id)
+            trader.register_callback(self.callback)
+        self.trader = trader
+        self.acc = account or XtStockAccount(Config.acc_id)
         
     def connect(self):
         self.trader.start()
@@ -311,8 +321,9 @@ class RobotTrader:
             print(f"{'代码':<10} | {'名称':<12} | {'动量得分':<10}")
             
             print("-" * 40)
+            pool_scores = get_momentum_scores(safe_pool)
             for code in safe_pool:
-                s = get_momentum_score(code)
+                s = pool_scores[code]
                 name = Config.symbol_to_name.get(code, "未知")
                 print(f"{code:<10} | {name:<12} | {s:10.4f}")
 
@@ -368,7 +379,7 @@ class RobotTrader:
         print(f"\n本策略分配额度: {Config.policy_asset:.2f} | 目标持仓数: {len(target_list)} | 每仓目标金额: {target_value_per_slot:.2f}")
 
         # ===== A. 卖出（调出目标池 + 超配减仓）=====
-        full_sell_codes = set()  # 用于轮询等待全仓清零
+        sell_orders = {}  # {code: 卖单委托号}，买入前等待这些卖单结束
         for code, owned_volume in strategy_holdings.items():
             sell_vol = 0
             reason = ""
@@ -383,11 +394,10 @@ class RobotTrader:
                         "归属已不一致，为避免卖到手工或其他策略仓位，本轮禁止卖出"
                     )
                     continue
-                tick = xtdata.get_full_tick([code])
-                if code not in tick or tick[code]['lastPrice'] <= 0:
+                current_price = TickHub.instance().price(code)
+                if current_price <= 0:
                     print(f"  -> 获取 {code} 最新价失败，跳过卖出检查")
                     continue
-                current_price = tick[code]['lastPrice']
 
                 if code not in target_list:
                     sell_vol = min(owned_volume, pos.can_use_volume)
@@ -415,25 +425,15 @@ class RobotTrader:
                     seq = self.trader.order_stock(self.acc, code, xtconstant.STOCK_SELL, sell_vol, xtconstant.FIX_PRICE, current_price, STRATEGY_SELL_TAG, remark)
                     if seq != -1:
                         sell_records.append(f"{name}({code}) | 数量: {sell_vol} | {reason}")
-                        if code not in target_list:
-                            full_sell_codes.add(code)
+                        sell_orders[code] = seq
             except Exception as e:
                 print(f"  -> {code} 卖出处理报错: {e}")
 
-        # 等待 36 号账本中的目标持仓卖出成交（最多 120 秒）。
-        # 不能等待账户持仓清零，因为同代码可能还属于手工或其他策略。
-        if full_sell_codes and not DEBUG:
-            deadline = datetime.datetime.now(BEIJING_TZ) + datetime.timedelta(seconds=120)
-            print(f"  -> 等待全仓卖出成交: {full_sell_codes}")
-            while datetime.datetime.now(BEIJING_TZ) < deadline:
-                time.sleep(3)
-                still_holding = {code for code in full_sell_codes if self.ledger.get(code) > 0}
-                if not still_holding:
-                    print(f"  -> 卖出已全部成交。")
-                    break
-                print(f"  -> 仍有持仓未清: {still_holding}，继续等待...")
-            else:
-                print(f"  !! 超时 120 秒仍有未成交卖单，继续执行买入（可用现金以实际为准）。")
+        # 等待卖单结束（最多 120 秒）：按委托回报判断，不看账户持仓，
+        # 同代码还属于手工或其他策略时也不会误判；最后一笔卖单结束即开始买入。
+        if sell_orders and not DEBUG:
+            print(f"  -> 等待卖单结束: {list(sell_orders)}")
+            TradeMgr.wait_for_sells(self.trader, self.acc, sell_orders, timeout=120, interval=5)
 
         # ===== B. 买入（新标的 + 欠配补仓）=====
         # 买入计算只读取 36 号独立账本，不读取账户聚合持仓。
@@ -446,11 +446,10 @@ class RobotTrader:
 
         for code in target_list:
             try:
-                tick = xtdata.get_full_tick([code])
-                if code not in tick or tick[code]['lastPrice'] <= 0:
+                current_price = TickHub.instance().price(code)
+                if current_price <= 0:
                     print(f"  -> 获取 {code} 最新价失败，跳过买入")
                     continue
-                current_price = tick[code]['lastPrice']
                 name = Config.symbol_to_name.get(code, code)
 
                 owned_volume = strategy_holdings.get(code, 0)
@@ -487,21 +486,34 @@ class RobotTrader:
         z = MarketMgr.get_rsrs_signal(Config.index_code, Config.rsrs_n, Config.rsrs_m)
         print(f"当前 RSRS Z-Score: {z:.2f}")
 
-        last_run_date = ""
-        while True:
-            now_dt = datetime.datetime.now(BEIJING_TZ)
-            now_time = now_dt.strftime('%H:%M:%S')
-            today = now_dt.strftime('%Y%m%d')
-            if DEBUG or (now_time >= Config.check_time and last_run_date != today):
-                try:
-                    self.execute_logic()
-                except Exception as e:
-                    print(f"运行时发生错误: {e}")
-                last_run_date = today
-            if DEBUG:
-                break
-            time.sleep(1)
+        if DEBUG:
+            try:
+                self.execute_logic()
+            except Exception as e:
+                print(f"运行时发生错误: {e}")
+            return
+
+        # 每个交易日 check_time 触发一次；执行记录落盘，同一天重启不会重复调仓
+        sched = Scheduler(os.path.join(current_dir, 'kj202536_schedule.json'))
+        sched.daily('execute_logic', Config.check_time, self.execute_logic)
+        sched.run_forever()
     
+def setup(host):
+    """StrategyHost 插件入口：共用宿主的交易会话与调度器（见 utils/strategyhost.py）"""
+    global DEBUG
+    DEBUG = host.debug
+    ledger = StrategyVolumeLedger(os.path.join(current_dir, 'kj202536_holdings.json'))
+    if not DEBUG and not ledger.initialized:
+        reason = f"账本损坏: {ledger.load_error}" if ledger.load_error else '账本尚未初始化'
+        raise RuntimeError(f"REAL 模式拒绝启动：{reason}。请先单独运行 kj202536.py --init-ledger 初始化")
+    if not host.lock(os.path.join(current_dir, 'kj202536.lock')):
+        raise RuntimeError('36号策略已有一个实例正在运行')
+    bot = RobotTrader(ledger, host.trader, host.account)
+    host.add_callback(bot.callback)
+    host.on_debug(bot.execute_logic)
+    host.scheduler.daily('kj202536.execute_logic', Config.check_time, bot.execute_logic)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="金阳光 QMT 极简模式策略36 启动器")
     
@@ -525,6 +537,7 @@ if __name__ == "__main__":
     else:
         print(">>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。")
         DEBUG = True
+    EventLog.setup(tag='[实盘]' if args.mode == 'REAL' else '[调试]')
     ledger = StrategyVolumeLedger(os.path.join(current_dir, 'kj202536_holdings.json'))
     instance_lock = SingleInstanceLock(os.path.join(current_dir, 'kj202536.lock'))
     if not instance_lock.acquire():
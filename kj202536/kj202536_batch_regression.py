@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 """
 36号策略 - 批量参数回测优化版
-针对 RSRS_M, SLOP_THRESHOLD, TRADE_CYCLE 进行网格搜索
+针对 RSRS_M, SLOP_THRESHOLD, TRADE_CYCLE 进行参数扫描（网格 / 随机 / 拉丁超立方），
+多进程并行，价格与预计算矩阵经共享内存分发，结果边跑边写入 CSV。
 """
 
 import numpy as np
 import pandas as pd
-from scipy import stats
-from xtquant import xtdata
-from tqdm import tqdm
-import itertools
 import warnings
+import sys
+import os
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from utils.barstore import BarStore
+from utils.rsrs import RSRS
+from utils.momentum import Momentum
+from utils.portfoliosim import PortfolioSim
+from utils.sweeprunner import SweepRunner
 
 warnings.filterwarnings('ignore')
 
@@ -28,118 +36,155 @@ ETF_GROUPS = {
 }
 ALL_SYMBOLS = [item for sublist in ETF_GROUPS.values() for item in sublist] + [BOND_ETF]
 
-# 待测试的参数网格
 RSRS_N = 18 
 MOM_DAYS = 20
-RSRS_M_LIST = [600, 450, 300]
-SLOP_THRESHOLD_LIST = [0.3, 0.5, 0.7]
-TRADE_CYCLE_LIST = [5, 10]
-
-# ================= 2. 数据准备 (仅执行一次) =================
-print(">>> 正在初始化数据...")
-fetch_start = '20181201' 
-# xtdata.download_history_data(INDEX_CODE, period='1d', start_time=fetch_start, end_time=END_DATE)
-# for sym in ALL_SYMBOLS:
-#      xtdata.download_history_data(sym, period='1d', start_time=fetch_start, end_time=END_DATE)
-
-# 获取基准数据
-idx_data = xtdata.get_market_data_ex(['high', 'low', 'close'], [INDEX_CODE], period='1d', start_time=fetch_start, end_time=END_DATE, dividend_type='front')[INDEX_CODE]
-idx_data.index = pd.to_datetime(idx_data.index)
-
-# 获取所有标的收盘价
-close_df = pd.DataFrame(index=idx_data.index)
-for sym in ALL_SYMBOLS:
-    df = xtdata.get_market_data_ex(['close'], [sym], period='1d', start_time=fetch_start, end_time=END_DATE, dividend_type='front')[sym]
-    df.index = pd.to_datetime(df.index)
-    close_df[sym] = df['close']
-
-# 预计算 RSRS 原始斜率 (不随 M 变化)
-print(">>> 预计算 RSRS 斜率...")
-rsrs_slopes = pd.Series(index=idx_data.index, dtype=float)
-highs, lows = idx_data['high'].values, idx_data['low'].values
-for i in range(RSRS_N, len(idx_data)):
-    slope, _, _, _, _ = stats.linregress(lows[i-RSRS_N:i], highs[i-RSRS_N:i])
-    rsrs_slopes.iloc[i] = slope
-
-# 预计算 动量得分 (不随择时参数变化)
-print(">>> 预计算动量得分...")
-mom_scores = pd.DataFrame(index=close_df.index, columns=ALL_SYMBOLS)
-for sym in ALL_SYMBOLS:
-    prices = close_df[sym].values
-    for i in range(MOM_DAYS, len(prices)):
-        window = prices[i-MOM_DAYS:i]
-        if np.isnan(window).any(): continue
-        slope, _, r_val, _, _ = stats.linregress(np.arange(MOM_DAYS), np.log(window))
-        mom_scores.loc[mom_scores.index[i], sym] = (np.exp(slope * 250) - 1) * (r_val ** 2)
-
-# ================= 3. 批量回测引擎 =================
-results = []
-bt_dates = idx_data.loc[START_DATE:END_DATE].index
-param_combinations = list(itertools.product(RSRS_M_LIST, SLOP_THRESHOLD_LIST, TRADE_CYCLE_LIST))
-
-print(f">>> 开始执行批量回测，共 {len(param_combinations)} 组参数...")
-
-for m, threshold, cycle in tqdm(param_combinations):
-    # 根据当前 M 计算 Z-Score
-    z_scores = (rsrs_slopes - rsrs_slopes.rolling(m).mean()) / rsrs_slopes.rolling(m).std()
-    
-    portfolio_returns = []
-    target_weights = {sym: 0.0 for sym in ALL_SYMBOLS}
-    days_since_trade = 999 # 确保第一天触发调仓
-    
-    for i in range(1, len(bt_dates)):
-        today, tomorrow = bt_dates[i-1], bt_dates[i]
-        
-        # 1. 计算收益
-        daily_ret = sum(target_weights[s] * (close_df.loc[tomorrow, s]/close_df.loc[today, s] - 1) 
-                        for s in ALL_SYMBOLS if target_weights[s] > 0)
-        portfolio_returns.append(daily_ret)
-        
-        # 2. 调仓
-        days_since_trade += 1
-        if days_since_trade >= cycle:
-            days_since_trade = 0
-            z = z_scores.loc[today]
-            new_targets = []
-            
-            if pd.isna(z):
-                new_targets = [BOND_ETF]
-            elif z > threshold:
-                day_scores = mom_scores.loc[today].dropna()
-                valid_scores = day_scores[day_scores > 0].sort_values(ascending=False)
-                used_grp = set()
-                for sym, score in valid_scores.items():
-                    if sym == BOND_ETF: continue
-                    grp = next((k for k, v in ETF_GROUPS.items() if sym in v), 'Other')
-                    if grp not in used_grp:
-                        new_targets.append(sym)
-                        used_grp.add(grp)
-                    if len(new_targets) >= 3: break
-                if not new_targets: new_targets = [BOND_ETF]
-            elif z < -threshold:
-                new_targets = [BOND_ETF]
-            else:
-                continue # 震荡区维持现状
-
-            target_weights = {sym: (1.0/len(new_targets) if sym in new_targets else 0.0) for sym in ALL_SYMBOLS}
-
-    # 计算绩效指标
-    nav = (1 + pd.Series(portfolio_returns)).cumprod()
-    total_ret = nav.iloc[-1] - 1
-    ann_ret = (nav.iloc[-1] ** (252/len(nav))) - 1
-    mdd = (nav / nav.cummax() - 1).min()
-    
-    results.append({
-        'RSRS_M': m,
-        'Threshold': threshold,
-        'Cycle': cycle,
-        'TotalReturn': f"{total_ret*100:.2f}%",
-        'AnnualReturn': f"{ann_ret*100:.2f}%",
-        'MaxDrawdown': f"{mdd*100:.2f}%"
-    })
-
-# ================= 4. 输出结果 =================
-res_df = pd.DataFrame(results)
-print("\n" + "="*30 + " 批量回测最终结果 " + "="*30)
-print(res_df.to_string(index=False))
-print("="*78)
\ No newline at end of file
+
+# 参数空间：SAMPLE_MODE='grid' 时取 PARAM_GRID 的笛卡尔积；
+# 'random' / 'lhs' 时在 PARAM_RANGES 内抽 N_SAMPLES 组（整数端点按整数取值）
+SAMPLE_MODE = 'grid'
+PARAM_GRID = {
+    'RSRS_M': [600, 450, 300],
+    'Threshold': [0.3, 0.5, 0.7],
+    'Cycle': [5, 10],
+}
+PARAM_RANGES = {
+    'RSRS_M': (250, 700),
+    'Threshold': (0.2, 1.0),
+    'Cycle': (3, 20),
+}
+N_SAMPLES = 2000
+SEED = 42
+WORKERS = None          # None = 全部 CPU 核心
+TOP_N = 30              # 结果超过该行数时只打印年化收益最高的前 TOP_N 组
+OUT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kj202536_batch_result.csv')
+
+# ================= 2. 数据准备 (主进程仅执行一次) =================
+def prepare_data() -> dict:
+    """加载行情并预计算与参数无关的矩阵，返回给 SweepRunner 共享的数据"""
+    print(">>> 正在初始化数据...")
+    fetch_start = '20181201' 
+    # xtdata.download_history_data(INDEX_CODE, period='1d', start_time=fetch_start, end_time=END_DATE)
+    # for sym in ALL_SYMBOLS:
+    #      xtdata.download_history_data(sym, period='1d', start_time=fetch_start, end_time=END_DATE)
+
+    # 获取基准数据与所有标的收盘价（本地列式行情仓库，一次加载）
+    bar_store = BarStore()
+    bar_store.ensure([INDEX_CODE] + list(ALL_SYMBOLS), start_time=fetch_start, end_time=END_DATE, fields=['high', 'low', 'close'])
+    idx_data = bar_store.load_bars(INDEX_CODE, ['high', 'low', 'close'], start_time=fetch_start, as_of=END_DATE).dropna()
+
+    close_df = bar_store.load_field('close', ALL_SYMBOLS, start_time=fetch_start, as_of=END_DATE).reindex(index=idx_data.index, columns=ALL_SYMBOLS)
+    return build_matrices(idx_data, close_df)
+
+
+def build_matrices(idx_data: pd.DataFrame, close_df: pd.DataFrame) -> dict:
+    # 预计算 RSRS 原始斜率 (不随 M 变化)
+    print(">>> 预计算 RSRS 斜率...")
+    slopes = RSRS.rolling_slope(idx_data['high'].values, idx_data['low'].values, RSRS_N)
+    rsrs_slopes = pd.Series(slopes, index=idx_data.index).shift(1)   # 第 i 天使用 [i-N, i) 窗口
+
+    # 预计算 动量得分 (不随择时参数变化)
+    print(">>> 预计算动量得分...")
+    mom_scores = Momentum.rolling(close_df, MOM_DAYS)['score'].shift(1)   # 第 i 天使用 [i-MOM_DAYS, i) 窗口
+
+    # 收益率与动量持仓覆盖全部历史，回测区间由 backtest 的 start / end 截取（滚动检验也复用这些矩阵）
+    bt_dates = idx_data.index
+    returns = close_df.pct_change()
+
+    # 预计算 每日的动量持仓 (与择时参数无关)：各分组取得分最高且 > 0 的一只，再按得分取前 3 组，等权；无则持有国债
+    print(">>> 预计算动量持仓...")
+    group_syms = list(ETF_GROUPS.values())
+    scores = mom_scores.reindex(bt_dates)
+    best_sym = np.empty((len(bt_dates), len(group_syms)), dtype=object)
+    best_score = np.full((len(bt_dates), len(group_syms)), -np.inf)
+    for g, syms in enumerate(group_syms):
+        sub = scores[syms].to_numpy(dtype=float)
+        sub = np.where(sub > 0, sub, -np.inf)
+        pick = np.argmax(sub, axis=1)
+        best_sym[:, g] = np.asarray(syms, dtype=object)[pick]
+        best_score[:, g] = sub[np.arange(len(sub)), pick]
+    rank = np.argsort(-best_score, axis=1, kind='stable')[:, :3]
+    top_score = np.take_along_axis(best_score, rank, axis=1)
+    top_sym = np.take_along_axis(best_sym, rank, axis=1)
+    held = np.isfinite(top_score)
+    mom_weights = pd.DataFrame(0.0, index=bt_dates, columns=ALL_SYMBOLS)
+    for i in range(len(bt_dates)):
+        picks = top_sym[i][held[i]] if held[i].any() else [BOND_ETF]
+        mom_weights.iloc[i, [ALL_SYMBOLS.index(s) for s in picks]] = 1.0 / len(picks)
+
+    return {'slopes': rsrs_slopes, 'returns': returns, 'mom_weights': mom_weights}
+
+
+# ================= 3. 单组参数回测 (在子进程内执行) =================
+def backtest(params: dict, data: dict, start=START_DATE, end=END_DATE) -> dict:
+    """在 [start, end] 上按 params 回测，返回 PortfolioSim.run 的结果（首日建仓）"""
+    m, threshold, cycle = int(params['RSRS_M']), float(params['Threshold']), int(params['Cycle'])
+    returns = data['returns'].loc[start:end]
+    bt_dates = returns.index
+
+    # 同一进程内相同 M 的 Z-Score 只算一次
+    cache = data.setdefault('_zscore', {})
+    if m not in cache:
+        cache[m] = RSRS.zscore(data['slopes'], m)
+    z = cache[m].reindex(bt_dates).to_numpy()
+
+    # 每 cycle 天研判一次：z 缺失或 < -阈值 持国债，> 阈值 持动量组合，震荡区维持现状 (整行 NaN)
+    decide = np.zeros(len(bt_dates), dtype=bool)
+    decide[:-1:cycle] = True
+    with np.errstate(invalid='ignore'):
+        to_bond = decide & (np.isnan(z) | (z < -threshold))
+        to_mom = decide & (z > threshold)
+    decisions = np.full((len(bt_dates), len(ALL_SYMBOLS)), np.nan)
+    decisions[to_bond] = 0.0
+    decisions[to_bond, ALL_SYMBOLS.index(BOND_ETF)] = 1.0
+    decisions[to_mom] = data['mom_weights'].loc[start:end].to_numpy()[to_mom]
+
+    # 研判日当天收盘后的目标，从下一交易日的收盘起持有，即调度表整体后移一行
+    schedule = pd.DataFrame(decisions, index=bt_dates, columns=returns.columns).shift(1)
+    return PortfolioSim.run(schedule, returns, mode='fixed')
+
+
+def evaluate(params: dict, data: dict) -> dict:
+    stats = backtest(params, data)['stats']
+    return {
+        'TotalReturn': stats['total_return'],
+        'AnnualReturn': stats['ann_return'],
+        'MaxDrawdown': stats['max_drawdown'],
+        'Sharpe': stats['sharpe'],
+    }
+
+
+# ================= 4. 参数扫描与输出 =================
+def build_params() -> list:
+    if SAMPLE_MODE == 'random':
+        return SweepRunner.random(PARAM_RANGES, N_SAMPLES, seed=SEED)
+    if SAMPLE_MODE == 'lhs':
+        return SweepRunner.lhs(PARAM_RANGES, N_SAMPLES, seed=SEED)
+    return SweepRunner.grid(PARAM_GRID)
+
+
+def main():
+    data = prepare_data()
+    params = build_params()
+    print(f">>> 开始执行批量回测，共 {len(params)} 组参数 ({SAMPLE_MODE})，结果写入 {OUT_CSV}")
+
+    runner = SweepRunner(evaluate, data, workers=WORKERS)
+    res_df = runner.run_all(params, out_csv=OUT_CSV)
+    if 'error' in res_df.columns:
+        failed = res_df['error'].notna()
+        if failed.any():
+            print(f"--> {failed.sum()} 组参数回测失败，例如: {res_df.loc[failed, 'error'].iloc[0]}")
+        res_df = res_df[~failed].drop(columns='error')
+    if len(res_df) > TOP_N:
+        res_df = res_df.sort_values('AnnualReturn', ascending=False).head(TOP_N)
+
+    show = res_df.copy()
+    for col in ('TotalReturn', 'AnnualReturn', 'MaxDrawdown'):
+        show[col] = show[col].map(lambda v: f"{v*100:.2f}%")
+    show['Sharpe'] = show['Sharpe'].map(lambda v: f"{v:.2f}")
+    print("\n" + "="*30 + " 批量回测最终结果 " + "="*30)
+    print(show.to_string(index=False))
+    print("="*78)
+
+
+if __name__ == '__main__':
+    main()
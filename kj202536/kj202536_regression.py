@@ -6,10 +6,7 @@
 
 import numpy as np
 import pandas as pd
-from scipy import stats
 import matplotlib.pyplot as plt
-from xtquant import xtdata
-from tqdm import tqdm # 进度条库，需 pip install tqdm
 import sys
 import os
 
@@ -17,6 +14,9 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 from utils.stockmgr import StockMgr
+from utils.barstore import BarStore
+from utils.rsrs import RSRS
+from utils.momentum import Momentum
 
 # ================= 1. 回测参数配置 =================
 START_DATE = '20230101'
@@ -70,48 +70,26 @@ fetch_start = '20181201'
 
 StockMgr.download_history([INDEX_CODE] + list(ALL_SYMBOLS), start_time=fetch_start, end_time=END_DATE, period='1d')
 
-# 获取基准数据
-idx_data = xtdata.get_market_data_ex(['high', 'low', 'close'], [INDEX_CODE], period='1d', start_time=fetch_start, end_time=END_DATE, dividend_type='front')[INDEX_CODE]
-idx_data.index = pd.to_datetime(idx_data.index)
+# 获取基准数据与所有标的收盘价（本地列式行情仓库，一次加载）
+bar_store = BarStore()
+bar_store.ensure([INDEX_CODE] + list(ALL_SYMBOLS), start_time=fetch_start, end_time=END_DATE, fields=['high', 'low', 'close'])
+idx_data = bar_store.load_bars(INDEX_CODE, ['high', 'low', 'close'], start_time=fetch_start, as_of=END_DATE).dropna()
 
-# 获取所有标的收盘价
-close_df = pd.DataFrame(index=idx_data.index)
-for sym in ALL_SYMBOLS:
-    df = xtdata.get_market_data_ex(['close'], [sym], period='1d', start_time=fetch_start, end_time=END_DATE, dividend_type='front')[sym]
-    df.index = pd.to_datetime(df.index)
-    close_df[sym] = df['close']
+close_df = bar_store.load_field('close', ALL_SYMBOLS, start_time=fetch_start, as_of=END_DATE).reindex(index=idx_data.index, columns=ALL_SYMBOLS)
 
 # ================= 3. 预计算 RSRS 择时指标 =================
 print(">>> 正在计算 RSRS 标准分...")
-rsrs_slopes = pd.Series(index=idx_data.index, dtype=float)
-
-# 滚动计算斜率
-highs = idx_data['high'].values
-lows = idx_data['low'].values
-for i in tqdm(range(RSRS_N, len(idx_data))):
-    y = highs[i-RSRS_N : i]
-    x = lows[i-RSRS_N : i]
-    slope, _, rvalue, _, _ = stats.linregress(x, y)
-    rsrs_slopes.iloc[i] = slope
+# 滚动计算斜率（第 i 天使用 [i-N, i) 窗口，即截至前一日的 N 根 K 线）
+slopes = RSRS.rolling_slope(idx_data['high'].values, idx_data['low'].values, RSRS_N)
+rsrs_slopes = pd.Series(slopes, index=idx_data.index).shift(1)
 
 # 计算 Z-Score (使用前 M 天的数据)
-z_scores = (rsrs_slopes - rsrs_slopes.rolling(RSRS_M).mean()) / rsrs_slopes.rolling(RSRS_M).std()
+z_scores = RSRS.zscore(rsrs_slopes, RSRS_M)
 
 # ================= 4. 预计算动量得分 =================
 print(">>> 正在计算各标的动量评分...")
-mom_scores = pd.DataFrame(index=close_df.index, columns=ALL_SYMBOLS)
-
-for sym in tqdm(ALL_SYMBOLS):
-    prices = close_df[sym].values
-    for i in range(MOM_DAYS, len(prices)):
-        window = prices[i-MOM_DAYS : i]
-        if np.isnan(window).any(): continue
-        
-        y = np.log(window)
-        x = np.arange(len(y))
-        slope, _, r_val, _, _ = stats.linregress(x, y)
-        score = (np.exp(slope * 250) - 1) * (r_val ** 2)
-        mom_scores.loc[mom_scores.index[i], sym] = score
+# 第 i 天使用 [i-MOM_DAYS, i) 窗口，即截至前一日的收盘价
+mom_scores = Momentum.rolling(close_df, MOM_DAYS)['score'].shift(1)
 
 # ================= 5. 步进式回测主引擎 =================
 print(">>> 开始执行交易回测...")
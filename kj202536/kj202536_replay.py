@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+36号策略 - 实盘代码回放
+直接用 kj202536.py 中的 RobotTrader（与实盘同一份代码，含份数账本和卖后等待成交的流程）
+在本地 BarStore 上逐日回放，每个交易日在 Config.check_time 触发一次 execute_logic。
+回放用的账本写在 localdata/replay/kj202536/，不会改动实盘的 kj202536_holdings.json。
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kj202536
+from utils.replay import ReplayRunner
+from utils.utilities import StrategyVolumeLedger
+
+# ================= 可配置参数 =================
+START_DATE = '20220101'
+END_DATE   = None           # None = 本地数据的最后一天
+CASH       = 100000
+
+
+def main():
+    kj202536.DEBUG = False   # 非周一不调仓等实盘判断照常生效
+    with ReplayRunner('kj202536', START_DATE, END_DATE, cash=CASH,
+                      times=[kj202536.Config.check_time]) as rp:
+        ledger = StrategyVolumeLedger(os.path.join(kj202536.current_dir, 'kj202536_holdings.json'))
+        ledger.initialize({}, overwrite=True)
+        bot = kj202536.RobotTrader(ledger)
+        bot.connect()
+        res = rp.run(bot.execute_logic)
+        print(f"\n>>> 回放结束时的 36 号账本: {ledger.get_all()}")
+
+    stats = res['stats']
+    print("\n" + "=" * 30 + " 回放结果 " + "=" * 30)
+    print(f"区间: {res['nav'].index[0].date()} — {res['nav'].index[-1].date()}")
+    print(f"总收益: {stats['total_return']:.2%}  年化: {stats['ann_return']:.2%}  "
+          f"最大回撤: {stats['max_drawdown']:.2%}  夏普: {stats['sharpe']:.2f}")
+    print(f"成交 {stats['trade_count']} 笔，交易成本 {stats['total_cost']:,.2f} 元")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,17 @@
 运行方式：直接执行，输出当次调仓建议，不涉及实盘下单
 """
 
+import os
 import sys
 import datetime
 import argparse
-import numpy as np
 import pandas as pd
-from scipy import stats
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from utils.rsrs import RSRS
+from utils.momentum import Momentum
 
 try:
     import yfinance as yf
@@ -131,32 +136,17 @@ def calc_rsrs(df: pd.DataFrame, n: int, m: int) -> float:
         print(f"  [RSRS] 数据不足 (有 {len(df)} 条，需要 {needed} 条)，返回 0")
         return 0.0
 
-    data  = df.tail(needed).reset_index(drop=True)
-    highs = data['high'].values
-    lows  = data['low'].values
-
-    slopes = []
-    for i in range(len(highs) - n + 1):
-        slope, *_ = stats.linregress(lows[i:i + n], highs[i:i + n])
-        slopes.append(slope)
-
-    current_slope  = slopes[-1]
-    history_slopes = np.array(slopes[:-1])
-    z = (current_slope - history_slopes.mean()) / (history_slopes.std() + 1e-9)
+    data  = df.tail(needed)
+    current_slope, hist_mean, hist_std = RSRS.latest(data['high'].values, data['low'].values, n, m)
+    z = (current_slope - hist_mean) / (hist_std + 1e-9)
     return float(z)
 
 
-def calc_momentum(df: pd.DataFrame, rank_days: int) -> float:
-    """动量质量评分 = (年化收益率 / 年化波动率) × R²（平滑夏普比率）"""
-    prices = df['close'].values[-rank_days:]
-    if len(prices) < rank_days:
-        return -999.0
-    y = np.log(prices)
-    x = np.arange(len(y))
-    slope, _, r_val, *_ = stats.linregress(x, y)
-    annualized_return = np.exp(slope * 250) - 1
-    annualized_vol = np.diff(y).std() * np.sqrt(250) + 1e-9
-    return float((annualized_return / annualized_vol) * (r_val ** 2))
+def calc_momentum_scores(ohlc: dict, rank_days: int) -> dict:
+    """动量质量评分 = (年化收益率 / 年化波动率) × R²（平滑夏普比率），整个资产池一次计算；数据不足记 -999"""
+    closes = Momentum.stack_tail({c: df['close'].values for c, df in ohlc.items()}, rank_days)
+    scores = Momentum.latest(closes, rank_days)['sharpe_score'] if not closes.empty else pd.Series(dtype=float)
+    return {c: float(scores.get(c, -999.0)) for c in ohlc}
 
 
 # ======================== 4. 主逻辑 ========================
@@ -203,18 +193,25 @@ def run(policy_asset: float):
         scores: list[dict] = []
         print(f"  {'代码':<8}  {'名称':<38}  {'动量得分':>10}")
         print(f"  {'-' * 60}")
+        failed: dict[str, Exception] = {}
         for code in Config.all_symbols[:]:
-            name = Config.symbol_to_name.get(code, code)
             try:
-                df = _fetch_ohlc(code, count=max(Config.rank_days + 10, 30))
-                ohlc_cache[code] = df
-                s = calc_momentum(df, Config.rank_days)
-                flag = "✓" if s > 0 else " "
-                print(f"  {code:<8}  {name:<38}  {s:>10.4f} {flag}")
-                if s > 0:
-                    scores.append({'code': code, 'score': s})
+                ohlc_cache[code] = _fetch_ohlc(code, count=max(Config.rank_days + 10, 30))
             except Exception as e:
-                print(f"  {code:<8}  {name:<38}  获取失败: {e}")
+                failed[code] = e
+        pool_scores = calc_momentum_scores({c: ohlc_cache[c] for c in Config.all_symbols[:] if c in ohlc_cache},
+                                           Config.rank_days)
+
+        for code in Config.all_symbols[:]:
+            name = Config.symbol_to_name.get(code, code)
+            if code in failed:
+                print(f"  {code:<8}  {name:<38}  获取失败: {failed[code]}")
+                continue
+            s = pool_scores[code]
+            flag = "✓" if s > 0 else " "
+            print(f"  {code:<8}  {name:<38}  {s:>10.4f} {flag}")
+            if s > 0:
+                scores.append({'code': code, 'score': s})
         print(f"  {'-' * 60}\n")
 
         if scores:
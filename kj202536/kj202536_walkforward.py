@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+36号策略 - 滚动训练 / 样本外检验
+每月用最近 TRAIN_MONTHS 个月的数据并行扫描 RSRS_M / Threshold / Cycle，取最优参数在下一个月样本外运行，
+拼接所有样本外月份得到真实可复现的净值；最后给出截至最新交易日训练出的参数，供下月实盘使用。
+窗口结果缓存在 localdata/walkforward/kj202536/，每月重跑只需计算新增的窗口。
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kj202536_batch_regression import prepare_data, backtest, START_DATE
+from utils.sweeprunner import SweepRunner
+from utils.walkforward import WalkForward
+
+# ================= 可配置参数 =================
+TRAIN_MONTHS = 24           # 训练窗口长度（月）
+TEST_MONTHS  = 1            # 样本外窗口长度（月），即重新调参的频率
+ANCHORED     = False        # True: 训练窗口从数据起点开始不断扩展
+OBJECTIVE    = 'sharpe'     # sharpe / ann_return / total_return / calmar
+WORKERS      = None         # None = 全部 CPU 核心
+VERSION      = '1'          # 回测逻辑改动后修改此值，使所有窗口缓存失效
+
+PARAM_SPACE = {
+    'RSRS_M': [300, 450, 600],
+    'Threshold': [0.3, 0.5, 0.7, 0.9],
+    'Cycle': [5, 10, 20],
+}
+
+
+def main():
+    data = prepare_data()
+    params = SweepRunner.grid(PARAM_SPACE)
+    wf = WalkForward('kj202536', backtest, data, params, objective=OBJECTIVE,
+                     workers=WORKERS, version=VERSION)
+    res = wf.run(data['returns'].index, TRAIN_MONTHS, TEST_MONTHS, ANCHORED, test_start=START_DATE)
+
+    stats = res['stats']
+    print("\n" + "=" * 30 + " 滚动窗口明细 " + "=" * 30)
+    print(res['windows'].to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print("=" * 74)
+    print(f"样本外区间: {res['nav'].index[0].date()} — {res['nav'].index[-1].date()}")
+    print(f"样本外总收益: {stats['total_return']:.2%}  年化: {stats['ann_return']:.2%}  "
+          f"最大回撤: {stats['max_drawdown']:.2%}  夏普: {stats['sharpe']:.2f}")
+    print(f"下月建议参数: {res['next_params']}")
+
+
+if __name__ == '__main__':
+    main()
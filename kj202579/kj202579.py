@@ -22,7 +22,13 @@ if parent_dir not in sys.path:
 
 from utils.utilities import StrategyLedger, BlacklistManager, StateManager
 from utils.stockmgr import StockMgr
+from utils.tickhub import TickHub
 from utils.trademgr import TradeMgr
+from utils.scheduler import Scheduler
+from utils.ordertracker import OrderTracker
+from utils.orderexecutor import OrderExecutor
+from utils.stoploss import StopLossEngine
+from utils.eventlog import EventLog
 # ================= 1. 全局配置与参数 =================
 BEIJING_TZ = timezone(timedelta(hours=8))
 class Config:
@@ -59,9 +65,18 @@ class MyCallback(XtQuantTraderCallback):
     
     def on_stock_order(self, order):
         print(f"订单更新: {order.stock_code}, 状态: {order.order_status_msg}, 成交均价: {order.traded_price}, 成交量: {order.traded_volume}")
+        OrderTracker.instance().on_stock_order(order)
         
     def on_stock_trade(self, trade):
         print(f"成交回报: {trade.stock_code}, 数量: {trade.traded_volume}, 价格: {trade.traded_price}")
+        OrderTracker.instance().on_stock_trade(trade)
+
+    def on_order_error(self, order_error):
+        print(f"委托失败: 委托号 {order_error.order_id}, 原因: {order_error.error_msg}")
+        OrderTracker.instance().on_order_error(order_error)
+
+    def on_order_stock_async_response(self, response):
+        OrderTracker.instance().on_order_stock_async_response(response)
 
 
 
@@ -281,9 +296,8 @@ def check_stop_loss(trader, account, state):
     df_idx = xtdata.get_market_data_ex(['close'], [Config.index_code], period='1d', count=2).get(Config.index_code)
     if df_idx is not None and len(df_idx) >= 2:
         prev_close = df_idx['close'].iloc[-2]
-        tick_data = xtdata.get_full_tick([Config.index_code])
-        if Config.index_code in tick_data and prev_close > 0:
-            current_idx_price = tick_data[Config.index_code]['lastPrice']
+        current_idx_price = TickHub.instance().price(Config.index_code)
+        if current_idx_price > 0 and prev_close > 0:
             down_ratio = (current_idx_price / prev_close) - 1
             print(f"大盘相对昨收涨跌幅: {down_ratio:.2%} (昨收: {prev_close:.2f}, 当前: {current_idx_price:.2f})")
             if down_ratio <= -Config.stoploss_market:
@@ -293,7 +307,8 @@ def check_stop_loss(trader, account, state):
     strategy_stocks = GlobalVar.strategy_ledger.get_all()
 
     # 2. 追踪止损：持续更新历史最高价，以最高价×(1-止损比例)作为止损线
-    high_prices = state.get('stock_high_prices') or {}
+    #    盘中止损引擎线程也会改这份高点，这里读副本，写回一律走 state.update
+    high_prices = dict(state.get('stock_high_prices') or {})
 
     for pos in positions:
         code = pos.stock_code
@@ -308,15 +323,14 @@ def check_stop_loss(trader, account, state):
         # 更新追踪高点
         if current_price > high_prices.get(code, 0):
             high_prices[code] = current_price
-            state.set('stock_high_prices', high_prices)
+            raise_high(state, code, current_price)
 
         trail_high = high_prices.get(code, cost)
 
         if GlobalVar.market_crash:
             if order_target_volume(trader, account, code, 0, current_price, 'market_crash_sell'):
                 GlobalVar.blacklist_mgr.add(code)
-                high_prices.pop(code, None)
-                state.set('stock_high_prices', high_prices)
+                drop_high(state, code)
             continue
 
         # 盈利保护：盈利超过阈值时收窄追踪止损，让利润继续跑但保护更严
@@ -330,8 +344,19 @@ def check_stop_loss(trader, account, state):
                 print(f"[{code}] 追踪止损触发（当前 {current_price:.2f} < 历史高点 {trail_high:.2f} × {1-trail_pct:.0%}），关进 30 天小黑屋！")
             if order_target_volume(trader, account, code, 0, current_price, 'stop_loss'):
                 GlobalVar.blacklist_mgr.add(code)
-                high_prices.pop(code, None)
-                state.set('stock_high_prices', high_prices)
+                drop_high(state, code)
+
+
+def raise_high(state, code, price):
+    """追踪高点只升不降；在状态锁内基于最新值生成新字典写回，不与止损引擎线程的写入互相覆盖"""
+    state.update('stock_high_prices',
+                 lambda highs: {**(highs or {}), code: max(price, (highs or {}).get(code, 0))})
+
+
+def drop_high(state, code):
+    """清仓后删除该股的追踪高点"""
+    state.update('stock_high_prices',
+                 lambda highs: {c: h for c, h in (highs or {}).items() if c != code})
 
 def adjust_positions(trader, account, target_list):
     """【目标调仓】对比当前持仓，执行卖出和买入，实现等权重调仓"""
@@ -347,20 +372,23 @@ def adjust_positions(trader, account, target_list):
     strategy_holdings = [code for code in hold_list if code in GlobalVar.strategy_ledger.get_all()]
     sell_list = [code for code in strategy_holdings if code not in target_list]
 
-    has_sell_order = False
-    sold_targets   = {}   # {stock_code: pre_sell_market_value}，用于轮询确认成交
-    # 1. 卖出不在目标列表中的股票
+    executor = OrderExecutor(trader, account)
+    sold_targets = {}   # {stock_code: 卖单委托号}，买入前等待这些卖单结束
+    # 1. 卖出不在目标列表中的股票（整篮并发发出）
+    legs = []
     for p in positions:
         if p.volume > 0 and p.stock_code in sell_list:
-            print(f"调仓卖出: {p.stock_code}")
-            if order_target_volume(trader, account, p.stock_code, 0, 0, 'rebalance_sell'):
-                has_sell_order = True
-                sold_targets[p.stock_code] = p.market_value
+            if p.can_use_volume <= 0:
+                print(f"--> [忽略请求] {p.stock_code} 需卖出，但可用额度为 0 (可能是 T+1 锁仓或在途冻结)。")
+                continue
+            print(f"调仓卖出: {p.stock_code} | 数量: {p.can_use_volume}股")
+            legs.append(OrderExecutor.leg(p.stock_code, xtconstant.STOCK_SELL, p.can_use_volume, 'strategy', 'rebalance_sell'))
+    if legs and not DEBUG:
+        sold_targets = {r['stock_code']: r['order_id'] for r in executor.submit(legs) if r['ok']}
 
-    if has_sell_order:
-        print("已发送卖出指令，轮询等待成交确认...")
-        if not DEBUG:
-            TradeMgr.wait_for_sells(trader, account, sold_targets, timeout=120, interval=5)
+    if sold_targets:
+        print("已发送卖出指令，等待卖单结束...")
+        TradeMgr.wait_for_sells(trader, account, sold_targets, timeout=120, interval=5)
 
     #重新获取 positions
     positions = trader.query_stock_positions(account)
@@ -395,22 +423,27 @@ def adjust_positions(trader, account, target_list):
         
     cash_per_stock = available_cash / len(buy_list)
     
-    # 【修正处 3：买入前的新标的行情下载】往前推 5 天，确保覆盖最新 1 天
-    start_date_buy = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=5)).strftime("%Y%m%d")
+    # 同一份最新价快照给所有买入腿定价，再一次性并发发出
+    prices = TickHub.instance().prices(buy_list)
+    legs = []
     for code in buy_list:
-        StockMgr.download_history([code], start_time=start_date_buy, period='1d')
-        price_df = xtdata.get_market_data_ex(['close'], [code], period='1d', count=1)
-        if code in price_df and not price_df[code].empty:
-            price = price_df[code]['close'].iloc[-1]
+        price = prices.get(code, 0)
+        if price > 0:
             volume = int(cash_per_stock / price / 100) * 100 # 向下取整到整百股
             if volume > 0:
-                order_target_volume(trader, account, code, volume, price, 'rebalance_buy')
+                print(f"--> [发送订单] 动作: 买入 | 代码: {code} | 数量: {volume}股 | 挂单价: {price} | 业务: rebalance_buy")
+                legs.append(OrderExecutor.leg(code, xtconstant.STOCK_BUY, volume, 'strategy', 'rebalance_buy', price=price))
+    if legs and not DEBUG:
+        # 只要柜台没有立刻报错拒单，就先记账（没成交的下次调仓时由容错代码剔除）
+        for r in executor.submit(legs):
+            if r['ok']:
+                GlobalVar.strategy_ledger.add(r['stock_code'])
 
     print(f"调仓完毕，当前策略名下持仓: {GlobalVar.strategy_ledger.get_all()}")
 
 
 def order_target_volume(trader, account, stock_code, target_vol, price, remark='adjust'):
-    """基础辅助函数：下单直到满足目标股数"""
+    """基础辅助函数：下单直到满足目标股数，返回委托号；未报单或报单失败返回 0（可直接当布尔值判断）"""
     positions = trader.query_stock_positions(account)
     current_vol = 0
     can_use_vol = 0
@@ -430,7 +463,7 @@ def order_target_volume(trader, account, stock_code, target_vol, price, remark='
         # 如果后续没成交，下一次调仓时的容错代码会自动把它从账本里删掉
         if seq != -1:
             GlobalVar.strategy_ledger.add(stock_code)
-        return seq != -1
+        return seq if seq != -1 else 0
     
     elif diff < 0:
         sell_vol = min(abs(diff), can_use_vol)
@@ -445,23 +478,94 @@ def order_target_volume(trader, account, stock_code, target_vol, price, remark='
             if seq == -1:
                 print(f"❌ [拒单] {stock_code} 卖出报单失败！")
             
-            return seq != -1
+            return seq if seq != -1 else 0
         else:
             print(f"--> [忽略请求] {stock_code} 需卖出，但可用额度为 0 (可能是 T+1 锁仓或在途冻结)。")
-            return False
-    return False
+            return 0
+    return 0
 
 # ================= 5. 定时任务主循环 =================
 
-def run_strategy():
-    # 初始化状态管理器（跨重启持久化任务执行记录与追踪止损高点）
+def register_stoploss(engine, trader, account, state):
+    """个股追踪止损 / 盈利保护登记到实时止损引擎（大盘暴跌止损仍由 check_stop_loss 巡检判断）"""
+    def holdings():
+        return [code for code in GlobalVar.strategy_ledger.get_all() if code != Config.etf]
+
+    def exit(code, volume, price, reason):
+        print(f"[{code}] 盘中{reason}触发（现价 {price:.2f}），关进 30 天小黑屋！")
+        if not order_target_volume(trader, account, code, 0, price, 'stop_loss'):
+            return False
+        GlobalVar.blacklist_mgr.add(code)
+        drop_high(state, code)
+        return True
+
+    def save_highs(highs):
+        """引擎盘中观察到的新高写回状态，14:00 巡检与重启后都从这里接着追踪"""
+        state.update('stock_high_prices', lambda old: {
+            **(old or {}), **{code: h for code, h in highs.items() if h > (old or {}).get(code, 0)}})
+
+    engine.register('kj202579', holdings=holdings, exit=exit, trail=Config.stoploss_limit,
+                    protect=(Config.stopearning_limit, Config.stopearning_trail),
+                    highs=lambda: dict(state.get('stock_high_prices') or {}), save_highs=save_highs)
+
+
+def build_tasks(trader, account, stoploss=None):
+    """每日定时任务 [(名称, 触发时刻, 函数)]，单独运行与 StrategyHost 托管共用；给出 stoploss 引擎时同时登记实时止损"""
+    # 初始化状态管理器（跨重启持久化追踪止损高点）
     state = StateManager(os.path.join(current_dir, 'kj202579_state.json'), defaults={
-        'task_09_05_date': '',
-        'task_10_00_date': '',
-        'task_14_00_date': '',
         'stock_high_prices': {},
     })
+    if stoploss is not None:
+        register_stoploss(stoploss, trader, account, state)
+
+    # 09:05 盘前准备：重置大盘止损标志 + 测算大盘趋势并更新仓位数量
+    def task_09_05():
+        GlobalVar.market_crash = False  # 每天盘前重置，防止昨日触发的标志影响今天
+        GlobalVar.stock_num = get_market_trend_stock_num()
+        print(f"今日大盘趋势运算完成，计划持仓股数: {GlobalVar.stock_num}")
 
+    # 10:00 调仓时刻：风控检查 + 根据月份与基本面选股池调仓
+    def task_10_00():
+        now = datetime.datetime.now(BEIJING_TZ)
+        check_stop_loss(trader, account, state)
+
+        is_rebalance_day = (now.weekday() == 0) or DEBUG
+
+        if now.month in Config.pass_months:
+            print(f"当前为规避月份({now.month}月)，空仓防雷，买入 ETF。")
+            adjust_positions(trader, account, [Config.etf])
+        elif is_rebalance_day and not GlobalVar.market_crash:
+            print("今日是调仓日, 开始评估持仓排名与宽容度...")
+            GlobalVar.target_list = get_tolerant_target_list(
+                trader,
+                account,
+                target_num=GlobalVar.stock_num,
+                tolerance_pool_size=10
+            )
+            adjust_positions(trader, account, GlobalVar.target_list)
+        else:
+            print("今日非调仓日，仅执行风控监控。")
+
+    # 14:00 下午风控：再次检查系统暴跌或个股止损
+    def task_14_00():
+        check_stop_loss(trader, account, state)
+
+    return [('task_09_05', '09:05:00', task_09_05),
+            ('task_10_00', '10:00:00', task_10_00),
+            ('task_14_00', '14:00:00', task_14_00)]
+
+
+def setup(host):
+    """StrategyHost 插件入口：共用宿主的交易会话与调度器（见 utils/strategyhost.py）"""
+    global DEBUG
+    DEBUG = host.debug
+    host.add_callback(MyCallback())
+    for name, at, fn in build_tasks(host.trader, host.account, host.stoploss):
+        host.on_debug(fn)
+        host.scheduler.daily(f'kj202579.{name}', at, fn)
+
+
+def run_strategy():
     # 初始化交易接口
     session_id = int(time.time())
     trader = XtQuantTrader(Config.mini_qmt_path, session_id)
@@ -475,51 +579,21 @@ def run_strategy():
     trader.subscribe(account)
     print("====== QMT 交易接口连接成功，策略启动 ======")
 
-    while True:
-        now = datetime.datetime.now(BEIJING_TZ)
-        time_str = now.strftime("%H:%M")
-        today_str = now.strftime("%Y%m%d")
-
-        # 09:05 盘前准备：重置大盘止损标志 + 测算大盘趋势并更新仓位数量
-        if DEBUG or (time_str == "09:05" and state.get('task_09_05_date') != today_str):
-            GlobalVar.market_crash = False  # 每天盘前重置，防止昨日触发的标志影响今天
-            GlobalVar.stock_num = get_market_trend_stock_num()
-            print(f"[{time_str}] 今日大盘趋势运算完成，计划持仓股数: {GlobalVar.stock_num}")
-            state.set('task_09_05_date', today_str)
-
-        # 10:00 调仓时刻：风控检查 + 根据月份与基本面选股池调仓
-        if DEBUG or (time_str == "10:00" and state.get('task_10_00_date') != today_str):
-            check_stop_loss(trader, account, state)
-
-            is_rebalance_day = (now.weekday() == 0) or DEBUG
-
-            if now.month in Config.pass_months:
-                print(f"[{time_str}] 当前为规避月份({now.month}月)，空仓防雷，买入 ETF。")
-                adjust_positions(trader, account, [Config.etf])
-            elif is_rebalance_day and not GlobalVar.market_crash:
-                print(f"[{time_str}] 今日是调仓日, 开始评估持仓排名与宽容度...")
-                GlobalVar.target_list = get_tolerant_target_list(
-                    trader,
-                    account,
-                    target_num=GlobalVar.stock_num,
-                    tolerance_pool_size=10
-                )
-                adjust_positions(trader, account, GlobalVar.target_list)
-            else:
-                print(f"[{time_str}] 今日非调仓日，仅执行风控监控。")
-
-            state.set('task_10_00_date', today_str)
+    sched = Scheduler(os.path.join(current_dir, 'kj202579_schedule.json'))
+    stoploss = StopLossEngine(trader, account)
+    for name, at, fn in build_tasks(trader, account, stoploss):
+        sched.daily(name, at, fn)
 
-        # 14:00 下午风控：再次检查系统暴跌或个股止损
-        if DEBUG or (time_str == "14:00" and state.get('task_14_00_date') != today_str):
-            check_stop_loss(trader, account, state)
-            state.set('task_14_00_date', today_str)
-
-        # 防止高频死循环占用CPU
-        if DEBUG:
-            break
-        else:
-            time.sleep(1)
+    if DEBUG:
+        sched.run_all_now()
+    else:
+        # 盘中逐 tick 追踪止损，10:00 / 14:00 的风控巡检作为兜底
+        stoploss.start()
+        # 非交易日自动跳过；执行记录落盘，同一天重启不会重复执行，错过的时刻（收盘前）启动时补跑
+        try:
+            sched.run_forever()
+        finally:
+            stoploss.stop()
 
 
 DEBUG = True
@@ -539,6 +613,7 @@ if __name__ == '__main__':
     else:
         print(">>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。")
         DEBUG = True
+    EventLog.setup(tag='[实盘]' if args.mode == 'REAL' else '[调试]')
     run_strategy()
 
 #Todo: Debug the policy after the change.
\ No newline at end of file
@@ -32,6 +32,12 @@ import xtquant.xtconstant as xtconstant
 
 from utils.utilities import StrategyVolumeLedger, SingleInstanceLock, MessagePusher
 from utils.stockmgr import StockMgr
+from utils.tickhub import TickHub
+from utils.scheduler import Scheduler
+from utils.ordertracker import OrderTracker
+from utils.trademgr import TradeMgr
+from utils.stoploss import StopLossEngine
+from utils.eventlog import EventLog
 
 # ================= 1. 全局配置 =================
 
@@ -96,9 +102,15 @@ class MyCallback(XtQuantTraderCallback):
             f"| 成交均价: {getattr(order, 'traded_price', 0.0):.4f} "
             f"| 成交量: {getattr(order, 'traded_volume', 0)}"
         )
+        OrderTracker.instance().on_stock_order(order)
+
+    def on_order_error(self, order_error):
+        print(f"[废单] 委托号: {order_error.order_id} | 原因: {order_error.error_msg}")
+        OrderTracker.instance().on_order_error(order_error)
 
     def on_stock_trade(self, trade):
         print(f"[成交] {trade.stock_code} | 数量: {trade.traded_volume} | 价格: {trade.traded_price:.4f}")
+        OrderTracker.instance().on_stock_trade(trade)
         strategy_name = getattr(trade, 'strategy_name', '')
         stock_code = getattr(trade, 'stock_code', '')
         traded_volume = int(getattr(trade, 'traded_volume', 0) or 0)
@@ -117,19 +129,17 @@ class MyCallback(XtQuantTraderCallback):
 def get_latest_price(stock_code: str) -> float:
     """
     获取最新成交价，两级容错：
-      1. get_full_tick  — 实时 tick，正常交易时间首选
+      1. TickHub 快照   — 实时 tick，正常交易时间首选
       2. 日线收盘价     — tick 不可用时的 fallback
     两者均失败则返回 0.0，调用方需自行跳过该 ETF。
     """
-    # ── 第一优先：实时 tick ───────────────────────────────────────
+    # ── 第一优先：实时 tick（进程内 TickHub 推送快照）────────────────
     try:
-        tick = xtdata.get_full_tick([stock_code])
-        if stock_code in tick:
-            price = tick[stock_code].get('lastPrice', 0.0)
-            if price > 0:
-                return price
+        price = TickHub.instance().price(stock_code)
+        if price > 0:
+            return price
     except Exception as e:
-        print(f"[警告] get_full_tick 失败 ({stock_code}): {e}")
+        print(f"[警告] 获取 tick 失败 ({stock_code}): {e}")
 
     # ── Fallback：最近一根日线收盘价 ─────────────────────────────
     print(f"[警告] {stock_code} tick 价格无效，回落到日线收盘价...")
@@ -256,30 +266,30 @@ def check_equity_stoploss(trader: XtQuantTrader, account: StockAccount,
     return stopped
 
 
-def wait_for_ledger_sells(target_volumes: dict, timeout: int = 120, interval: int = 5):
-    """等待 90 号账本达到卖出后的目标份数，不要求账户聚合持仓清零。"""
-    deadline = time.time() + timeout
-    pending = set(target_volumes)
+def register_stoploss(engine, trader: XtQuantTrader, account: StockAccount):
+    """
+    权益类 ETF 成本回撤止损登记到实时止损引擎：盘中跌破即卖出，不再等 14:35 再平衡。
+    份数以 90 号账本为准，账户合计份数与账本不一致时引擎跳过该代码（与 check_equity_stoploss 相同）。
+    """
+    def holdings():
+        owned = GlobalVar.strategy_ledger.get_all()
+        return {code: owned[code] for code in Config.equity_etfs if owned.get(code, 0) > 0}
 
-    while pending and time.time() < deadline:
-        time.sleep(interval)
-        confirmed = {
-            code for code in pending
-            if GlobalVar.strategy_ledger.get(code) <= target_volumes[code]
-        }
-        for code in confirmed:
-            print(f"  [✓ 成交确认] {code} | 90号剩余 {GlobalVar.strategy_ledger.get(code)} 份")
-        pending -= confirmed
+    def exit(stock, volume, price, reason):
+        print(f"  [止损] {stock} 盘中现价 {price:.4f} 跌破成本 {Config.stoploss_pct:.0%}，触发清仓！")
+        if DEBUG:
+            return False
+        seq = trader.order_stock(account, stock, xtconstant.STOCK_SELL, volume,
+                                 xtconstant.LATEST_PRICE, price, STRATEGY_SELL_TAG, 'stoploss')
+        return seq is not None and seq > 0
+
+    engine.register('kj202590', holdings=holdings, exit=exit, fixed=Config.stoploss_pct)
 
-    if pending:
-        print(f"  [超时警告] 以下卖单在 {timeout}s 内未完全确认成交: {pending}")
-    else:
-        print("  [轮询完成] 90号全部卖出指令已按账本确认。")
 
 def rebalance(trader: XtQuantTrader, account: StockAccount):
     """
     计算各 ETF 目标市值与实际市值的偏差，满足阈值条件时触发再平衡。
-    执行顺序：止损检查 → 卖出超配（轮询等待成交）→ 买入欠配。
+    执行顺序：止损检查 → 卖出超配（等待卖单结束）→ 买入欠配。
     """
     print("\n" + "=" * 50)
     print(f"[再平衡] 开始检查持仓偏差 @ {datetime.datetime.now(BEIJING_TZ).strftime('%H:%M:%S')}")
@@ -354,7 +364,7 @@ def rebalance(trader: XtQuantTrader, account: StockAccount):
 
     # ── 第一轮：执行卖出 ──────────────────────────────────────────
     has_sell    = False
-    sold_targets: dict = {}   # {stock: 卖出后90号目标份数}，用于轮询成交
+    sold_targets: dict = {}   # {stock: 卖单委托号}，买入前等待这些卖单结束
     print("[再平衡] 第一轮：检查是否需要卖出（超配品种）")
 
     for stock, info in sorted_stocks:
@@ -411,13 +421,13 @@ def rebalance(trader: XtQuantTrader, account: StockAccount):
                 print(f"  [拒单] {stock} 卖出报单失败，不进入成交等待。")
                 continue
             sell_log.append(f"{stock} {sell_shares}份 @{latest_price:.4f} 预计到手{proceeds:,.0f}元")
-            sold_targets[stock] = owned_volume - sell_shares
+            sold_targets[stock] = order_id
         has_sell = True
 
     if has_sell:
-        print("\n[再平衡] 已发送卖出指令，轮询等待成交确认...")
+        print("\n[再平衡] 已发送卖出指令，等待卖单结束...")
         if not DEBUG:
-            wait_for_ledger_sells(sold_targets, timeout=120, interval=5)
+            TradeMgr.wait_for_sells(trader, account, sold_targets, timeout=120, interval=5)
 
     # ── 第二轮：执行买入 ──────────────────────────────────────────
     # 重新查询可用资金（卖出可能已到账）
@@ -502,15 +512,30 @@ def rebalance(trader: XtQuantTrader, account: StockAccount):
 
 # ================= 6. 策略主循环 =================
 
-def is_trading_day() -> bool:
-    """判断今天是否是 A 股交易日（查 QMT 上交所日历）"""
-    today = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
-    try:
-        days = xtdata.get_trading_dates('SH', today, today)
-        return len(days) > 0
-    except Exception as e:
-        print(f"[警告] 交易日查询失败: {e}，默认视为交易日继续运行。")
-        return True
+def daily_rebalance(trader, account):
+    """每日再平衡：先更新 ETF 行情，再检查偏差并下单"""
+    download_etf_data()   # 保证行情最新
+    rebalance(trader, account)
+
+
+def setup(host):
+    """StrategyHost 插件入口：共用宿主的交易会话与调度器（见 utils/strategyhost.py）"""
+    global DEBUG
+    DEBUG = host.debug
+    ledger = GlobalVar.strategy_ledger
+    if not DEBUG and not ledger.initialized:
+        reason = f"账本损坏: {ledger.load_error}" if ledger.load_error else '账本尚未初始化'
+        raise RuntimeError(f"REAL 模式拒绝启动：{reason}。请先单独运行 kj202590.py --init-ledger 初始化")
+    if not host.lock(os.path.join(current_dir, 'kj202590.lock')):
+        raise RuntimeError('90号策略已有一个实例正在运行')
+    host.add_callback(MyCallback(ledger))
+    register_stoploss(host.stoploss, host.trader, host.account)
+
+    def job():
+        daily_rebalance(host.trader, host.account)
+
+    host.on_debug(job)
+    host.scheduler.daily('kj202590.rebalance', '14:35:00', job, until='14:56:00')
 
 
 def run_strategy():
@@ -536,31 +561,24 @@ def run_strategy():
     # ── 预下载行情 ────────────────────────────────────────────────
     download_etf_data()
 
-    # ── 每日任务执行标记 ─────────────────────────────────────────
-    task_done = {'14:35': False}
-
-    while True:
-        now      = datetime.datetime.now(BEIJING_TZ)
-        time_str = now.strftime('%H:%M')
-
-        # 午夜重置任务标记
-        if time_str == '00:00':
-            for k in task_done:
-                task_done[k] = False
-            time.sleep(1)
+    # ── 14:35 每日再平衡 ──────────────────────────────────────────
+    if DEBUG:
+        daily_rebalance(trader, account)
+        return
 
-        # ── 14:35 每日再平衡 ──────────────────────────────────────
-        # 选在开盘 5 分钟后执行，避开集合竞价的价格异常波动
-        if DEBUG or (time_str == '14:35' and not task_done['14:35'] and is_trading_day()):
-            print(f"\n[{time_str}] 触发每日再平衡任务...")
-            download_etf_data()   # 保证行情最新
-            rebalance(trader, account)
-            task_done['14:35'] = True
+    # 非交易日自动跳过；执行记录落盘，同一天重启不会重复再平衡；
+    # 14:35 之后启动会立即补跑，但不晚于 14:56（收盘集合竞价前）
+    # 盘中逐 tick 监控权益类 ETF 止损，14:35 再平衡里的止损检查作为兜底
+    stoploss = StopLossEngine(trader, account)
+    register_stoploss(stoploss, trader, account)
+    stoploss.start()
 
-        if DEBUG:
-            break
-        else:
-            time.sleep(1)
+    sched = Scheduler(os.path.join(current_dir, 'kj202590_schedule.json'))
+    sched.daily('rebalance', '14:35:00', lambda: daily_rebalance(trader, account), until='14:56:00')
+    try:
+        sched.run_forever()
+    finally:
+        stoploss.stop()
 
 
 # ================= 7. 入口 =================
@@ -587,6 +605,7 @@ if __name__ == '__main__':
     else:
         print('>>> 当前处于 [DEBUG 调试模式]：仅输出日志，不触发真实报单。')
         DEBUG = True
+    EventLog.setup(tag='[实盘]' if args.mode == 'REAL' else '[调试]')
 
     instance_lock = SingleInstanceLock(os.path.join(current_dir, 'kj202590.lock'))
     if not instance_lock.acquire():
@@ -17,6 +17,8 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 from utils.stockmgr import StockMgr
+from utils.downloadmgr import DownloadMgr
+from utils.eventlog import EventLog
 from xtquant import xtdata
 
 # ================= 1. 基础配置与网络防断装甲 =================
@@ -286,7 +288,7 @@ def download_xtquant_data():
     pool1  = StockMgr.query_stocks_in_sector('000300.SH')
     pool2 = StockMgr.query_stocks_in_sector('000852.SH')
     pool = list(pool1) + list(pool2) + ['000300.SH', '000852.SH']
-    StockMgr.download_history(pool, start_time='20260101', period='1d', showprogress=True)
+    DownloadMgr.download(pool, start_time='20260101', period='1d', showprogress=True)
     print(f"✅ 股票历史数据下载完毕。")
     time.sleep(5)
     xtdata.download_financial_data2(pool, table_list=['PershareIndex','Income', 'Capital'], start_time='20250930',
@@ -314,4 +316,5 @@ if __name__ == '__main__':
     # print("\n🎉 所有数据更新程序执行完毕！")
    
     # #time.sleep(3) # 模块间休眠
+    EventLog.setup()
     download_xtquant_data() 
\ No newline at end of file
@@ -1,6 +1,55 @@
-from .utilities import StrategyLedger, BlacklistManager, MessagePusher, StateManager, DateMgr
-from .stockmgr import StockInfo, StockMgr
-from .marketmgr import MarketMgr
-from .trademgr import TradeMgr
+# 按需导入：只有真正用到某个类时才加载对应模块，
+# 这样纯计算模块（如 utils.rsrs）可以在没有 xtquant / msvcrt 的环境（港股、美股版脚本）中单独使用。
+import importlib
 
-__all__ = ['StrategyLedger', 'BlacklistManager', 'MessagePusher', 'StateManager', 'DateMgr', 'StockInfo', 'StockMgr', 'MarketMgr', 'TradeMgr']
+_EXPORTS = {
+    'StrategyLedger': 'utilities',
+    'BlacklistManager': 'utilities',
+    'MessagePusher': 'utilities',
+    'StateManager': 'utilities',
+    'DateMgr': 'utilities',
+    'StockInfo': 'stockmgr',
+    'StockMgr': 'stockmgr',
+    'MarketMgr': 'marketmgr',
+    'TradeMgr': 'trademgr',
+    'BarStore': 'barstore',
+    'DownloadMgr': 'downloadmgr',
+    'RSRS': 'rsrs',
+    'RSRSStream': 'rsrs',
+    'Momentum': 'momentum',
+    'TickHub': 'tickhub',
+    'InstrumentMgr': 'instrumentmgr',
+    'FinancialStore': 'financialstore',
+    'DividendStore': 'dividendstore',
+    'PortfolioSim': 'portfoliosim',
+    'SweepRunner': 'sweeprunner',
+    'WalkForward': 'walkforward',
+    'SimClock': 'replay',
+    'SimXtData': 'replay',
+    'SimTrader': 'replay',
+    'ReplayRunner': 'replay',
+    'Scheduler': 'scheduler',
+    'OrderTracker': 'ordertracker',
+    'OrderExecutor': 'orderexecutor',
+    'AccountCache': 'accountcache',
+    'CachedTrader': 'accountcache',
+    'OrderIndex': 'orderindex',
+    'StrategyHost': 'strategyhost',
+    'JournalStore': 'journal',
+    'StopLossEngine': 'stoploss',
+    'PushQueue': 'pushqueue',
+    'EventLog': 'eventlog',
+    'get_logger': 'eventlog',
+    'Timing': 'timing',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'utils' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
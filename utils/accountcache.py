@@ -0,0 +1,205 @@
+__all__ = ['AccountCache', 'CachedTrader']
+
+import copy
+import time
+import threading
+from dataclasses import dataclass, field
+from utils.tickhub import TickHub
+
+
+@dataclass(frozen=True)
+class AccountSnapshot:
+    """某一时刻的账户状态（只读，version 每次变化 +1）"""
+    version: int
+    positions: dict = field(default_factory=dict)     # code -> 持仓对象（volume > 0）
+    asset: object = None
+    at: float = 0.0                                   # 从柜台全量查询的时刻
+
+
+class AccountCache:
+    """
+    推送维护的账户状态缓存（持仓 + 资产）。
+
+    首次读取时向柜台全量查询一次，之后由交易推送保持最新：
+      - on_stock_position / on_stock_asset 直接替换对应条目；
+      - on_stock_trade / on_stock_order / on_order_error 只把缓存标记为过期（成交、报单冻结、废单解冻
+        都会改变可用数量和资金），下一次读取时再全量查询一次。一篮子委托无论多少笔都只会触发一次查询；
+      - 超过 max_age 秒没有全量查询过时也会重查一次，兜底推送丢失（断线重连等）。
+    读取返回的持仓 / 资产是副本，市值按 TickHub 最新价重新计算（推送不会因行情变化而更新市值）。
+    每次变化生成新的不可变快照（写时复制），读方拿到的 positions / asset / version 总是彼此一致的。
+
+    通常不直接使用，而是通过 CachedTrader 透明接入。
+    """
+
+    def __init__(self, trader, account, max_age: float = 60):
+        self.trader = trader
+        self.account = account
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snap = None
+        self._dirty = True
+        self._gen = 0                       # 每次标记过期 +1，查询期间又过期时不清除过期标记
+        self._version = 0
+        self.queries = 0                    # 向柜台全量查询的次数（观察 IPC 流量用）
+
+    # ------------------------------------------------------------------ #
+    #  推送入口（由交易回调线程调用）
+    # ------------------------------------------------------------------ #
+    def on_stock_position(self, position) -> None:
+        with self._lock:
+            if self._snap is None:
+                return
+            positions = dict(self._snap.positions)
+            if position.volume > 0:
+                positions[position.stock_code] = position
+            else:
+                positions.pop(position.stock_code, None)
+            self._publish(positions, self._snap.asset, self._snap.at)
+
+    def on_stock_asset(self, asset) -> None:
+        with self._lock:
+            if self._snap is not None:
+                self._publish(self._snap.positions, asset, self._snap.at)
+
+    def on_stock_trade(self, trade) -> None:
+        self.invalidate()
+
+    def on_stock_order(self, order) -> None:
+        self.invalidate()
+
+    def on_order_error(self, order_error) -> None:
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._gen += 1
+            self._dirty = True
+
+    def _publish(self, positions: dict, asset, at: float) -> None:
+        self._version += 1
+        self._snap = AccountSnapshot(self._version, positions, asset, at)
+
+    # ------------------------------------------------------------------ #
+    #  读取
+    # ------------------------------------------------------------------ #
+    def _seed(self) -> None:
+        gen = self._gen
+        positions = self.trader.query_stock_positions(self.account) or []
+        asset = self.trader.query_stock_asset(self.account)
+        with self._lock:
+            self.queries += 1
+            self._dirty = self._gen != gen
+            self._publish({p.stock_code: p for p in positions if p.volume > 0}, asset, time.time())
+
+    def snapshot(self) -> AccountSnapshot:
+        """当前快照；过期或超过 max_age 时先全量查询一次"""
+        snap = self._snap
+        if snap is None or self._dirty or time.time() - snap.at > self.max_age:
+            self._seed()
+            snap = self._snap
+        return snap
+
+    def _marked(self, snap: AccountSnapshot) -> dict:
+        """按 TickHub 最新价重算市值后的持仓副本 {code: 持仓}"""
+        prices = TickHub.instance().prices(list(snap.positions)) if snap.positions else {}
+        out = {}
+        for code, pos in snap.positions.items():
+            p = copy.copy(pos)
+            if code in prices:
+                p.market_value = p.volume * prices[code]
+            out[code] = p
+        return out
+
+    def positions(self) -> list:
+        return list(self._marked(self.snapshot()).values())
+
+    def position(self, stock_code: str):
+        snap = self.snapshot()
+        if stock_code not in snap.positions:
+            return None
+        return self._marked(AccountSnapshot(snap.version, {stock_code: snap.positions[stock_code]}))[stock_code]
+
+    def asset(self):
+        snap = self.snapshot()
+        if snap.asset is None:
+            return None
+        asset = copy.copy(snap.asset)
+        market_value = sum(p.market_value for p in self._marked(snap).values())
+        asset.market_value = market_value
+        asset.total_asset = asset.cash + asset.frozen_cash + market_value
+        return asset
+
+
+class _Relay:
+    """注册到真实 trader 上的回调：先更新缓存，再转发给策略自己的回调对象"""
+
+    HOOKS = ('on_stock_position', 'on_stock_asset', 'on_stock_trade', 'on_stock_order', 'on_order_error')
+
+    def __init__(self, cache: AccountCache):
+        self.cache = cache
+        self.target = None
+        for name in self.HOOKS:
+            setattr(self, name, self._hook(name))
+
+    def _hook(self, name):
+        update = getattr(self.cache, name)
+
+        def relay(obj):
+            update(obj)
+            fn = getattr(self.target, name, None)
+            if fn is not None:
+                fn(obj)
+        return relay
+
+    def __getattr__(self, name):
+        if name.startswith('on_'):
+            fn = getattr(self.target, name, None)
+            return fn if fn is not None else (lambda *args, **kwargs: None)
+        raise AttributeError(name)
+
+
+class CachedTrader:
+    """
+    XtQuantTrader 的透明代理：本账户的 query_stock_positions / query_stock_position / query_stock_asset
+    由 AccountCache 回答（纯内存读），其余方法原样转发给真实 trader。
+
+    策略自己的回调照常 register_callback，代理会先用推送更新缓存再转发。
+
+    用法：
+        trader = CachedTrader(XtQuantTrader(qmt_path, session_id), acc)
+        trader.register_callback(MyCallback())
+        trader.start(); trader.connect(); trader.subscribe(acc)
+        trader.query_stock_positions(acc)          # 不再每次都走 IPC
+        trader.cache.queries                       # 实际向柜台查询的次数
+    """
+
+    def __init__(self, trader, account, max_age: float = 60):
+        self._trader = trader
+        self._account_id = account.account_id
+        self.cache = AccountCache(trader, account, max_age)
+        self._relay = _Relay(self.cache)
+        trader.register_callback(self._relay)
+
+    def __getattr__(self, name):
+        return getattr(self._trader, name)
+
+    def register_callback(self, callback) -> None:
+        self._relay.target = callback
+
+    def _mine(self, account) -> bool:
+        return getattr(account, 'account_id', None) == self._account_id
+
+    def query_stock_positions(self, account) -> list:
+        if self._mine(account):
+            return self.cache.positions()
+        return self._trader.query_stock_positions(account)
+
+    def query_stock_position(self, account, stock_code):
+        if self._mine(account):
+            return self.cache.position(stock_code)
+        return self._trader.query_stock_position(account, stock_code)
+
+    def query_stock_asset(self, account):
+        if self._mine(account):
+            return self.cache.asset()
+        return self._trader.query_stock_asset(account)
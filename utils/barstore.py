@@ -0,0 +1,265 @@
+__all__ = ['BarStore', 'LOCAL_DATA_DIR']
+
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+from datetime import timezone, timedelta
+from xtquant import xtdata
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+# 本地派生数据的统一落盘目录（行情仓库、下载水位、财务/分红快照等）
+LOCAL_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'localdata')
+
+
+class BarStore:
+    """
+    本地列式行情仓库。
+
+    每个 (周期, 复权方式) 一个目录，每个字段一个 日期×代码 的 float64 矩阵 (.npy)，
+    另存日期轴 dates.npy (int64, 如 20240102) 与代码轴 meta.json。
+    读取时以 np.load(mmap_mode='r') 内存映射，按日期截取只是切片视图，不复制数据；
+    上千只股票、多年日线的回测可在亚秒级完成加载。
+
+    用法：
+        store = BarStore()
+        store.ensure(codes, start_time='20230101')           # 缺失/过期才会从 xtdata 重建
+        close = store.load_field('close', codes, start_time='20230101')
+        close_asof = store.load_field('close', as_of='20250630')  # 截至某日的视图
+
+    注意：前复权 ('front') 数据在每次除权后整段历史都会变化，因此 build() 对所请求的
+    代码整段重写，而不是只追加新行。
+    """
+
+    DEFAULT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+
+    def __init__(self, root=None, period='1d'):
+        self.period = period
+        self.root = os.path.join(root or LOCAL_DATA_DIR, 'bars', period)
+        self._cache = {}    # dividend_type -> {'dates', 'codes', 'index', 'built_at', 'fields'}
+        self._mmaps = {}    # (dividend_type, field) -> np.memmap
+
+    # ------------------------------------------------------------------ #
+    #  元数据
+    # ------------------------------------------------------------------ #
+    def _dir(self, dividend_type):
+        return os.path.join(self.root, dividend_type)
+
+    def _meta(self, dividend_type):
+        """读取 (并缓存) 日期轴、代码轴；仓库不存在返回 None"""
+        if dividend_type in self._cache:
+            return self._cache[dividend_type]
+        folder = self._dir(dividend_type)
+        meta_path = os.path.join(folder, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['dates'] = np.load(os.path.join(folder, 'dates.npy'))
+        meta['index'] = {code: i for i, code in enumerate(meta['codes'])}
+        self._cache[dividend_type] = meta
+        return meta
+
+    def codes(self, dividend_type='front') -> list:
+        meta = self._meta(dividend_type)
+        return list(meta['codes']) if meta else []
+
+    def dates(self, dividend_type='front') -> pd.DatetimeIndex:
+        meta = self._meta(dividend_type)
+        return self._to_index(meta['dates']) if meta else pd.DatetimeIndex([])
+
+    def _release(self, dividend_type):
+        """写盘前释放本进程持有的映射 (Windows 下被映射的文件无法替换)"""
+        self._cache.pop(dividend_type, None)
+        for key in [k for k in self._mmaps if k[0] == dividend_type]:
+            del self._mmaps[key]
+
+    # ------------------------------------------------------------------ #
+    #  日期转换
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _to_int(t) -> int:
+        """'20240102' / '2024-01-02' / Timestamp / datetime -> 20240102 (分钟线则为 20240102093100)"""
+        if isinstance(t, (pd.Timestamp, datetime.datetime, datetime.date)):
+            return int(pd.Timestamp(t).strftime('%Y%m%d'))
+        return int(str(t).replace('-', '').replace(':', '').replace(' ', ''))
+
+    def _bound(self, t, upper) -> int:
+        """把日期参数对齐到本仓库日期轴的精度 (日线 8 位，分钟线 14 位)"""
+        v = self._to_int(t)
+        if self.period.endswith('d') or self.period in ('1w', '1mon'):
+            return int(str(v)[:8])
+        s = str(v)
+        if len(s) == 8:
+            s += '235959' if upper else '000000'
+        return int(s)
+
+    @staticmethod
+    def _to_index(values) -> pd.DatetimeIndex:
+        text = pd.Index(values).astype(str)
+        fmt = '%Y%m%d' if len(text) == 0 or len(text[0]) == 8 else '%Y%m%d%H%M%S'
+        return pd.DatetimeIndex(pd.to_datetime(text, format=fmt))
+
+    # ------------------------------------------------------------------ #
+    #  构建 / 更新
+    # ------------------------------------------------------------------ #
+    def build(self, codes, start_time, end_time='', dividend_type='front', fields=None) -> None:
+        """
+        从 xtdata 本地缓存一次性批量读取 codes 的行情并写入仓库。
+        仓库中已有、但不在本次 codes 中的代码原样保留 (日期轴取并集)。
+        """
+        old = self._meta(dividend_type)
+        # 字段取并集，保证仓库内每只标的的字段完整
+        fields = list(dict.fromkeys(list(fields or self.DEFAULT_FIELDS) + (old.get('fields', []) if old else [])))
+        codes = list(dict.fromkeys(codes))
+        print(f">> [BarStore] 从本地缓存读取 {len(codes)} 只标的 {self.period}/{dividend_type} 行情...")
+        raw = xtdata.get_market_data_ex(fields, codes, period=self.period, start_time=start_time,
+                                        end_time=end_time, dividend_type=dividend_type)
+
+        frames = {}
+        for field in fields:
+            cols = {c: raw[c][field] for c in codes if c in raw and raw[c] is not None and not raw[c].empty}
+            panel = pd.DataFrame(cols, dtype='float64')
+            panel.index = panel.index.astype(str).astype('int64') if len(panel) else panel.index
+            frames[field] = panel
+
+        kept = []
+        if old is not None:
+            kept = [c for c in old['codes'] if c not in frames[fields[0]].columns]
+            for field in fields:
+                if kept and field in old.get('fields', []):
+                    # 只复制保留的列，并释放本地的内存映射引用：Windows 下映射未关闭时 _write 无法替换 .npy
+                    mat = self._matrix(field, dividend_type)
+                    cols = [old['index'][c] for c in kept]
+                    prev = pd.DataFrame(np.array(mat[:, cols]), index=old['dates'], columns=kept)
+                    del mat
+                else:
+                    prev = pd.DataFrame(index=old['dates'])
+                frames[field] = pd.concat([prev, frames[field]], axis=1)
+
+        all_dates = sorted(set().union(*[set(f.index) for f in frames.values()]))
+        all_codes = list(dict.fromkeys(c for f in frames.values() for c in f.columns))
+        covered = str(self._to_int(start_time))[:8]
+        if kept:
+            covered = max(covered, old.get('start_time', covered))
+        self._write(dividend_type, fields, frames, np.array(all_dates, dtype='int64'), all_codes, covered)
+        print(f">> [BarStore] 写入完成：{len(all_dates)} 个交易日 × {len(all_codes)} 只标的。")
+
+    def _write(self, dividend_type, fields, frames, dates, codes, start_time):
+        folder = self._dir(dividend_type)
+        os.makedirs(folder, exist_ok=True)
+        self._release(dividend_type)
+
+        for field in fields:
+            mat = frames[field].reindex(index=dates, columns=codes).to_numpy(dtype='float64')
+            self._atomic_save(os.path.join(folder, f'{field}.npy'), np.ascontiguousarray(mat))
+        self._atomic_save(os.path.join(folder, 'dates.npy'), dates)
+
+        meta = {
+            'codes': codes,
+            'fields': fields,
+            'start_time': start_time,
+            'built_at': datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d'),
+        }
+        tmp = os.path.join(folder, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+    @staticmethod
+    def _atomic_save(path, arr):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, path)
+
+    def ensure(self, codes, start_time, end_time='', dividend_type='front', fields=None) -> None:
+        """
+        仅在必要时重建：有代码缺失、起始日期覆盖不足、字段缺失，
+        或仓库最后一根 K 线早于 end_time (为空时即今天) 且仓库是在那之前构建的。
+        """
+        meta = self._meta(dividend_type)
+        need = fields or self.DEFAULT_FIELDS
+        # 仓库总是取到本地缓存的最新一根 K 线，end_time 只用于判断是否过期；截止日期在读取时用 as_of 控制
+        if meta is None:
+            return self.build(codes, start_time, '', dividend_type, fields)
+
+        today = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+        end_day = min(str(self._to_int(end_time))[:8], today) if end_time else today
+        start_day = str(self._to_int(start_time))[:8]
+        missing = [c for c in codes if c not in meta['index']]
+        stale = (
+            len(meta['dates']) == 0
+            or start_day < meta.get('start_time', '99999999')
+            or any(f not in meta.get('fields', []) for f in need)
+            # 仓库最后一根 K 线早于所需日期，且构建时间也早于该日期，才说明可能漏了新数据
+            or (meta['dates'][-1] < self._bound(end_day, upper=False) and meta.get('built_at', '') < end_day)
+        )
+        if stale:
+            # 整库过期：连同仓库已有代码一起重建，避免新旧数据混杂
+            start_day = min(start_day, meta.get('start_time', start_day))
+            self.build(list(codes) + list(meta['codes']), start_day, '', dividend_type, fields)
+        elif missing:
+            self.build(missing, meta.get('start_time', start_day), '', dividend_type, fields)
+
+    # ------------------------------------------------------------------ #
+    #  读取
+    # ------------------------------------------------------------------ #
+    def _matrix(self, field, dividend_type):
+        key = (dividend_type, field)
+        if key not in self._mmaps:
+            path = os.path.join(self._dir(dividend_type), f'{field}.npy')
+            if not os.path.exists(path):
+                raise KeyError(f"BarStore 中没有字段 {field} ({self.period}/{dividend_type})，请先 build()。")
+            self._mmaps[key] = np.load(path, mmap_mode='r')
+        return self._mmaps[key]
+
+    def _row_slice(self, meta, start_time, as_of) -> slice:
+        dates = meta['dates']
+        lo = 0 if not start_time else int(np.searchsorted(dates, self._bound(start_time, upper=False), side='left'))
+        hi = len(dates) if not as_of else int(np.searchsorted(dates, self._bound(as_of, upper=True), side='right'))
+        return slice(lo, hi)
+
+    def load_array(self, field, codes=None, dividend_type='front', start_time=None, as_of=None):
+        """
+        返回 (矩阵, 日期轴 int64, 代码列表)。
+        codes=None 时矩阵为内存映射上的行切片视图 (零拷贝)；指定 codes 时只复制被选中的列。
+        """
+        meta = self._meta(dividend_type)
+        if meta is None:
+            raise FileNotFoundError(f"BarStore 尚未构建: {self._dir(dividend_type)}")
+        rows = self._row_slice(meta, start_time, as_of)
+        mat = self._matrix(field, dividend_type)[rows]
+        if codes is None:
+            return mat, meta['dates'][rows], list(meta['codes'])
+
+        codes = [c for c in codes if c in meta['index']]
+        cols = np.fromiter((meta['index'][c] for c in codes), dtype=np.intp, count=len(codes))
+        if len(cols) and np.all(np.diff(cols) == 1):
+            return mat[:, cols[0]:cols[-1] + 1], meta['dates'][rows], codes
+        return mat[:, cols], meta['dates'][rows], codes
+
+    def load_field(self, field, codes=None, dividend_type='front', start_time=None, as_of=None) -> pd.DataFrame:
+        """返回 index=日期 (DatetimeIndex)、columns=代码 的 DataFrame，数据区直接引用矩阵不复制"""
+        mat, dates, cols = self.load_array(field, codes, dividend_type, start_time, as_of)
+        return pd.DataFrame(mat, index=self._to_index(dates), columns=cols, copy=False)
+
+    def load(self, fields=('close',), codes=None, dividend_type='front', start_time=None, as_of=None) -> dict:
+        """批量读取多个字段，返回 {field: DataFrame}"""
+        return {f: self.load_field(f, codes, dividend_type, start_time, as_of) for f in fields}
+
+    def load_bars(self, code, fields=None, dividend_type='front', start_time=None, as_of=None) -> pd.DataFrame:
+        """
+        单只标的的 OHLCV 表 (index=日期, columns=字段)，用法同 get_market_data_ex 返回的单票 DataFrame。
+        仓库尚未构建时抛 FileNotFoundError，代码不在仓库中时抛 KeyError。
+        """
+        meta = self._meta(dividend_type)
+        if meta is None:
+            raise FileNotFoundError(f"BarStore 尚未构建: {self._dir(dividend_type)}")
+        if code not in meta['index']:
+            raise KeyError(f"BarStore 中没有 {code} ({self.period}/{dividend_type})，请先 build() / ensure() 加入该代码。")
+        fields = list(fields or meta.get('fields', self.DEFAULT_FIELDS))
+        data = {f: self.load_field(f, [code], dividend_type, start_time, as_of).iloc[:, 0] for f in fields}
+        return pd.DataFrame(data)
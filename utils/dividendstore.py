@@ -0,0 +1,187 @@
+__all__ = ['DividendStore']
+
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+from datetime import timezone, timedelta
+from xtquant import xtdata
+from utils.barstore import LOCAL_DATA_DIR
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class DividendStore:
+    """
+    本地分红事件表。
+
+    所有股票的现金分红事件摊平成三列，按 (代码序号, 除权日) 排序存盘：
+        code_idx.npy  int32    代码序号（对应 meta.json 中的 codes）
+        ex_date.npy   int64    除权除息日 YYYYMMDD
+        interest.npy  float64  每股现金红利
+    另在 meta.json 记录每只代码上次刷新的日期。
+
+    xtdata 没有批量分红接口，get_divid_factors 只能逐只调用；这里把调用次数摊到
+    "每只代码每 max_age_days 天一次"，并且只从该代码最后一个除权日开始增量读取。
+    全市场约 5000 次串行调用，应放在盘前 / 每日数据任务里执行，选股路径只读 ttm_dps。
+    近 12 个月每股分红 (TTM DPS) 用一次 np.bincount 对整张表分组求和。
+
+    用法：
+        store = DividendStore()
+        store.ensure(codes, max_age_days=7)
+        dps = store.ttm_dps(codes)                  # Series(index=codes)
+    """
+
+    START_TIME = '20150101'             # 首次入库的起始除权日
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or LOCAL_DATA_DIR, 'dividend')
+        self._data = None
+
+    # ------------------------------------------------------------------ #
+    #  读写
+    # ------------------------------------------------------------------ #
+    def _load(self):
+        if self._data is not None:
+            return self._data
+        meta_path = os.path.join(self.root, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            data = {
+                'meta': meta,
+                'code_idx': np.load(os.path.join(self.root, 'code_idx.npy')),
+                'ex_date': np.load(os.path.join(self.root, 'ex_date.npy')),
+                'interest': np.load(os.path.join(self.root, 'interest.npy')),
+            }
+        else:
+            data = {
+                'meta': {'codes': [], 'updated': {}},
+                'code_idx': np.empty(0, dtype=np.int32),
+                'ex_date': np.empty(0, dtype=np.int64),
+                'interest': np.empty(0, dtype=float),
+            }
+        data['index'] = {code: i for i, code in enumerate(data['meta']['codes'])}
+        self._data = data
+        return data
+
+    def _save(self):
+        data = self._data
+        os.makedirs(self.root, exist_ok=True)
+        for name in ('code_idx', 'ex_date', 'interest'):
+            path = os.path.join(self.root, f'{name}.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, data[name])
+            os.replace(path + '.tmp', path)
+        tmp = os.path.join(self.root, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data['meta'], f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.root, 'meta.json'))
+
+    # ------------------------------------------------------------------ #
+    #  增量刷新
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _to_int(t) -> int:
+        if isinstance(t, (pd.Timestamp, datetime.date)):
+            return int(t.strftime('%Y%m%d'))
+        return int(str(t).replace('-', '')[:8])
+
+    @staticmethod
+    def _fetch(code: str, start_time: str):
+        """返回 (ex_date int64 数组, interest 数组)，无分红返回空数组；读取失败返回 None（与"没有新分红"区分）"""
+        try:
+            dd = xtdata.get_divid_factors(code, start_time=start_time)
+        except Exception:
+            return None
+        if dd is None or dd.empty or 'interest' not in dd.columns:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        days = pd.Series(dd.index).astype(str).str.replace('-', '', regex=False).str[:8]
+        days = pd.to_numeric(days, errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+        interest = pd.to_numeric(dd['interest'], errors='coerce').fillna(0).to_numpy(dtype=float)
+        keep = (days > 0) & (interest > 0)
+        return days[keep], interest[keep]
+
+    def stale(self, codes, max_age_days: int = 1) -> list:
+        """超过 max_age_days 天未刷新（或从未入库）的代码"""
+        updated = self._load()['meta']['updated']
+        today = datetime.datetime.now(BEIJING_TZ).date()
+        fresh_since = (today - datetime.timedelta(days=max_age_days - 1)).strftime('%Y%m%d')
+        return [c for c in dict.fromkeys(codes) if updated.get(c, '') < fresh_since]
+
+    def ensure(self, codes, max_age_days: int = 1, showprogress: bool = False) -> None:
+        """刷新超过 max_age_days 天未更新的代码（新代码从 START_TIME 起全量读取）"""
+        data = self._load()
+        meta = data['meta']
+        today = datetime.datetime.now(BEIJING_TZ).date()
+        stale = self.stale(codes, max_age_days)
+        if not stale:
+            return
+
+        # 各代码已入库的最后一个除权日，作为增量读取的起点（含当日，重叠部分整体替换）
+        last_ex = {}
+        if len(data['ex_date']):
+            ends = np.r_[np.flatnonzero(np.diff(data['code_idx'])), len(data['code_idx']) - 1]
+            last_ex = {meta['codes'][data['code_idx'][e]]: int(data['ex_date'][e]) for e in ends}
+
+        index = data['index']
+        limit = np.full(len(meta['codes']) + len(stale), np.iinfo(np.int64).max, dtype=np.int64)
+        idx_parts, day_parts, val_parts = [], [], []
+        total = len(stale)
+        done = []
+        for n, code in enumerate(stale):
+            since = last_ex.get(code)
+            fetched = self._fetch(code, str(since or self.START_TIME))
+            if showprogress and ((n + 1) % 200 == 0 or n + 1 == total):
+                print(f"\r   分红数据: {n + 1}/{total}", end='', flush=True)
+            if fetched is None:
+                continue                        # 读取失败：保留已入库的事件，也不记刷新日期，下次重试
+            days, interest = fetched
+            done.append(code)
+            if code not in index:
+                index[code] = len(meta['codes'])
+                meta['codes'].append(code)
+            if since:
+                limit[index[code]] = since
+            idx_parts.append(np.full(len(days), index[code], dtype=np.int32))
+            day_parts.append(days)
+            val_parts.append(interest)
+        if showprogress:
+            print()
+        if len(done) < total:
+            print(f"--> 分红数据: {total - len(done)} 只读取失败，保留原有数据，下次刷新时重试")
+        if not done:
+            return
+
+        keep = data['ex_date'] < limit[data['code_idx']]
+        code_idx = np.concatenate([data['code_idx'][keep]] + idx_parts).astype(np.int32)
+        ex_date = np.concatenate([data['ex_date'][keep]] + day_parts).astype(np.int64)
+        interest = np.concatenate([data['interest'][keep]] + val_parts).astype(float)
+        order = np.lexsort((ex_date, code_idx))
+        data['code_idx'], data['ex_date'], data['interest'] = code_idx[order], ex_date[order], interest[order]
+
+        stamp = today.strftime('%Y%m%d')
+        meta['updated'].update({c: stamp for c in done})
+        self._save()
+
+    # ------------------------------------------------------------------ #
+    #  查询
+    # ------------------------------------------------------------------ #
+    def ttm_dps(self, codes, as_of=None, days: int = 365) -> pd.Series:
+        """
+        近 days 天内除权的每股现金红利合计，无分红为 0。
+        as_of 给定时只统计 [as_of - days, as_of] 内的事件（回测口径）；
+        默认以今天为基准，已公告但尚未除权的分红也计入（与原逐只统计的口径一致）。
+        """
+        codes = list(codes)
+        data = self._load()
+        base = pd.Timestamp(str(self._to_int(as_of))) if as_of is not None else pd.Timestamp.now(BEIJING_TZ)
+        start = self._to_int(base - pd.Timedelta(days=days))
+        end = self._to_int(base) if as_of is not None else np.iinfo(np.int64).max
+        mask = (data['ex_date'] >= start) & (data['ex_date'] <= end)
+        sums = np.bincount(data['code_idx'][mask], weights=data['interest'][mask],
+                           minlength=len(data['meta']['codes']))
+        sums = np.append(sums, 0.0)                  # 未入库的代码映射到末尾的 0
+        rows = np.array([data['index'].get(c, -1) for c in codes], dtype=np.int64)
+        return pd.Series(sums[rows], index=codes)
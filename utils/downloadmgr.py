@@ -0,0 +1,174 @@
+__all__ = ['DownloadMgr']
+
+import os
+import json
+import time
+import datetime
+import logging
+import threading
+from datetime import timezone, timedelta
+from xtquant import xtdata
+from utils.barstore import LOCAL_DATA_DIR
+from utils.eventlog import get_logger
+from utils.timing import Timing
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+LOG = get_logger('utils.downloadmgr')
+
+
+class DownloadMgr:
+    """
+    增量历史行情下载管理器。
+
+    为每个 (周期, 代码) 记录已完整下载的日期区间 [lo, hi]（下载水位），
+    再次调用时只请求缺失的区间，并把起止日期相同的代码合并为一次
+    download_history_data2 批量请求。水位文件落盘在 localdata/download_watermark.json。
+
+    当天的 K 线在收盘前不完整，因此水位最多记到"昨天"，当天数据会重新补齐；
+    同一进程内 TODAY_TTL 秒内重复请求同一代码的当天数据只下载一次（多个策略共用一个进程时不再各下一遍）。
+    进程内多线程调用通过类锁串行化，可在策略、MarketMgr、数据更新脚本中放心调用。
+    """
+
+    WATERMARK_FILE = os.path.join(LOCAL_DATA_DIR, 'download_watermark.json')
+    BATCH_SIZE = 500                # 单次批量请求的代码数量上限
+    TODAY_TTL = 60                  # 当天数据的进程内去重窗口（秒）
+
+    _lock = threading.RLock()
+    _marks = None                   # {period: {code: [lo, hi]}}
+    _today_at = {}                  # {(period, code): 最近一次下载到当天的时刻}
+
+    # ------------------------------------------------------------------ #
+    #  水位持久化
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def _load(cls):
+        if cls._marks is None:
+            cls._marks = {}
+            if os.path.exists(cls.WATERMARK_FILE):
+                try:
+                    with open(cls.WATERMARK_FILE, 'r', encoding='utf-8') as f:
+                        cls._marks = json.load(f)
+                except Exception as e:
+                    LOG.warning(f"读取下载水位失败: {e}，将全量重新下载。")
+        return cls._marks
+
+    @classmethod
+    def _save(cls):
+        try:
+            os.makedirs(os.path.dirname(cls.WATERMARK_FILE), exist_ok=True)
+            tmp = cls.WATERMARK_FILE + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(cls._marks, f, ensure_ascii=False)
+            os.replace(tmp, cls.WATERMARK_FILE)
+        except Exception as e:
+            LOG.warning(f"保存下载水位失败: {e}")
+
+    @classmethod
+    def reset(cls, codes=None, period=None) -> None:
+        """清除水位（全部 / 指定周期 / 指定代码），下次调用将重新下载对应区间"""
+        with cls._lock:
+            marks = cls._load()
+            for p in ([period] if period else list(marks.keys())):
+                if codes is None:
+                    marks.pop(p, None)
+                else:
+                    for code in codes:
+                        marks.get(p, {}).pop(code, None)
+            cls._save()
+
+    # ------------------------------------------------------------------ #
+    #  日期工具
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _day(t: str) -> str:
+        return str(t).replace('-', '')[:8]
+
+    @staticmethod
+    def _shift(day: str, n: int) -> str:
+        d = datetime.datetime.strptime(day, '%Y%m%d') + datetime.timedelta(days=n)
+        return d.strftime('%Y%m%d')
+
+    # ------------------------------------------------------------------ #
+    #  下载
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def plan(cls, codes: list, start_time: str, end_time: str = '', period: str = '1d') -> dict:
+        """计算每只代码缺失的区间，按 (起, 止) 分组返回 {(start, end): [codes]}"""
+        today = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+        start_day = cls._day(start_time)
+        end_day = min(cls._day(end_time), today) if end_time else today
+        marks = cls._load().get(period, {})
+
+        groups = {}
+        for code in dict.fromkeys(codes):
+            lo, hi = marks.get(code, (None, None))
+            req_start, req_end = start_day, end_day
+            if lo is None:
+                pass                                    # 从未下载：完整区间
+            elif start_day < lo:
+                # 向前补历史：补到与已有区间相接，保证水位区间连续
+                if end_day <= hi:
+                    req_end = cls._shift(lo, -1)
+            elif hi >= end_day:
+                continue                                # 区间已完整覆盖
+            else:
+                req_start = cls._shift(hi, 1)           # 只补水位之后的部分
+            if req_start > req_end:
+                continue
+            if req_start == today and time.time() - cls._today_at.get((period, code), 0) < cls.TODAY_TTL:
+                continue                                # 只缺当天，且刚下载过
+            groups.setdefault((req_start, req_end), []).append(code)
+        return groups
+
+    @classmethod
+    def download(cls, codes: list, start_time: str, end_time: str = '',
+                 period: str = '1d', pause=False, showprogress=False) -> None:
+        """增量下载 codes 在 [start_time, end_time] 的历史数据，已有部分直接跳过"""
+        with cls._lock:
+            today = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+            groups = cls.plan(codes, start_time, end_time, period)
+            if not groups:
+                LOG.debug(f"{len(codes)} 只 {period} 数据均已是最新，跳过。")
+                return
+
+            for (req_start, req_end), group in groups.items():
+                for i in range(0, len(group), cls.BATCH_SIZE):
+                    batch = group[i:i + cls.BATCH_SIZE]
+                    LOG.event('download', level=logging.INFO if showprogress else logging.DEBUG,
+                              period=period, count=len(batch), start=req_start, end=req_end)
+                    try:
+                        with Timing.span('DownloadMgr.download_batch', size=len(batch)):
+                            cls._download_batch(batch, period, req_start, '' if req_end == today else req_end,
+                                                showprogress)
+                    except Exception as e:
+                        LOG.error(f"批量下载失败 ({period} {req_start}~{req_end}): {e}")
+                        continue
+
+                    # 当天 K 线未收盘，水位最多记到昨天
+                    complete = min(req_end, cls._shift(today, -1))
+                    marks = cls._load().setdefault(period, {})
+                    for code in batch:
+                        lo, hi = marks.get(code, (req_start, cls._shift(req_start, -1)))
+                        marks[code] = [min(lo, req_start), max(hi, complete)]
+                    cls._save()
+                    if req_end == today:
+                        now = time.time()
+                        cls._today_at.update({(period, code): now for code in batch})
+                    if pause:
+                        time.sleep(1)
+
+    @staticmethod
+    def _download_batch(codes, period, start_time, end_time, showprogress):
+        if hasattr(xtdata, 'download_history_data2'):
+            callback = None
+            if showprogress:
+                def callback(data):
+                    print(f"\r   进度: {data.get('finished', '?')}/{data.get('total', '?')}", end='', flush=True)
+            xtdata.download_history_data2(codes, period=period, start_time=start_time,
+                                          end_time=end_time, callback=callback)
+            if showprogress:
+                print()
+        else:
+            # 旧版 xtquant 没有批量接口，退化为逐只下载
+            for code in codes:
+                xtdata.download_history_data(code, period=period, start_time=start_time, end_time=end_time)
@@ -0,0 +1,236 @@
+__all__ = ['EventLog', 'get_logger']
+
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from time import time as _now           # 不用模块级 time：回放会替换仓库模块里的 time
+
+# 与 utils.barstore.LOCAL_DATA_DIR 同一目录（这里不导入 barstore，日志模块不依赖 xtquant）
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'localdata', 'logs')
+
+
+class _RateLimit(logging.Filter):
+    """
+    同一调用位置（模块 + 行号）每 interval 秒最多放行 burst 条，其余丢弃并计数，下一条放行时带上省略条数；
+    ERROR 及以上不限。只挂在控制台 handler 上：JSON 文件完整记录每一条（一篮子委托 / 成交事件不能丢）。
+    """
+
+    def __init__(self, interval: float, burst: int):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._sites = {}                  # (模块, 文件, 行号) -> [窗口起点, 已放行, 已省略]
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno >= logging.ERROR or self.burst <= 0:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or record.created - site[0] >= self.interval:
+                if site is not None and site[2]:
+                    record.suppressed = site[2]
+                self._sites[key] = [record.created, 1, 0]
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class _AsyncHandler(logging.handlers.QueueHandler):
+    """调用线程只做消息插值并入队；异常堆栈在这里展开成文本，结构化字段原样保留给后台格式化"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _JsonFormatter(logging.Formatter):
+    """一行一个紧凑 JSON：ts / lvl / mod / msg，另有 event、data（结构化字段）、exc"""
+
+    def format(self, record) -> str:
+        out = {'ts': round(record.created, 3), 'lvl': record.levelname, 'mod': record.name,
+               'msg': record.getMessage()}
+        event = getattr(record, 'event', None)
+        if event:
+            out['event'] = event
+        data = getattr(record, 'data', None)
+        if data:
+            out['data'] = data
+        if record.exc_text:
+            out['exc'] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class _RotatingFile(logging.handlers.TimedRotatingFileHandler):
+    """
+    零点轮转失败（Windows 下文件仍被其它句柄占用）时继续写当前文件并推迟到下一个轮转点，
+    不让之后的每一条日志都报 logging error。
+    """
+
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError as e:
+            if self.stream is None:
+                self.stream = self._open()
+            self.rolloverAt = self.computeRollover(int(_now()))
+            sys.stderr.write(f"[EventLog] 日志轮转失败，继续写入 {self.baseFilename}: {e}\n")
+
+
+class _ConsoleFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text}  (同位置另有 {suppressed} 条已省略)" if suppressed else text
+
+
+class EventLogger(logging.LoggerAdapter):
+    """
+    logging.Logger 的薄包装：info / warning / exception 等用法不变，另加 event() 输出结构化事件。
+        LOG.event('order', code='600000.SH', volume=100, price=10.5)                    # 控制台：order code=600000.SH ...
+        LOG.event('stoploss', '跌破止损线', level=logging.WARNING, code=code, price=p)
+    """
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+    def event(self, event: str, msg: str = '', level: int = logging.INFO, **data) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        text = ' '.join([msg or event] + [f'{k}={v}' for k, v in data.items()])
+        self.logger.log(level, text, extra={'event': event, 'data': data}, stacklevel=2)
+
+
+class EventLog:
+    """
+    进程级的异步结构化日志配置（标准库 logging 之上）。
+
+    原先大多数模块直接 print，kj202512 用同步 StreamHandler：每条日志都在调用线程里做控制台 I/O，
+    选股、下载这类循环里的进度输出会拖慢主逻辑，而且事后只能 grep 文本。现在：
+      - 所有记录经 _AsyncHandler 入队（调用线程只做一次字符串插值），由 QueueListener 后台线程写出；
+      - 同时写两处：控制台（原来的人读格式）和 localdata/logs/<入口脚本名>.jsonl（紧凑 JSON Lines，
+        每天零点轮转、保留 BACKUP_DAYS 天；每个入口脚本一个文件，独立运行的多个策略进程不会争用同一文件），
+        可以直接用 pandas.read_json(lines=True) 做盘后分析；
+      - 按模块设置级别：setup(levels={'kj202512-DaMa': 'WARNING'})，或环境变量
+        QMT_LOG_LEVEL=INFO、QMT_LOG_LEVELS="utils.downloadmgr=DEBUG,kj202509=WARNING"（环境变量优先）；
+      - 控制台上同一调用位置每 RATE_INTERVAL 秒最多输出 RATE_BURST 条，循环里重复的行不再刷屏，
+        省略的条数附在该位置下一条输出上（ERROR 及以上不限；JSON 文件不限流）。
+    只有入口脚本（__main__ 块 / host.py）调用 setup()；工具模块只 get_logger，导入时不改动 logging 配置。
+    没有调用 setup 的进程（回放驱动、数据脚本等）沿用标准库默认行为。
+
+    用法：
+        EventLog.setup(level='DEBUG', tag='[实盘]')     # 入口脚本里调用一次
+        LOG = get_logger('kj202509')
+        LOG.info('月度调仓完成')
+        LOG.event('order', code=code, volume=vol, price=price)
+    """
+
+    CONSOLE_FORMAT = '%(asctime)s {tag}[%(name)s] %(levelname)s  %(message)s'
+    DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+    RATE_INTERVAL = 1.0
+    RATE_BURST = 5
+    BACKUP_DAYS = 30
+
+    _lock = threading.Lock()
+    _listener = None
+    _handler = None
+
+    @staticmethod
+    def _env_levels() -> dict:
+        levels = {}
+        for item in os.environ.get('QMT_LOG_LEVELS', '').split(','):
+            name, _, level = item.partition('=')
+            if name.strip() and level.strip():
+                levels[name.strip()] = level.strip().upper()
+        return levels
+
+    @classmethod
+    def setup(cls, level='INFO', levels: dict = None, console: bool = True, json_file: str = None,
+              tag: str = '', rate: tuple = None) -> None:
+        """
+        配置（或重新配置）根 logger。
+        :param json_file: JSON Lines 文件路径，默认 localdata/logs/<入口脚本名>.jsonl；传 '' 不写文件
+        :param rate:      (burst, interval)，默认 (RATE_BURST, RATE_INTERVAL)；burst=0 关闭限流
+        """
+        with cls._lock:
+            cls._stop()
+            root = logging.getLogger()
+            for h in list(root.handlers):                 # 替换 basicConfig 等留下的同步 handler
+                root.removeHandler(h)
+            root.setLevel(os.environ.get('QMT_LOG_LEVEL', '').upper() or level)
+            for name, lv in {**(levels or {}), **cls._env_levels()}.items():
+                logging.getLogger(name).setLevel(lv)
+
+            handlers = []
+            burst, interval = rate or (cls.RATE_BURST, cls.RATE_INTERVAL)
+            if console:
+                h = logging.StreamHandler(sys.stdout)
+                h.setFormatter(_ConsoleFormatter(cls.CONSOLE_FORMAT.format(tag=f'{tag} ' if tag else ''),
+                                                 datefmt=cls.DATE_FORMAT))
+                h.addFilter(_RateLimit(interval, burst))
+                handlers.append(h)
+            path = os.path.join(LOG_DIR, f'{cls._script()}.jsonl') if json_file is None else json_file
+            if path:
+                try:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                    h = _RotatingFile(path, when='midnight', backupCount=cls.BACKUP_DAYS, encoding='utf-8', delay=True)
+                    h.setFormatter(_JsonFormatter())
+                    handlers.append(h)
+                except OSError as e:
+                    print(f"[EventLog] 无法写入日志文件 {path}: {e}，只输出到控制台")
+
+            q = queue.SimpleQueue()
+            cls._handler = _AsyncHandler(q)
+            root.addHandler(cls._handler)
+            cls._listener = logging.handlers.QueueListener(q, *handlers)
+            cls._listener.start()
+
+    @staticmethod
+    def _script() -> str:
+        """入口脚本名（不含扩展名），交互式 / -c 运行时为 'python'"""
+        return os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else ''))[0] or 'python'
+
+    @classmethod
+    def _stop(cls) -> None:
+        if cls._listener is not None:
+            cls._listener.stop()                          # 写完队列中剩余的记录
+            for h in cls._listener.handlers:
+                h.close()
+            cls._listener = None
+        if cls._handler is not None:
+            logging.getLogger().removeHandler(cls._handler)
+            cls._handler = None
+
+    @classmethod
+    def configured(cls) -> bool:
+        return cls._listener is not None
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """写完队列并关闭文件（进程退出时自动调用）"""
+        with cls._lock:
+            cls._stop()
+
+
+def get_logger(name: str) -> EventLogger:
+    """取模块 logger（不做任何配置，输出去向由入口脚本的 EventLog.setup() 决定）"""
+    return EventLogger(logging.getLogger(name), {})
+
+
+atexit.register(EventLog.shutdown)
@@ -0,0 +1,291 @@
+__all__ = ['FinancialStore']
+
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+from datetime import timezone, timedelta
+from xtquant import xtdata
+from utils.barstore import LOCAL_DATA_DIR
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class FinancialStore:
+    """
+    本地时点 (point-in-time) 财务数据仓库。
+
+    每张财务表 (PershareIndex / Income / Balance ...) 一个目录，所有股票的全部报告期
+    摊平成一张长表，按 (代码序号, 公告日, 报告期) 排序后逐列存为 .npy：
+        code_idx.npy  int32   代码序号（对应 meta.json 中的 codes）
+        ann_date.npy  int64   公告日 YYYYMMDD
+        report.npy    int64   报告期 YYYYMMDD
+        <field>.npy   float64 各财务字段
+
+    查询"截至某日 U 中每只股票已公告的最新一期"时，把 (代码, 日期) 编码成一个 int64 键，
+    对排序后的键数组做一次 np.searchsorted 即可，几千只股票 × 几十个调仓日也只是一次向量运算，
+    天然避免未来函数。
+
+    用法：
+        store = FinancialStore()
+        store.ensure(codes, 'PershareIndex', ['equity_roe', 's_fa_eps_basic'], start_time='20200101')
+        df = store.as_of(codes, 'PershareIndex', ['equity_roe'], '20240630')     # index=代码
+        panel = store.panel(codes, 'PershareIndex', 'equity_roe', rebalance_dates)  # 日期×代码
+
+    ensure() 每天对每只股票最多从 xtdata 增量读取一次（从该股最后一个公告日起），
+    新增字段或更早的起始日期会触发整表重建。
+    """
+
+    KEY_BASE = 10 ** 8                  # 键 = 代码序号 × KEY_BASE + 日期
+    BATCH_SIZE = 200                    # 单次 get_financial_data 的代码数量
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or LOCAL_DATA_DIR, 'financial')
+        self._cache = {}                # table -> {'meta', 'index', 'code_idx', 'ann', 'report', 'keys', 'cols'}
+
+    # ------------------------------------------------------------------ #
+    #  读写
+    # ------------------------------------------------------------------ #
+    def _dir(self, table):
+        return os.path.join(self.root, table)
+
+    def _load(self, table):
+        if table in self._cache:
+            return self._cache[table]
+        folder = self._dir(table)
+        meta_path = os.path.join(folder, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data = {
+            'meta': meta,
+            'index': {code: i for i, code in enumerate(meta['codes'])},
+            'code_idx': np.load(os.path.join(folder, 'code_idx.npy')),
+            'ann': np.load(os.path.join(folder, 'ann_date.npy')),
+            'report': np.load(os.path.join(folder, 'report.npy')),
+            'cols': {f: np.load(os.path.join(folder, f'{f}.npy')) for f in meta['fields']},
+        }
+        data['keys'] = data['code_idx'].astype(np.int64) * self.KEY_BASE + data['ann']
+        self._cache[table] = data
+        return data
+
+    def _write(self, table, meta, code_idx, ann, report, cols):
+        folder = self._dir(table)
+        os.makedirs(folder, exist_ok=True)
+        self._cache.pop(table, None)
+        arrays = {'code_idx': code_idx, 'ann_date': ann, 'report': report}
+        arrays.update(cols)
+        for name, arr in arrays.items():
+            path = os.path.join(folder, f'{name}.npy')
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, arr)
+            os.replace(path + '.tmp', path)
+        tmp = os.path.join(folder, 'meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+    # ------------------------------------------------------------------ #
+    #  日期转换
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _to_int(t) -> int:
+        if isinstance(t, (pd.Timestamp, datetime.date)):
+            return int(t.strftime('%Y%m%d'))
+        return int(str(t).replace('-', '')[:8])
+
+    @staticmethod
+    def _date_array(values) -> np.ndarray:
+        """把 xtdata 返回的各种日期表示 (str / int / Timestamp) 统一成 int YYYYMMDD，无法解析为 0"""
+        s = pd.Series(values).astype(str).str.replace('-', '', regex=False).str[:8]
+        return pd.to_numeric(s, errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+    @classmethod
+    def _frame_dates(cls, df: pd.DataFrame):
+        """(公告日, 报告期)；优先用 m_anntime / m_timetag 列，缺失时退回 index"""
+        ann = df['m_anntime'] if 'm_anntime' in df.columns else df.index
+        report = df['m_timetag'] if 'm_timetag' in df.columns else ann
+        return cls._date_array(ann), cls._date_array(report)
+
+    # ------------------------------------------------------------------ #
+    #  构建 / 增量更新
+    # ------------------------------------------------------------------ #
+    def _fetch(self, codes, table, fields, start_time):
+        """
+        从 xtdata 读取并摊平为 (code, ann, report, {field: values}) 的长表片段。
+        返回 (parts, failed)：failed 为读取失败批次里的代码，调用方不得删除它们的旧记录或记为已更新。
+        """
+        parts, failed = [], []
+        for i in range(0, len(codes), self.BATCH_SIZE):
+            chunk = codes[i:i + self.BATCH_SIZE]
+            try:
+                data = xtdata.get_financial_data(chunk, table_list=[table], start_time=start_time,
+                                                 report_type='announce_time')
+            except Exception as e:
+                print(f"--> [FinancialStore] {table} 第 {i // self.BATCH_SIZE + 1} 批读取失败: {e}")
+                failed.extend(chunk)
+                continue
+            for code in chunk:
+                df = (data.get(code) or {}).get(table)
+                if df is None or not isinstance(df, pd.DataFrame) or df.empty:
+                    continue
+                ann, report = self._frame_dates(df)
+                keep = ann > 0
+                if not keep.any():
+                    continue
+                vals = {f: pd.to_numeric(df[f], errors='coerce').to_numpy(dtype=float)[keep]
+                        if f in df.columns else np.full(int(keep.sum()), np.nan) for f in fields}
+                parts.append((code, ann[keep], report[keep], vals))
+        return parts, failed
+
+    def ensure(self, codes, table, fields, start_time='20180101') -> None:
+        """保证 codes 在 table 上的 fields 已入库且为当天最新"""
+        codes = list(dict.fromkeys(codes))
+        today = datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+        start_day = str(self._to_int(start_time))
+        old = self._load(table)
+
+        rebuild = (old is None
+                   or start_day < old['meta']['start_time']
+                   or any(f not in old['meta']['fields'] for f in fields))
+        if rebuild:
+            all_codes = codes if old is None else list(dict.fromkeys(old['meta']['codes'] + codes))
+            all_fields = list(dict.fromkeys((old['meta']['fields'] if old else []) + list(fields)))
+            start_day = min(start_day, old['meta']['start_time']) if old else start_day
+            print(f">> [FinancialStore] 构建 {table}：{len(all_codes)} 只，{len(all_fields)} 个字段...")
+            parts, failed = self._fetch(all_codes, table, all_fields, start_day)
+            if failed and old is not None:
+                # 重建会整体替换旧表，有批次失败时放弃本次重建，保留原有数据
+                print(f">> [FinancialStore] {table} 重建时 {len(failed)} 只读取失败，保留原表，下次调用重试")
+                return
+            failed = set(failed)
+            meta = {'codes': [], 'fields': all_fields, 'start_time': start_day, 'updated': {}}
+            self._merge(table, meta, None, parts, {c: today for c in all_codes if c not in failed})
+            return
+
+        meta = old['meta']
+        updated = meta.get('updated', {})
+        stale = [c for c in codes if updated.get(c) != today]
+        if not stale:
+            return
+
+        # 从各股已入库的最后一个公告日开始增量读取，按起点分组批量请求
+        last_ann = {}
+        if len(old['ann']):
+            ends = np.r_[np.flatnonzero(np.diff(old['code_idx'])), len(old['code_idx']) - 1]
+            last_ann = {meta['codes'][old['code_idx'][e]]: int(old['ann'][e]) for e in ends}
+        groups = {}
+        for c in stale:
+            groups.setdefault(str(last_ann.get(c, meta['start_time'])), []).append(c)
+        parts, failed = [], set()
+        for since, group in groups.items():
+            got, bad = self._fetch(group, table, meta['fields'], since)
+            parts.extend(got)
+            failed.update(bad)
+        # 读取失败的代码保留旧记录、不记更新日期，下次调用重试
+        fetched = [c for c in stale if c not in failed]
+        if not fetched:
+            return
+        drop_from = {c: last_ann.get(c, 0) for c in fetched}
+        self._merge(table, meta, old, parts, {c: today for c in fetched}, drop_from)
+
+    def _merge(self, table, meta, old, parts, touched, drop_from=None):
+        codes = list(meta['codes'])
+        index = {c: i for i, c in enumerate(codes)}
+        for code in touched:
+            if code not in index:
+                index[code] = len(codes)
+                codes.append(code)
+        fields = meta['fields']
+
+        idx_list, ann_list, rep_list = [], [], []
+        col_lists = {f: [] for f in fields}
+        if old is not None and len(old['ann']):
+            keep = np.ones(len(old['ann']), dtype=bool)
+            if drop_from:
+                # 增量区间内的旧记录整体替换，避免同一公告重复入库
+                limit = np.full(len(codes), np.iinfo(np.int64).max, dtype=np.int64)
+                for c, since in drop_from.items():
+                    if since:
+                        limit[index[c]] = since
+                keep = old['ann'] < limit[old['code_idx']]
+            idx_list.append(old['code_idx'][keep])
+            ann_list.append(old['ann'][keep])
+            rep_list.append(old['report'][keep])
+            for f in fields:
+                col_lists[f].append(old['cols'][f][keep])
+        for code, ann, report, vals in parts:
+            idx_list.append(np.full(len(ann), index[code], dtype=np.int32))
+            ann_list.append(ann)
+            rep_list.append(report)
+            for f in fields:
+                col_lists[f].append(vals[f])
+
+        if idx_list:
+            code_idx = np.concatenate(idx_list).astype(np.int32)
+            ann = np.concatenate(ann_list).astype(np.int64)
+            report = np.concatenate(rep_list).astype(np.int64)
+        else:
+            code_idx = np.empty(0, dtype=np.int32)
+            ann = report = np.empty(0, dtype=np.int64)
+        order = np.lexsort((report, ann, code_idx))
+        cols = {f: (np.concatenate(col_lists[f]) if col_lists[f] else np.empty(0))[order] for f in fields}
+
+        updated = dict(meta.get('updated', {}))
+        updated.update(touched)
+        new_meta = {'codes': codes, 'fields': fields, 'start_time': meta['start_time'], 'updated': updated}
+        self._write(table, new_meta, code_idx[order], ann[order], report[order], cols)
+
+    # ------------------------------------------------------------------ #
+    #  时点查询
+    # ------------------------------------------------------------------ #
+    def _locate(self, data, codes, days: np.ndarray, back: int) -> np.ndarray:
+        """返回形如 days 广播后的行号矩阵，无记录处为 -1"""
+        cidx = np.array([data['index'].get(c, -1) for c in codes], dtype=np.int64)
+        keys = cidx * self.KEY_BASE + days
+        pos = np.searchsorted(data['keys'], keys, side='right') - 1 - back
+        ok = (cidx >= 0) & (pos >= 0)
+        safe = np.where(ok, pos, 0)
+        if len(data['code_idx']):
+            ok &= data['code_idx'][safe] == cidx
+        else:
+            ok[...] = False
+        return np.where(ok, pos, -1)
+
+    def as_of(self, codes, table, fields, as_of=None, lag_days: int = 0, back: int = 0) -> pd.DataFrame:
+        """
+        截至 as_of（默认今天）每只股票已公告的最新一期。
+        lag_days : 公告后滞后若干自然日才视为可用（模拟数据入库延迟）
+        back     : 0 为最新一期，1 为上一期，依此类推
+        返回 index=codes、columns=fields + ['ann_date', 'report'] 的 DataFrame，无数据为 NaN。
+        """
+        codes = list(codes)
+        data = self._load(table)
+        columns = list(fields) + ['ann_date', 'report']
+        if data is None or not len(data['ann']):
+            return pd.DataFrame(np.nan, index=codes, columns=columns)
+        day = pd.Timestamp(str(self._to_int(as_of))) if as_of is not None else pd.Timestamp.now(BEIJING_TZ)
+        day = self._to_int(day - pd.Timedelta(days=lag_days))
+        rows = self._locate(data, codes, np.int64(day), back)
+        hit = rows >= 0
+        out = {}
+        for f in fields:
+            col = data['cols'].get(f)
+            out[f] = np.where(hit, col[rows], np.nan) if col is not None else np.full(len(codes), np.nan)
+        out['ann_date'] = np.where(hit, data['ann'][rows], 0)
+        out['report'] = np.where(hit, data['report'][rows], 0)
+        return pd.DataFrame(out, index=codes)[columns]
+
+    def panel(self, codes, table, field, dates, lag_days: int = 0, back: int = 0) -> pd.DataFrame:
+        """多个日期一次查询：返回 index=dates、columns=codes 的 时点取值矩阵"""
+        codes = list(codes)
+        idx = pd.DatetimeIndex(pd.to_datetime(list(dates)))
+        data = self._load(table)
+        if data is None or field not in data['cols']:
+            return pd.DataFrame(np.nan, index=idx, columns=codes)
+        days = (idx - pd.Timedelta(days=lag_days)).strftime('%Y%m%d').astype(np.int64).to_numpy()
+        rows = self._locate(data, codes, days[:, None], back)
+        values = np.where(rows >= 0, data['cols'][field][rows], np.nan)
+        return pd.DataFrame(values, index=idx, columns=codes)
@@ -0,0 +1,231 @@
+__all__ = ['InstrumentMgr']
+
+import os
+import datetime
+import threading
+from datetime import timezone, timedelta
+import numpy as np
+import pandas as pd
+from xtquant import xtdata
+from utils.barstore import LOCAL_DATA_DIR
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class InstrumentMgr:
+    """
+    每日合约信息快照表。
+
+    get_instrument_detail 每次都是一次 IPC 往返，逐只过滤全市场 5000 只股票要调用上万次。
+    这里每天只拉取一次（优先用批量接口 get_instrument_detail_list），整理成以代码为索引的
+    DataFrame 并落盘到 localdata/instrument/instrument_YYYYMMDD.pkl；同一天的其它进程直接读盘。
+    之后的 ST / 次新 / 涨跌停 / 市值过滤全部是对这张表的向量化掩码运算。
+
+    列说明：
+      valid        : 是否取到了合约信息
+      name         : 证券名称
+      is_st        : 名称含 ST / * / 退
+      open_date    : 上市日期 (int YYYYMMDD，缺失为 0，无法解析为 -1)
+      total_volume : 总股本
+      up_stop      : 涨停价
+      down_stop    : 跌停价
+
+    涨跌停价按交易日变化，9:15 之前建的快照在开盘后会自动重建一次。
+    """
+
+    SNAPSHOT_DIR = os.path.join(LOCAL_DATA_DIR, 'instrument')
+    COLUMNS = ('valid', 'name', 'is_st', 'open_date', 'total_volume', 'up_stop', 'down_stop')
+    REFRESH_TIME = datetime.time(9, 15)       # 当日涨跌停价生效时间
+    KEEP_DAYS = 5                             # 保留最近几天的快照文件
+
+    _lock = threading.RLock()
+    _table = None
+    _day = None
+    _built_at = None
+
+    # ------------------------------------------------------------------ #
+    #  快照维护
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def _path(cls, day: str) -> str:
+        return os.path.join(cls.SNAPSHOT_DIR, f'instrument_{day}.pkl')
+
+    @staticmethod
+    def _empty() -> pd.DataFrame:
+        return pd.DataFrame({
+            'valid': pd.Series(dtype=bool), 'name': pd.Series(dtype=object),
+            'is_st': pd.Series(dtype=bool), 'open_date': pd.Series(dtype=np.int64),
+            'total_volume': pd.Series(dtype=float), 'up_stop': pd.Series(dtype=float),
+            'down_stop': pd.Series(dtype=float),
+        })
+
+    @staticmethod
+    def _parse_date(v) -> int:
+        s = str(v or '').strip()
+        if not s:
+            return 0
+        try:
+            return int(datetime.datetime.strptime(s[:8], '%Y%m%d').strftime('%Y%m%d'))
+        except Exception:
+            return -1
+
+    @classmethod
+    def _rows(cls, details: dict) -> pd.DataFrame:
+        records = {}
+        for code, d in details.items():
+            if not d:
+                records[code] = (False, '', False, 0, 0.0, 0.0, 0.0)
+                continue
+            name = d.get('InstrumentName', '') or ''
+            records[code] = (
+                True, name, ('ST' in name or '*' in name or '退' in name),
+                cls._parse_date(d.get('OpenDate', '')),
+                float(d.get('TotalVolume', 0) or 0),
+                float(d.get('UpStopPrice', 0) or 0),
+                float(d.get('DownStopPrice', 0) or 0),
+            )
+        if not records:
+            return cls._empty()
+        return pd.DataFrame.from_dict(records, orient='index', columns=list(cls.COLUMNS))
+
+    @staticmethod
+    def _fetch(codes: list) -> dict:
+        if hasattr(xtdata, 'get_instrument_detail_list'):
+            try:
+                details = xtdata.get_instrument_detail_list(codes, False) or {}
+                return {c: details.get(c) for c in codes}
+            except Exception as e:
+                print(f"--> 批量获取合约信息失败: {e}，改为逐只获取。")
+        return {c: xtdata.get_instrument_detail(c) for c in codes}
+
+    @classmethod
+    def _load_day(cls, day: str):
+        path = cls._path(day)
+        if cls._day == day or not os.path.exists(path):
+            return
+        try:
+            cls._table = pd.read_pickle(path)
+            cls._built_at = datetime.datetime.fromtimestamp(os.path.getmtime(path), BEIJING_TZ)
+            cls._day = day
+        except Exception as e:
+            print(f"--> 读取合约快照失败: {e}，将重新获取。")
+
+    @classmethod
+    def _save(cls):
+        try:
+            os.makedirs(cls.SNAPSHOT_DIR, exist_ok=True)
+            path = cls._path(cls._day)
+            tmp = path + '.tmp'
+            cls._table.to_pickle(tmp)
+            os.replace(tmp, path)
+            old = sorted(f for f in os.listdir(cls.SNAPSHOT_DIR)
+                         if f.startswith('instrument_') and f.endswith('.pkl'))
+            for f in old[:-cls.KEEP_DAYS]:
+                os.remove(os.path.join(cls.SNAPSHOT_DIR, f))
+        except Exception as e:
+            print(f"--> 保存合约快照失败: {e}")
+
+    @classmethod
+    def snapshot(cls, codes=None) -> pd.DataFrame:
+        """
+        返回当日快照表（index=代码，columns=COLUMNS）。
+        codes 给定时只补拉表中缺少的代码，并按 codes 顺序返回；为 None 时返回整张表。
+        """
+        with cls._lock:
+            now = datetime.datetime.now(BEIJING_TZ)
+            day = now.strftime('%Y%m%d')
+            cls._load_day(day)
+            stale = (cls._day != day or cls._table is None or
+                     (cls._built_at is not None and cls._built_at.time() < cls.REFRESH_TIME <= now.time()))
+            if stale:
+                # 开盘后重建：把旧表里的代码全部重新拉取，保证涨跌停价是当天的
+                keep = [] if cls._table is None else list(cls._table.index)
+                cls._table = cls._empty()
+                cls._day = day
+                cls._built_at = now
+                codes_needed = list(dict.fromkeys(keep + list(codes or [])))
+            else:
+                codes_needed = [c for c in dict.fromkeys(codes or []) if c not in cls._table.index]
+
+            if codes_needed:
+                rows = cls._rows(cls._fetch(codes_needed))
+                cls._table = rows if cls._table.empty else pd.concat([cls._table, rows])
+                cls._save()
+
+            if codes is None:
+                return cls._table
+            return cls._table.reindex(list(codes))
+
+    # ------------------------------------------------------------------ #
+    #  向量化过滤
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _cutoff(min_days: int) -> int:
+        d = datetime.datetime.now(BEIJING_TZ).date() - datetime.timedelta(days=min_days)
+        return int(d.strftime('%Y%m%d'))
+
+    @classmethod
+    def st_mask(cls, codes: list) -> np.ndarray:
+        """非 ST 且取到了合约信息的代码为 True"""
+        t = cls.snapshot(codes)
+        return (t['valid'].eq(True) & ~t['is_st'].eq(True)).to_numpy(dtype=bool)
+
+    @classmethod
+    def new_mask(cls, codes: list, min_days: int, keep_unknown: bool = True) -> np.ndarray:
+        """
+        上市满 min_days 天的代码为 True。
+        无法解析上市日期的保留；上市日期为空的按 keep_unknown 决定。
+        """
+        t = cls.snapshot(codes)
+        od = t['open_date'].fillna(0).to_numpy(dtype=np.int64)
+        ok = (od <= cls._cutoff(min_days)) & (od > 0)
+        ok |= od == -1
+        if keep_unknown:
+            ok |= od == 0
+        return ok & t['valid'].eq(True).to_numpy(dtype=bool)
+
+    @classmethod
+    def limit_mask(cls, codes: list, prices: dict, side: str = 'up') -> np.ndarray:
+        """当前价触及涨停 (side='up') / 跌停 (side='down') 的代码为 True"""
+        t = cls.snapshot(codes)
+        px = np.array([prices.get(c, 0) for c in codes], dtype=float)
+        if side == 'up':
+            lim = t['up_stop'].fillna(0).to_numpy(dtype=float)
+            return (lim > 0) & (px >= lim)
+        lim = t['down_stop'].fillna(0).to_numpy(dtype=float)
+        return (lim > 0) & (px <= lim)
+
+    @classmethod
+    def filter_st(cls, codes: list) -> list:
+        """过滤 ST / *ST / 退市风险股"""
+        codes = list(codes)
+        if not codes:
+            return []
+        return [c for c, ok in zip(codes, cls.st_mask(codes)) if ok]
+
+    @classmethod
+    def filter_new(cls, codes: list, min_days: int, keep_unknown: bool = True) -> list:
+        """过滤上市不足 min_days 天的次新股"""
+        codes = list(codes)
+        if not codes:
+            return []
+        return [c for c, ok in zip(codes, cls.new_mask(codes, min_days, keep_unknown)) if ok]
+
+    @classmethod
+    def names(cls, codes: list, default: str = '--') -> dict:
+        """返回 {code: 证券名称}，取不到的用 default"""
+        t = cls.snapshot(codes)
+        ok = t['valid'].eq(True).to_numpy(dtype=bool)
+        return {c: (n if v and n else default) for c, n, v in zip(codes, t['name'], ok)}
+
+    @classmethod
+    def market_caps(cls, codes: list, prices: dict) -> dict:
+        """估算市值 = 当前价 × 总股本；价格或股本缺失的记为 inf"""
+        codes = list(codes)
+        if not codes:
+            return {}
+        t = cls.snapshot(codes)
+        px = np.array([prices.get(c, 0) for c in codes], dtype=float)
+        vol = t['total_volume'].fillna(0).to_numpy(dtype=float)
+        caps = np.where((px > 0) & (vol > 0), px * vol, np.inf)
+        return dict(zip(codes, caps.tolist()))
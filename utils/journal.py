@@ -0,0 +1,193 @@
+__all__ = ['JournalStore']
+
+import os
+import json
+import atexit
+import threading
+import weakref
+
+
+class JournalStore:
+    """
+    追加日志（journal）+ 快照的 JSON 持久化后端，StateManager / BlacklistManager / StrategyLedger /
+    StrategyVolumeLedger 共用。
+
+    原先每次修改都把整份 JSON 重新序列化、缩进、覆盖写一遍；现在：
+      - 每次修改只向 <filepath>.journal 追加一行（本次修改的全部操作，一行即一个原子组），
+        写入操作系统缓冲即返回，进程崩溃不丢；
+      - fsync 按组提交：第一笔未落盘的修改到达后 COMMIT_DELAY 秒内的所有修改共用一次 fsync
+        （一篮子 50 笔成交回报只落盘一次，而不是 50 次全量重写）；
+      - 日志超过 compact_every 行时压缩：整份状态原子写入快照文件 filepath（tmp + fsync + replace），再清空日志；
+      - 启动时读取快照并重放日志（只有上次压缩之后的少量修改），随即压缩一次。
+    快照文件仍是原来的 JSON 格式，旧文件无需迁移；手工查看时以 "快照 + 日志" 为准。
+
+    日志中的操作都是幂等的（set / del / add / remove），压缩写完快照、清空日志之前崩溃，
+    重启时把整份日志重放到新快照上结果不变；最后一行写到一半（断电）时整行丢弃。
+
+    用法（由持久化类内部使用）：
+        store = JournalStore(path, snapshot=lambda: self._data, empty=dict)
+        data = store.load()                    # 快照 + 重放日志；两者都不存在时返回 None
+        store.append(('set', 'style', 'BIG'))  # 追加一个原子组
+    """
+
+    COMMIT_DELAY = 0.2          # 组提交窗口（秒）
+    COMPACT_EVERY = 500         # 日志超过多少行时压缩
+
+    _live = weakref.WeakSet()   # 进程退出时统一 fsync
+
+    def __init__(self, filepath: str, snapshot=None, empty=dict, indent: int = 4, sort_keys: bool = False,
+                 compact_every: int = None):
+        self.filepath = filepath
+        self.journal_path = filepath + '.journal'
+        self.snapshot = snapshot            # 返回当前完整状态的函数，压缩时调用
+        self.empty = empty                  # 只有日志、没有快照时的初始状态（dict / list）
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.compact_every = compact_every or self.COMPACT_EVERY
+        self._lock = threading.RLock()
+        self._file = None
+        self._lines = 0                     # 日志当前行数
+        self._timer = None                  # 等待中的组提交
+        JournalStore._live.add(self)
+
+    # ------------------------------------------------------------------ #
+    #  操作
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def apply(data, op):
+        """把一个操作应用到状态上：dict 用 set / del，list 用 add / remove（均幂等）"""
+        kind = op[0]
+        if kind == 'set':
+            data[op[1]] = op[2]
+        elif kind == 'del':
+            data.pop(op[1], None)
+        elif kind == 'add':
+            if op[1] not in data:
+                data.append(op[1])
+        elif kind == 'remove':
+            if op[1] in data:
+                data.remove(op[1])
+        else:
+            raise ValueError(f"未知的日志操作: {op!r}")
+        return data
+
+    # ------------------------------------------------------------------ #
+    #  读取 / 恢复
+    # ------------------------------------------------------------------ #
+    def _read_journal(self) -> list:
+        groups = []
+        if not os.path.exists(self.journal_path):
+            return groups
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    groups.append(json.loads(line))
+                except ValueError:
+                    print(f"--> [Journal] 丢弃不完整的日志行: {self.journal_path}")
+        return groups
+
+    def load(self):
+        """读取快照并重放日志；快照损坏时抛出异常（由调用方决定如何处理），都不存在时返回 None"""
+        with self._lock:
+            data = None
+            if os.path.exists(self.filepath):
+                with open(self.filepath, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            groups = self._read_journal()
+            if groups:
+                if data is None:
+                    data = self.empty()
+                for group in groups:
+                    for op in group:
+                        self.apply(data, op)
+                try:
+                    self._write_snapshot(data)
+                    self._truncate()
+                    print(f"--> [Journal] 已重放 {len(groups)} 组日志修改并压缩: {self.filepath}")
+                except OSError as e:
+                    self._lines = len(groups)
+                    print(f"--> [Journal] 已重放 {len(groups)} 组日志修改，压缩失败（保留日志）: {e}")
+            return data
+
+    # ------------------------------------------------------------------ #
+    #  写入
+    # ------------------------------------------------------------------ #
+    def append(self, *ops) -> None:
+        """追加一个原子组（一行），组提交 fsync；日志过长时压缩"""
+        if not ops:
+            return
+        line = json.dumps([list(op) for op in ops], ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.filepath)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+            self._lines += 1
+            if self._lines >= self.compact_every and self.snapshot is not None:
+                self.compact()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.COMMIT_DELAY, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self) -> None:
+        """立即 fsync 尚未落盘的日志（组提交定时器到期或进程退出时调用）"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                try:
+                    os.fsync(self._file.fileno())
+                except (OSError, ValueError) as e:
+                    print(f"--> [Journal] 日志落盘失败: {e}")
+
+    def replace(self, data) -> None:
+        """整体替换状态：直接写快照并清空日志（初始化 / 覆盖账本时使用）"""
+        with self._lock:
+            self._write_snapshot(data)
+            self._truncate()
+
+    def compact(self) -> None:
+        """把当前完整状态写成快照并清空日志"""
+        with self._lock:
+            self.replace(self.snapshot())
+
+    def _write_snapshot(self, data) -> None:
+        directory = os.path.dirname(self.filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.filepath + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=self.indent, sort_keys=self.sort_keys)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filepath)
+
+    def _truncate(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.journal_path):
+            try:
+                os.remove(self.journal_path)
+            except OSError:
+                open(self.journal_path, 'w').close()     # Windows 下文件被其它句柄打开时无法删除，改为清空
+        self._lines = 0
+
+    @classmethod
+    def sync_all(cls) -> None:
+        for store in list(cls._live):
+            store.sync()
+
+
+atexit.register(JournalStore.sync_all)
@@ -2,10 +2,11 @@ __all__ = ['MarketMgr']
 
 import datetime
 import numpy as np
-from scipy import stats
+import pandas as pd
 from datetime import timezone, timedelta
 from xtquant import xtdata
-from utils.stockmgr import StockMgr
+from utils.downloadmgr import DownloadMgr
+from utils.rsrs import RSRS
 
 BEIJING_TZ = timezone(timedelta(hours=8))
 
@@ -28,7 +29,7 @@ class MarketMgr:
         - bool: True 表示处于猴市，False 表示非猴市（趋势市或极低波动的死市）
         """
         # 1. 补充下载最近的日线数据 (防止本地数据缺失)
-        StockMgr.download_history([stock_code], start_time='20260101', period='1d')
+        DownloadMgr.download([stock_code], start_time='20260101', period='1d')
 
         # 2. 从本地缓存获取最近 window + 1 天的收盘价
         data = xtdata.get_market_data(
@@ -74,8 +75,8 @@ class MarketMgr:
         """
         print(f"正在计算 {index_code} 的 RSRS 信号...")
         start_date = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=rsrs_m + rsrs_n)).strftime("%Y%m%d")
-        StockMgr.download_history([index_code], start_time=start_date, period='1d', showprogress=True)
-        StockMgr.download_history([index_code], start_time=datetime.datetime.now(BEIJING_TZ).strftime("%Y%m%d"), period='1m', showprogress=True)
+        DownloadMgr.download([index_code], start_time=start_date, period='1d', showprogress=True)
+        DownloadMgr.download([index_code], start_time=datetime.datetime.now(BEIJING_TZ).strftime("%Y%m%d"), period='1m', showprogress=True)
 
         data = xtdata.get_market_data_ex(['high', 'low'], [index_code], period='1d', count=rsrs_m + rsrs_n, dividend_type='front')[index_code]
         highs = data['high'].values
@@ -84,18 +85,13 @@ class MarketMgr:
         if len(highs) < rsrs_n + 2:
             raise ValueError(f"RSRS 数据不足：需要至少 {rsrs_n + 2} 条，实际获取 {len(highs)} 条，请检查数据下载。")
 
-        slopes = []
-        for i in range(len(highs) - rsrs_n + 1):
-            slope, _, _, _, _ = stats.linregress(lows[i:i + rsrs_n], highs[i:i + rsrs_n])
-            slopes.append(slope)
-
-        if len(slopes) < 2:
-            raise ValueError(f"RSRS slopes 数量不足以标准化：{len(slopes)} 个，请增大 rsrs_m 或检查数据。")
-
-        current_slope = slopes[-1]
-        history_slopes = slopes[:-1]
-        z_score = (current_slope - np.mean(history_slopes)) / np.std(history_slopes)
-        return z_score
+        current_slope, hist_mean, hist_std = RSRS.latest(highs, lows, rsrs_n, rsrs_m)
+        if not np.isfinite(current_slope) or not hist_std > 0:
+            # 当期斜率无效（窗口内缺数据 / 最低价无波动）或有效的历史斜率不足两个，无法标准化
+            raise ValueError(f"RSRS slopes 数量不足以标准化：当期斜率 {current_slope}，历史标准差 {hist_std}，"
+                             f"请增大 rsrs_m 或检查数据。")
+        z_score = (current_slope - hist_mean) / hist_std
+        return float(z_score)
 
     @staticmethod
     def get_market_sentiment(benchmark: str, at_date: str, sentiment_duration: int = 20) -> int:
@@ -127,3 +123,21 @@ class MarketMgr:
             return 2
         print('震荡市')
         return 3
+
+    @staticmethod
+    def get_market_sentiment_series(benchmark: str, start_time: str, end_time: str, sentiment_duration: int = 20) -> pd.Series:
+        """
+        一次算出区间内每个交易日的市场环境，口径与 get_market_sentiment 逐日调用一致。
+
+        返回:
+        - pd.Series: index 为 'YYYYMMDD' 字符串，值为 1 牛市 / 2 熊市 / 3 震荡市
+        """
+        warmup = (datetime.datetime.strptime(str(start_time)[:8], '%Y%m%d')
+                  - datetime.timedelta(days=sentiment_duration * 3)).strftime('%Y%m%d')
+        data = xtdata.get_market_data_ex(['close'], [benchmark], period='1d', start_time=warmup,
+                                         end_time=end_time, dividend_type='front')[benchmark]
+        close = data['close']
+        ma = close.rolling(sentiment_duration).mean()
+        state = np.select([close > ma * 1.02, close < ma * 0.98], [1, 2], default=3)
+        series = pd.Series(state, index=close.index.astype(str).str.replace('-', '').str[:8])
+        return series[series.index >= str(start_time)[:8]]
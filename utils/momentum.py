@@ -0,0 +1,123 @@
+__all__ = ['Momentum']
+
+import numpy as np
+import pandas as pd
+
+
+class Momentum:
+    """
+    动量质量评分的向量化计算：对 日期×标的 收盘价矩阵，一次算出每个格子在给定窗口上的
+      - ann_return   : 对数价格线性回归斜率年化，exp(slope × 250) - 1
+      - r2           : 回归拟合优度 R²
+      - volatility   : 窗口内对数收益率总体标准差 × √250
+      - score        : ann_return × R²            (36号回测 / ETF 轮动口径)
+      - sharpe_score : ann_return / volatility × R² (36号实盘、港美股版"平滑夏普"口径)
+
+    第 t 行使用窗口 [t-w+1, t]；窗口内有缺失值的格子为 NaN。
+    """
+
+    FIELDS = ('ann_return', 'r2', 'volatility', 'score', 'sharpe_score')
+
+    @staticmethod
+    def _window_sum(a: np.ndarray, w: int) -> np.ndarray:
+        c = np.cumsum(a, axis=0)
+        out = c.copy()
+        out[w:] = c[w:] - c[:-w]
+        return out
+
+    @staticmethod
+    def _compute(close: np.ndarray, w: int, ann_days: int) -> dict:
+        one_d = close.ndim == 1
+        p = close[:, None] if one_d else close
+        with np.errstate(all='ignore'):
+            y = np.log(np.where(p > 0, p, np.nan))
+        T = y.shape[0]
+        valid = ~np.isnan(y)
+        with np.errstate(all='ignore'):
+            y0 = np.nan_to_num(np.nanmean(np.where(valid, y, np.nan), axis=0))
+        yc = np.where(valid, y - y0, 0.0)                       # 去中心化，降低累加误差
+        k = np.arange(T, dtype=float)[:, None]
+
+        cnt = Momentum._window_sum(valid.astype(float), w)
+        sy = Momentum._window_sum(yc, w)
+        syy = Momentum._window_sum(yc * yc, w)
+        sky = Momentum._window_sum(k * yc, w)
+
+        start = k - (w - 1)                                     # 窗口起点的全局下标
+        sxy = sky - start * sy                                  # Σ (k - start)·y
+        sx = w * (w - 1) / 2.0
+        var_x = w * (w * w - 1) / 12.0                          # Σ(x - x̄)²，x = 0..w-1
+        cov = sxy - sx * sy / w
+        var_y = syy - sy * sy / w
+
+        with np.errstate(all='ignore'):
+            slope = cov / var_x
+            r2 = np.where(var_y > 1e-18, cov * cov / (var_x * var_y), 0.0)
+        ann_return = np.exp(slope * ann_days) - 1
+
+        # 对数收益率的窗口波动率（w-1 个差分，总体标准差）
+        diff = np.vstack([np.full((1, y.shape[1]), np.nan), np.diff(y, axis=0)])
+        dvalid = ~np.isnan(diff)
+        d = np.where(dvalid, diff, 0.0)
+        n_d = w - 1
+        if n_d > 0:
+            s1 = Momentum._window_sum(d, n_d)
+            s2 = Momentum._window_sum(d * d, n_d)
+            with np.errstate(all='ignore'):
+                vol = np.sqrt(np.maximum(s2 / n_d - (s1 / n_d) ** 2, 0.0)) * np.sqrt(ann_days)
+        else:
+            vol = np.zeros_like(slope)
+
+        bad = cnt < w
+        bad[:w - 1] = True
+        out = {'ann_return': ann_return, 'r2': r2, 'volatility': vol}
+        for key in out:
+            out[key] = np.where(bad, np.nan, out[key])
+        out['score'] = out['ann_return'] * out['r2']
+        out['sharpe_score'] = out['ann_return'] / (out['volatility'] + 1e-9) * out['r2']
+        if one_d:
+            out = {key: v[:, 0] for key, v in out.items()}
+        return out
+
+    @staticmethod
+    def _wrap(arrs: dict, like):
+        if isinstance(like, pd.DataFrame):
+            return {k: pd.DataFrame(v, index=like.index, columns=like.columns) for k, v in arrs.items()}
+        if isinstance(like, pd.Series):
+            return {k: pd.Series(v, index=like.index, name=like.name) for k, v in arrs.items()}
+        return arrs
+
+    @staticmethod
+    def rolling(close, window: int = 20, ann_days: int = 250) -> dict:
+        """单个窗口：返回 {字段: 与 close 同形状的矩阵}，close 可为 ndarray / Series / DataFrame"""
+        values = np.asarray(close, dtype=float)
+        return Momentum._wrap(Momentum._compute(values, window, ann_days), close)
+
+    @staticmethod
+    def panel(close, windows=(20, 25, 60, 200), ann_days: int = 250) -> dict:
+        """多个窗口：返回 {window: {字段: 矩阵}}"""
+        values = np.asarray(close, dtype=float)
+        return {w: Momentum._wrap(Momentum._compute(values, w, ann_days), close) for w in windows}
+
+    @staticmethod
+    def latest(close, window: int = 20, ann_days: int = 250) -> pd.DataFrame:
+        """
+        只算最后一行：对整个标的池的最近 window 根 K 线一次打分。
+        返回 index=标的、columns=FIELDS 的 DataFrame（输入为 ndarray 时 index 为列序号）。
+        """
+        frame = close if isinstance(close, pd.DataFrame) else pd.DataFrame(np.asarray(close, dtype=float))
+        tail = frame.iloc[-window:] if len(frame) >= window else frame
+        if len(tail) < window:
+            return pd.DataFrame(np.nan, index=frame.columns, columns=list(Momentum.FIELDS))
+        arrs = Momentum._compute(tail.to_numpy(dtype=float), window, ann_days)
+        return pd.DataFrame({k: v[-1] for k, v in arrs.items()}, index=frame.columns)[list(Momentum.FIELDS)]
+
+    @staticmethod
+    def stack_tail(series_map: dict, count: int) -> pd.DataFrame:
+        """
+        把各标的各自的最近 count 个收盘价按位置对齐为矩阵（不按日期对齐，
+        与逐只取 count 根 K 线的旧逻辑一致）；不足 count 根的标的被剔除。
+        """
+        cols = {code: np.asarray(s, dtype=float)[-count:] for code, s in series_map.items()
+                if s is not None and len(s) >= count}
+        return pd.DataFrame(cols)
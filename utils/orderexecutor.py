@@ -0,0 +1,89 @@
+__all__ = ['OrderExecutor']
+
+import time
+from xtquant import xtconstant
+from utils.ordertracker import OrderTracker
+
+
+class OrderExecutor:
+    """
+    篮子委托的并发执行层。
+
+    调用方先用同一份行情快照（TickHub.prices）算好每条腿的数量和价格，
+    再一次性交给 submit()：所有腿连续用 order_stock_async 发出（不等柜台应答），
+    随后按 seq 把 on_order_stock_async_response 应答关联回各条腿，拿到委托号和每条腿的应答延迟。
+    10~20 只的篮子从第一笔到最后一笔的发送间隔是毫秒级，不再是逐笔同步等待的数秒。
+
+    应答由 OrderTracker 接收，交易回调里需要转发 on_order_stock_async_response（见 OrderTracker 说明）。
+    超时仍未应答的腿无法确定是否已报到柜台，按"已发出、委托号未知"处理（order_id 为 None）。
+
+    用法：
+        executor = OrderExecutor(trader, account)
+        legs = [OrderExecutor.leg(code, xtconstant.STOCK_BUY, vol, 'strategy', '调仓买入') for code, vol in ...]
+        for r in executor.submit(legs):
+            if r['ok']: ...            # r['order_id'] / r['latency_ms'] / r['error']
+    """
+
+    def __init__(self, trader, account, response_timeout: float = 10):
+        self.trader = trader
+        self.account = account
+        self.response_timeout = response_timeout
+
+    @staticmethod
+    def leg(stock_code: str, order_type: int, volume: int, strategy_name: str = '', remark: str = '',
+            price_type: int = xtconstant.LATEST_PRICE, price: float = 0.0) -> dict:
+        """一条委托腿（参数与 order_stock 一致）"""
+        return {'stock_code': stock_code, 'order_type': order_type, 'volume': int(volume),
+                'price_type': price_type, 'price': float(price or 0), 'strategy_name': strategy_name,
+                'remark': remark}
+
+    def submit(self, legs: list) -> list:
+        """
+        并发发出全部委托腿，返回与 legs 一一对应的结果：
+        leg 的字段 + seq / order_id / ok / error / latency_ms（发出到柜台应答的毫秒数）。
+        """
+        results, sent = [], {}
+        t0 = time.perf_counter()
+        for leg in legs:
+            r = dict(leg, seq=-1, order_id=-1, ok=False, error='', latency_ms=None)
+            try:
+                r['seq'] = self.trader.order_stock_async(self.account, leg['stock_code'], leg['order_type'],
+                                                         leg['volume'], leg['price_type'], leg['price'],
+                                                         leg['strategy_name'], leg['remark'])
+            except Exception as e:
+                r['error'] = f'报单异常: {e}'
+            if r['seq'] is not None and r['seq'] > 0:
+                sent[r['seq']] = (r, time.perf_counter())
+            elif not r['error']:
+                r['error'] = '报单失败（接口返回 -1）'
+            results.append(r)
+        send_ms = (time.perf_counter() - t0) * 1000
+
+        responses = OrderTracker.instance().wait_responses(sent, timeout=self.response_timeout) if sent else {}
+        for seq, (r, t_send) in sent.items():
+            if seq not in responses:
+                r.update(ok=True, order_id=None, error=f'{self.response_timeout}s 内未收到应答')
+                continue
+            order_id, error_msg, t_resp = responses[seq]
+            r['order_id'] = order_id
+            r['latency_ms'] = max(t_resp - t_send, 0.0) * 1000
+            r['ok'] = order_id is not None and order_id > 0
+            r['error'] = '' if r['ok'] else (error_msg or '柜台拒单')
+
+        self._report(results, send_ms)
+        return results
+
+    @staticmethod
+    def _report(results: list, send_ms: float) -> None:
+        if not results:
+            return
+        lat = sorted(r['latency_ms'] for r in results if r['latency_ms'] is not None)
+        ok = sum(r['ok'] for r in results)
+        line = f"[OrderExecutor] 发出 {len(results)} 笔（成功 {ok}），首末间隔 {send_ms:.1f}ms"
+        if lat:
+            line += f"，应答延迟 中位 {lat[len(lat) // 2]:.1f}ms / 最大 {lat[-1]:.1f}ms"
+        print(line)
+        for r in results:
+            if r['error']:
+                side = '买入' if r['order_type'] == xtconstant.STOCK_BUY else '卖出'
+                print(f"  [!] {side} {r['stock_code']} {r['volume']}: {r['error']}")
@@ -0,0 +1,148 @@
+__all__ = ['OrderIndex']
+
+import time
+import datetime
+import threading
+from xtquant import xtconstant
+
+
+class OrderIndex:
+    """
+    当日委托的内存索引（回报驱动 + 定期对账）。
+
+    按 (日期, 代码, 方向) 索引委托号，并按日期累计买入委托金额，
+    "今天是否已对该股做过该方向的操作 / 是否有未结束挂单 / 当日已买金额" 都是 O(1) 的字典查找，
+    不再每次 query_stock_orders 全量拉取后线性扫描。
+
+    数据来源：
+      - on_stock_order / on_order_error：交易回调推送（注册为 trader 回调，或在策略回调里转发）；
+        推送只在 trader.subscribe(account) 成功后才会到达，未订阅时只剩 on_submit 与 reconcile；
+      - on_submit：order_stock 返回委托号后立即登记，回报到达前的同一轮循环也能看到这笔挂单；
+      - reconcile：每 reconcile_interval 秒全量查询一次当日委托覆盖更新，兜底回报丢失（断线重连等）。
+    从未对账成功时查询接口按最保守的结果返回（视为已操作 / 额度用尽），与原先查询失败时的风控一致。
+
+    用法：
+        index = OrderIndex(trader, acc)
+        trader.register_callback(index)
+        trader.subscribe(acc)                               # connect 之后订阅，否则收不到回报
+        index.reconcile()                                   # 每轮循环调用，未到间隔时直接返回
+        index.has_traded_today(code, xtconstant.STOCK_BUY)
+        index.has_open_order(code, xtconstant.STOCK_SELL)
+        index.daily_buy_amount()
+    """
+
+    FINAL = (xtconstant.ORDER_PART_CANCEL, xtconstant.ORDER_CANCELED,
+             xtconstant.ORDER_SUCCEEDED, xtconstant.ORDER_JUNK)
+
+    def __init__(self, trader, account, reconcile_interval: float = 60):
+        self.trader = trader
+        self.account = account
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._orders = {}            # order_id -> {'key': (日期, 代码, 方向), 'status', 'amount'}
+        self._by_key = {}            # (日期, 代码, 方向) -> {order_id}
+        self._open = {}              # (代码, 方向) -> {未结束的 order_id}
+        self._buy_amount = {}        # 日期 -> 当日买入委托金额
+        self._last_reconcile = None  # 最近一次对账成功的时刻
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.datetime.now().strftime("%Y%m%d")
+
+    @staticmethod
+    def _date_of(ts: int) -> str:
+        return datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d") if ts and ts > 0 else ''
+
+    # ------------------------------------------------------------------ #
+    #  写入（回调线程 / 下单方 / 对账）
+    # ------------------------------------------------------------------ #
+    def _put(self, order_id: int, date: str, code: str, side: int, status, amount: float) -> None:
+        """登记或更新一笔委托（调用方持锁）"""
+        old = self._orders.get(order_id)
+        if old is not None:
+            if old['status'] in self.FINAL and status not in self.FINAL:
+                return                                  # 迟到的中间状态不覆盖终态
+            self._unlink(order_id, old)
+        key = (date, code, side)
+        self._orders[order_id] = {'key': key, 'status': status, 'amount': amount}
+        self._by_key.setdefault(key, set()).add(order_id)
+        if status not in self.FINAL:
+            self._open.setdefault((code, side), set()).add(order_id)
+        if side == xtconstant.STOCK_BUY:
+            self._buy_amount[date] = self._buy_amount.get(date, 0.0) + amount
+
+    def _unlink(self, order_id: int, rec: dict) -> None:
+        date, code, side = rec['key']
+        self._by_key.get(rec['key'], set()).discard(order_id)
+        self._open.get((code, side), set()).discard(order_id)
+        if side == xtconstant.STOCK_BUY:
+            self._buy_amount[date] = self._buy_amount.get(date, 0.0) - rec['amount']
+
+    def on_stock_order(self, order) -> None:
+        amount = order.price * order.order_volume
+        if amount == 0:                                 # 市价单 price 为 0，用成交金额
+            amount = order.traded_price * order.traded_volume
+        with self._lock:
+            self._put(order.order_id, self._date_of(order.order_time), order.stock_code,
+                      order.order_type, order.order_status, amount)
+
+    def on_order_error(self, order_error) -> None:
+        with self._lock:
+            rec = self._orders.get(order_error.order_id)
+            if rec is not None:
+                date, code, side = rec['key']
+                self._put(order_error.order_id, date, code, side, xtconstant.ORDER_JUNK, rec['amount'])
+
+    def on_submit(self, order_id: int, stock_code: str, order_type: int, volume: int, price: float) -> None:
+        """order_stock 返回委托号后立即登记；回报已先到达时不覆盖"""
+        if order_id is None or order_id <= 0:
+            return
+        with self._lock:
+            if order_id not in self._orders:
+                self._put(order_id, self._today(), stock_code, order_type, None, price * volume)
+
+    def reconcile(self, force: bool = False) -> bool:
+        """距上次对账超过 reconcile_interval 秒（或 force）时全量查询当日委托覆盖索引，返回是否成功"""
+        now = time.time()
+        if not force and self._last_reconcile is not None and now - self._last_reconcile < self.reconcile_interval:
+            return True
+        try:
+            orders = self.trader.query_stock_orders(self.account, cancelable_only=False) or []
+        except Exception as e:
+            print(f"!!! [OrderIndex] 查询当日委托失败: {e}")
+            return False
+        for o in orders:
+            self.on_stock_order(o)
+        with self._lock:
+            today = self._today()
+            for oid in [oid for oid, rec in self._orders.items() if rec['key'][0] not in (today, '')]:
+                self._unlink(oid, self._orders.pop(oid))
+            self._buy_amount = {d: v for d, v in self._buy_amount.items() if d in (today, '')}
+        self._last_reconcile = now
+        return True
+
+    # ------------------------------------------------------------------ #
+    #  查询（O(1)）
+    # ------------------------------------------------------------------ #
+    @property
+    def ready(self) -> bool:
+        return self._last_reconcile is not None or self.reconcile()
+
+    def has_traded_today(self, stock_code: str, order_type: int) -> bool:
+        """今天是否对该股下过该方向的委托（含废单）；从未对账成功时保守返回 True"""
+        if not self.ready:
+            return True
+        with self._lock:
+            return bool(self._by_key.get((self._today(), stock_code, order_type)))
+
+    def has_open_order(self, stock_code: str, order_type: int) -> bool:
+        """是否存在该股该方向未结束的委托"""
+        with self._lock:
+            return bool(self._open.get((stock_code, order_type)))
+
+    def daily_buy_amount(self) -> float:
+        """当日买入委托金额（委托价 × 委托量）；从未对账成功时返回极大值暂停买入"""
+        if not self.ready:
+            return 9999999.0
+        with self._lock:
+            return self._buy_amount.get(self._today(), 0.0)
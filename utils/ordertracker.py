@@ -0,0 +1,240 @@
+__all__ = ['OrderTracker']
+
+import time
+import threading
+from concurrent.futures import Future
+from xtquant import xtconstant
+
+
+class OrderTracker:
+    """
+    进程内唯一的委托状态中心（回报驱动）。
+
+    交易回调（on_stock_order / on_stock_trade / on_order_error）把委托状态写进来，
+    等待方用 wait() 阻塞在条件变量上，所有委托一进入终态（已成 / 部成部撤 / 已撤 / 废单）立即被唤醒，
+    不再按固定间隔轮询持仓去"猜"是否成交。回报可能先于 order_stock 的返回值到达，
+    所以任何委托号的回报都会被记录，之后再等待也能立即拿到结果。
+
+    XtQuantTrader 只能注册一个回调对象，策略回调里转发即可：
+        class MyCallback(XtQuantTraderCallback):
+            def on_stock_order(self, order):
+                OrderTracker.instance().on_stock_order(order)
+            def on_stock_trade(self, trade):
+                OrderTracker.instance().on_stock_trade(trade)
+            def on_order_error(self, order_error):
+                OrderTracker.instance().on_order_error(order_error)
+            def on_order_stock_async_response(self, response):      # 使用 OrderExecutor 异步下单时需要
+                OrderTracker.instance().on_order_stock_async_response(response)
+
+    用法：
+        tracker = OrderTracker.instance()
+        pending = tracker.wait([oid1, oid2], timeout=120, trader=trader, account=acc)   # 返回超时仍未结束的委托号
+        fut = tracker.when_done([oid1, oid2])          # concurrent.futures.Future，全部结束时 set_result({oid: 状态})
+
+    长期运行的进程里记录不会无限增长：进入终态且 RETAIN_SECONDS 内没有新回报、也没有 Future 在等的委托
+    （连同它的成交去重记录）会被清理；STALE_SECONDS 内没有任何回报的委托（隔夜委托、清理后才到的重复成交）
+    和无人领取的异步下单应答同样清理。清理最多每 PRUNE_INTERVAL 秒在回报线程里做一次。
+    """
+
+    FINAL = (xtconstant.ORDER_PART_CANCEL, xtconstant.ORDER_CANCELED,
+             xtconstant.ORDER_SUCCEEDED, xtconstant.ORDER_JUNK)
+    RETAIN_SECONDS = 3600.0
+    STALE_SECONDS = 86400.0
+    PRUNE_INTERVAL = 60.0
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> 'OrderTracker':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._orders = {}            # order_id -> {'code', 'status', 'traded_volume', 'traded_price', 'msg'}
+        self._futures = []           # [(委托号集合, Future)]
+        self._responses = {}         # 异步下单 seq -> (order_id, error_msg, 回报到达的 perf_counter)
+        self._trades = {}            # order_id -> 已累计的 traded_id 集合：多个回调转发同一笔成交时只算一次
+        self._touched = {}           # order_id -> 最近一次回报的 time.time()，清理用
+        self._pruned_at = time.time()
+
+    # ------------------------------------------------------------------ #
+    #  回报入口（由交易回调线程调用）
+    # ------------------------------------------------------------------ #
+    def on_stock_order(self, order) -> None:
+        self._update(order.order_id, code=order.stock_code, status=order.order_status,
+                     traded_volume=order.traded_volume, traded_price=order.traded_price,
+                     msg=getattr(order, 'status_msg', ''))
+
+    def on_stock_trade(self, trade) -> None:
+        """成交回报只累计成交量（按成交编号去重）；终态以随后的委托回报为准"""
+        with self._cond:
+            traded_id = getattr(trade, 'traded_id', None)
+            if traded_id:
+                seen = self._trades.setdefault(trade.order_id, set())
+                if traded_id in seen:
+                    return
+                seen.add(traded_id)
+            info = self._orders.setdefault(trade.order_id, self._blank(trade.stock_code))
+            self._touched[trade.order_id] = time.time()
+            if info['status'] not in self.FINAL:
+                info['traded_volume'] += int(trade.traded_volume)
+                info['traded_price'] = trade.traded_price
+            self._cond.notify_all()
+
+    def on_order_error(self, order_error) -> None:
+        self._update(order_error.order_id, status=xtconstant.ORDER_JUNK, msg=order_error.error_msg)
+
+    def on_order_stock_async_response(self, response) -> None:
+        """order_stock_async 的应答：按 seq 关联到柜台委托号"""
+        with self._cond:
+            self._responses[response.seq] = (response.order_id, getattr(response, 'error_msg', ''),
+                                              time.perf_counter())
+            self._cond.notify_all()
+            self._prune()
+
+    @staticmethod
+    def _blank(code: str = '') -> dict:
+        return {'code': code, 'status': None, 'traded_volume': 0, 'traded_price': 0.0, 'msg': ''}
+
+    def _update(self, order_id: int, **fields) -> None:
+        done = []
+        with self._cond:
+            info = self._orders.setdefault(order_id, self._blank())
+            if info['status'] in self.FINAL and fields.get('status') not in self.FINAL:
+                return                                  # 迟到的中间状态不覆盖终态
+            info.update({k: v for k, v in fields.items() if v is not None and v != ''})
+            self._touched[order_id] = time.time()
+            if info['status'] in self.FINAL and self._futures:
+                keep = []
+                for ids, fut in self._futures:
+                    (done if all(self._final(i) for i in ids) else keep).append((ids, fut))
+                self._futures = keep
+                done = [(fut, {i: self._orders[i]['status'] for i in ids}) for ids, fut in done]
+            self._cond.notify_all()
+            self._prune()
+        for fut, result in done:
+            fut.set_result(result)
+
+    def _prune(self) -> None:
+        """持有锁时调用：清理早已结束的委托、长期无回报的委托和无人领取的异步应答"""
+        now = time.time()
+        if now - self._pruned_at < self.PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        waited = set().union(*(ids for ids, _ in self._futures)) if self._futures else set()
+        stale = [i for i, t in self._touched.items() if i not in waited and (
+                 now - t > self.STALE_SECONDS or (now - t > self.RETAIN_SECONDS and self._final(i)))]
+        for i in stale:
+            self._orders.pop(i, None)
+            self._trades.pop(i, None)
+            del self._touched[i]
+        tick = time.perf_counter()
+        for seq in [s for s, r in self._responses.items() if tick - r[2] > self.RETAIN_SECONDS]:
+            del self._responses[seq]
+
+    # ------------------------------------------------------------------ #
+    #  查询
+    # ------------------------------------------------------------------ #
+    def _final(self, order_id: int) -> bool:
+        info = self._orders.get(order_id)
+        return info is not None and info['status'] in self.FINAL
+
+    def status(self, order_id: int):
+        """最近一次回报的委托状态，没收到过回报时返回 None"""
+        with self._cond:
+            info = self._orders.get(order_id)
+            return info['status'] if info else None
+
+    def get(self, order_id: int) -> dict:
+        """委托的状态快照 {'code', 'status', 'traded_volume', 'traded_price', 'msg'}"""
+        with self._cond:
+            return dict(self._orders.get(order_id) or self._blank())
+
+    def done(self, order_ids) -> bool:
+        with self._cond:
+            return all(self._final(i) for i in order_ids)
+
+    # ------------------------------------------------------------------ #
+    #  等待
+    # ------------------------------------------------------------------ #
+    def refresh(self, trader, account, order_ids) -> None:
+        """主动查询委托状态（回报丢失时的兜底，例如断线重连期间）"""
+        for oid in order_ids:
+            try:
+                order = trader.query_stock_order(account, oid)
+            except Exception as e:
+                print(f"[OrderTracker] 查询委托 {oid} 失败: {e}")
+                continue
+            if order is not None:
+                self.on_stock_order(order)
+
+    def _block(self, seconds: float) -> None:
+        """持有锁时等待回报唤醒（回放时换成拨动虚拟时钟）"""
+        self._cond.wait(seconds)
+
+    def _progress(self, order_ids) -> tuple:
+        """order_ids 当前的 (状态, 已成交量)，用于判断等待期间这批委托是否收到了新回报"""
+        blank = (None, 0)
+        return tuple((self._orders[i]['status'], self._orders[i]['traded_volume']) if i in self._orders else blank
+                     for i in sorted(order_ids))
+
+    def wait(self, order_ids, timeout: float = 120, trader=None, account=None, interval: float = 5) -> set:
+        """
+        阻塞到 order_ids 全部进入终态或超时，返回仍未结束的委托号集合。
+        给了 trader / account 时，这批委托连续 interval 秒没有新回报才主动查询一次未结束委托兜底；
+        其它委托的回报唤醒不触发查询。
+        """
+        order_ids = set(order_ids)
+        deadline = time.time() + timeout
+        if trader is not None:
+            with self._cond:
+                unseen = [i for i in order_ids if i not in self._orders]
+            if unseen:
+                self.refresh(trader, account, unseen)
+        last = time.time()                  # 上次主动查询或这批委托收到回报的时刻
+        while True:
+            with self._cond:
+                pending = {i for i in order_ids if not self._final(i)}
+                now = time.time()
+                remaining = deadline - now
+                if not pending or remaining <= 0:
+                    return pending
+                quiet = last + interval - now
+                if quiet > 0:
+                    before = self._progress(pending)
+                    self._block(min(remaining, quiet))
+                    if self._progress(pending) != before:
+                        last = time.time()      # 有新回报，重新计时
+                    continue
+            if trader is not None:
+                self.refresh(trader, account, pending)
+            last = time.time()
+
+    def wait_responses(self, seqs, timeout: float = 10) -> dict:
+        """等待异步下单应答，返回 {seq: (order_id, error_msg, 到达时刻)}，超时未应答的 seq 不在结果里"""
+        seqs = set(seqs)
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                missing = seqs - self._responses.keys()
+                remaining = deadline - time.time()
+                if not missing or remaining <= 0:
+                    return {s: self._responses.pop(s) for s in seqs if s in self._responses}
+                self._block(remaining)
+
+    def when_done(self, order_ids) -> Future:
+        """Future 版本：order_ids 全部进入终态时由回报线程 set_result({order_id: 状态})"""
+        fut = Future()
+        ids = set(order_ids)
+        with self._cond:
+            if all(self._final(i) for i in ids):
+                result = {i: self._orders[i]['status'] for i in ids}
+            else:
+                self._futures.append((ids, fut))
+                return fut
+        fut.set_result(result)
+        return fut
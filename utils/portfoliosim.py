@@ -0,0 +1,275 @@
+__all__ = ['PortfolioSim']
+
+import numpy as np
+import pandas as pd
+
+
+class PortfolioSim:
+    """
+    基于目标权重的组合回测引擎，供各策略的回测脚本共用。
+
+    输入：
+      returns : 日期×标的 的简单收益率矩阵（第 t 行 = 第 t-1 日收盘到第 t 日收盘），NaN 按 0 处理
+      weights : 目标权重调度表（index 为 returns 中的日期，columns 为标的）。
+                某一行只要有一个非 NaN 值就是一次"调仓信号"，该行缺失的标的按 0；
+                全 NaN 或不在表里的日期维持原持仓，即按信号前向填充。
+                第 t 行的目标在第 t 日收盘成交，从第 t+1 行开始计收益；权重和不足 1 的部分为现金（收益 0）。
+
+    持仓口径：
+      mode='fixed' : 两次信号之间每天回到目标权重（固定比例，中间的再平衡不计成本）
+      mode='drift' : 两次信号之间持仓随价格漂移（买入持有），每段用累计收益矩阵一次算完
+      band=x       : 阈值再平衡。目标权重前向填充到每一天，某标的偏离目标超过 x × 目标权重时
+                     才把它调回目标（先卖后买，买入受现金约束）；可叠加 stop_loss 成本止损。
+                     这一口径依赖逐日的持仓路径，按天循环，每天内部是数组运算。
+
+    交易成本（都可以是标量，或按标的给出的 dict / Series）：
+      佣金 max(成交额 × commission, min_fee) + 成交额 × slippage，卖出另加 成交额 × sell_tax（印花税）。
+      min_fee 以元计，需配合 capital 使用。
+
+    返回 dict：
+      nav      : 组合市值 Series（第 0 行为 capital）
+      returns  : 组合日收益率 Series（第 0 行为 0）
+      weights  : 每日收盘（调仓后）的持仓权重 DataFrame
+      turnover : 每日双边换手率 Σ|成交额| / 组合市值
+      cost     : 每日交易成本（元）
+      drawdown : 回撤序列
+      trades   : 成交明细 DataFrame [date, code, value(买正卖负), fee, reason]
+      stats    : 汇总指标，见 stats()
+
+    用法：
+        res = PortfolioSim.run(schedule, close.pct_change(), mode='drift', commission=0.0002, min_fee=5, capital=1e5)
+        print(res['stats']['ann_return'], res['stats']['max_drawdown'])
+    """
+
+    EPS = 1e-9          # 权重变动小于此值视为未成交（避免浮点误差触发最低佣金）
+
+    # ------------------------------------------------------------------ #
+    #  指标
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def stats(nav, ann_days: int = 252, rf: float = 0.0) -> dict:
+        """由净值序列计算总收益、年化收益、年化波动、夏普 (无风险利率 rf) 与最大回撤"""
+        nav = np.asarray(nav, dtype=float)
+        n = len(nav) - 1
+        if n <= 0 or nav[0] <= 0:
+            return {'total_return': 0.0, 'ann_return': 0.0, 'ann_vol': 0.0,
+                    'sharpe': float('nan'), 'max_drawdown': 0.0}
+        growth = nav[-1] / nav[0]
+        rets = nav[1:] / nav[:-1] - 1
+        std = rets.std(ddof=1) if n > 1 else 0.0
+        sharpe = (rets.mean() - rf / ann_days) / std * np.sqrt(ann_days) if std > 0 else float('nan')
+        return {
+            'total_return': growth - 1,
+            'ann_return': growth ** (ann_days / n) - 1,
+            'ann_vol': std * np.sqrt(ann_days),
+            'sharpe': sharpe,
+            'max_drawdown': (nav / np.maximum.accumulate(nav) - 1).min(),
+        }
+
+    # ------------------------------------------------------------------ #
+    #  内部工具
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _per_asset(v, columns) -> np.ndarray:
+        if isinstance(v, (dict, pd.Series)):
+            return np.array([float(v.get(c, 0.0)) for c in columns], dtype=float)
+        return np.full(len(columns), float(v))
+
+    @staticmethod
+    def _fees(delta_val: np.ndarray, cost: dict) -> np.ndarray:
+        """按标的计算一次调仓的交易成本（元），delta_val 为成交额，买正卖负"""
+        traded = np.abs(delta_val)
+        fee = np.maximum(traded * cost['commission'], cost['min_fee']) + traded * cost['slippage']
+        fee = fee + np.where(delta_val < 0, traded * cost['sell_tax'], 0.0)
+        return np.where(traded > 0, fee, 0.0)
+
+    @staticmethod
+    def _fee(value: float, j: int, cost: dict) -> float:
+        """单笔成交（第 j 个标的，value 买正卖负）的交易成本"""
+        traded = abs(value)
+        if traded <= 0:
+            return 0.0
+        fee = max(traded * cost['commission'][j], cost['min_fee'][j]) + traded * cost['slippage'][j]
+        return fee + (traded * cost['sell_tax'][j] if value < 0 else 0.0)
+
+    @staticmethod
+    def _max_buy(cash: float, i: int, cost: dict) -> float:
+        """现金 cash 在扣除佣金、滑点后最多能买入的金额"""
+        by_rate = cash / (1 + cost['commission'][i] + cost['slippage'][i])
+        by_min = (cash - cost['min_fee'][i]) / (1 + cost['slippage'][i])
+        return max(min(by_rate, by_min), 0.0)
+
+    # ------------------------------------------------------------------ #
+    #  主入口
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def run(cls, weights: pd.DataFrame, returns: pd.DataFrame, mode: str = 'drift',
+            commission=0.0, slippage=0.0, sell_tax=0.0, min_fee=0.0, capital: float = 1.0,
+            band=None, stop_loss=None, ann_days: int = 252, rf: float = 0.0) -> dict:
+        """
+        weights / returns 见类说明；stop_loss 为 {code: 回撤比例}，仅在 band 口径下生效，
+        持仓相对平均成本跌幅达到该比例时当日清仓，当日不再对其做再平衡。
+        """
+        if mode not in ('fixed', 'drift'):
+            raise ValueError(f"mode 只能是 'fixed' 或 'drift'，收到 {mode!r}")
+        returns = returns.sort_index()
+        index, columns = returns.index, list(returns.columns)
+        R = returns.to_numpy(dtype=float, na_value=np.nan)
+        R = np.nan_to_num(R, nan=0.0)
+        W = weights.reindex(index=index, columns=columns).to_numpy(dtype=float, na_value=np.nan)
+        signal = ~np.isnan(W).all(axis=1)
+        W = np.where(signal[:, None], np.nan_to_num(W, nan=0.0), np.nan)
+        cost = {
+            'commission': cls._per_asset(commission, columns),
+            'slippage': cls._per_asset(slippage, columns),
+            'sell_tax': cls._per_asset(sell_tax, columns),
+            'min_fee': cls._per_asset(min_fee, columns),
+        }
+
+        if band is None and not stop_loss:
+            out = cls._run_segments(W, R, signal, mode, cost, capital)
+        else:
+            stop = cls._per_asset(stop_loss or {}, columns)
+            out = cls._run_daily(W, R, signal, band, stop, cost, capital)
+        nav, held, turnover, fees, trades = out
+
+        nav_s = pd.Series(nav, index=index, name='nav')
+        trades = pd.DataFrame(trades, columns=['row', 'col', 'value', 'fee', 'reason'])
+        trades.insert(0, 'date', index[trades.pop('row').to_numpy(dtype=int)])
+        trades.insert(1, 'code', [columns[c] for c in trades.pop('col')])
+        stats = cls.stats(nav, ann_days, rf)
+        stats.update({
+            'total_cost': float(fees.sum()),
+            'turnover': float(turnover.sum()),
+            'trade_days': int(np.count_nonzero(turnover > 0)),
+        })
+        return {
+            'nav': nav_s,
+            'returns': nav_s.pct_change().fillna(0.0),
+            'weights': pd.DataFrame(held, index=index, columns=columns),
+            'turnover': pd.Series(turnover, index=index, name='turnover'),
+            'cost': pd.Series(fees, index=index, name='cost'),
+            'drawdown': nav_s / nav_s.cummax() - 1,
+            'trades': trades,
+            'stats': stats,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  按信号分段计算（fixed / drift）
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def _run_segments(cls, W, R, signal, mode, cost, capital):
+        T, A = R.shape
+        nav = np.full(T, float(capital))
+        held = np.zeros((T, A))
+        turnover = np.zeros(T)
+        fees = np.zeros(T)
+        trades = []
+
+        rows = np.flatnonzero(signal)
+        ends = np.r_[rows[1:], T - 1]
+        for s, e in zip(rows, ends):
+            # 第 s 日收盘：由漂移后的持仓调到目标权重
+            v, w = nav[s], W[s]
+            delta = w - held[s]
+            delta[np.abs(delta) < cls.EPS] = 0.0
+            fee = cls._fees(delta * v, cost)
+            traded = np.flatnonzero(delta)
+            trades.extend((s, j, delta[j] * v, fee[j], 'rebalance') for j in traded)
+            fees[s] = fee.sum()
+            turnover[s] = np.abs(delta).sum()
+            v = v - fees[s]
+            nav[s], held[s] = v, w
+            if e <= s:
+                continue
+
+            # 第 s+1 .. e 行：持有到下一次信号
+            r = R[s + 1:e + 1]
+            if mode == 'drift':
+                growth = np.cumprod(1 + r, axis=0)
+                value = growth @ w + (1 - w.sum())
+                held[s + 1:e + 1] = growth * w / value[:, None]
+            else:
+                value = np.cumprod(1 + r @ w)
+                held[s + 1:e + 1] = w
+            nav[s + 1:e + 1] = v * value
+        return nav, held, turnover, fees, trades
+
+    # ------------------------------------------------------------------ #
+    #  逐日阈值再平衡 + 止损
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def _run_daily(cls, W, R, signal, band, stop, cost, capital):
+        T, A = R.shape
+        target = pd.DataFrame(W).ffill().to_numpy()
+        index_px = np.cumprod(1 + R, axis=0)           # 价格指数，用于跟踪平均成本
+        nav = np.zeros(T)
+        held = np.zeros((T, A))
+        turnover = np.zeros(T)
+        fees = np.zeros(T)
+        trades = []
+
+        vals = np.zeros(A)                             # 各标的持仓市值（元）
+        basis = np.zeros(A)                            # 平均成本（价格指数口径）
+        cash = float(capital)
+        for t in range(T):
+            if t:
+                vals *= 1 + R[t]
+            traded_val = 0.0
+
+            # 止损：持仓相对平均成本回撤达到阈值，清仓
+            stopped = np.zeros(A, dtype=bool)
+            if stop.any():
+                with np.errstate(all='ignore'):
+                    dd = np.where(basis > 0, index_px[t] / basis - 1, 0.0)
+                stopped = (stop > 0) & (vals > 0) & (dd <= -stop)
+                for j in np.flatnonzero(stopped):
+                    fee = cls._fee(-vals[j], j, cost)
+                    trades.append((t, j, -vals[j], fee, 'stoploss'))
+                    cash += vals[j] - fee
+                    fees[t] += fee
+                    traded_val += vals[j]
+                    vals[j], basis[j] = 0.0, 0.0
+
+            w = target[t]
+            if not np.isnan(w).any():
+                total = cash + vals.sum()
+                diff = w * total - vals
+                if band is None:
+                    trigger = np.full(A, bool(signal[t]))
+                else:
+                    trigger = np.abs(diff) > band * w * total
+                trigger &= (np.abs(diff) > cls.EPS * total) & ~stopped
+                order = [j for j in np.argsort(diff, kind='stable') if trigger[j]]
+
+                for j in order:                         # 先卖超配
+                    if diff[j] >= 0:
+                        continue
+                    sell = min(-diff[j], vals[j])
+                    fee = cls._fee(-sell, j, cost)
+                    trades.append((t, j, -sell, fee, 'rebalance'))
+                    cash += sell - fee
+                    vals[j] -= sell
+                    fees[t] += fee
+                    traded_val += sell
+                for j in order:                         # 再买欠配，受现金约束
+                    if diff[j] <= 0:
+                        continue
+                    buy = min(diff[j], cls._max_buy(cash, j, cost))
+                    if buy <= cls.EPS * total:
+                        continue
+                    fee = cls._fee(buy, j, cost)
+                    trades.append((t, j, buy, fee, 'rebalance'))
+                    units_old = vals[j] / index_px[t, j]
+                    units_new = buy / index_px[t, j]
+                    basis[j] = (units_old * basis[j] + units_new * index_px[t, j]) / (units_old + units_new)
+                    cash -= buy + fee
+                    vals[j] += buy
+                    fees[t] += fee
+                    traded_val += buy
+
+            nav[t] = cash + vals.sum()
+            held[t] = vals / nav[t] if nav[t] > 0 else 0.0
+            if traded_val:
+                turnover[t] = traded_val / (nav[t] + fees[t])
+        return nav, held, turnover, fees, trades
@@ -0,0 +1,238 @@
+__all__ = ['PushQueue']
+
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import weakref
+
+
+class PushQueue:
+    """
+    后台推送队列：调用方只把消息放进有界队列就返回，网络请求全部在后台线程完成。
+
+    原先 MessagePusher.send_text 在调用线程里同步 requests.post（超时 10 秒），
+    调仓、止损流程里每发一次报告，推送服务慢或断网时下单就要跟着等；现在：
+      - put() 只做一次 put_nowait，不碰网络、不等锁；队列满时直接写入落盘文件，同样不阻塞；
+      - 后台线程取到第一条消息后再等 window 秒，把这段时间内到达的消息合并成一条摘要发送
+        （一篮子止损 / 多个子策略同时出报告时只推一次，也不会触发推送服务的频率限制）；
+      - 发送失败按 backoff × 2^k 秒退避重试 retries 次，仍失败则追加到 spool_file（JSON Lines）；
+      - 启动时和之后每次发送成功后，把 spool_file 里积压的消息合并补发，补发成功才删除文件；
+      - 进程退出时最多等 EXIT_TIMEOUT 秒发完队列，剩余消息写入 spool_file，下次启动补发。
+    spool_file 只由本进程读写（_spool_lock 是线程锁），多个进程不能共用同一个文件，
+    否则一方补发时的改名 / 删除会吞掉另一方刚写入的消息；MessagePusher 按入口脚本名区分。
+
+    用法：
+        pq = PushQueue(send, spool_file='localdata/push_spool.kj202509.jsonl')   # send(title, content)，失败时抛出异常
+        pq.put('调仓报告', '<b>...</b>')                                           # 立即返回
+        pq.flush(timeout=5)                                                       # 等待队列发完（测试 / 退出时使用）
+    """
+
+    WINDOW = 2.0            # 合并窗口（秒）
+    MAX_BATCH = 20          # 单条摘要最多合并的消息数
+    MAXSIZE = 1000          # 队列容量
+    RETRIES = 4             # 失败后的重试次数
+    BACKOFF = 1.0           # 首次重试前的等待（秒），之后逐次翻倍
+    EXIT_TIMEOUT = 5.0      # 进程退出时等待发送的最长时间（秒）
+
+    _live = weakref.WeakSet()
+
+    def __init__(self, send, spool_file: str = None, window: float = WINDOW, maxsize: int = MAXSIZE,
+                 retries: int = RETRIES, backoff: float = BACKOFF):
+        self.send = send
+        self.spool_file = spool_file
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._spool_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._idle = threading.Condition()
+        self._busy = 0                        # 已取出、尚未发送完成的消息数
+        self._thread = threading.Thread(target=self._run, name='PushQueue', daemon=True)
+        self._thread.start()
+        PushQueue._live.add(self)
+
+    # ------------------------------------------------------------------ #
+    #  调用方（交易线程）
+    # ------------------------------------------------------------------ #
+    def put(self, title: str, content: str) -> bool:
+        """放入队列立即返回；队列已满或已关闭时写入落盘文件，返回 False"""
+        msg = {'title': title, 'content': content, 'time': time.time()}
+        if not self._closed.is_set():
+            try:
+                self._queue.put_nowait(msg)
+                return True
+            except queue.Full:
+                print(f">>> [推送队列] 队列已满，消息转存磁盘: {title}")
+        self._spool([msg])
+        return False
+
+    def flush(self, timeout: float = None) -> bool:
+        """等待队列中的消息全部处理完（发送成功或转存磁盘），返回是否在超时前完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._queue.unfinished_tasks or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(0.1 if remaining is None else min(remaining, 0.1))
+        return True
+
+    def close(self, timeout: float = EXIT_TIMEOUT) -> None:
+        """最多等 timeout 秒发完队列，停止后台线程，剩余消息写入落盘文件"""
+        if self._closed.is_set():
+            return
+        self.flush(timeout)
+        self._closed.set()
+        self._thread.join(timeout=1.0)
+        left = []
+        while True:
+            try:
+                left.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if left:
+            self._spool(left)
+
+    # ------------------------------------------------------------------ #
+    #  后台线程
+    # ------------------------------------------------------------------ #
+    def _run(self) -> None:
+        self._resend_spool()
+        while not self._closed.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            with self._idle:
+                self._busy += 1
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                    with self._idle:
+                        self._busy += 1
+                except queue.Empty:
+                    break
+            try:
+                if self._deliver(batch):
+                    self._resend_spool()
+                else:
+                    self._spool(batch)
+            finally:
+                with self._idle:
+                    for _ in batch:
+                        self._queue.task_done()
+                    self._busy -= len(batch)
+                    self._idle.notify_all()
+
+    @staticmethod
+    def _digest(batch: list) -> tuple:
+        """多条消息合并为一条：标题取第一条并注明条数，正文按时间顺序以分隔线拼接"""
+        if len(batch) == 1:
+            return batch[0]['title'], batch[0]['content']
+        title = f"{batch[0]['title']} 等 {len(batch)} 条"
+        parts = []
+        for m in batch:
+            stamp = time.strftime('%H:%M:%S', time.localtime(m['time']))
+            parts.append(f"<b>{m['title']}</b> <small>{stamp}</small><br>{m['content']}")
+        return title, '<hr>'.join(parts)
+
+    def _deliver(self, batch: list) -> bool:
+        """发送一条摘要，失败按指数退避重试；关闭时不再等待重试"""
+        title, content = self._digest(batch)
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(title, content)
+                print(f">>> [推送成功] {title}")
+                return True
+            except Exception as e:
+                print(f">>> [推送异常] {title}（第 {attempt + 1} 次）: {e}")
+            if attempt < self.retries and self._closed.wait(self.backoff * 2 ** attempt):
+                break
+        return False
+
+    # ------------------------------------------------------------------ #
+    #  落盘
+    # ------------------------------------------------------------------ #
+    def _spool(self, batch: list) -> None:
+        if not self.spool_file:
+            print(f">>> [推送队列] 未配置落盘文件，丢弃 {len(batch)} 条消息")
+            return
+        with self._spool_lock:
+            try:
+                directory = os.path.dirname(self.spool_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.spool_file, 'a', encoding='utf-8') as f:
+                    for m in batch:
+                        f.write(json.dumps(m, ensure_ascii=False) + '\n')
+                print(f">>> [推送队列] {len(batch)} 条消息未送达，已保存至 {self.spool_file}")
+            except OSError as e:
+                print(f">>> [推送队列] 保存未送达消息失败: {e}")
+
+    @staticmethod
+    def _read(path: str) -> list:
+        msgs = []
+        if not os.path.exists(path):
+            return msgs
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    msgs.append(json.loads(line))
+                except ValueError:
+                    pass                                    # 写到一半的行直接丢弃
+        return msgs
+
+    def _resend_spool(self) -> None:
+        """
+        把积压的消息分批补发。先在锁内把落盘文件整体改名为 .sending（put() 转存新消息不会等网络），
+        补发全部成功才删除；中途失败时把未发出的部分追加回落盘文件，进程崩溃则下次启动连同 .sending 一起补发。
+        """
+        if not self.spool_file:
+            return
+        sending = self.spool_file + '.sending'
+        with self._spool_lock:
+            try:
+                if os.path.exists(self.spool_file):
+                    msgs = self._read(sending) + self._read(self.spool_file)
+                    tmp = sending + '.tmp'
+                    with open(tmp, 'w', encoding='utf-8') as f:
+                        for m in msgs:
+                            f.write(json.dumps(m, ensure_ascii=False) + '\n')
+                    os.replace(tmp, sending)
+                    os.remove(self.spool_file)
+                else:
+                    msgs = self._read(sending)
+            except OSError as e:
+                print(f">>> [推送队列] 读取未送达消息失败: {e}")
+                return
+        if not msgs:
+            return
+        print(f">>> [推送队列] 补发 {len(msgs)} 条积压消息")
+        for i in range(0, len(msgs), self.MAX_BATCH):
+            if not self._deliver(msgs[i:i + self.MAX_BATCH]):
+                self._spool(msgs[i:])
+                break
+        try:
+            os.remove(sending)
+        except OSError:
+            pass
+
+    @classmethod
+    def close_all(cls) -> None:
+        for pq in list(cls._live):
+            pq.close()
+
+
+atexit.register(PushQueue.close_all)
@@ -0,0 +1,1260 @@
+__all__ = ['SimClock', 'SimXtData', 'SimTrader', 'ReplayRunner']
+
+import os
+import sys
+import time
+import types
+import shutil
+import inspect
+import copy
+import logging
+import datetime
+import contextlib
+import dataclasses
+from dataclasses import dataclass
+from datetime import timezone, timedelta
+import numpy as np
+import pandas as pd
+from xtquant import xtdata, xtconstant
+from utils.barstore import BarStore, LOCAL_DATA_DIR
+from utils.financialstore import FinancialStore
+from utils.portfoliosim import PortfolioSim
+from utils.timing import Timing
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MISSING = object()
+
+
+# ====================================================================== #
+#  虚拟时钟
+# ====================================================================== #
+class SimClock:
+    """
+    回放用的虚拟时钟（北京时间）。
+
+    ReplayRunner 把策略模块里的 datetime / time 换成 datetime_module() / time_module() 返回的替身，
+    策略里的 datetime.datetime.now()、time.time() 读这里的时间，time.sleep() 直接把时钟往后拨，
+    因此"等待卖单成交 120 秒"之类的轮询在回放中不占用真实时间。时钟只会前进，不会后退。
+    """
+
+    def __init__(self, start=None):
+        self._now = self._aware(start) if start is not None else datetime.datetime.now(BEIJING_TZ)
+        self._stamp = None                  # 当前时刻的 YYYYMMDDHHMMSS 整数，时钟变化时失效
+
+    @staticmethod
+    def _aware(t) -> datetime.datetime:
+        t = pd.Timestamp(t).to_pydatetime()
+        return t.replace(tzinfo=BEIJING_TZ) if t.tzinfo is None else t.astimezone(BEIJING_TZ)
+
+    def now(self, tz=None) -> datetime.datetime:
+        """同 datetime.datetime.now(tz)：tz 为空时返回不带时区的北京时间"""
+        return self._now.replace(tzinfo=None) if tz is None else self._now.astimezone(tz)
+
+    def time(self) -> float:
+        return self._now.timestamp()
+
+    def sleep(self, seconds) -> None:
+        self._now += timedelta(seconds=max(float(seconds), 0.0))
+        self._stamp = None
+
+    def set(self, t) -> None:
+        """拨到 t（早于当前时间则忽略）"""
+        t = self._aware(t)
+        if t > self._now:
+            self._now = t
+            self._stamp = None
+
+    def day(self) -> int:
+        """当前日期 YYYYMMDD"""
+        return self.stamp() // 1000000
+
+    def hms(self) -> int:
+        """当前时刻 HHMMSS"""
+        return self.stamp() % 1000000
+
+    def stamp(self) -> int:
+        """当前时间 YYYYMMDDHHMMSS"""
+        if self._stamp is None:
+            self._stamp = int(self._now.strftime('%Y%m%d%H%M%S'))
+        return self._stamp
+
+    def datetime_module(self) -> types.ModuleType:
+        """datetime 模块替身：datetime.datetime.now() / today() 读虚拟时钟，其余与标准库相同"""
+        clock = self
+
+        class _SimDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now(tz)
+
+            @classmethod
+            def today(cls):
+                return clock.now()
+
+            @classmethod
+            def utcnow(cls):
+                return clock.now(timezone.utc).replace(tzinfo=None)
+
+            @classmethod
+            def fromtimestamp(cls, t, tz=None):
+                # 与 now() 一致：不带时区时按北京时间换算（实盘机器本身就在北京时间下运行）
+                if tz is None:
+                    return datetime.datetime.fromtimestamp(t, BEIJING_TZ).replace(tzinfo=None)
+                return datetime.datetime.fromtimestamp(t, tz)
+
+        mod = types.ModuleType('datetime')
+        mod.__dict__.update(datetime.__dict__)
+        mod.datetime = _SimDatetime
+        return mod
+
+    def time_module(self) -> types.ModuleType:
+        """time 模块替身：time.time() 读虚拟时钟，time.sleep() 拨动虚拟时钟"""
+        mod = types.ModuleType('time')
+        mod.__dict__.update(time.__dict__)
+        mod.time = self.time
+        mod.sleep = self.sleep
+        return mod
+
+
+# ====================================================================== #
+#  行情接口
+# ====================================================================== #
+class SimXtData:
+    """
+    基于本地 BarStore / FinancialStore 的 xtdata 替身，所有查询都截止到虚拟时钟的"现在"。
+
+    可见性：
+      日线当天那根 K 线从 09:30 起可见（quote='close' 时直接用全天的收盘数据近似盘中，
+      与各 *_regression.py 按收盘价成交的口径一致；quote='open' 时当天 K 线的高低收都按开盘价给出；
+      quote 为分钟 / 分笔周期时当天 K 线按截至当前时刻的盘中数据合成），
+      分钟线只能看到时间戳不晚于当前时刻的 K 线。
+    最新价：
+      get_full_tick / 订阅推送 / 模拟成交都使用同一份报价：开盘前为昨收，开盘后按 quote 取当天收盘或开盘；
+      当天没有 K 线的代码视为停牌（最新价=昨收，不能成交）。
+      quote='1m' / '5m' / 'tick' 时报价取自对应周期的 BarStore：最新价为截至当前时刻最后一根 K 线的收盘价
+      （分笔为 lastPrice），开高低、成交量按当天已走完的部分累计；分钟仓库里没有的代码（包括风控用的指数）
+      当天一律视为未开盘，不会用到当天收盘价。
+    其它：
+      合约信息取 InstrumentMgr 最近一次落盘的快照（名称、股本），上市日期缺失时用仓库里第一根 K 线补，
+      涨跌停价按昨收 × (1 ± 10% / 20% / 5%) 估算；财务数据按公告日时点取自 FinancialStore；
+      板块 / 指数成分取 sectors 参数，未提供时 '沪深A股' 等板块名返回当时已上市的全部 A 股，
+      指数代码返回空（历史成分股请通过 sectors 传入，否则会有幸存者偏差）。download_* 均为空操作。
+    """
+
+    OPEN_TIME = 93000
+    INTRADAY = ('1m', '5m', 'tick')
+    TODAY_FIELDS = {'open': 'open', 'high': 'high', 'low': 'low', 'close': 'lastPrice',
+                    'volume': 'volume', 'amount': 'amount'}
+    LIMITS = {'30': 0.2, '68': 0.2}                # 创业板 / 科创板涨跌幅，其余 10%，ST 5%
+    API = ('get_market_data', 'get_market_data_ex', 'get_full_tick', 'subscribe_quote',
+           'subscribe_whole_quote', 'unsubscribe_quote', 'get_trading_dates', 'get_instrument_detail',
+           'get_instrument_detail_list', 'get_stock_list_in_sector', 'get_index_weight',
+           'get_financial_data', 'get_divid_factors', 'download_history_data', 'download_history_data2',
+           'download_financial_data', 'download_financial_data2', 'download_index_weight',
+           'download_sector_data', 'connect')
+
+    def __init__(self, clock: SimClock, root=None, dividend_type: str = 'front', quote: str = 'close',
+                 sectors: dict = None, instruments: pd.DataFrame = None, financial: FinancialStore = None):
+        if quote not in ('close', 'open') + self.INTRADAY:
+            raise ValueError(f"quote 只能是 'close' / 'open' / {' / '.join(self.INTRADAY)}，收到 {quote!r}")
+        self.clock = clock
+        self.root = root
+        self.dividend_type = dividend_type
+        self.quote = quote
+        self.sectors = {k: list(v) for k, v in (sectors or {}).items()}
+        self.financial = financial or FinancialStore(root)
+        self.instruments = instruments if instruments is not None else self._latest_instruments()
+        self._stores = {}
+        self._labels = {}
+        self._span = None                   # 各代码首末有效 K 线的行号
+        self._quotes = None
+        self._quote_key = None
+        self._quote_stamp = None            # 同一时刻重复查询直接复用
+        self._intraday = None               # 当天的盘中累计数组，按日期缓存
+        self._subs = {}                     # seq -> (codes, callback, 是否单票订阅)
+        self._seq = 0
+        self._pushed_key = None
+
+    @staticmethod
+    def _latest_instruments() -> pd.DataFrame:
+        from utils.instrumentmgr import InstrumentMgr
+        folder = InstrumentMgr.SNAPSHOT_DIR
+        files = sorted(f for f in os.listdir(folder)
+                       if f.startswith('instrument_') and f.endswith('.pkl')) if os.path.isdir(folder) else []
+        if not files:
+            return InstrumentMgr._empty()
+        return pd.read_pickle(os.path.join(folder, files[-1]))
+
+    # ------------------------------------------------------------------ #
+    #  仓库与时间窗口
+    # ------------------------------------------------------------------ #
+    def _store(self, period: str) -> BarStore:
+        if period not in self._stores:
+            self._stores[period] = BarStore(self.root, period)
+        return self._stores[period]
+
+    def _dtype(self, period: str, dividend_type: str) -> str:
+        """请求的复权方式在仓库中不存在时退回默认复权方式"""
+        store = self._store(period)
+        for dt in (dividend_type, self.dividend_type):
+            if dt and store._meta(dt) is not None:
+                return dt
+        raise FileNotFoundError(f"BarStore 中没有 {period} 行情，请先 BarStore(period='{period}').ensure(...)")
+
+    def _label(self, period: str, dt: str) -> np.ndarray:
+        key = (period, dt)
+        if key not in self._labels:
+            self._labels[key] = self._store(period)._meta(dt)['dates'].astype(str)
+        return self._labels[key]
+
+    def _visible(self, period: str, dates: np.ndarray) -> int:
+        """截至当前时刻可见的行数"""
+        if period.endswith('d') or period in ('1w', '1mon'):
+            side = 'right' if self.clock.hms() >= self.OPEN_TIME else 'left'
+            return int(np.searchsorted(dates, self.clock.day(), side=side))
+        return int(np.searchsorted(dates, self.clock.stamp(), side='right'))
+
+    def _window(self, period, dt, start_time, end_time, count) -> tuple:
+        store = self._store(period)
+        dates = store._meta(dt)['dates']
+        hi = self._visible(period, dates)
+        if end_time:
+            hi = min(hi, int(np.searchsorted(dates, store._bound(end_time, upper=True), side='right')))
+        lo = int(np.searchsorted(dates, store._bound(start_time, upper=False), side='left')) if start_time else 0
+        if count is not None and count > 0:
+            lo = max(lo, hi - count)
+        return min(lo, hi), hi
+
+    def _block(self, field, codes, period, dt, lo, hi, fill) -> np.ndarray:
+        """行 [lo, hi) × codes 的数值块，仓库中没有的代码为 NaN"""
+        store = self._store(period)
+        meta = store._meta(dt)
+        if field == 'time':
+            labels = pd.to_datetime(self._label(period, dt)[lo:hi],
+                                    format='%Y%m%d' if len(meta['dates']) and meta['dates'][0] < 10 ** 9 else '%Y%m%d%H%M%S')
+            ms = ((labels - pd.Timedelta(hours=8)).asi8 // 10 ** 6).astype(float)
+            return np.repeat(ms[:, None], len(codes), axis=1)
+        out = np.full((hi - lo, len(codes)), np.nan)
+        pos = [(k, meta['index'][c]) for k, c in enumerate(codes) if c in meta['index']]
+        if pos and hi > lo:
+            ks, cols = zip(*pos)
+            out[:, list(ks)] = store._matrix(field, dt)[lo:hi][:, list(cols)]
+        if period == '1d' and hi > lo and meta['dates'][hi - 1] == self.clock.day():
+            if self.quote == 'open' and field in ('high', 'low', 'close'):
+                out[-1] = self._block('open', codes, period, dt, hi - 1, hi, False)[0]
+            elif self.quote in self.INTRADAY and field in self.TODAY_FIELDS:
+                out[-1] = self._today_row(field, codes)
+        if fill:
+            if field in ('volume', 'amount'):
+                out = np.nan_to_num(out, nan=0.0)
+            elif field not in ('time',):
+                out = pd.DataFrame(out).ffill().to_numpy()
+        return out
+
+    # ------------------------------------------------------------------ #
+    #  K 线
+    # ------------------------------------------------------------------ #
+    def get_market_data_ex(self, field_list=[], stock_list=[], period='1d', start_time='', end_time='',
+                           count=-1, dividend_type='none', fill_data=True) -> dict:
+        """{code: DataFrame(index=时间标签, columns=字段)}，上市前的行不返回"""
+        codes = list(stock_list)
+        dt = self._dtype(period, dividend_type)
+        fields = list(field_list) or list(self._store(period)._meta(dt).get('fields', BarStore.DEFAULT_FIELDS))
+        lo, hi = self._window(period, dt, start_time, end_time, count)
+        labels = self._label(period, dt)[lo:hi]
+        valid = ~np.isnan(self._block('close', codes, period, dt, lo, hi, True))
+        first = np.where(valid.any(axis=0), valid.argmax(axis=0), hi - lo)
+        # (代码, 时间, 字段) 三维块：每只代码切出一个连续二维数组，DataFrame 只需构造一个数值块
+        cube = np.stack([self._block(f, codes, period, dt, lo, hi, fill_data).T for f in fields], axis=2) \
+            if fields else np.empty((len(codes), hi - lo, 0))
+        index = self._store(period)._meta(dt)['index']
+        out = {}
+        for j, code in enumerate(codes):
+            if code not in index:
+                out[code] = pd.DataFrame(columns=fields)
+                continue
+            s = first[j]
+            out[code] = pd.DataFrame(cube[j, s:], index=labels[s:], columns=fields)
+        return out
+
+    def get_market_data(self, field_list=[], stock_list=[], period='1d', start_time='', end_time='',
+                        count=-1, dividend_type='none', fill_data=True) -> dict:
+        """{field: DataFrame(index=代码, columns=时间标签)}"""
+        codes = list(stock_list)
+        dt = self._dtype(period, dividend_type)
+        fields = list(field_list) or list(self._store(period)._meta(dt).get('fields', BarStore.DEFAULT_FIELDS))
+        lo, hi = self._window(period, dt, start_time, end_time, count)
+        labels = self._label(period, dt)[lo:hi]
+        return {f: pd.DataFrame(self._block(f, codes, period, dt, lo, hi, fill_data).T, index=codes, columns=labels)
+                for f in fields}
+
+    def get_trading_dates(self, market='SH', start_time='', end_time='', count=-1) -> list:
+        """交易日（毫秒时间戳），截至今天"""
+        dt = self._dtype('1d', self.dividend_type)
+        dates = self._store('1d')._meta(dt)['dates']
+        hi = int(np.searchsorted(dates, self.clock.day(), side='right'))
+        if end_time:
+            hi = min(hi, int(np.searchsorted(dates, BarStore._to_int(str(end_time)[:8]), side='right')))
+        lo = int(np.searchsorted(dates, BarStore._to_int(str(start_time)[:8]), side='left')) if start_time else 0
+        if count is not None and count > 0:
+            lo = max(lo, hi - count)
+        days = pd.to_datetime(dates[lo:hi].astype(str), format='%Y%m%d') - pd.Timedelta(hours=8)
+        return (days.asi8 // 10 ** 6).tolist()
+
+    # ------------------------------------------------------------------ #
+    #  报价
+    # ------------------------------------------------------------------ #
+    def _intraday_day(self, day: int) -> dict:
+        """
+        当天的盘中数组：行为当天的分钟 / 分笔，列为同时在日线仓库中的代码（cols 为其日线列号）。
+        最新价向前填充，开盘价取当天第一笔，高低价、成交量 / 额按时间累计（分笔数据本身已是当日累计值）。
+        """
+        if self._intraday is not None and self._intraday['day'] == day:
+            return self._intraday
+        store = self._store(self.quote)
+        dt = self._dtype(self.quote, self.dividend_type)
+        meta = store._meta(dt)
+        dates = meta['dates']
+        lo = int(np.searchsorted(dates, day * 10 ** 6, side='left'))
+        hi = int(np.searchsorted(dates, (day + 1) * 10 ** 6, side='left'))
+        daily = self._store('1d')._meta(self._dtype('1d', self.dividend_type))['index']
+        pairs = [(daily[c], j) for c, j in meta['index'].items() if c in daily]
+        cols_daily = np.array([p[0] for p in pairs], dtype=np.intp)
+        cols = np.array([p[1] for p in pairs], dtype=np.intp)
+        fields = meta.get('fields', [])
+        tick = 'close' not in fields
+
+        def block(f):
+            if f not in fields:
+                return np.full((hi - lo, len(cols)), np.nan)
+            arr = np.asarray(store._matrix(f, dt)[lo:hi], dtype=float)[:, cols]
+            return np.where(arr > 0, arr, np.nan) if f not in ('volume', 'amount') else arr
+
+        raw = block('lastPrice' if tick else 'close')
+        traded = ~np.isnan(raw)
+        opens = np.full_like(raw, np.nan)
+        has = np.flatnonzero(traded.any(axis=0))
+        if len(has):
+            first = traded.argmax(axis=0)[has]
+            day_open = block('open')[first, has]
+            opens[first, has] = np.where(np.isnan(day_open), raw[first, has], day_open)
+
+        def ffill(arr):
+            return pd.DataFrame(arr).ffill().to_numpy() if len(arr) else arr
+
+        def cumulate(f):
+            arr = block(f)
+            return np.nan_to_num(ffill(arr)) if tick else np.nancumsum(arr, axis=0)
+
+        self._intraday = {
+            'day': day,
+            'stamps': dates[lo:hi],
+            'cols': cols_daily,
+            'seen': np.logical_or.accumulate(traded, axis=0) if len(raw) else traded,
+            'lastPrice': ffill(raw),
+            'open': ffill(opens),
+            'high': np.fmax.accumulate(np.fmax(block('high'), raw), axis=0) if len(raw) else raw,
+            'low': np.fmin.accumulate(np.fmin(block('low'), raw), axis=0) if len(raw) else raw,
+            'volume': cumulate('volume'),
+            'amount': cumulate('amount'),
+        }
+        return self._intraday
+
+    def _quote_table(self) -> dict:
+        """全部代码当前时刻的报价数组，按 (日期, 是否已开盘, 盘中行号) 缓存"""
+        if self.clock.stamp() == self._quote_stamp:
+            return self._quotes
+        self._quote_stamp = self.clock.stamp()
+        day, opened = self.clock.day(), self.clock.hms() >= self.OPEN_TIME
+        r = -1
+        if self.quote in self.INTRADAY and opened:
+            r = int(np.searchsorted(self._intraday_day(day)['stamps'], self.clock.stamp(), side='right')) - 1
+        key = (day, opened, r)
+        if key == self._quote_key:
+            return self._quotes
+        dt = self._dtype('1d', self.dividend_type)
+        store = self._store('1d')
+        meta = store._meta(dt)
+        dates = meta['dates']
+        t = int(np.searchsorted(dates, day, side='left'))
+        today = t < len(dates) and dates[t] == day
+        n = len(meta['codes'])
+
+        hist = np.asarray(store._matrix('close', dt)[max(t - 30, 0):t])
+        pre = pd.DataFrame(hist).ffill().to_numpy()[-1] if len(hist) else np.full(n, np.nan)
+        row = {}
+        last = np.full(n, np.nan)
+        if self.quote in self.INTRADAY:
+            if r >= 0:
+                d = self._intraday
+                seen = d['seen'][r]
+                cols = d['cols'][seen]
+                for f in ('lastPrice', 'open', 'high', 'low', 'volume', 'amount'):
+                    row[f] = np.full(n, np.nan)
+                    row[f][cols] = d[f][r][seen]
+                last = row.pop('lastPrice')
+        elif today and opened:
+            row = {f: np.asarray(store._matrix(f, dt)[t], dtype=float)
+                   for f in ('open', 'high', 'low', 'close', 'volume', 'amount') if f in meta.get('fields', [])}
+            if self.quote == 'open':
+                row['high'] = row['low'] = row['close'] = row['open']
+            last = row['close']
+        zeros = np.zeros(n)
+        self._quotes = {
+            'lastPrice': np.where(np.isnan(last), pre, last),
+            'open': np.nan_to_num(row.get('open', zeros)),
+            'high': np.nan_to_num(row.get('high', zeros)),
+            'low': np.nan_to_num(row.get('low', zeros)),
+            'lastClose': pre,
+            'volume': np.nan_to_num(row.get('volume', zeros)),
+            'amount': np.nan_to_num(row.get('amount', zeros)),
+            'halted': np.isnan(last),
+            'index': meta['index'],
+        }
+        self._quote_key = key
+        return self._quotes
+
+    def _today_row(self, field: str, codes) -> np.ndarray:
+        """盘中回放时日线当天那一行：按截至当前时刻的报价合成，未开盘 / 停牌为 NaN"""
+        q = self._quote_table()
+        vals = q[self.TODAY_FIELDS[field]]
+        out = np.full(len(codes), np.nan)
+        for k, code in enumerate(codes):
+            j = q['index'].get(code)
+            if j is not None and not q['halted'][j]:
+                out[k] = vals[j]
+        return out
+
+    def last_price(self, code: str) -> float:
+        """可成交价：停牌或无行情返回 NaN"""
+        q = self._quote_table()
+        j = q['index'].get(code)
+        if j is None or q['halted'][j]:
+            return float('nan')
+        return float(q['lastPrice'][j])
+
+    def mark_price(self, code: str) -> float:
+        """估值价：最新价，停牌时为昨收"""
+        q = self._quote_table()
+        j = q['index'].get(code)
+        return float(q['lastPrice'][j]) if j is not None else float('nan')
+
+    def get_full_tick(self, code_list) -> dict:
+        """{code: tick_dict}，格式同 xtdata.get_full_tick"""
+        q = self._quote_table()
+        codes = [c for c in code_list if c in q['index']]
+        if not codes:
+            return {}
+        rows = np.fromiter((q['index'][c] for c in codes), dtype=np.intp, count=len(codes))
+        cols = {f: q[f][rows].tolist() for f in ('lastPrice', 'open', 'high', 'low', 'lastClose', 'volume', 'amount')}
+        stamp = int(self.clock.time() * 1000)
+        out = {}
+        for k, code in enumerate(codes):
+            last = cols['lastPrice'][k]
+            if not last > 0:
+                continue
+            out[code] = {'time': stamp, 'lastPrice': last, 'open': cols['open'][k], 'high': cols['high'][k],
+                         'low': cols['low'][k], 'lastClose': cols['lastClose'][k], 'volume': cols['volume'][k],
+                         'amount': cols['amount'][k], 'askPrice': [last, 0, 0, 0, 0],
+                         'bidPrice': [last, 0, 0, 0, 0], 'askVol': [0] * 5, 'bidVol': [0] * 5}
+        return out
+
+    def subscribe_quote(self, stock_code, period='1d', start_time='', end_time='', count=0, callback=None) -> int:
+        self._seq += 1
+        self._subs[self._seq] = ([stock_code], callback, True)
+        return self._seq
+
+    def subscribe_whole_quote(self, code_list, callback=None) -> int:
+        self._seq += 1
+        self._subs[self._seq] = (list(code_list), callback, False)
+        return self._seq
+
+    def unsubscribe_quote(self, seq) -> None:
+        self._subs.pop(seq, None)
+
+    def push(self) -> None:
+        """报价变化（新交易日 / 开盘）时向所有订阅回调推送一次快照"""
+        self._quote_table()
+        if self._quote_key == self._pushed_key:
+            return
+        self._pushed_key = self._quote_key
+        for codes, callback, single in list(self._subs.values()):
+            if callback is None:
+                continue
+            ticks = self.get_full_tick(codes)
+            if ticks:
+                callback({c: [t] for c, t in ticks.items()} if single else ticks)
+
+    # ------------------------------------------------------------------ #
+    #  合约 / 板块
+    # ------------------------------------------------------------------ #
+    def _listed_span(self):
+        """各代码在日线仓库中第一根、最后一根有效 K 线的日期"""
+        if self._span is None:
+            dt = self._dtype('1d', self.dividend_type)
+            store = self._store('1d')
+            dates = store._meta(dt)['dates']
+            valid = ~np.isnan(np.asarray(store._matrix('close', dt)))
+            has = valid.any(axis=0)
+            first = np.where(has, dates[valid.argmax(axis=0)], 0)
+            last = np.where(has, dates[len(dates) - 1 - valid[::-1].argmax(axis=0)], 0)
+            self._span = (first, last)
+        return self._span
+
+    def _listed(self, codes) -> list:
+        """当天已上市且未退市的代码"""
+        index = self._quote_table()['index']
+        first, last = self._listed_span()
+        day = self.clock.day()
+        return [c for c in codes if c in index and 0 < first[index[c]] <= day <= last[index[c]]]
+
+    @staticmethod
+    def _is_a_share(code: str) -> bool:
+        num, _, mkt = code.partition('.')
+        return (mkt == 'SH' and num[:2] in ('60', '68')) or (mkt == 'SZ' and num[:2] in ('00', '30')) \
+            or mkt == 'BJ'
+
+    def get_instrument_detail(self, stock_code, iscomplete=False):
+        q = self._quote_table()
+        j = q['index'].get(stock_code)
+        if j is None or not self._listed([stock_code]):
+            return None
+        name, total, open_date = stock_code, 0.0, 0
+        if stock_code in self.instruments.index:
+            row = self.instruments.loc[stock_code]
+            if isinstance(row['name'], str) and row['name']:
+                name = row['name']
+            if pd.notna(row['total_volume']):
+                total = float(row['total_volume'])
+            if pd.notna(row['open_date']):
+                open_date = int(row['open_date'])
+        if open_date <= 0:
+            open_date = int(self._listed_span()[0][j])
+        pre = float(q['lastClose'][j])
+        lim = 0.05 if ('ST' in name or '*' in name) else self.LIMITS.get(stock_code[:2], 0.1)
+        num, _, mkt = stock_code.partition('.')
+        return {
+            'ExchangeID': mkt, 'InstrumentID': num, 'InstrumentName': name,
+            'OpenDate': str(open_date), 'TotalVolume': total, 'FloatVolume': total, 'PreClose': pre,
+            'UpStopPrice': round(pre * (1 + lim), 2) if pre > 0 else 0.0,
+            'DownStopPrice': round(pre * (1 - lim), 2) if pre > 0 else 0.0,
+        }
+
+    def get_instrument_detail_list(self, stock_list, iscomplete=False) -> dict:
+        return {c: self.get_instrument_detail(c) for c in stock_list}
+
+    def get_stock_list_in_sector(self, sector_name, real_timetag=-1) -> list:
+        if sector_name in self.sectors:
+            return self._listed(self.sectors[sector_name])
+        if '.' in sector_name:
+            return []
+        return self._listed([c for c in self._quote_table()['index'] if self._is_a_share(c)])
+
+    def get_index_weight(self, index_code) -> dict:
+        codes = self._listed(self.sectors.get(index_code, []))
+        return {c: 1.0 / len(codes) for c in codes}
+
+    # ------------------------------------------------------------------ #
+    #  财务
+    # ------------------------------------------------------------------ #
+    def get_financial_data(self, stock_list, table_list=[], start_time='', end_time='',
+                           report_type='report_time') -> dict:
+        """{code: {table: DataFrame}}，只包含公告日不晚于今天的记录（按公告日排序）"""
+        day = self.clock.day()
+        start = FinancialStore._to_int(start_time) if start_time else 0
+        out = {c: {} for c in stock_list}
+        for table in table_list:
+            data = self.financial._load(table)
+            for code in stock_list:
+                c = data['index'].get(code) if data is not None else None
+                if c is None:
+                    out[code][table] = pd.DataFrame()
+                    continue
+                base = np.int64(c) * FinancialStore.KEY_BASE
+                lo = int(np.searchsorted(data['keys'], base + start, side='left'))
+                hi = int(np.searchsorted(data['keys'], base + day, side='right'))
+                df = pd.DataFrame({f: v[lo:hi] for f, v in data['cols'].items()})
+                df['m_timetag'] = data['report'][lo:hi].astype(str)
+                df['m_anntime'] = data['ann'][lo:hi].astype(str)
+                out[code][table] = df
+        return out
+
+    def get_divid_factors(self, stock_code, start_time='', end_time='') -> pd.DataFrame:
+        return pd.DataFrame()
+
+    def _noop(self, *args, **kwargs):
+        return None
+
+    download_history_data = download_history_data2 = _noop
+    download_financial_data = download_financial_data2 = _noop
+    download_index_weight = download_sector_data = connect = _noop
+
+
+# ====================================================================== #
+#  交易接口
+# ====================================================================== #
+@dataclass
+class SimAccount:
+    account_id: str = 'SIM'
+    account_type: int = 2
+
+
+@dataclass
+class SimPosition:
+    account_id: str
+    stock_code: str
+    volume: int = 0
+    can_use_volume: int = 0
+    frozen_volume: int = 0
+    on_road_volume: int = 0
+    yesterday_volume: int = 0
+    open_price: float = 0.0
+    avg_price: float = 0.0
+    market_value: float = 0.0
+
+
+@dataclass
+class SimAsset:
+    account_id: str
+    cash: float
+    frozen_cash: float
+    market_value: float
+    total_asset: float
+
+
+@dataclass
+class SimOrder:
+    account_id: str
+    stock_code: str
+    order_id: int
+    order_sysid: str
+    order_time: int
+    order_type: int
+    order_volume: int
+    price_type: int
+    price: float
+    traded_volume: int = 0
+    traded_price: float = 0.0
+    order_status: int = 0
+    status_msg: str = ''
+    strategy_name: str = ''
+    order_remark: str = ''
+
+
+@dataclass
+class SimTrade:
+    account_id: str
+    stock_code: str
+    order_type: int
+    traded_id: str
+    traded_time: int
+    traded_price: float
+    traded_volume: int
+    traded_amount: float
+    order_id: int
+    order_sysid: str
+    strategy_name: str
+    order_remark: str
+    commission: float = 0.0
+
+
+@dataclass
+class SimOrderError:
+    account_id: str
+    order_id: int
+    error_id: int
+    error_msg: str
+    strategy_name: str = ''
+    order_remark: str = ''
+
+
+@dataclass
+class SimAsyncResponse:
+    account_id: str
+    order_id: int
+    seq: int
+    strategy_name: str = ''
+    order_remark: str = ''
+    error_msg: str = ''
+
+
+@dataclass
+class SimCancelResponse:
+    account_id: str
+    order_id: int
+    seq: int
+    cancel_result: int
+    order_sysid: str = ''
+
+
+class SimTrader:
+    """
+    XtQuantTrader 替身，按 SimXtData 的报价撮合。
+
+    下单：
+      市价 / 最新价委托按当前最新价（± slippage）立即成交；限价委托价格可成交时按最新价成交，
+      否则挂单，在之后的每个调度时刻重新撮合，收盘时仍未成交的撤单。
+      废单（on_order_error + 状态 57）：数量非法、买入不是 100 的整数倍、可用资金 / 可卖数量不足、停牌或未开盘。
+      order_stock 与真实接口一样，只要报单发出就返回订单号；成交结果通过回调告知。
+    回调：
+      与真实接口相同的顺序 on_stock_order(已报) → on_stock_trade → on_stock_order(已成)，
+      在 order_stock 返回前同步调用（相当于回报瞬间到达）；回调拿到的是对象快照。
+    规则：
+      默认全部 T+1（t0_codes 中的代码当日买入可卖），佣金 max(成交额 × commission, min_fee)，
+      股票卖出另收 sell_tax 印花税（ETF / 债券不收）。
+    """
+
+    def __init__(self, xt: SimXtData, clock: SimClock, cash: float = 1e6, commission: float = 0.0001,
+                 min_fee: float = 5.0, sell_tax: float = 0.0005, slippage: float = 0.0, t0_codes=(),
+                 account_id: str = 'SIM'):
+        self.xt = xt
+        self.clock = clock
+        self.account_id = account_id
+        self.commission = commission
+        self.min_fee = min_fee
+        self.sell_tax = sell_tax
+        self.slippage = slippage
+        self.t0_codes = set(t0_codes)
+        self.cash = float(cash)
+        self.frozen_cash = 0.0
+        self.positions = {}                 # code -> SimPosition（内部状态，查询返回副本）
+        self.orders = []                    # 全部委托
+        self.trades = []                    # 全部成交
+        self._pending = {}                  # order_id -> (order, 冻结金额)
+        self._callbacks = []
+        self._order_id = 0
+        self._trade_id = 0
+        self._seq = 0
+        self._day = None
+        self._day_start = (None, 0.0)       # (日期, 当天零点的时间戳)
+
+    # ------------------------------------------------------------------ #
+    #  连接（空操作）
+    # ------------------------------------------------------------------ #
+    def register_callback(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def connect(self) -> int:
+        return 0
+
+    def subscribe(self, account) -> int:
+        return 0
+
+    def run_forever(self) -> None:
+        pass
+
+    def _notify(self, name: str, obj) -> None:
+        snap = copy.copy(obj)
+        for cb in self._callbacks:
+            fn = getattr(cb, name, None)
+            if fn is not None:
+                fn(snap)
+
+    # ------------------------------------------------------------------ #
+    #  下单 / 撤单
+    # ------------------------------------------------------------------ #
+    def _fee(self, code: str, amount: float, side: int) -> float:
+        fee = max(amount * self.commission, self.min_fee) if amount > 0 else 0.0
+        if side == xtconstant.STOCK_SELL and SimXtData._is_a_share(code):
+            fee += amount * self.sell_tax
+        return fee
+
+    def _reject(self, order: SimOrder, msg: str) -> None:
+        order.order_status = xtconstant.ORDER_JUNK
+        order.status_msg = msg
+        self._notify('on_order_error', SimOrderError(self.account_id, order.order_id, -1, msg,
+                                                     order.strategy_name, order.order_remark))
+        self._notify('on_stock_order', order)
+
+    def _submit(self, stock_code, order_type, order_volume, price_type, price, strategy_name,
+                order_remark, seq=None) -> int:
+        self._order_id += 1
+        order = SimOrder(self.account_id, stock_code, self._order_id, str(self._order_id),
+                         int(self.clock.time()), order_type, int(order_volume), price_type, float(price or 0),
+                         order_status=xtconstant.ORDER_REPORTED, strategy_name=strategy_name,
+                         order_remark=order_remark)
+        self.orders.append(order)
+        if seq is not None:
+            self._notify('on_order_stock_async_response',
+                         SimAsyncResponse(self.account_id, order.order_id, seq, strategy_name, order_remark))
+
+        err, frozen = self._freeze(order)
+        if err:
+            self._reject(order, err)
+            return order.order_id
+        self._pending[order.order_id] = (order, frozen)
+        self._notify('on_stock_order', order)
+        self._match(order)
+        return order.order_id
+
+    def _freeze(self, order: SimOrder) -> tuple:
+        """校验委托并冻结资金 / 持仓，返回 (废单原因, 冻结金额)"""
+        px = self.xt.last_price(order.stock_code)
+        if order.order_volume <= 0:
+            return '委托数量必须大于 0', 0.0
+        if not px > 0:
+            return '停牌或不在交易时段', 0.0
+        if order.order_type == xtconstant.STOCK_BUY:
+            if order.order_volume % 100:
+                return '买入数量必须是 100 的整数倍', 0.0
+            limit = order.price_type == xtconstant.FIX_PRICE and order.price > 0
+            cost = (order.price if limit else px * (1 + self.slippage)) * order.order_volume
+            frozen = cost + self._fee(order.stock_code, cost, order.order_type)
+            if frozen > self.cash + 1e-6:
+                return f'可用资金不足（需 {frozen:.2f}，可用 {self.cash:.2f}）', 0.0
+            self.cash -= frozen
+            self.frozen_cash += frozen
+            return '', frozen
+        pos = self.positions.get(order.stock_code)
+        if pos is None or order.order_volume > pos.can_use_volume:
+            return '可卖数量不足', 0.0
+        pos.can_use_volume -= order.order_volume
+        pos.frozen_volume += order.order_volume
+        return '', 0.0
+
+    def order_stock(self, account, stock_code, order_type, order_volume, price_type, price,
+                    strategy_name='', order_remark='') -> int:
+        return self._submit(stock_code, order_type, order_volume, price_type, price, strategy_name, order_remark)
+
+    def order_stock_async(self, account, stock_code, order_type, order_volume, price_type, price,
+                          strategy_name='', order_remark='') -> int:
+        self._seq += 1
+        self._submit(stock_code, order_type, order_volume, price_type, price, strategy_name, order_remark,
+                     seq=self._seq)
+        return self._seq
+
+    def _release(self, order: SimOrder, frozen: float) -> None:
+        """释放挂单冻结的资金 / 持仓"""
+        self._pending.pop(order.order_id, None)
+        if order.order_type == xtconstant.STOCK_BUY:
+            self.cash += frozen
+            self.frozen_cash -= frozen
+        else:
+            pos = self.positions[order.stock_code]
+            left = order.order_volume - order.traded_volume
+            pos.frozen_volume -= left
+            pos.can_use_volume += left
+
+    def cancel_order_stock(self, account, order_id) -> int:
+        item = self._pending.get(order_id)
+        if item is None:
+            return -1
+        order, frozen = item
+        self._release(order, frozen)
+        order.order_status = xtconstant.ORDER_CANCELED
+        self._notify('on_stock_order', order)
+        return 0
+
+    def cancel_order_stock_async(self, account, order_id) -> int:
+        self._seq += 1
+        result = self.cancel_order_stock(account, order_id)
+        self._notify('on_cancel_order_stock_async_response',
+                     SimCancelResponse(self.account_id, order_id, self._seq, result, str(order_id)))
+        return self._seq
+
+    # ------------------------------------------------------------------ #
+    #  撮合与结算
+    # ------------------------------------------------------------------ #
+    def _match(self, order: SimOrder) -> None:
+        px = self.xt.last_price(order.stock_code)
+        if not px > 0:
+            return
+        buy = order.order_type == xtconstant.STOCK_BUY
+        limit = order.price_type == xtconstant.FIX_PRICE and order.price > 0
+        if limit and (order.price < px if buy else order.price > px):
+            return
+        fill = px * (1 + self.slippage) if buy else px * (1 - self.slippage)
+        if limit:
+            fill = min(fill, order.price) if buy else max(fill, order.price)
+
+        order, frozen = self._pending.pop(order.order_id)
+        vol = order.order_volume
+        amount = fill * vol
+        fee = self._fee(order.stock_code, amount, order.order_type)
+        pos = self.positions.get(order.stock_code)
+        if buy:
+            self.frozen_cash -= frozen
+            self.cash += frozen - amount - fee
+            if pos is None:
+                pos = self.positions[order.stock_code] = SimPosition(self.account_id, order.stock_code)
+            pos.open_price = (pos.open_price * pos.volume + amount) / (pos.volume + vol)
+            pos.avg_price = pos.open_price
+            pos.volume += vol
+            if order.stock_code in self.t0_codes:
+                pos.can_use_volume += vol
+        else:
+            self.cash += amount - fee
+            pos.frozen_volume -= vol
+            pos.volume -= vol
+            if pos.volume <= 0:
+                del self.positions[order.stock_code]
+
+        self._trade_id += 1
+        order.traded_volume = vol
+        order.traded_price = fill
+        order.order_status = xtconstant.ORDER_SUCCEEDED
+        trade = SimTrade(self.account_id, order.stock_code, order.order_type, str(self._trade_id),
+                         int(self.clock.time()), fill, vol, amount, order.order_id, order.order_sysid,
+                         order.strategy_name, order.order_remark, fee)
+        self.trades.append(trade)
+        self._notify('on_stock_trade', trade)
+        self._notify('on_stock_order', order)
+
+    def set_position(self, stock_code: str, volume: int, open_price: float) -> None:
+        """放入回放开始前已有的持仓（视为昨日持仓，当天可卖），不占用现金"""
+        pos = self.positions.setdefault(stock_code, SimPosition(self.account_id, stock_code))
+        pos.open_price = pos.avg_price = float(open_price)
+        pos.volume = pos.yesterday_volume = pos.can_use_volume = int(volume)
+        pos.frozen_volume = 0
+
+    def match(self) -> None:
+        """重新撮合全部挂单（每个调度时刻调用）"""
+        for order, _ in list(self._pending.values()):
+            self._match(order)
+
+    def start_day(self, day: int) -> None:
+        """新交易日：昨日持仓全部可卖"""
+        self._day = day
+        for pos in self.positions.values():
+            pos.yesterday_volume = pos.volume
+            pos.can_use_volume = pos.volume - pos.frozen_volume
+
+    def end_of_day(self) -> None:
+        """收盘：未成交挂单全部撤销"""
+        for order, frozen in list(self._pending.values()):
+            self._release(order, frozen)
+            order.order_status = xtconstant.ORDER_CANCELED
+            self._notify('on_stock_order', order)
+
+    # ------------------------------------------------------------------ #
+    #  查询
+    # ------------------------------------------------------------------ #
+    def _snapshot(self, pos: SimPosition) -> SimPosition:
+        snap = copy.copy(pos)
+        px = self.xt.mark_price(pos.stock_code)
+        snap.market_value = pos.volume * (px if px > 0 else pos.open_price)
+        return snap
+
+    def query_stock_positions(self, account) -> list:
+        return [self._snapshot(p) for p in self.positions.values() if p.volume > 0]
+
+    def query_stock_position(self, account, stock_code):
+        pos = self.positions.get(stock_code)
+        return self._snapshot(pos) if pos is not None else None
+
+    def market_value(self) -> float:
+        return sum(p.market_value for p in self.query_stock_positions(None))
+
+    def total_asset(self) -> float:
+        return self.cash + self.frozen_cash + self.market_value()
+
+    def query_stock_asset(self, account) -> SimAsset:
+        mv = self.market_value()
+        return SimAsset(self.account_id, self.cash, self.frozen_cash, mv, self.cash + self.frozen_cash + mv)
+
+    def _today(self, items, attr) -> list:
+        """当天的委托 / 成交：列表按时间追加，从尾部往前找到今天零点为止"""
+        day = self.clock.day()
+        if self._day_start[0] != day:
+            self._day_start = (day, self.clock.now(BEIJING_TZ).replace(hour=0, minute=0, second=0,
+                                                                         microsecond=0).timestamp())
+        start = self._day_start[1]
+        k = len(items)
+        while k and getattr(items[k - 1], attr) >= start:
+            k -= 1
+        return items[k:]
+
+    def query_stock_orders(self, account, cancelable_only=False) -> list:
+        if cancelable_only:
+            return [copy.copy(o) for o, _ in self._pending.values()]
+        return [copy.copy(o) for o in self._today(self.orders, 'order_time')]
+
+    def query_stock_order(self, account, order_id):
+        for o in reversed(self.orders):
+            if o.order_id == order_id:
+                return copy.copy(o)
+        return None
+
+    def query_stock_trades(self, account) -> list:
+        return [copy.copy(t) for t in self._today(self.trades, 'traded_time')]
+
+
+# ====================================================================== #
+#  回放驱动
+# ====================================================================== #
+class ReplayRunner:
+    """
+    用历史数据回放实盘策略类（kj202512 各子策略、kj202509.AllWeatherStrategy、kj202536.RobotTrader 等）。
+
+    进入 with 块时：
+      - xtquant.xtdata 模块上的行情函数换成 SimXtData（所有 `from xtquant import xtdata` 的模块都受影响）；
+      - 仓库内已导入模块的 datetime / time 换成虚拟时钟替身，XtQuantTrader 换成返回 self.trader 的工厂；
+      - StateManager / StrategyLedger / StrategyVolumeLedger / BlacklistManager 的文件重定向到
+        localdata/replay/<name>/（每次回放从空状态开始，不会碰实盘状态文件），MessagePusher 只记录不推送；
+      - DownloadMgr / FinancialStore / DividendStore 的增量同步变为空操作，时点查询默认截至虚拟"今天"；
+      - InstrumentMgr / TickHub 使用独立的进程内缓存；OrderTracker 换成直接接收模拟回报的新实例，
+        等待委托结束时拨动虚拟时钟（回放中的挂单只在下一个调度时刻重新撮合）。
+    退出时全部还原。策略模块必须在进入 with 块之前导入（导入后再改它们的模块属性）。
+
+    每个交易日在 times 指定的时刻依次调用 handlebar（策略内部的"时间到了且今天还没做"判断照常生效），
+    收盘后撤销挂单并按收盘价记录总资产。策略里的轮询等待（time.sleep）只拨动虚拟时钟。
+    quote='1m' / '5m' / 'tick' 时报价取自盘中仓库，times 默认为连续竞价时段内的每根 K 线（session_times），
+    适合盘中轮询型策略（如网格）。已有持仓用 hold() 放入，计入初始资产。
+
+    用法：
+        import kj202509
+        kj202509.DEBUG = False
+        with ReplayRunner('kj202509', '20220101', '20241231', cash=60000) as rp:
+            s = kj202509.AllWeatherStrategy(rp.trader, rp.account)
+            res = rp.run(s.handlebar)
+        res['nav'], res['trades'], res['stats']
+    """
+
+    DEFAULT_TIMES = ('09:31:00', '09:35:00', '10:30:00', '14:00:00', '14:30:00', '14:45:00', '14:50:00')
+    CLOSE_TIME = '15:00:00'
+    REDIRECT = ('StateManager', 'StrategyLedger', 'StrategyVolumeLedger', 'BlacklistManager')
+
+    def __init__(self, name: str, start, end=None, cash: float = 1e6, times=None, quote: str = 'close',
+                 sectors: dict = None, instruments: pd.DataFrame = None, quiet: bool = True, root=None,
+                 **costs):
+        self.name = name
+        if times is None and quote in SimXtData.INTRADAY:
+            times = self.session_times(300 if quote == '5m' else 60)
+        self.times = tuple(times or self.DEFAULT_TIMES)
+        self.quiet = quiet
+        self.workdir = os.path.join(LOCAL_DATA_DIR, 'replay', name)
+        self.clock = SimClock(pd.Timestamp(str(BarStore._to_int(start))[:8]))
+        self.xt = SimXtData(self.clock, root, quote=quote, sectors=sectors, instruments=instruments)
+        self.days = self._trading_days(start, end)
+        if not self.days:
+            raise ValueError(f"{start} ~ {end} 之间没有交易日（请确认日线 BarStore 已覆盖该区间）")
+        self.clock.set(self._at(self.days[0], '09:00:00'))
+        self.trader = SimTrader(self.xt, self.clock, cash=cash, **costs)
+        self.account = SimAccount(self.trader.account_id)
+        self.initial_cash = float(cash)
+        self.messages = []
+        self._patches = []
+
+    def _trading_days(self, start, end) -> list:
+        dates = self.xt._store('1d')._meta(self.xt._dtype('1d', self.xt.dividend_type))['dates']
+        lo = BarStore._to_int(str(start)[:8])
+        hi = BarStore._to_int(str(end)[:8]) if end else int(dates[-1])
+        return [int(d) for d in dates if lo <= d <= hi]
+
+    @staticmethod
+    def session_times(step: int = 60) -> list:
+        """连续竞价时段内每隔 step 秒的调度时刻：09:30 + step ~ 11:30，13:00 + step ~ 14:57"""
+        out = []
+        for begin, end in (('09:30:00', '11:30:00'), ('13:00:00', '14:57:00')):
+            t, end = pd.Timestamp(f'20000101 {begin}'), pd.Timestamp(f'20000101 {end}')
+            while True:
+                t += pd.Timedelta(seconds=step)
+                if t > end:
+                    break
+                out.append(t.strftime('%H:%M:%S'))
+        return out
+
+    def hold(self, positions: dict) -> None:
+        """放入回放开始前已有的持仓 {code: (股数, 成本价)}，按首日昨收计入初始资产"""
+        for code, (volume, cost) in positions.items():
+            self.trader.set_position(code, volume, cost)
+            px = self.xt.mark_price(code)
+            self.initial_cash += volume * (px if px > 0 else cost)
+
+    @staticmethod
+    def _at(day: int, hhmmss: str) -> datetime.datetime:
+        """hhmmss 可写成 '14:50' 或 '14:50:00'"""
+        return pd.Timestamp(f'{day} {hhmmss}').to_pydatetime()
+
+    # ------------------------------------------------------------------ #
+    #  替换 / 还原
+    # ------------------------------------------------------------------ #
+    def patch(self, obj, attr, value) -> None:
+        """替换 obj.attr，退出 with 块时自动还原（驱动脚本也可用它替换策略里的显示 / 文件读写等）"""
+        old = obj.__dict__.get(attr, _MISSING) if isinstance(obj, type) else getattr(obj, attr, _MISSING)
+        self._patches.append((obj, attr, old))
+        setattr(obj, attr, value)
+
+    def _restore(self) -> None:
+        while self._patches:
+            obj, attr, old = self._patches.pop()
+            if old is _MISSING:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, old)
+
+    def _redirect(self, cls) -> None:
+        """状态 / 账本文件改写到回放目录，文件名前加上原所在目录名以免重名"""
+        orig = cls.__init__
+        sig = inspect.signature(orig)
+        workdir = self.workdir
+
+        def __init__(obj, *args, **kwargs):
+            bound = sig.bind(obj, *args, **kwargs)
+            bound.apply_defaults()
+            path = os.path.abspath(bound.arguments['filepath'])
+            bound.arguments['filepath'] = os.path.join(
+                workdir, f"{os.path.basename(os.path.dirname(path))}_{os.path.basename(path)}")
+            orig(*bound.args, **bound.kwargs)
+
+        self.patch(cls, '__init__', __init__)
+
+    def _install(self) -> None:
+        from utils.downloadmgr import DownloadMgr
+        from utils.dividendstore import DividendStore
+        from utils.instrumentmgr import InstrumentMgr
+        from utils.tickhub import TickHub
+        from utils.ordertracker import OrderTracker
+
+        for name in SimXtData.API:
+            fn = getattr(self.xt, name)
+            self.patch(xtdata, name, Timing.wrap(fn, f'xtdata.{name}') if Timing.enabled else fn)
+        if Timing.enabled:                  # 与实盘同名计时，便于对比热点
+            Timing.instrument(self.trader, 'xttrader', patch=self.patch,
+                              names=[n for n in dir(self.trader) if n.startswith(('query_', 'order_', 'cancel_'))])
+
+        dt_mod, time_mod = self.clock.datetime_module(), self.clock.time_module()
+        real_trader = sys.modules.get('xtquant.xttrader')
+        real_trader = getattr(real_trader, 'XtQuantTrader', None)
+        for mod in list(sys.modules.values()):
+            path = getattr(mod, '__file__', None)
+            if not path or mod is sys.modules[__name__] or getattr(mod, '__name__', '') == '__main__':
+                continue
+            if not os.path.abspath(path).startswith(REPO_ROOT + os.sep):
+                continue
+            if getattr(mod, 'datetime', None) is datetime:
+                self.patch(mod, 'datetime', dt_mod)
+            if getattr(mod, 'time', None) is time:
+                self.patch(mod, 'time', time_mod)
+            if real_trader is not None and getattr(mod, 'XtQuantTrader', None) is real_trader:
+                self.patch(mod, 'XtQuantTrader', lambda *args, **kwargs: self.trader)
+
+        clock = self.clock
+        noop = classmethod(lambda cls, *args, **kwargs: None)
+        self.patch(DownloadMgr, 'download', noop)
+        self.patch(FinancialStore, 'ensure', lambda store, *args, **kwargs: None)
+        self.patch(DividendStore, 'ensure', lambda store, *args, **kwargs: None)
+        fin_as_of, dps = FinancialStore.as_of, DividendStore.ttm_dps
+        self.patch(FinancialStore, 'as_of', lambda store, codes, table, fields, as_of=None, lag_days=0, back=0:
+                    fin_as_of(store, codes, table, fields, clock.day() if as_of is None else as_of, lag_days, back))
+        self.patch(DividendStore, 'ttm_dps', lambda store, codes, as_of=None, days=365:
+                    dps(store, codes, clock.day() if as_of is None else as_of, days))
+        self.patch(InstrumentMgr, 'SNAPSHOT_DIR', os.path.join(self.workdir, 'instrument'))
+        self.patch(InstrumentMgr, '_save', noop)
+        for attr in ('_table', '_day', '_built_at'):
+            self.patch(InstrumentMgr, attr, None)
+        self.patch(TickHub, '_instance', None)
+        tracker = OrderTracker()
+        self.patch(OrderTracker, '_instance', tracker)
+        self.patch(OrderTracker, '_block', lambda tracker, seconds: clock.sleep(seconds))
+        self.trader.register_callback(tracker)
+
+        try:
+            from utils import utilities
+        except ImportError:                 # utilities 依赖 msvcrt，非 Windows 环境下策略本身也无法导入
+            return
+        for name in self.REDIRECT:
+            self._redirect(getattr(utilities, name))
+        self.patch(utilities.MessagePusher, 'send_text',
+                    lambda pusher, title, content: self.messages.append((self.clock.now(), title, content)))
+
+    def __enter__(self) -> 'ReplayRunner':
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        os.makedirs(self.workdir, exist_ok=True)
+        try:
+            self._install()
+        except Exception:
+            self._restore()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._restore()
+        return False
+
+    # ------------------------------------------------------------------ #
+    #  执行
+    # ------------------------------------------------------------------ #
+    @contextlib.contextmanager
+    def _silenced(self):
+        if not self.quiet:
+            yield
+            return
+        level = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+        try:
+            with open(os.devnull, 'w', encoding='utf-8') as null, contextlib.redirect_stdout(null):
+                yield
+        finally:
+            logging.disable(level)
+
+    def run(self, handlebar, times=None, showprogress: bool = True) -> dict:
+        """
+        逐日回放。handlebar 为可调用对象或其列表（如多个子策略的 handlebar）。
+        返回 dict：
+          nav       : 每日收盘总资产 Series
+          returns   : 日收益率 Series
+          trades    : 成交明细 DataFrame
+          orders    : 委托明细 DataFrame（含废单 / 撤单）
+          positions : 回放结束时的持仓 DataFrame
+          messages  : 被拦截的推送消息 [(时间, 标题, 内容)]
+          stats     : PortfolioSim.stats 指标，另含 total_cost / trade_count
+        """
+        if not self._patches:
+            raise RuntimeError("ReplayRunner.run() 需要在 with ReplayRunner(...) 块内调用")
+        bars = list(handlebar) if isinstance(handlebar, (list, tuple)) else [handlebar]
+        spans = [f"handlebar.{getattr(fn, '__qualname__', type(fn).__name__)}" for fn in bars]
+        times = tuple(times or self.times)
+        nav = []
+        total, t0 = len(self.days), time.time()
+        for i, day in enumerate(self.days):
+            self.trader.start_day(day)
+            for hhmmss in times:
+                self.clock.set(self._at(day, hhmmss))
+                self.xt.push()
+                self.trader.match()
+                with self._silenced():
+                    for fn, span in zip(bars, spans):
+                        with Timing.span(span):
+                            fn()
+            self.clock.set(self._at(day, self.CLOSE_TIME))
+            self.trader.match()
+            self.trader.end_of_day()
+            nav.append(self.trader.total_asset())
+            if showprogress and ((i + 1) % 20 == 0 or i + 1 == total):
+                print(f"\r   回放 {self.name}: {i + 1}/{total}  {day}  总资产 {nav[-1]:,.0f}  "
+                      f"用时 {time.time() - t0:.1f}s", end='', flush=True)
+        if showprogress:
+            print()
+        return self.result(nav)
+
+    @staticmethod
+    def _frame(cls, items) -> pd.DataFrame:
+        return pd.DataFrame([dataclasses.asdict(x) for x in items],
+                            columns=[f.name for f in dataclasses.fields(cls)])
+
+    def result(self, nav: list) -> dict:
+        index = pd.to_datetime([str(d) for d in self.days[:len(nav)]], format='%Y%m%d')
+        nav = pd.Series(nav, index=index, dtype=float)
+        trades = self._frame(SimTrade, self.trader.trades)
+        orders = self._frame(SimOrder, self.trader.orders)
+        positions = self._frame(SimPosition, self.trader.query_stock_positions(self.account))
+        stats = PortfolioSim.stats(np.r_[self.initial_cash, nav.to_numpy()])
+        stats['total_cost'] = float(trades['commission'].sum()) if len(trades) else 0.0
+        stats['trade_count'] = len(trades)
+        return {
+            'nav': nav,
+            'returns': nav / nav.shift(1).fillna(self.initial_cash) - 1,
+            'trades': trades,
+            'orders': orders,
+            'positions': positions,
+            'messages': list(self.messages),
+            'stats': stats,
+        }
@@ -0,0 +1,184 @@
+__all__ = ['RSRS', 'RSRSStream']
+
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+class RSRS:
+    """
+    RSRS 阻力支撑相对强度 (最高价对最低价的滚动回归斜率) 的向量化计算。
+
+    滚动斜率用累加和公式一次算出：
+        β = (Σxy - Σx·Σy/n) / (Σxx - Σx·Σx/n)，x = low, y = high
+    输入可以是一维序列，也可以是 日期×标的 的二维矩阵（整个 ETF 池一次算完）。
+    """
+
+    @staticmethod
+    def _window_sum(a: np.ndarray, n: int) -> np.ndarray:
+        c = np.cumsum(a, axis=0)
+        out = c.copy()
+        out[n:] = c[n:] - c[:-n]
+        return out
+
+    @staticmethod
+    def rolling_slope(highs, lows, n: int = 18) -> np.ndarray:
+        """
+        返回与输入同形状的滚动斜率数组，第 t 行为窗口 [t-n+1, t] 的斜率。
+        前 n-1 行、窗口内有缺失值或最低价无波动的位置为 NaN。
+        """
+        y = np.asarray(highs, dtype=float)
+        x = np.asarray(lows, dtype=float)
+        one_d = y.ndim == 1
+        if one_d:
+            y, x = y[:, None], x[:, None]
+
+        valid = ~(np.isnan(x) | np.isnan(y))
+        # 先去中心化，避免长序列累加和的数值误差（斜率对平移不变）
+        with np.errstate(all='ignore'):
+            x0 = np.nanmean(np.where(valid, x, np.nan), axis=0)
+            y0 = np.nanmean(np.where(valid, y, np.nan), axis=0)
+        xc = np.where(valid, x - np.nan_to_num(x0), 0.0)
+        yc = np.where(valid, y - np.nan_to_num(y0), 0.0)
+
+        cnt = RSRS._window_sum(valid.astype(float), n)
+        sx = RSRS._window_sum(xc, n)
+        sy = RSRS._window_sum(yc, n)
+        sxx = RSRS._window_sum(xc * xc, n)
+        sxy = RSRS._window_sum(xc * yc, n)
+
+        var = sxx - sx * sx / n
+        cov = sxy - sx * sy / n
+        with np.errstate(all='ignore'):
+            slope = np.where((cnt == n) & (var > 1e-12 * np.maximum(sxx, 1.0)), cov / var, np.nan)
+        slope[:n - 1] = np.nan
+        return slope[:, 0] if one_d else slope
+
+    @staticmethod
+    def zscore(slopes, m: int = 600, include_current: bool = True, ddof: int = 1):
+        """
+        滚动标准分。
+        - include_current=True : 以含当期在内的最近 m 个斜率为基准（回测脚本的口径，pandas rolling）
+        - include_current=False: 以当期之前的 m 个斜率为基准（实盘 get_rsrs_signal 的口径）
+        """
+        frame = pd.DataFrame(slopes)
+        base = frame if include_current else frame.shift(1)
+        mean = base.rolling(m).mean()
+        std = base.rolling(m).std(ddof=ddof)
+        z = (frame - mean) / std
+        out = z.to_numpy()
+        if isinstance(slopes, pd.Series):
+            return pd.Series(out[:, 0], index=slopes.index)
+        if isinstance(slopes, pd.DataFrame):
+            return pd.DataFrame(out, index=slopes.index, columns=slopes.columns)
+        return out[:, 0] if np.ndim(slopes) == 1 else out
+
+    @staticmethod
+    def latest(highs, lows, n: int = 18, m: int = 600):
+        """
+        最新斜率及其历史基准：返回 (current_slope, history_mean, history_std)。
+        历史基准为当期之前最多 m 个斜率 (np.std 总体标准差)，与原实盘逻辑一致；
+        输入为二维矩阵时三者均为按列的一维数组。
+        """
+        slopes = RSRS.rolling_slope(highs, lows, n)
+        current = slopes[-1]
+        history = slopes[-(m + 1):-1]
+        with np.errstate(all='ignore'):
+            mean = np.nanmean(history, axis=0)
+            std = np.nanstd(history, axis=0)
+        return current, mean, std
+
+
+class RSRSStream:
+    """
+    RSRS 流式计算器：每来一根新 K 线以 O(1) 更新最新斜率与标准分。
+
+    口径与 MarketMgr.get_rsrs_signal 一致：z = (β_t - mean(β_{t-m..t-1})) / std(β_{t-m..t-1})。
+    盘中同一根 K 线的高低点变化可用 update(..., new_bar=False) 覆盖最后一根，不推进窗口。
+
+    用法：
+        stream = RSRSStream.from_history(highs, lows, n=18, m=600)
+        z = stream.update(high, low)                   # 新的一天
+        z = stream.update(high, low, new_bar=False)    # 盘中刷新当天
+    """
+
+    def __init__(self, n: int = 18, m: int = 600):
+        self.n = n
+        self.m = m
+        self._bars = deque()                 # 窗口内的 (x, y)，已减去锚点
+        self._anchor = None                  # 去中心化锚点 (low0, high0)
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+        self._hist = deque()                 # 历史斜率（不含当期）
+        self._h1 = self._h2 = 0.0
+        self.slope = math.nan
+        self.zscore = math.nan
+
+    @classmethod
+    def from_history(cls, highs, lows, n: int = 18, m: int = 600) -> 'RSRSStream':
+        stream = cls(n, m)
+        for h, l in zip(np.asarray(highs, dtype=float), np.asarray(lows, dtype=float)):
+            stream.update(h, l)
+        return stream
+
+    # ------------------------------------------------------------------ #
+    def _add_bar(self, x, y, sign):
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxx += sign * x * x
+        self._sxy += sign * x * y
+
+    def _push_history(self, slope):
+        if math.isnan(slope):
+            return
+        self._hist.append(slope)
+        self._h1 += slope
+        self._h2 += slope * slope
+        if len(self._hist) > self.m:
+            old = self._hist.popleft()
+            self._h1 -= old
+            self._h2 -= old * old
+
+    @property
+    def mean(self) -> float:
+        k = len(self._hist)
+        return self._h1 / k if k else math.nan
+
+    @property
+    def std(self) -> float:
+        k = len(self._hist)
+        if k == 0:
+            return math.nan
+        mean = self._h1 / k
+        return math.sqrt(max(self._h2 / k - mean * mean, 0.0))
+
+    def update(self, high: float, low: float, new_bar: bool = True) -> float:
+        """输入最新一根 K 线的最高/最低价，返回最新标准分（历史不足时为 NaN）"""
+        if math.isnan(high) or math.isnan(low):
+            return self.zscore
+        if self._anchor is None:
+            self._anchor = (low, high)
+        x, y = low - self._anchor[0], high - self._anchor[1]
+
+        if new_bar or not self._bars:
+            # 上一根 K 线的斜率转入历史基准
+            self._push_history(self.slope)
+            self._bars.append((x, y))
+            self._add_bar(x, y, 1)
+            if len(self._bars) > self.n:
+                self._add_bar(*self._bars.popleft(), -1)
+        else:
+            self._add_bar(*self._bars.pop(), -1)
+            self._bars.append((x, y))
+            self._add_bar(x, y, 1)
+
+        n = len(self._bars)
+        var = self._sxx - self._sx * self._sx / n
+        if n < self.n or var <= 1e-12 * max(self._sxx, 1.0):
+            self.slope = math.nan
+        else:
+            self.slope = (self._sxy - self._sx * self._sy / n) / var
+
+        std = self.std
+        self.zscore = (self.slope - self.mean) / std if std and not math.isnan(self.slope) else math.nan
+        return self.zscore
@@ -0,0 +1,290 @@
+__all__ = ['Scheduler']
+
+import os
+import json
+import time
+import queue
+import heapq
+import datetime
+import threading
+import traceback
+from datetime import timezone, timedelta
+from xtquant import xtdata
+from utils.timing import Timing
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class _Job:
+    """一个定时任务：每个交易日的 at 时刻检查一次，满足周期条件且本周期尚未执行过就执行"""
+
+    def __init__(self, name, fn, at, until, period, weekday=None, nth=None):
+        self.name = name
+        self.fn = fn
+        self.at = datetime.time.fromisoformat(at)
+        self.until = datetime.time.fromisoformat(until) if until else None
+        self.period = period          # 'day' / 'week' / 'month'
+        self.weekday = weekday        # 每周任务：最早在周几执行 (0=周一)
+        self.nth = nth                # 每月任务：最早在本月第几个交易日执行
+
+    def key(self, day: datetime.date) -> str:
+        """执行记录的周期键：同一周期内只执行一次"""
+        if self.period == 'week':
+            year, week, _ = day.isocalendar()
+            return f'{year}-W{week:02d}'
+        if self.period == 'month':
+            return day.strftime('%Y%m')
+        return day.strftime('%Y%m%d')
+
+    def due(self, day: datetime.date) -> datetime.datetime:
+        return datetime.datetime.combine(day, self.at, tzinfo=BEIJING_TZ)
+
+
+class Scheduler:
+    """
+    按交易日历触发的定时任务调度器，替代 while True: handlebar(); time.sleep(3) 式的轮询。
+
+    所有任务放在一个按触发时刻排序的小顶堆里，主线程按堆顶时刻精确等待
+    （threading.Event.wait，可被 stop() 立即唤醒），触发延迟在毫秒级，不会像整分钟字符串匹配那样漏掉。
+    非交易日（周末 / 节假日，按 xtdata 交易日历）自动跳过。
+
+    每个任务都有"每个周期只执行一次"的保证：执行记录（周期键 + 执行时间）落盘到 record_file，
+    进程在同一天重启不会重复执行；启动时如果某任务今天的触发时刻已过、但还没到 until 且本周期尚未执行，
+    会立即补执行一次（until=None 表示当天任何时候都补）。同一时刻到期的任务按注册顺序执行。
+    运行中被前面的任务拖到 until 之后才轮到的任务同样不再执行，本周期记为已处理。
+    任务抛出的异常只打印，不影响其它任务，该周期仍记为已执行（与原轮询循环的行为一致）。
+
+    默认所有任务都在调用 run_forever 的线程里依次执行，前一个任务没跑完，后面到期的任务只能排队。
+    lanes=True 时按任务名前缀（第一个 '.' 之前，StrategyHost 里即插件名）分组，每组一个执行线程：
+    不同组的任务互不阻塞，同一组内仍按到期顺序依次执行（同一策略的任务不会并发）。
+
+    用法：
+        sched = Scheduler(os.path.join(current_dir, 'kj202590_schedule.json'))
+        sched.daily('rebalance', '14:35:00', job)                  # 每个交易日一次
+        sched.weekly('adjust', '10:00:00', job, weekday=0)         # 每周一次，周一休市则顺延到本周下一个交易日
+        sched.monthly('adjust', '09:35:00', job, nth=1)            # 每月第 nth 个交易日（错过则本月内顺延）
+        sched.run_forever()                                        # Ctrl+C / stop() 退出
+        Scheduler(record_file, lanes=True)                         # 多策略同进程：按任务名前缀分线程执行
+    """
+
+    # 单次最长等待（秒）：醒来只看一眼堆顶、按当前时钟重算等待时间，用来兼容系统休眠 / 校时；
+    # 任务间隔通常是小时级，没必要每秒醒一次。Windows 下 Event.wait 期间收不到 Ctrl+C，最迟在本次等待结束时退出
+    MAX_SLEEP = 60.0
+    CLOSE = '15:00:00'
+    JOIN_TIMEOUT = 10.0     # 退出时等待各执行线程跑完手头任务的最长时间（秒）
+
+    def __init__(self, record_file: str = None, lanes: bool = False):
+        self.record_file = record_file
+        self.lanes = lanes
+        self.jobs = []
+        self._records = self._load()
+        self._records_lock = threading.Lock()
+        self._lanes = {}                 # 组名 -> (任务队列, 执行线程)
+        self._calendar = {}              # 'YYYYMMDD' -> 是否交易日
+        self._heap = []
+        self._seq = 0
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------ #
+    #  执行记录
+    # ------------------------------------------------------------------ #
+    def _load(self) -> dict:
+        if not self.record_file or not os.path.exists(self.record_file):
+            return {}
+        try:
+            with open(self.record_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"--> [Scheduler] 读取执行记录失败: {e}，视为全部未执行。")
+            return {}
+
+    def _save(self):
+        if not self.record_file:
+            return
+        tmp = self.record_file + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._records, f, ensure_ascii=False, indent=4)
+            os.replace(tmp, self.record_file)
+        except Exception as e:
+            print(f"--> [Scheduler] 保存执行记录失败: {e}")
+
+    def done(self, name: str, day: datetime.date = None) -> bool:
+        """任务在 day 所在周期内是否已经执行过"""
+        job = next((j for j in self.jobs if j.name == name), None)
+        if job is None:
+            return False
+        day = day or self.now().date()
+        return self._records.get(name, {}).get('key') == job.key(day)
+
+    # ------------------------------------------------------------------ #
+    #  交易日历
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def now() -> datetime.datetime:
+        return datetime.datetime.now(BEIJING_TZ)
+
+    def is_trading_day(self, day: datetime.date) -> bool:
+        key = day.strftime('%Y%m%d')
+        if key not in self._calendar:
+            if day.weekday() >= 5:
+                self._calendar[key] = False
+            else:
+                try:
+                    self._calendar[key] = len(xtdata.get_trading_dates('SH', key, key)) > 0
+                except Exception as e:
+                    print(f"[Scheduler] 交易日查询失败: {e}，{key} 按交易日处理。")
+                    return True
+        return self._calendar[key]
+
+    def trading_day_of_month(self, day: datetime.date) -> int:
+        """day 是当月第几个交易日（从 1 开始）"""
+        first = day.replace(day=1)
+        return sum(self.is_trading_day(first + timedelta(days=i)) for i in range(day.day))
+
+    # ------------------------------------------------------------------ #
+    #  注册
+    # ------------------------------------------------------------------ #
+    def _add(self, job: _Job) -> _Job:
+        if any(j.name == job.name for j in self.jobs):
+            raise ValueError(f"任务名重复: {job.name}")
+        self.jobs.append(job)
+        return job
+
+    def daily(self, name: str, at: str, fn, until: str = CLOSE) -> None:
+        """每个交易日 at 时刻执行一次"""
+        self._add(_Job(name, fn, at, until, 'day'))
+
+    def weekly(self, name: str, at: str, fn, weekday: int = 0, until: str = CLOSE) -> None:
+        """每周执行一次：本周第一个星期几 >= weekday 的交易日"""
+        self._add(_Job(name, fn, at, until, 'week', weekday=weekday))
+
+    def monthly(self, name: str, at: str, fn, nth: int = 1, until: str = CLOSE) -> None:
+        """每月执行一次：本月第 nth 个及以后的第一个交易日"""
+        self._add(_Job(name, fn, at, until, 'month', nth=nth))
+
+    # ------------------------------------------------------------------ #
+    #  调度
+    # ------------------------------------------------------------------ #
+    def _push(self, when: datetime.datetime, job: _Job):
+        self._seq += 1
+        heapq.heappush(self._heap, (when.timestamp(), self._seq, job))
+
+    def _first_due(self, job: _Job, now: datetime.datetime) -> datetime.datetime:
+        """启动时的首次触发时刻：今天还没到 → 今天 at；已过但可补执行 → 立即；否则明天 at"""
+        today = now.date()
+        due = job.due(today)
+        if now < due:
+            return due
+        if job.until is None or now.time() <= job.until:
+            return now
+        return job.due(today + timedelta(days=1))
+
+    def _eligible(self, job: _Job, day: datetime.date) -> bool:
+        if not self.is_trading_day(day):
+            return False
+        if self._records.get(job.name, {}).get('key') == job.key(day):
+            return False
+        if job.period == 'week':
+            return day.weekday() >= job.weekday
+        if job.period == 'month':
+            return self.trading_day_of_month(day) >= job.nth
+        return True
+
+    def _fire(self, job: _Job, now: datetime.datetime):
+        """到期：先排好下一次触发，再交给任务所在组的执行线程（未分组时就在当前线程执行）"""
+        day = now.date()
+        self._push(job.due(day + timedelta(days=1)), job)
+        if not self.lanes:
+            self._execute(job, day)
+            return
+        group = job.name.split('.', 1)[0]
+        if group not in self._lanes:
+            q = queue.SimpleQueue()
+            t = threading.Thread(target=self._lane_loop, args=(q,), name=f'Scheduler-{group}', daemon=True)
+            self._lanes[group] = (q, t)
+            t.start()
+        self._lanes[group][0].put((job, day))
+
+    def _lane_loop(self, q) -> None:
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            self._execute(*item)
+
+    def _execute(self, job: _Job, day: datetime.date):
+        """执行 day 这一周期的任务并记录（组内排队时按到期那天的周期判断）"""
+        with self._records_lock:
+            if not self._eligible(job, day):
+                return
+        now = self.now()
+        if job.until is not None and (now.date() != day or now.time() > job.until):
+            # 被前面的任务拖到截止时刻之后才轮到：与启动补执行的规则一致，本周期不再执行
+            print(f"!!! [Scheduler] 任务 {job.name} 到 {now.strftime('%H:%M:%S')} 才轮到执行，"
+                  f"已过截止时刻 {job.until.strftime('%H:%M:%S')}，本周期跳过")
+            self._record(job, day, now)
+            return
+        print(f"\n>> [Scheduler] {now.strftime('%Y-%m-%d %H:%M:%S')} 触发任务: {job.name}")
+        try:
+            with Timing.span(f'job.{job.name}'):
+                job.fn()
+        except Exception as e:
+            print(f"!!! [Scheduler] 任务 {job.name} 执行异常: {e}")
+            traceback.print_exc()
+        self._record(job, day, now)
+
+    def _record(self, job: _Job, day: datetime.date, now: datetime.datetime):
+        with self._records_lock:
+            self._records[job.name] = {'key': job.key(day), 'at': now.strftime('%Y-%m-%d %H:%M:%S')}
+            self._save()
+
+    def _close_lanes(self) -> None:
+        """通知各执行线程退出，最多等 JOIN_TIMEOUT 秒让正在执行的任务跑完"""
+        lanes, self._lanes = self._lanes, {}
+        for q, _ in lanes.values():
+            q.put(None)
+        deadline = time.monotonic() + self.JOIN_TIMEOUT
+        for group, (_, t) in lanes.items():
+            t.join(max(0.0, deadline - time.monotonic()))
+            if t.is_alive():
+                print(f"[Scheduler] {group} 的任务仍在执行，不再等待")
+
+    def next_run(self) -> tuple:
+        """(下一个触发时刻, 任务名)，没有任务时返回 (None, None)"""
+        if not self._heap:
+            return None, None
+        ts, _, job = self._heap[0]
+        return datetime.datetime.fromtimestamp(ts, BEIJING_TZ), job.name
+
+    def run_forever(self) -> None:
+        """阻塞运行，直到 stop() 或 Ctrl+C"""
+        now = self.now()
+        self._heap = []
+        for job in self.jobs:
+            self._push(self._first_due(job, now), job)
+        when, name = self.next_run()
+        if when is not None:
+            print(f">> [Scheduler] 已注册 {len(self.jobs)} 个任务，下一个: {name} @ {when.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        try:
+            while self._heap and not self._stop.is_set():
+                ts, _, job = self._heap[0]
+                delay = ts - time.time()
+                if delay > 0:
+                    self._stop.wait(min(delay, self.MAX_SLEEP))
+                    continue
+                heapq.heappop(self._heap)
+                self._fire(job, self.now())
+        finally:
+            self._close_lanes()
+
+    def run_all_now(self) -> None:
+        """调试用：忽略时刻、周期和执行记录，按注册顺序把所有任务立即执行一遍"""
+        for job in self.jobs:
+            print(f"\n>> [Scheduler] 调试模式立即执行: {job.name}")
+            with Timing.span(f'job.{job.name}'):
+                job.fn()
+
+    def stop(self) -> None:
+        self._stop.set()
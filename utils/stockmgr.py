@@ -1,10 +1,10 @@
 __all__ = ['StockInfo', 'StockMgr']
 
-from datetime import time
 from dataclasses import dataclass
 from typing import Optional
 import pandas as pd
 from xtquant import xtdata
+from utils.downloadmgr import DownloadMgr
 
 
 @dataclass
@@ -75,17 +75,9 @@ class StockMgr:
     @staticmethod
     def download_history(codes: list, start_time: str, end_time: str = '',
                          period: str = '1d', pause=False, showprogress=False) -> None:
-        """逐只下载指定周期的历史数据"""
-        total = len(codes)
-        for i, code in enumerate(codes, 1):
-            if showprogress:
-                print(f"[{i}/{total}] 下载 {code} {period} {start_time}~{end_time or 'now'} ...", end=' ', flush=True)
-            callback = (lambda res: print(f"进度: {res}")) if showprogress else None
-            xtdata.download_history_data(code, period=period, start_time=start_time, end_time=end_time)
-            if showprogress:
-                print("完成")
-            if pause:
-                time.sleep(1)
+        """下载指定周期的历史数据（按下载水位增量、批量下载，见 DownloadMgr）"""
+        DownloadMgr.download(codes, start_time=start_time, end_time=end_time, period=period,
+                             pause=pause, showprogress=showprogress)
 
     @staticmethod
     def query_stocks_in_sector(sector) -> list:
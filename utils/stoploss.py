@@ -0,0 +1,336 @@
+__all__ = ['StopLossEngine']
+
+import queue
+import datetime
+import threading
+from datetime import timezone, timedelta
+import numpy as np
+from xtquant import xtdata
+from utils.tickhub import TickHub
+from utils.downloadmgr import DownloadMgr
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+class _Book:
+    """一个策略的止损登记：持仓来源、退出函数与阈值"""
+
+    def __init__(self, name, holdings, exit, fixed, atr, trail, protect, highs, save_highs):
+        self.name = name
+        self.holdings = holdings          # () -> [代码] 或 {代码: 策略份数}
+        self.exit = exit                  # (代码, 数量, 触发价, 原因) -> 是否已报单
+        self.fixed = fixed
+        self.atr = atr
+        self.trail = trail
+        self.protect = protect            # (盈利阈值, 收窄后的追踪比例)
+        self.highs = highs                # () -> {代码: 已记录的最高价}，用于跨重启延续追踪高点
+        self.save_highs = save_highs      # ({代码: 最高价}) -> None，把引擎观察到的新高写回 highs 的来源
+
+    def owned(self) -> dict:
+        h = self.holdings() or {}
+        return dict(h) if isinstance(h, dict) else {code: None for code in h}
+
+
+class StopLossEngine:
+    """
+    跨策略的实时止损引擎（行情推送驱动）。
+
+    原先各策略的止损都是定时巡检：kj202509 每天 14:45 一次、kj202579 每天 10:00 / 14:00、
+    kj202512 子策略 14:45 逐只 get_latest_prices、kj202590 只在 14:35 再平衡里顺带检查，
+    盘中跌破止损线要等到下一个巡检点（最长数小时）才会处理。
+
+    现在各策略把账本持仓与止损阈值登记到同一个引擎：
+      - 引擎订阅所有登记持仓的代码（TickHub，同一代码只订阅一次），每批推送到达时
+        用 numpy 对全部 (策略, 代码) 行一次性计算止损线并比较最新价，跌破即在下一个 tick 内处理；
+      - 每行的止损线取已启用规则中最高的一条：
+          fixed   成本价 × (1 - fixed)
+          atr     成本价 - atr × ATR(14)（前一交易日为止的日线）
+          trail   追踪高点 × (1 - trail)；protect=(g, t) 时，当前盈利 ≥ g 后追踪比例收窄为 t。
+                  追踪高点从 max(策略记录的高点, 成本价) 起算，盘中新高经 save_highs 写回策略状态
+      - 触发后通过该策略自己的退出函数报单（各自的委托备注 / 账本 / 黑名单逻辑不变），
+        报单在引擎的工作线程里执行，不阻塞行情回调；同一 (策略, 代码) 当天只触发一次。
+    持仓、成本价、可用数量来自 trader 的持仓查询（CachedTrader 下是内存读），
+    工作线程每 refresh_interval 秒重建一次登记行，新买入的持仓最迟在这个间隔后纳入监控。
+    策略原有的定时巡检保留，作为引擎未运行（DEBUG / 回放）时的兜底；卖单冻结可用数量后巡检不会重复卖出。
+
+    用法：
+        engine = StopLossEngine(trader, acc)
+        engine.register('kj202509', holdings=ledger.get_all, exit=strategy.stoploss_exit, fixed=0.08)
+        engine.register('kj202579', holdings=..., exit=..., trail=0.09, protect=(0.15, 0.05))
+        engine.start()                  # 实盘：订阅行情、启动工作线程
+        engine.report()                 # 打印当前各行的现价与止损线
+        engine.stop()
+    """
+
+    ATR_PERIOD = 14
+    SESSION = ('09:30:00', '15:00:00')       # 只在连续竞价时段内处理推送，集合竞价的虚拟价格不触发
+
+    def __init__(self, trader, account, refresh_interval: float = 60, hub: TickHub = None):
+        self.trader = trader
+        self.account = account
+        self.refresh_interval = refresh_interval
+        self.hub = hub
+        self._books = {}                  # 策略名 -> _Book
+        self._lock = threading.Lock()
+        self._keys = []                   # 每行 (策略名, 代码)
+        self._codes = []
+        self._code_set = frozenset()
+        self._cost = np.empty(0)
+        self._fixed = np.empty(0)         # 以下阈值数组未启用处为 NaN
+        self._atr = np.empty(0)           # atr 倍数 × ATR（价格单位）
+        self._trail = np.empty(0)
+        self._pgain = np.empty(0)
+        self._ptrail = np.empty(0)
+        self._high = np.empty(0)
+        self._seed = np.empty(0)          # 登记行重建时 highs() 给出的记录值，用于判断哪些新高需要写回
+        self._fired = np.empty(0, dtype=bool)
+        self._fired_keys = set()          # 当天已触发的 (日期, 策略名, 代码)
+        self._atr_cache = {}              # (代码, 日期) -> ATR
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------ #
+    #  登记
+    # ------------------------------------------------------------------ #
+    def register(self, name: str, holdings, exit, fixed: float = None, atr: float = None,
+                 trail: float = None, protect: tuple = None, highs=None, save_highs=None) -> None:
+        """
+        登记一个策略的止损规则。
+        :param holdings: 返回本策略持仓的函数：[代码] 或 {代码: 策略份数}；给出份数时，
+                         账户合计份数与之不一致的代码跳过（成本价混合了其他来源，不能用于本策略止损）
+        :param exit:     exit(代码, 数量, 触发价, 原因) -> bool，用本策略的委托备注 / 账本逻辑卖出
+        :param highs:    返回已记录追踪高点的函数 {代码: 最高价}；追踪高点以 max(记录值, 成本价) 起算
+        :param save_highs: save_highs({代码: 最高价})，每次重建登记行和停止时把高于记录值的新高写回，
+                         策略自己的巡检与重启后的引擎都能接着用
+        """
+        if fixed is None and atr is None and trail is None:
+            raise ValueError(f"{name} 至少需要一种止损规则（fixed / atr / trail）")
+        self._books[name] = _Book(name, holdings, exit, fixed, atr, trail, protect, highs, save_highs)
+
+    # ------------------------------------------------------------------ #
+    #  登记行重建（工作线程 / 启动时）
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _today() -> str:
+        return datetime.datetime.now(BEIJING_TZ).strftime('%Y%m%d')
+
+    def _atr_of(self, codes: list) -> dict:
+        """前一交易日为止的 ATR(ATR_PERIOD)，每个代码每天只算一次"""
+        today = self._today()
+        need = [c for c in codes if (c, today) not in self._atr_cache]
+        if need:
+            n = self.ATR_PERIOD
+            start = (datetime.datetime.now(BEIJING_TZ) - datetime.timedelta(days=n * 3)).strftime('%Y%m%d')
+            try:
+                DownloadMgr.download(need, start_time=start, period='1d')
+                data = xtdata.get_market_data_ex(['high', 'low', 'close'], need, period='1d',
+                                                 count=n + 2, dividend_type='front')
+            except Exception as e:
+                print(f"[StopLoss] ATR 行情获取失败: {e}")
+                data = {}
+            for code in need:
+                df = data.get(code)
+                atr = np.nan
+                if df is not None and not df.empty:
+                    df = df[df.index.astype(str) < today].tail(n + 1)
+                    if len(df) > n:
+                        h, l, c = df['high'].values, df['low'].values, df['close'].values
+                        tr = np.maximum(h[1:] - l[1:], np.maximum(np.abs(h[1:] - c[:-1]), np.abs(l[1:] - c[:-1])))
+                        atr = float(tr.mean())
+                self._atr_cache[(code, today)] = atr
+        return {c: self._atr_cache[(c, today)] for c in codes}
+
+    def refresh(self) -> int:
+        """按各策略当前账本与账户持仓重建登记行（保留已有的追踪高点与当天触发记录），返回行数"""
+        self._save_highs()
+        positions = self.trader.query_stock_positions(self.account) or []
+        pos_map = {p.stock_code: p for p in positions}
+        rows = []
+        for book in list(self._books.values()):
+            try:
+                owned = book.owned()
+                seeds = (book.highs() or {}) if book.highs else {}
+            except Exception as e:
+                print(f"[StopLoss] {book.name} 读取账本失败: {e}")
+                continue
+            atrs = self._atr_of([c for c in owned if c in pos_map]) if book.atr is not None else {}
+            for code, vol in owned.items():
+                pos = pos_map.get(code)
+                if pos is None or pos.volume <= 0 or pos.open_price <= 0:
+                    continue
+                if vol is not None and pos.volume != vol:
+                    continue
+                rows.append((book, code, vol, pos.open_price, atrs.get(code, np.nan), seeds.get(code, np.nan)))
+
+        def col(values):
+            return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+        today = self._today()
+        keys = [(b.name, code) for b, code, *_ in rows]
+        codes = [code for _, code, *_ in rows]
+        if codes:
+            (self.hub or TickHub.instance()).subscribe(codes)
+        with self._lock:
+            old_high = dict(zip(self._keys, self._high))
+            self._fired_keys = {k for k in self._fired_keys if k[0] == today}
+            self._keys, self._codes, self._code_set = keys, codes, frozenset(codes)
+            self._cost = col(r[3] for r in rows)
+            self._fixed = col(r[0].fixed for r in rows)
+            self._atr = col(r[4] * r[0].atr if r[0].atr is not None else None for r in rows)
+            self._trail = col(r[0].trail for r in rows)
+            self._pgain = col(r[0].protect[0] if r[0].protect else None for r in rows)
+            self._ptrail = col(r[0].protect[1] if r[0].protect else None for r in rows)
+            seeded = np.fmax(col(r[5] for r in rows), np.where(np.isnan(self._trail), np.nan, self._cost))
+            self._high = np.fmax(seeded, col(old_high.get(k, np.nan) for k in keys))
+            self._seed = col(r[5] for r in rows)
+            self._fired = np.array([(today,) + k in self._fired_keys for k in keys], dtype=bool)
+        return len(keys)
+
+    def _save_highs(self) -> None:
+        """把高于记录值的追踪高点交给各策略的 save_highs 写回（当天已触发的行不写，避免卖出后又把高点写回去）"""
+        updates = {}
+        with self._lock:
+            with np.errstate(invalid='ignore'):
+                new = ~self._fired & (self._high > np.nan_to_num(self._seed, nan=-np.inf))
+            for i in np.flatnonzero(new):
+                name, code = self._keys[i]
+                updates.setdefault(name, {})[code] = float(self._high[i])
+            self._seed = np.where(new, self._high, self._seed)
+        for name, highs in updates.items():
+            book = self._books.get(name)
+            if book is None or book.save_highs is None:
+                continue
+            try:
+                book.save_highs(highs)
+            except Exception as e:
+                print(f"[StopLoss] {name} 写回追踪高点失败: {e}")
+
+    # ------------------------------------------------------------------ #
+    #  向量化判断（行情回调线程）
+    # ------------------------------------------------------------------ #
+    def _stops(self, prices: np.ndarray) -> np.ndarray:
+        """各规则的止损线，形状 (3, 行数)：fixed / atr / trail，未启用为 NaN（调用方持锁）"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            gain = prices / self._cost - 1
+            trail = np.where(gain >= self._pgain, self._ptrail, self._trail)
+            return np.vstack([self._cost * (1 - self._fixed),
+                              self._cost - self._atr,
+                              self._high * (1 - trail)])
+
+    def _evaluate(self, prices: np.ndarray) -> list:
+        """更新追踪高点并找出新跌破止损线的行，标记为已触发，返回 [(策略名, 代码, 现价, 止损线, 原因)]"""
+        valid = prices > 0
+        self._high = np.where(valid, np.fmax(self._high, prices), self._high)
+        stops = self._stops(prices)
+        line = np.fmax.reduce(stops, axis=0)
+        with np.errstate(invalid='ignore'):
+            hit = valid & (prices <= line) & ~self._fired
+        breaches = []
+        today = self._today()
+        for i in np.flatnonzero(hit):
+            rule = int(np.nanargmax(stops[:, i]))
+            name, code = self._keys[i]
+            reason = ('固定止损', 'ATR止损', '追踪止损')[rule]
+            self._fired[i] = True
+            self._fired_keys.add((today, name, code))
+            breaches.append((name, code, float(prices[i]), float(line[i]), reason))
+        return breaches
+
+    def _in_session(self) -> bool:
+        t = datetime.datetime.now(BEIJING_TZ).strftime('%H:%M:%S')
+        return self.SESSION[0] <= t < self.SESSION[1]
+
+    def _on_ticks(self, codes) -> None:
+        """TickHub 推送监听：本批包含登记代码时对全部行做一次判断，触发的行交给工作线程报单"""
+        if self._code_set.isdisjoint(codes) or not self._in_session():
+            return
+        hub = self.hub or TickHub.instance()
+        with self._lock:
+            if not self._codes:
+                return
+            prices = hub.matrix(self._codes, ('lastPrice',))[:, 0]
+            breaches = self._evaluate(prices)
+        for b in breaches:
+            self._queue.put(b)
+
+    # ------------------------------------------------------------------ #
+    #  报单（工作线程）
+    # ------------------------------------------------------------------ #
+    def _exit(self, name: str, code: str, price: float, line: float, reason: str) -> None:
+        book = self._books.get(name)
+        if book is None:
+            return
+        print(f"!! [StopLoss] {name} {code} {reason}：现价 {price:.3f} ≤ 止损线 {line:.3f}，立即卖出")
+        try:
+            owned = book.owned().get(code)
+            pos = next((p for p in self.trader.query_stock_positions(self.account) or []
+                        if p.stock_code == code), None)
+            volume = pos.can_use_volume if pos is not None else 0
+            if owned is not None:
+                volume = min(volume, owned)
+            if volume <= 0:
+                print(f"   [StopLoss] {code} 可用数量为 0（T+1 或在途冻结），今日不再触发，由策略巡检兜底")
+                return
+            ok = book.exit(code, volume, price, reason)
+            print(f"   [StopLoss] {name} {code} 卖出 {volume} {'已报单' if ok else '未报单'}")
+        except Exception as e:
+            print(f"!!! [StopLoss] {name} {code} 止损报单异常: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._queue.get(timeout=self.refresh_interval)
+            except queue.Empty:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[StopLoss] 刷新登记行失败: {e}")
+                continue
+            if job is None:
+                break
+            self._exit(*job)
+
+    # ------------------------------------------------------------------ #
+    #  生命周期
+    # ------------------------------------------------------------------ #
+    def start(self) -> None:
+        """重建登记行、挂上行情监听并启动工作线程"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='StopLossEngine', daemon=True)
+        self._thread.start()
+        (self.hub or TickHub.instance()).add_listener(self._on_ticks)
+        print(f"[StopLoss] 已启动：{len(self._books)} 个策略、{len(self._keys)} 个持仓纳入实时止损")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        (self.hub or TickHub.instance()).remove_listener(self._on_ticks)
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._save_highs()
+
+    def report(self) -> list:
+        """打印并返回各行 (策略名, 代码, 成本, 现价, 止损线)，不触发报单"""
+        hub = self.hub or TickHub.instance()
+        codes = list(self._codes)
+        if not codes:
+            print("[StopLoss] 没有纳入监控的持仓")
+            return []
+        hub.prices(codes)                 # 补快照会触发推送监听，不能在持锁时调用
+        with self._lock:
+            prices = hub.matrix(self._codes, ('lastPrice',))[:, 0]
+            high = np.fmax(self._high, np.where(prices > 0, prices, np.nan))
+            saved, self._high = self._high, high
+            line = np.fmax.reduce(self._stops(prices), axis=0)
+            self._high = saved
+            rows = [(name, code, float(self._cost[i]), float(prices[i]), float(line[i]))
+                    for i, (name, code) in enumerate(self._keys)]
+        for name, code, cost, price, stop in rows:
+            print(f"[StopLoss] {name:<10} {code}  成本 {cost:.3f}  现价 {price:.3f}  止损线 {stop:.3f}")
+        return rows
@@ -0,0 +1,173 @@
+__all__ = ['StrategyHost']
+
+import os
+import sys
+import time
+import importlib.util
+from xtquant.xttrader import XtQuantTrader
+from xtquant.xttype import StockAccount
+from utils.accountcache import CachedTrader
+from utils.scheduler import Scheduler
+from utils.stoploss import StopLossEngine
+from utils.timing import Timing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Fanout:
+    """注册到交易会话上的唯一回调：把每个推送依次分发给各策略自己的回调对象，单个回调异常不影响其它策略"""
+
+    def __init__(self, callbacks: list):
+        self.callbacks = callbacks
+
+    def __getattr__(self, name):
+        if not name.startswith('on_'):
+            raise AttributeError(name)
+
+        def dispatch(*args):
+            for cb in self.callbacks:
+                fn = getattr(cb, name, None)
+                if fn is None:
+                    continue
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"[StrategyHost] {type(cb).__name__}.{name} 异常: {e}")
+        return dispatch
+
+
+class StrategyHost:
+    """
+    单进程多策略宿主：所有策略共用一个交易会话、一个调度器和进程内的 TickHub / 下载水位。
+
+    原先每个策略各自启动一个 XtQuantTrader 会话、各自订阅行情、各自下载同一批沪深300 / 中证1000 / ETF 数据；
+    放进同一个进程后：
+      - 交易会话只有一个（CachedTrader 包装，持仓 / 资产查询走推送维护的缓存），推送由 _Fanout 分发给各策略回调；
+      - TickHub 是进程单例，同一代码只订阅一次；DownloadMgr 的下载水位与当天数据去重在进程内共享；
+      - 所有定时任务放进同一个 Scheduler（任务名以插件名为前缀，执行记录落盘到同一个文件），
+        每个插件的任务在各自的执行线程里跑（lanes=True），一个插件的长任务不会推迟其它插件；
+      - 各策略的止损规则登记到同一个 StopLossEngine，REAL 模式下随调度循环一起逐 tick 监控；
+      - 各策略的独立账本（StrategyLedger / StrategyVolumeLedger）、状态文件、单实例锁保持不变，
+        与单独运行时互斥（同一策略不会既在宿主里又单独运行）。
+    所有委托都经同一个会话发出，OrderTracker / AccountCache 能看到全部策略的委托，为跨策略对冲轧差留出了位置。
+
+    插件协议：策略模块提供 setup(host)，在其中
+        - 用 host.trader / host.account 构造策略对象（不再自建会话），
+        - host.add_callback(回调对象) 接收交易推送，
+        - host.scheduler.daily('插件名.任务名', at, fn) 注册定时任务，
+        - host.on_debug(fn) 登记 DEBUG 模式下立即执行一次的入口，
+        - host.stoploss.register(...) 登记实时止损（见 utils/stoploss.py），
+        - 需要单实例保护时 host.lock(路径)，拒绝加载时抛出异常（只跳过该插件）。
+
+    用法：
+        host = StrategyHost(qmt_path, account_id, debug=True, record_file='host_schedule.json')
+        if host.connect():
+            for name in ('kj202509', 'kj202536'):
+                host.load(name)                 # 加载 <仓库根>/<name>/<name>.py 并调用其 setup(host)
+            host.run()                          # DEBUG：各插件入口各跑一次；REAL：进入调度循环
+        host.close()
+    """
+
+    def __init__(self, qmt_path: str, account_id: str, debug: bool = True, record_file: str = None,
+                 session_id: int = None):
+        self.debug = debug
+        self.account = StockAccount(account_id)
+        self.trader = CachedTrader(XtQuantTrader(qmt_path, session_id or int(time.time())), self.account)
+        self.scheduler = Scheduler(record_file, lanes=True)
+        self.stoploss = StopLossEngine(self.trader, self.account)
+        self.plugins = {}                # 插件名 -> 模块
+        self._callbacks = []
+        self._debug_runs = []            # [(插件名, fn)]
+        self._locks = []
+        self._loading = None
+        self.trader.register_callback(_Fanout(self._callbacks))
+
+    # ------------------------------------------------------------------ #
+    #  插件使用的接口
+    # ------------------------------------------------------------------ #
+    def add_callback(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def on_debug(self, fn) -> None:
+        self._debug_runs.append((self._loading, fn))
+
+    def lock(self, path: str) -> bool:
+        """获取单实例锁（与策略单独运行时是同一把锁），宿主退出时释放"""
+        from utils.utilities import SingleInstanceLock      # 依赖 msvcrt，只在需要时导入
+        lock = SingleInstanceLock(path)
+        if not lock.acquire():
+            return False
+        self._locks.append(lock)
+        return True
+
+    # ------------------------------------------------------------------ #
+    #  生命周期
+    # ------------------------------------------------------------------ #
+    def connect(self) -> bool:
+        self.trader.start()
+        res = self.trader.connect()
+        if res != 0:
+            print(f"[StrategyHost] 连接 QMT 失败: {res}，请检查极简模式是否已启动并登录")
+            return False
+        self.trader.subscribe(self.account)
+        print(f"[StrategyHost] 已连接，订阅资金账号 {self.account.account_id}")
+        return True
+
+    def load(self, name: str, path: str = None):
+        """加载策略模块并调用其 setup(host)，失败时打印原因并返回 None（其它插件照常运行）"""
+        path = path or os.path.join(REPO_ROOT, name, f'{name}.py')
+        module = sys.modules.get(name)
+        fresh = module is None or os.path.abspath(getattr(module, '__file__', '') or '') != os.path.abspath(path)
+        held = len(self._locks)
+        try:
+            if fresh:
+                spec = importlib.util.spec_from_file_location(name, path)
+                module = importlib.util.module_from_spec(spec)
+                sys.modules[name] = module
+                spec.loader.exec_module(module)
+            if not hasattr(module, 'setup'):
+                raise AttributeError(f'{path} 没有提供 setup(host)')
+            self._loading = name
+            module.setup(self)
+        except Exception as e:
+            print(f"[StrategyHost] 插件 {name} 加载失败，已跳过: {e}")
+            for lock in self._locks[held:]:          # setup 中途失败：释放它已拿到的单实例锁，不挡住单独运行
+                lock.release()
+            del self._locks[held:]
+            if fresh:
+                sys.modules.pop(name, None)
+            return None
+        finally:
+            self._loading = None
+        self.plugins[name] = module
+        print(f"[StrategyHost] 已加载插件 {name}")
+        return module
+
+    def run(self) -> None:
+        """DEBUG：按加载顺序把各插件的调试入口各跑一次，打印止损监控表；REAL：启动实时止损并进入调度循环直到 Ctrl+C / stop()"""
+        print(f"[StrategyHost] {len(self.plugins)} 个插件: {list(self.plugins)}")
+        if self.debug:
+            for name, fn in self._debug_runs:
+                print(f"\n[StrategyHost] ===== {name} =====")
+                try:
+                    with Timing.span(f'debug.{name}'):
+                        fn()
+                except Exception as e:
+                    print(f"[StrategyHost] {name} 运行异常: {e}")
+            print("\n[StrategyHost] ===== 实时止损（DEBUG 只列出，不报单） =====")
+            self.stoploss.refresh()
+            self.stoploss.report()
+            return
+        self.stoploss.start()
+        self.scheduler.run_forever()
+
+    def close(self) -> None:
+        self.scheduler.stop()
+        self.stoploss.stop()
+        for lock in self._locks:
+            lock.release()
+        self._locks.clear()
+        try:
+            self.trader.stop()
+        except Exception as e:
+            print(f"[StrategyHost] 断开交易会话失败: {e}")
@@ -0,0 +1,248 @@
+__all__ = ['SweepRunner']
+
+import os
+import sys
+import csv
+import time
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+# 子进程内挂载好的共享数据：{名称: ndarray / Series / DataFrame}，由 _init_worker 填充
+_WORKER_DATA = None
+_WORKER_SHM = []
+
+
+def _open_shm(name: str):
+    """子进程只挂载、不负责释放（共享内存由主进程在扫描结束后统一 unlink）"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _attach(specs: dict):
+    """按描述信息挂载共享内存，重建零拷贝的 ndarray / Series / DataFrame"""
+    data, handles = {}, []
+    for name, spec in specs.items():
+        shm = _open_shm(spec['shm'])
+        handles.append(shm)
+        arr = np.ndarray(spec['shape'], dtype=spec['dtype'], buffer=shm.buf)
+        arr.flags.writeable = False
+        if spec['kind'] == 'frame':
+            data[name] = pd.DataFrame(arr, index=spec['index'], columns=spec['columns'], copy=False)
+        elif spec['kind'] == 'series':
+            data[name] = pd.Series(arr, index=spec['index'], name=spec['columns'], copy=False)
+        else:
+            data[name] = arr
+    return data, handles
+
+
+def _init_worker(specs: dict):
+    global _WORKER_DATA, _WORKER_SHM
+    _WORKER_DATA, _WORKER_SHM = _attach(specs)
+
+
+def _run_chunk(fn, chunk: list) -> list:
+    """在子进程内依次评估一批参数，单组出错只记录错误信息，不影响其它组"""
+    rows = []
+    for params in chunk:
+        try:
+            metrics = fn(params, _WORKER_DATA) or {}
+            rows.append({**params, **metrics})
+        except Exception as e:
+            rows.append({**params, 'error': f'{type(e).__name__}: {e}'})
+    return rows
+
+
+class SweepRunner:
+    """
+    多进程参数扫描。
+
+    价格面板和预计算好的指标矩阵只在主进程放进 multiprocessing.shared_memory 一次，
+    每个子进程启动时挂载成只读的 ndarray / DataFrame（零拷贝），任务本身只传参数字典，
+    不会为每组参数重复序列化大矩阵。结果按完成顺序流式返回，并可同时逐行追加写入 CSV。
+
+    evaluate 必须是模块级函数（Windows 下子进程以 spawn 方式重新导入主模块，
+    调用脚本需要放在 if __name__ == '__main__': 之下），签名为
+        evaluate(params: dict, data: dict) -> dict
+    data 是子进程内的共享数据字典，也可以用来缓存同一进程内可复用的中间结果
+    （缓存请用下划线开头的键，这类键不会被放进共享内存）。
+
+    参数空间：
+        SweepRunner.grid({'m': [300, 450, 600], 'th': [0.5, 0.7]})        # 笛卡尔积
+        SweepRunner.random({'m': (250, 700), 'th': (0.2, 1.0)}, n=500)    # 均匀随机
+        SweepRunner.lhs({'m': (250, 700), 'th': (0.2, 1.0)}, n=500)       # 拉丁超立方
+    区间用 (low, high) 元组表示（两端都是整数时按整数取值），列表表示离散候选。
+
+    用法：
+        runner = SweepRunner(evaluate, {'close': close_df, 'slopes': slopes})
+        for row in runner.run(SweepRunner.grid(space), out_csv='sweep.csv'):   # 边跑边看
+            ...
+        df = runner.run_all(SweepRunner.lhs(ranges, n=2000))                  # 或一次跑完
+    """
+
+    def __init__(self, evaluate, data: dict = None, workers: int = None, chunksize: int = None):
+        self.evaluate = evaluate
+        self.data = dict(data or {})
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.results = pd.DataFrame()
+
+    # ------------------------------------------------------------------ #
+    #  参数空间
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def grid(space: dict) -> list:
+        """离散候选的笛卡尔积"""
+        keys = list(space)
+        return [dict(zip(keys, combo)) for combo in itertools.product(*(list(space[k]) for k in keys))]
+
+    @staticmethod
+    def _scale(values, u: np.ndarray) -> list:
+        """把 [0, 1) 上的样本映射到区间或离散候选"""
+        if isinstance(values, tuple):
+            low, high = values
+            if isinstance(low, (int, np.integer)) and isinstance(high, (int, np.integer)):
+                return np.floor(low + u * (high - low + 1)).astype(int).tolist()
+            return (low + u * (high - low)).tolist()
+        values = list(values)
+        return [values[i] for i in np.minimum((u * len(values)).astype(int), len(values) - 1)]
+
+    @classmethod
+    def random(cls, space: dict, n: int, seed: int = None) -> list:
+        """每个维度独立均匀抽样 n 组"""
+        rng = np.random.default_rng(seed)
+        cols = {k: cls._scale(v, rng.random(n)) for k, v in space.items()}
+        return [{k: cols[k][i] for k in space} for i in range(n)]
+
+    @classmethod
+    def lhs(cls, space: dict, n: int, seed: int = None) -> list:
+        """拉丁超立方抽样：每个维度切成 n 等份，每份恰好落一个样本，维度间随机配对"""
+        rng = np.random.default_rng(seed)
+        cols = {}
+        for k, v in space.items():
+            u = (rng.permutation(n) + rng.random(n)) / n
+            cols[k] = cls._scale(v, u)
+        return [{k: cols[k][i] for k in space} for i in range(n)]
+
+    # ------------------------------------------------------------------ #
+    #  共享内存
+    # ------------------------------------------------------------------ #
+    def _share(self):
+        """把 self.data 拷进共享内存，返回 (描述信息, SharedMemory 句柄列表)"""
+        specs, handles = {}, []
+        try:
+            for name, obj in self.data.items():
+                if name.startswith('_'):
+                    continue                # 下划线开头的键是进程内缓存，不共享
+                if isinstance(obj, pd.DataFrame):
+                    kind, arr, index, columns = 'frame', obj.to_numpy(dtype=float), obj.index, obj.columns
+                elif isinstance(obj, pd.Series):
+                    kind, arr, index, columns = 'series', obj.to_numpy(dtype=float), obj.index, obj.name
+                else:
+                    kind, arr, index, columns = 'array', np.asarray(obj), None, None
+                arr = np.ascontiguousarray(arr)
+                shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+                handles.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                specs[name] = {'shm': shm.name, 'kind': kind, 'shape': arr.shape, 'dtype': arr.dtype.str,
+                               'index': index, 'columns': columns}
+        except Exception:
+            self._release(handles)
+            raise
+        return specs, handles
+
+    @staticmethod
+    def _release(handles):
+        for shm in handles:
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------ #
+    #  执行
+    # ------------------------------------------------------------------ #
+    def run(self, params: list, out_csv: str = None, showprogress: bool = True):
+        """
+        生成器：评估所有参数组，按完成顺序逐行 yield {参数..., 指标...}；
+        全部完成后 self.results 为汇总的 DataFrame（按输入顺序排列）。
+        """
+        params = list(params)
+        total = len(params)
+        if not total:
+            self.results = pd.DataFrame()
+            return
+        chunksize = self.chunksize or max(1, min(32, total // (self.workers * 4) or 1))
+        chunks = [(i, params[i:i + chunksize]) for i in range(0, total, chunksize)]
+
+        rows = [None] * total
+        writer, fh = None, None
+        pending = []                # 首个成功结果之前的出错行：表头要等到拿到完整指标列后再定
+        done, t0 = 0, time.time()
+        try:
+            for start, chunk_rows in self._iter_chunks(chunks):
+                for k, row in enumerate(chunk_rows):
+                    rows[start + k] = row
+                    if out_csv:
+                        if writer is None and 'error' in row:
+                            pending.append(row)
+                        else:
+                            if writer is None:
+                                fh, writer = self._open_csv(out_csv, [row])
+                                writer.writerows(pending)
+                                pending = []
+                            writer.writerow(row)
+                    yield row
+                if fh:
+                    fh.flush()
+                done += len(chunk_rows)
+                if showprogress:
+                    elapsed = time.time() - t0
+                    print(f"\r   参数扫描: {done}/{total}  用时 {elapsed:.0f}s  "
+                          f"预计剩余 {elapsed / done * (total - done):.0f}s", end='', flush=True)
+        finally:
+            if pending:             # 一组都没成功：按参数列 + error 写出
+                fh, writer = self._open_csv(out_csv, pending)
+                writer.writerows(pending)
+            if fh:
+                fh.close()
+            if showprogress:
+                print()
+        self.results = pd.DataFrame(rows)
+
+    @staticmethod
+    def _open_csv(path: str, rows: list):
+        """以 rows 中出现过的列（保持顺序）+ error 作为表头新建 CSV"""
+        fields = list(dict.fromkeys([k for row in rows for k in row] + ['error']))
+        fh = open(path, 'w', newline='', encoding='utf-8-sig')
+        writer = csv.DictWriter(fh, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        return fh, writer
+
+    def run_all(self, params: list, out_csv: str = None, showprogress: bool = True) -> pd.DataFrame:
+        """run() 的一次性版本：跑完全部参数组后返回结果表"""
+        for _ in self.run(params, out_csv, showprogress):
+            pass
+        return self.results
+
+    def _iter_chunks(self, chunks):
+        global _WORKER_DATA
+        if self.workers <= 1:
+            _WORKER_DATA = self.data
+            for start, chunk in chunks:
+                yield start, _run_chunk(self.evaluate, chunk)
+            return
+
+        specs, handles = self._share()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(specs,)) as pool:
+                futures = {pool.submit(_run_chunk, self.evaluate, chunk): start for start, chunk in chunks}
+                for fut in as_completed(futures):
+                    yield futures[fut], fut.result()
+        finally:
+            self._release(handles)
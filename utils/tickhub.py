@@ -0,0 +1,219 @@
+__all__ = ['TickHub']
+
+import time
+import threading
+import numpy as np
+from xtquant import xtdata
+
+
+class TickHub:
+    """
+    进程内唯一的行情快照中心（推送式）。
+
+    每只代码只订阅一次 (subscribe_whole_quote + 回调)，最新快照写入预分配的
+    代码×字段 float64 数组，同时保留一份原始 tick 字典（与 get_full_tick 返回格式一致）。
+    策略读取价格只是内存读，不再有 subscribe_quote / get_full_tick 的 IPC 往返；
+    重复订阅被自动去重。
+
+    每行记录最近一次写入的时刻：订阅失败、close() 退订或推送中断时，读取到超过 STALE_SECONDS 的旧快照
+    会先用 get_full_tick 补一次（每只代码每个间隔最多一次），不会整个交易时段静默返回旧价格；
+    订阅失败的代码不计入已订阅，STALE_SECONDS 之后读取时重试订阅。
+
+    用法：
+        hub = TickHub.instance()
+        hub.subscribe(codes)              # 已订阅的代码直接跳过
+        price = hub.price('510300.SH')
+        prices = hub.prices(codes)        # {code: lastPrice}
+        ticks = hub.get_ticks(codes)      # {code: tick_dict}，可直接替换 get_full_tick 的返回值
+        hub.add_listener(fn)              # 每批推送写入快照后回调 fn(本批代码列表)，如 StopLossEngine
+    """
+
+    FIELDS = ('lastPrice', 'open', 'high', 'low', 'lastClose', 'volume', 'amount', 'askPrice1', 'bidPrice1')
+    BATCH_SIZE = 500                 # 单次 subscribe_whole_quote 的代码数量
+    STALE_SECONDS = 30.0             # 快照超过这个时长没有更新就在读取时补查一次
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> 'TickHub':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._index = {}                                  # code -> 行号（分配后不回收，重新订阅沿用原行）
+        self._codes = []
+        self._subscribed = set()                          # 推送订阅成功、尚未退订的代码
+        self._failed = {}                                 # 订阅失败的代码 -> 失败时刻，STALE_SECONDS 内不重试
+        self._data = np.zeros((capacity, len(self.FIELDS)), dtype=float)
+        self._stamp = np.zeros(capacity)                  # 每行最近一次写入 / 补查的时刻
+        self._raw = {}                                    # code -> 最新原始 tick 字典
+        self._seqs = []                                   # 订阅号，用于退订
+        self._listeners = []                              # 每批推送后回调 fn(codes)
+        self._col = {f: i for i, f in enumerate(self.FIELDS)}
+
+    # ------------------------------------------------------------------ #
+    #  订阅与推送
+    # ------------------------------------------------------------------ #
+    def subscribe(self, codes) -> None:
+        """订阅尚未订阅（或上次订阅失败、已退订）的代码；订阅前用一次批量 get_full_tick 填充快照"""
+        now = time.time()
+        with self._lock:
+            new = [c for c in dict.fromkeys(codes) if c not in self._subscribed
+                   and now - self._failed.get(c, -np.inf) > self.STALE_SECONDS]
+            if not new:
+                return
+            self._allocate([c for c in new if c not in self._index])
+
+        try:
+            self._on_quote(xtdata.get_full_tick(new))
+        except Exception as e:
+            print(f"[TickHub] 初始快照获取失败: {e}")
+
+        for i in range(0, len(new), self.BATCH_SIZE):
+            batch = new[i:i + self.BATCH_SIZE]
+            try:
+                seq = xtdata.subscribe_whole_quote(batch, callback=self._on_quote)
+            except Exception as e:
+                print(f"[TickHub] 订阅失败 {batch[:3]}...: {e}，这些代码按 {self.STALE_SECONDS:.0f} 秒补查快照并稍后重试订阅")
+                with self._lock:
+                    self._failed.update(dict.fromkeys(batch, now))
+                continue
+            with self._lock:
+                self._seqs.append(seq)
+                self._subscribed.update(batch)
+                for c in batch:
+                    self._failed.pop(c, None)
+
+    def _allocate(self, codes):
+        need = len(self._codes) + len(codes)
+        if need > len(self._data):
+            cap = len(self._data)
+            while cap < need:
+                cap *= 2
+            grown = np.zeros((cap, len(self.FIELDS)), dtype=float)
+            grown[:len(self._codes)] = self._data[:len(self._codes)]
+            stamp = np.zeros(cap)
+            stamp[:len(self._codes)] = self._stamp[:len(self._codes)]
+            self._data, self._stamp = grown, stamp
+        for code in codes:
+            self._index[code] = len(self._codes)
+            self._codes.append(code)
+
+    def add_listener(self, fn) -> None:
+        """登记推送监听：每批行情写入快照后以本批代码列表调用 fn（在行情回调线程中执行，应尽快返回）"""
+        if fn not in self._listeners:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn) -> None:
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _on_quote(self, datas):
+        """推送回调：datas 为 {code: tick_dict}（部分版本为 {code: [tick_dict, ...]}）；监听在锁外调用"""
+        updated = self._write(datas)
+        if updated:
+            for fn in list(self._listeners):
+                try:
+                    fn(updated)
+                except Exception as e:
+                    print(f"[TickHub] 推送监听异常: {e}")
+
+    def _write(self, datas) -> list:
+        """把一批 tick 写入快照并打上时间戳，返回写入的代码列表"""
+        if not datas:
+            return []
+        updated = []
+        now = time.time()
+        with self._lock:                                  # 与 _allocate 扩容互斥，否则写进被替换掉的旧数组会丢失
+            data = self._data
+            for code, tick in datas.items():
+                if isinstance(tick, list):
+                    if not tick:
+                        continue
+                    tick = tick[-1]
+                row = self._index.get(code)
+                if row is None or not isinstance(tick, dict):
+                    continue
+                self._raw[code] = tick
+                self._stamp[row] = now
+                updated.append(code)
+                vals = data[row]
+                for i, f in enumerate(self.FIELDS):
+                    if f == 'askPrice1':
+                        v = tick.get('askPrice') or [0]
+                        vals[i] = v[0]
+                    elif f == 'bidPrice1':
+                        v = tick.get('bidPrice') or [0]
+                        vals[i] = v[0]
+                    else:
+                        vals[i] = tick.get(f, 0) or 0
+        return updated
+
+    def close(self) -> None:
+        """退订全部推送；之后读取时快照过期会补查，再次 subscribe 会重新订阅"""
+        with self._lock:
+            seqs, self._seqs = self._seqs, []
+            self._subscribed.clear()
+        for seq in seqs:
+            try:
+                xtdata.unsubscribe_quote(seq)
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------ #
+    #  读取（内存快照，过期时补查）
+    # ------------------------------------------------------------------ #
+    def _refresh_stale(self, codes):
+        """
+        快照超过 STALE_SECONDS 未更新（含从未取到）的代码补一次批量快照（订阅失败、已退订、推送中断）。
+        补查只写快照、不通知推送监听（matrix 会在监听方持锁时被调用）；无论是否取到都记下补查时刻，
+        同一代码每个间隔最多查一次。
+        """
+        now = time.time()
+        with self._lock:
+            rows = [(c, self._index[c]) for c in codes if c in self._index]
+            missing = [c for c, r in rows if now - self._stamp[r] > self.STALE_SECONDS]
+        if not missing:
+            return
+        try:
+            self._write(xtdata.get_full_tick(missing))
+        except Exception as e:
+            print(f"[TickHub] 补充快照失败: {e}")
+        with self._lock:
+            for c in missing:
+                self._stamp[self._index[c]] = max(self._stamp[self._index[c]], now)
+
+    def price(self, code: str, field: str = 'lastPrice') -> float:
+        self.subscribe([code])
+        self._refresh_stale([code])
+        return float(self._data[self._index[code], self._col[field]])
+
+    def prices(self, codes, field: str = 'lastPrice') -> dict:
+        """返回 {code: 价格}，未订阅的代码会先订阅；无有效行情的代码不出现在结果中"""
+        self.subscribe(codes)
+        self._refresh_stale(codes)
+        col = self._col[field]
+        out = {}
+        for code in codes:
+            v = self._data[self._index[code], col]
+            if v > 0:
+                out[code] = float(v)
+        return out
+
+    def matrix(self, codes, fields=None) -> np.ndarray:
+        """按 codes 顺序返回 代码×字段 的数值快照矩阵（副本），用于向量化风控计算"""
+        self.subscribe(codes)
+        self._refresh_stale(codes)
+        rows = np.fromiter((self._index[c] for c in codes), dtype=np.intp, count=len(codes))
+        cols = [self._col[f] for f in (fields or self.FIELDS)]
+        return self._data[np.ix_(rows, cols)]
+
+    def get_ticks(self, codes) -> dict:
+        """返回 {code: 原始 tick 字典}，格式同 xtdata.get_full_tick"""
+        self.subscribe(codes)
+        self._refresh_stale(codes)
+        return {c: self._raw[c] for c in codes if c in self._raw}
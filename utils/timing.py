@@ -0,0 +1,343 @@
+__all__ = ['Timing']
+
+import os
+import sys
+import atexit
+import inspect
+import threading
+import functools
+import contextlib
+from collections import deque
+from time import perf_counter, strftime, localtime
+
+# 与 utils.barstore.LOCAL_DATA_DIR 同一目录（这里不导入 barstore，计时模块不依赖 xtquant 以外的数据层）
+TIMING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'localdata', 'timing')
+
+
+def _size(value):
+    """返回值的条目数：DataFrame 行数、dict 键数、list 长度；没有长度的返回 None"""
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+class _Stat:
+    __slots__ = ('count', 'errors', 'total', 'max', 'items', 'samples')
+
+    def __init__(self, keep: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.items = 0
+        self.samples = deque(maxlen=keep)     # 最近 keep 次耗时，用于分位数
+
+
+class _Span:
+    """一次计时；with 块内可设置 span.size 记录本次处理的条目数"""
+    __slots__ = ('name', 'size', '_t0')
+
+    def __init__(self, name: str, size=None):
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self._t0 = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Timing.record(self.name, perf_counter() - self._t0, self.size, exc_type is not None)
+        return False
+
+
+class _NullSpan:
+    """关闭计时时 span() 返回的共享空对象：不计时，size 赋值直接丢弃"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class Timing:
+    """
+    热点调用计时：次数、总耗时、p50 / p99 / 最大耗时、失败次数与返回条目数。
+
+    调仓时间到底花在 download_history、get_financial_data、逐只 get_instrument_detail 还是 wait_for_sells
+    轮询上，原先只能靠猜。开启后：
+      - xtquant.xtdata 模块上的全部函数、XtQuantTrader 的查询 / 下单方法自动套上计时
+        （按 'xtdata.get_market_data_ex'、'xttrader.order_stock' 归类，返回值的 len() 记为条目数）；
+      - 调度任务、各策略 handlebar、TradeMgr.wait_for_sells、DownloadMgr.download 已在代码里打了 span；
+      - 进程退出时写出本次运行的汇总 localdata/timing/<tag>_<时间>.txt，
+        并定期（PROM_INTERVAL 秒）覆盖写 localdata/timing/<tag>.prom（Prometheus 文本格式，
+        可交给 node_exporter 的 textfile collector 采集）。
+    回放（ReplayRunner）里 SimXtData / SimTrader 同样按上述名字计时，耗时为真实耗时（不受虚拟时钟影响），
+    可以直接对比实盘与回放的热点。
+
+    默认关闭，设置环境变量 QMT_TIMING=1（或调用 Timing.enable()）开启；QMT_TIMING_TAG 指定文件名前缀，
+    默认为入口脚本名。关闭时不替换任何 xtquant 函数，span() 只返回一个共享空对象，timed() 多一次属性判断。
+    分位数取自每个名字最近 SAMPLES 次调用。
+
+    用法：
+        with Timing.span('kj202509.select', size=len(pool)):
+            ...
+        @Timing.timed('TradeMgr.wait_for_sells')
+        def wait_for_sells(...): ...
+        print(Timing.report())
+    """
+
+    SAMPLES = 2048                  # 每个名字保留的最近耗时样本数
+    PROM_INTERVAL = 60              # Prometheus 文本文件刷新间隔（秒）
+    # 阻塞 / 会话管理类方法不计时
+    SKIP = {'run', 'start', 'stop', 'run_forever', 'register_callback', 'subscribe', 'unsubscribe'}
+
+    enabled = False
+    tag = ''
+    _stats = {}                     # {name: _Stat}
+    _lock = threading.Lock()
+    _installed = False
+    _writer = None
+    _started = strftime('%Y%m%d_%H%M%S')
+
+    # ------------------------------------------------------------------ #
+    #  开关
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def enable(cls, tag: str = None, prom_interval: float = None) -> None:
+        """开启计时，给 xtdata / XtQuantTrader 套上计时，并启动 .prom 文件的定期刷新"""
+        cls.tag = tag or os.environ.get('QMT_TIMING_TAG') or \
+            os.path.splitext(os.path.basename(sys.argv[0] or ''))[0] or 'qmt'
+        cls.enabled = True
+        cls.install()
+        interval = cls.PROM_INTERVAL if prom_interval is None else prom_interval
+        if interval and cls._writer is None:
+            cls._writer = threading.Thread(target=cls._write_loop, args=(interval,), name='TimingProm', daemon=True)
+            cls._writer.start()
+
+    @classmethod
+    def disable(cls) -> None:
+        """停止记录（已套上的计时仍在，但每次调用只多一次属性判断）"""
+        cls.enabled = False
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._stats = {}
+
+    # ------------------------------------------------------------------ #
+    #  记录
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def record(cls, name: str, seconds: float, size=None, error: bool = False) -> None:
+        with cls._lock:
+            stat = cls._stats.get(name)
+            if stat is None:
+                stat = cls._stats[name] = _Stat(cls.SAMPLES)
+            stat.count += 1
+            stat.total += seconds
+            if seconds > stat.max:
+                stat.max = seconds
+            stat.samples.append(seconds)
+            if error:
+                stat.errors += 1
+            if size:
+                stat.items += size
+
+    @classmethod
+    def span(cls, name: str, size=None):
+        """计时上下文：with Timing.span('name') as sp: ...; sp.size = n"""
+        return _Span(name, size) if cls.enabled else _NULL
+
+    @classmethod
+    def wrap(cls, fn, name: str):
+        """返回带计时的 fn，返回值的 len() 记为条目数"""
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            if not cls.enabled:
+                return fn(*args, **kwargs)
+            t0 = perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                cls.record(name, perf_counter() - t0, None, True)
+                raise
+            cls.record(name, perf_counter() - t0, _size(result))
+            return result
+
+        timed.__timing__ = name
+        return timed
+
+    @classmethod
+    def timed(cls, name: str = None):
+        """装饰器版本的 wrap；name 默认为函数的 __qualname__"""
+        def decorator(fn):
+            return cls.wrap(fn, name or fn.__qualname__)
+        return decorator
+
+    # ------------------------------------------------------------------ #
+    #  xtquant 接入
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def instrument(cls, obj, prefix: str, names=None, patch=setattr) -> int:
+        """
+        把 obj（模块 / 类 / 实例）上的公开函数替换为计时版本，返回替换个数；已替换过的跳过。
+        patch 默认 setattr，ReplayRunner 传入自己的 patch 以便退出时还原。
+        """
+        count = 0
+        for name in (names if names is not None else dir(obj)):
+            if name.startswith('_') or name in cls.SKIP:
+                continue
+            fn = getattr(obj, name, None)
+            if not callable(fn) or inspect.isclass(fn) or inspect.ismodule(fn) or hasattr(fn, '__timing__'):
+                continue
+            if inspect.ismodule(obj) and not (getattr(fn, '__module__', '') or '').startswith('xtquant'):
+                continue                        # 只包 xtdata 自己的函数，不包它导入的 np / pd 等
+            if isinstance(obj, type):
+                fn = obj.__dict__.get(name)
+                if not inspect.isfunction(fn):
+                    continue                    # 只包类上直接定义的普通方法
+            patch(obj, name, cls.wrap(fn, f'{prefix}.{name}'))
+            count += 1
+        return count
+
+    @classmethod
+    def install(cls) -> None:
+        """给 xtquant.xtdata 模块函数与 XtQuantTrader 方法套上计时（进程内只做一次）"""
+        if cls._installed:
+            return
+        cls._installed = True
+        try:
+            from xtquant import xtdata
+            from xtquant.xttrader import XtQuantTrader
+        except ImportError:
+            return
+        cls.instrument(xtdata, 'xtdata')
+        cls.instrument(XtQuantTrader, 'xttrader')
+
+    # ------------------------------------------------------------------ #
+    #  输出
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _quantile(ordered: list, q: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @classmethod
+    def summary(cls) -> list:
+        """[{name, count, errors, total, mean, p50, p99, max, items}]，按总耗时降序"""
+        with cls._lock:
+            snapshot = [(name, s.count, s.errors, s.total, s.max, s.items, sorted(s.samples))
+                        for name, s in cls._stats.items()]
+        rows = []
+        for name, count, errors, total, peak, items, ordered in snapshot:
+            rows.append({'name': name, 'count': count, 'errors': errors, 'total': total,
+                         'mean': total / count if count else 0.0,
+                         'p50': cls._quantile(ordered, 0.50), 'p99': cls._quantile(ordered, 0.99),
+                         'max': peak, 'items': items})
+        rows.sort(key=lambda r: r['total'], reverse=True)
+        return rows
+
+    @classmethod
+    def report(cls, top: int = None) -> str:
+        """文本汇总表，耗时单位毫秒"""
+        rows = cls.summary()[:top] if top else cls.summary()
+        if not rows:
+            return '(没有计时记录)'
+        width = max(28, max(len(r['name']) for r in rows))
+        # 表头里的中文按两列宽计，手工对齐到数据列
+        lines = ['名称' + ' ' * (width - 4) + f" {'次数':>6} {'失败':>4} {'总耗时s':>7} {'p50ms':>10} {'p99ms':>10} "
+                 f"{'最大ms':>8} {'条目':>10}"]
+        for r in rows:
+            lines.append(f"{r['name']:<{width}} {r['count']:>8} {r['errors']:>6} {r['total']:>10.3f} "
+                         f"{r['p50'] * 1e3:>10.2f} {r['p99'] * 1e3:>10.2f} {r['max'] * 1e3:>10.2f} {r['items']:>12}")
+        return '\n'.join(lines)
+
+    @classmethod
+    def prometheus(cls) -> str:
+        """Prometheus 文本格式（summary 类型的 qmt_call_seconds，另有失败次数与条目数计数器）"""
+        run = cls.tag or 'qmt'
+        rows = cls.summary()
+
+        def label(r, **extra):
+            pairs = {'run': run, 'name': r['name'], **extra}
+            # 标签值只转义反斜杠、双引号和换行（Prometheus 文本格式的规定），中文等按 UTF-8 原样输出
+            return '{' + ','.join(f'{k}="{cls._escape(v)}"' for k, v in pairs.items()) + '}'
+
+        out = ['# HELP qmt_call_seconds xtquant 调用与策略 span 的耗时（秒）', '# TYPE qmt_call_seconds summary']
+        for r in rows:
+            out.append(f"qmt_call_seconds{label(r, quantile='0.5')} {r['p50']:.6f}")
+            out.append(f"qmt_call_seconds{label(r, quantile='0.99')} {r['p99']:.6f}")
+            out.append(f"qmt_call_seconds_sum{label(r)} {r['total']:.6f}")
+            out.append(f"qmt_call_seconds_count{label(r)} {r['count']}")
+        for metric, key, kind, text in (('qmt_call_seconds_max', 'max', 'gauge', '单次最大耗时（秒）'),
+                                        ('qmt_call_errors_total', 'errors', 'counter', '抛出异常的次数'),
+                                        ('qmt_call_items_total', 'items', 'counter', '返回值条目数合计')):
+            out += [f'# HELP {metric} {text}', f'# TYPE {metric} {kind}']
+            out += [f"{metric}{label(r)} {r[key]:.6f}" if kind == 'gauge' else f"{metric}{label(r)} {r[key]}"
+                    for r in rows]
+        return '\n'.join(out) + '\n'
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @staticmethod
+    def _atomic_write(path: str, text: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', newline='\n') as f:      # Windows 下也不转成 \r\n（.prom 要求 \n 换行）
+            f.write(text)
+        os.replace(tmp, path)
+
+    @classmethod
+    def write_prometheus(cls, path: str = None) -> str:
+        path = path or os.path.join(TIMING_DIR, f'{cls.tag or "qmt"}.prom')
+        cls._atomic_write(path, cls.prometheus())
+        return path
+
+    @classmethod
+    def dump(cls, directory: str = None) -> str:
+        """写出本次运行的汇总（<tag>_<启动时间>.txt）并刷新 .prom，返回汇总文件路径；没有记录时不写"""
+        if not cls._stats:
+            return None
+        directory = directory or TIMING_DIR
+        path = os.path.join(directory, f'{cls.tag or "qmt"}_{cls._started}.txt')
+        header = f"# {cls.tag or 'qmt'}  {cls._started} ~ {strftime('%Y%m%d_%H%M%S', localtime())}\n"
+        cls._atomic_write(path, header + cls.report() + '\n')
+        cls.write_prometheus(os.path.join(directory, f'{cls.tag or "qmt"}.prom'))
+        return path
+
+    @classmethod
+    def _write_loop(cls, interval: float) -> None:
+        stop = threading.Event()                # 用 Event.wait 而不是 time.sleep：回放会把仓库模块里的 time 换成虚拟时钟
+        while not stop.wait(interval):
+            if cls.enabled and cls._stats:
+                with contextlib.suppress(OSError):
+                    cls.write_prometheus()
+
+    @classmethod
+    def _at_exit(cls) -> None:
+        if not cls.enabled:
+            return
+        try:
+            path = cls.dump()
+            if path:
+                print(f">>> [Timing] 本次运行的调用耗时汇总已写入 {path}")
+        except OSError as e:
+            print(f">>> [Timing] 写出耗时汇总失败: {e}")
+
+
+if os.environ.get('QMT_TIMING', '').strip() not in ('', '0'):
+    Timing.enable()
+
+atexit.register(Timing._at_exit)
@@ -1,45 +1,58 @@
 __all__ = ['TradeMgr']
 
-import time
 from xtquant.xttrader import XtQuantTrader
 from xtquant.xttype import StockAccount
+from xtquant import xtconstant
+from utils.ordertracker import OrderTracker
+from utils.timing import Timing
 
 
 class TradeMgr:
     """交易执行辅助工具，封装与下单流程相关的通用逻辑"""
 
+    STATUS_TEXT = {
+        xtconstant.ORDER_SUCCEEDED: '已成',
+        xtconstant.ORDER_PART_CANCEL: '部成部撤',
+        xtconstant.ORDER_CANCELED: '已撤',
+        xtconstant.ORDER_JUNK: '废单',
+    }
+
     @staticmethod
+    @Timing.timed('TradeMgr.wait_for_sells')
     def wait_for_sells(trader: XtQuantTrader, account: StockAccount,
-                       sold_targets: dict, timeout: int = 120, interval: int = 5):
-        """
-        轮询持仓，直到所有卖出标的的市值已低于卖前水位（视为成交），或超时退出。
-
-        :param trader:       XtQuantTrader 实例
-        :param account:      StockAccount 实例
-        :param sold_targets: {stock_code: pre_sell_market_value} 卖出前各标的市值
-        :param timeout:      最长等待秒数（默认 120 秒）
-        :param interval:     轮询间隔秒数（默认 5 秒）
+                       sell_orders: dict, timeout: int = 120, interval: int = 5) -> set:
         """
-        deadline = time.time() + timeout
-        pending  = set(sold_targets.keys())
+        等待卖单全部结束（已成 / 部成部撤 / 已撤 / 废单），或超时退出，返回仍未结束的代码集合。
 
-        while pending and time.time() < deadline:
-            time.sleep(interval)
-            positions = trader.query_stock_positions(account)
-            pos_map   = {p.stock_code: p for p in positions if p.volume > 0}
+        由 OrderTracker 收到的委托回报即时唤醒，最后一笔卖单结束后立即返回，
+        卖出资金到账即可继续买入；回调需转发给 OrderTracker（见其说明）。
 
-            confirmed = set()
-            for code in pending:
-                pre_value = sold_targets[code]
-                cur_value = pos_map[code].market_value if code in pos_map else 0.0
-                # 市值下降超过 5%，认为卖单已部分或全部成交
-                if cur_value < pre_value * 0.95:
-                    print(f"  [✓ 成交确认] {code} 市值: {pre_value:,.0f} → {cur_value:,.0f}")
-                    confirmed.add(code)
-
-            pending -= confirmed
+        :param trader:      XtQuantTrader 实例
+        :param account:     StockAccount 实例
+        :param sell_orders: {stock_code: order_id} 卖单委托号（order_stock 返回值或 OrderExecutor 结果）
+        :param timeout:     最长等待秒数（默认 120 秒）
+        :param interval:    没有新回报时主动查询委托状态的间隔秒数（兜底，默认 5 秒）
+        """
+        untracked = [code for code, oid in sell_orders.items() if oid is None or oid <= 0]
+        if untracked:
+            print(f"  [提示] 以下卖单没有委托号（未收到下单应答），无法跟踪: {untracked}")
+        sell_orders = {code: oid for code, oid in sell_orders.items() if code not in untracked}
+        tracker = OrderTracker.instance()
+        pending_ids = tracker.wait(sell_orders.values(), timeout=timeout, trader=trader, account=account,
+                                   interval=interval)
+
+        pending = set()
+        for code, oid in sell_orders.items():
+            if oid in pending_ids:
+                pending.add(code)
+                continue
+            info = tracker.get(oid)
+            status = TradeMgr.STATUS_TEXT.get(info['status'], info['status'])
+            print(f"  [✓ 委托结束] {code} {status} 成交 {info['traded_volume']} @ {info['traded_price']:.3f}"
+                  + (f" ({info['msg']})" if info['msg'] and info['status'] == xtconstant.ORDER_JUNK else ''))
 
         if pending:
-            print(f"  [超时警告] 以下品种卖单在 {timeout}s 内未完全确认成交，继续执行买入: {pending}")
+            print(f"  [超时警告] 以下品种卖单在 {timeout}s 内未结束，继续执行买入: {pending}")
         else:
-            print(f"  [轮询完成] 所有卖出均已确认成交。")
+            print(f"  [确认完成] 所有卖单均已结束。")
+        return pending
@@ -1,10 +1,14 @@
 import os
+import sys
 import json
 import datetime
 import threading
 import msvcrt
 import requests
 from datetime import timezone, timedelta
+from utils.journal import JournalStore
+from utils.pushqueue import PushQueue
+from utils.barstore import LOCAL_DATA_DIR
 
 __all__ = [
     'StrategyLedger', 'StrategyVolumeLedger', 'SingleInstanceLock',
@@ -16,43 +20,59 @@ BEIJING_TZ = timezone(timedelta(hours=8))
 class StateManager:
     """
     策略状态持久化管理器。
-    像操作普通变量一样读写状态，每次 set() 自动将全量状态序列化到磁盘。
+    像操作普通变量一样读写状态，每次 set() 只向日志追加这一项修改（JournalStore，组提交落盘）。
     用法：
         state = StateManager('state.json', defaults={'style': 'DEFENSE', 'month': -1})
         state.set('style', 'BIG')       # 立即持久化
         style = state.get('style')      # 读取
+        state.update('highs', lambda h: {**(h or {}), code: price})    # 原子地读-改-写
+    读写都持有实例锁，调度线程与盘中止损引擎线程可以同时使用；get() 返回的字典 / 列表不要原地修改，
+    改副本后 set()，或用 update()。
     """
     def __init__(self, filepath, defaults=None):
         self.filepath = filepath
+        self._lock = threading.RLock()
         self._data = dict(defaults) if defaults else {}
+        self._store = JournalStore(filepath, snapshot=lambda: self._data)
         self._load()
 
     def _load(self):
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    saved = json.load(f)
+        try:
+            saved = self._store.load()
+            if saved is not None:
                 self._data.update(saved)
                 print(f"--> 已从磁盘恢复状态 ({self.filepath}): {self._data}")
-            except Exception as e:
-                print(f"--> 读取状态文件失败: {e}，使用默认初始状态。")
+        except Exception as e:
+            print(f"--> 读取状态文件失败: {e}，使用默认初始状态。")
 
     def _save(self):
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump(self._data, f, ensure_ascii=False, indent=4)
+            self._store.replace(self._data)
         except Exception as e:
             print(f"--> 保存状态文件失败: {e}")
 
     def get(self, key, default=None):
-        return self._data.get(key, default)
+        with self._lock:
+            return self._data.get(key, default)
 
     def set(self, key, value):
-        self._data[key] = value
-        self._save()
+        with self._lock:
+            self._data[key] = value
+            try:
+                self._store.append(('set', key, value))
+            except Exception as e:
+                print(f"--> 保存状态文件失败: {e}")
+
+    def update(self, key, fn):
+        """在锁内以当前值调用 fn，把返回的新值写回并返回（fn 不要原地修改传入的值）"""
+        with self._lock:
+            value = fn(self._data.get(key))
+            self.set(key, value)
+            return value
 
     def get_all(self):
-        return dict(self._data)
+        with self._lock:
+            return dict(self._data)
 
 
 class BlacklistManager:
@@ -64,26 +84,29 @@ class BlacklistManager:
         :param filepath: 小黑屋 JSON 文件的存储路径
         """
         self.filepath = filepath
+        self._lock = threading.RLock()
+        self._store = JournalStore(filepath, snapshot=lambda: self.data)
         # 实例化时，自动从本地加载记忆字典
         self.data = self.load()
 
     def load(self):
-        """（内部方法）从本地 JSON 文件读取小黑屋数据"""
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    print(f"--> 成功从本地恢复小黑屋记忆，当前黑名单包含 {len(data)} 只股票。")
-                    return data
-            except Exception as e:
-                print(f"--> 读取小黑屋文件失败: {e}，将初始化为空。")
+        """（内部方法）从本地 JSON 快照 + 日志读取小黑屋数据"""
+        try:
+            data = self._store.load()
+            if data is not None:
+                print(f"--> 成功从本地恢复小黑屋记忆，当前黑名单包含 {len(data)} 只股票。")
+                return data
+        except Exception as e:
+            print(f"--> 读取小黑屋文件失败: {e}，将初始化为空。")
         return {}
 
-    def save(self):
-        """（内部方法）将当前小黑屋数据保存到本地 JSON 文件"""
+    def save(self, *ops):
+        """（内部方法）持久化：给出修改操作时只追加日志，否则整份写入快照"""
         try:
-            with open(self.filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
+            if ops:
+                self._store.append(*ops)
+            else:
+                self._store.replace(self.data)
         except Exception as e:
             print(f"--> 保存小黑屋文件失败: {e}")
 
@@ -93,68 +116,80 @@ class BlacklistManager:
         :param stock_code: 股票代码
         :param reason: 关进小黑屋的原因或时间（可用来做后续的自动释放逻辑）
         """
-        # 如果不在黑名单中，才添加并触发保存
-        if stock_code not in self.data:
+        # 如果不在黑名单中，才添加并触发保存（止损引擎线程与调度线程都会调用）
+        with self._lock:
+            if stock_code in self.data:
+                return
             today_str = datetime.datetime.now(BEIJING_TZ).strftime("%Y-%m-%d")
             self.data[stock_code] = today_str
-            self.save()
-            print(f"--> [黑名单更新] 已将 {stock_code} 关进小黑屋")
+            self.save(('set', stock_code, today_str))
+        print(f"--> [黑名单更新] 已将 {stock_code} 关进小黑屋")
 
     def remove(self, stock_code):
         """将股票从小黑屋中释放并自动保存"""
-        if stock_code in self.data:
+        with self._lock:
+            if stock_code not in self.data:
+                return
             del self.data[stock_code]
-            self.save()
-            print(f"--> [黑名单更新] 已将 {stock_code} 从小黑屋释放。")
+            self.save(('del', stock_code))
+        print(f"--> [黑名单更新] 已将 {stock_code} 从小黑屋释放。")
 
     def is_blacklisted(self, stock_code):
         """检查某只股票是否在小黑屋中"""
-        return stock_code in self.data
+        with self._lock:
+            return stock_code in self.data
 
     def get_all(self):
-        """获取完整的小黑屋字典"""
-        return self.data
+        """获取小黑屋字典的副本"""
+        with self._lock:
+            return dict(self.data)
     
 class StrategyLedger:
     """策略独立账本类，用于记录本策略买入的股票，实现策略隔离"""
     def __init__(self, filepath='strategy_holdings.json'):
         self.filepath = filepath
+        self._lock = threading.RLock()
+        self._store = JournalStore(filepath, snapshot=lambda: self.holdings, empty=list)
         self.holdings = self.load_ledger()
 
     def load_ledger(self):
-        """读取账本：如果本地有记录，则加载；没有则新建空列表"""
-        if os.path.exists(self.filepath):
-            try:
-                with open(self.filepath, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"读取账本失败: {e}，将启用空账本")
+        """读取账本：如果本地有记录（快照 + 日志），则加载；没有则新建空列表"""
+        try:
+            holdings = self._store.load()
+            if holdings is not None:
+                return holdings
+        except Exception as e:
+            print(f"读取账本失败: {e}，将启用空账本")
         return []
 
     def save_ledger(self):
-        """保存账本到本地文件"""
-        with open(self.filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.holdings, f, ensure_ascii=False, indent=4)
+        """整份账本写入本地文件"""
+        with self._lock:
+            self._store.replace(self.holdings)
 
     def add(self, stock_code):
         """记录买入的股票"""
-        if stock_code not in self.holdings:
-            self.holdings.append(stock_code)
-            self.save_ledger()
+        with self._lock:
+            if stock_code not in self.holdings:
+                self.holdings.append(stock_code)
+                self._store.append(('add', stock_code))
 
     def remove(self, stock_code):
         """移除卖出的股票"""
-        if stock_code in self.holdings:
-            self.holdings.remove(stock_code)
-            self.save_ledger()
-            
+        with self._lock:
+            if stock_code in self.holdings:
+                self.holdings.remove(stock_code)
+                self._store.append(('remove', stock_code))
+
     def is_in_ledger(self, stock_code):
         """检查某只股票是否在本策略账本中"""
-        return stock_code in self.holdings
+        with self._lock:
+            return stock_code in self.holdings
 
     def get_all(self):
-        """获取当前策略名下的所有股票"""
-        return self.holdings
+        """获取当前策略名下所有股票的副本（止损引擎线程会同时增删）"""
+        with self._lock:
+            return list(self.holdings)
 
 
 class StrategyVolumeLedger:
@@ -163,16 +198,16 @@ class StrategyVolumeLedger:
     def __init__(self, filepath):
         self.filepath = os.path.abspath(filepath)
         self._lock = threading.RLock()
+        self._store = JournalStore(self.filepath, snapshot=lambda: self.holdings, sort_keys=True)
         self.initialized = False
         self.load_error = None
         self.holdings = self._load()
 
     def _load(self):
-        if not os.path.exists(self.filepath):
-            return {}
         try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                saved = json.load(f)
+            saved = self._store.load()
+            if saved is None:
+                return {}
             if not isinstance(saved, dict):
                 raise ValueError('账本格式必须是 {证券代码: 份数}')
 
@@ -189,13 +224,7 @@ class StrategyVolumeLedger:
             return {}
 
     def _save(self):
-        directory = os.path.dirname(self.filepath)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
-        temp_path = self.filepath + '.tmp'
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(self.holdings, f, ensure_ascii=False, indent=4, sort_keys=True)
-        os.replace(temp_path, self.filepath)
+        self._store.replace(self.holdings)
         self.initialized = True
         self.load_error = None
 
@@ -250,7 +279,7 @@ class StrategyVolumeLedger:
             if not self.initialized:
                 raise RuntimeError(f"策略份数账本尚未初始化: {self.filepath}")
             self.holdings[stock_code] = self.get(stock_code) + volume
-            self._save()
+            self._store.append(('set', stock_code, self.holdings[stock_code]))
 
     def record_sell(self, stock_code, volume):
         volume = int(volume)
@@ -262,9 +291,10 @@ class StrategyVolumeLedger:
             remaining = max(0, self.get(stock_code) - volume)
             if remaining:
                 self.holdings[stock_code] = remaining
+                self._store.append(('set', stock_code, remaining))
             else:
                 self.holdings.pop(stock_code, None)
-            self._save()
+                self._store.append(('del', stock_code))
 
 
 class SingleInstanceLock:
@@ -337,26 +367,56 @@ class MessagePusher:
     """
     通用消息推送类 (支持多策略调用)
     微信推送服务：Pushplus
+
+    send_text 只把消息放进后台推送队列（PushQueue）就返回，不在交易线程里做网络请求；
+    同一推送地址 + Token 的所有实例共用一个队列，短时间内的多条报告合并为一条摘要推送，
+    失败退避重试，仍未送达的消息保存在 localdata/push_spool.<入口脚本名>.jsonl，下次发送成功或重启后补发。
+    落盘文件按入口脚本区分：同时运行的几个策略进程各写各的，不会互相改名 / 删除对方的积压消息。
     """
-    def __init__(self):
-        # --- 在此硬编码您的唯一 Token ---
-        self.token = "cee05e0d24e047e89720d57a4dc6ab51"
-        self.api_url = "http://www.pushplus.plus/send"
+    SPOOL_FILE = os.path.join(LOCAL_DATA_DIR, 'push_spool.{script}.jsonl')
+    TIMEOUT = 10                # 单次 HTTP 请求超时（秒），只影响后台线程
 
-    def send_text(self, title, content):
-        """发送纯文本或自定义HTML消息"""
+    _queues = {}                # (api_url, token) -> PushQueue
+    _queues_lock = threading.Lock()
+
+    def __init__(self, api_url=None, token=None, spool_file=None, window=PushQueue.WINDOW):
+        # --- 在此硬编码您的唯一 Token ---
+        self.token = token or "cee05e0d24e047e89720d57a4dc6ab51"
+        self.api_url = api_url or "http://www.pushplus.plus/send"
+        entry = sys.argv[0] if sys.argv and sys.argv[0] not in ('', '-c') else 'python'
+        script = os.path.splitext(os.path.basename(entry))[0]
+        self.spool_file = spool_file or self.SPOOL_FILE.format(script=script)
+        self.window = window
+
+    @property
+    def queue(self) -> PushQueue:
+        """第一次发送时才创建后台队列（回放等只构造不发送的场景不启动线程、不补发积压消息）"""
+        with MessagePusher._queues_lock:
+            key = (self.api_url, self.token)
+            if key not in MessagePusher._queues:
+                MessagePusher._queues[key] = PushQueue(self._post, spool_file=self.spool_file, window=self.window)
+            return MessagePusher._queues[key]
+
+    def _post(self, title, content):
+        """实际的 HTTP 推送（后台线程调用），失败时抛出异常由队列重试"""
         payload = {
             "token": self.token,
             "title": title,
             "content": content,
             "template": "html"
         }
+        resp = requests.post(self.api_url, data=json.dumps(payload).encode('utf-8'), timeout=self.TIMEOUT)
+        resp.raise_for_status()
         try:
-            # 增加 timeout 防止网络延迟阻塞策略交易逻辑
-            requests.post(self.api_url, data=json.dumps(payload).encode('utf-8'), timeout=10)
-            print(f">>> [推送成功] {title}")
-        except Exception as e:
-            print(f">>> [推送异常] {e}")
+            code = resp.json().get('code', 200)
+        except ValueError:
+            code = 200
+        if code != 200:
+            raise RuntimeError(f"推送服务返回 {code}: {resp.text[:200]}")
+
+    def send_text(self, title, content):
+        """发送纯文本或自定义HTML消息（放入后台队列，立即返回）"""
+        self.queue.put(title, content)
 
     def send_strategy_report(self, strategy_name, buys=None, sells=None, extra_msg=""):
         """
@@ -0,0 +1,255 @@
+__all__ = ['WalkForward']
+
+import os
+import json
+import pickle
+import hashlib
+import functools
+import numpy as np
+import pandas as pd
+from utils.barstore import LOCAL_DATA_DIR
+from utils.portfoliosim import PortfolioSim
+from utils.sweeprunner import SweepRunner
+
+
+def _score(backtest, objective, windows, params, data) -> dict:
+    """SweepRunner 的评估函数：在 params['_w'] 指定的训练窗口上回测并打分"""
+    start, end = windows[params['_w']]
+    p = {k: v for k, v in params.items() if not k.startswith('_')}
+    nav = (1 + backtest(p, data, start, end)['returns']).cumprod()
+    stats = PortfolioSim.stats(nav.to_numpy())
+    return {'score': WalkForward.objective_value(stats, objective),
+            'ann_return': stats['ann_return'], 'max_drawdown': stats['max_drawdown'], 'sharpe': stats['sharpe']}
+
+
+class WalkForward:
+    """
+    滚动训练 / 样本外检验。
+
+    按自然月把交易日切成窗口：每个检验窗口 (test_months 个月) 之前的 train_months 个月为训练窗口
+    (anchored=True 时训练窗口从第一天开始不断扩展)。每个训练窗口上用 SweepRunner 并行评估全部参数组，
+    取 objective 最优的一组，在紧随其后的检验窗口上回测；各检验窗口的日收益首尾相接，得到样本外净值。
+    最后再用截至最新交易日的训练窗口选一次参数，作为下一期实盘可用的参数 (next_params)。
+
+    策略接入方式：提供一个模块级函数
+        backtest(params: dict, data: dict, start, end) -> dict
+    返回值至少包含 'returns'（[start, end] 内的组合日收益 Series，通常就是 PortfolioSim.run 的结果）。
+    信号可以使用 start 之前的历史数据，持仓从 start 当天开始建立。
+    回测函数从空仓起步，建仓需要几天（例如信号 shift(1) 后首日不持仓）；为免每个检验窗口开头都空仓，
+    样本外回测从 test_start 之前 warmup 个交易日开始，再截取 [test_start, test_end] 拼接。
+
+    缓存：每个窗口的训练结果表、最优参数与样本外收益落盘到 localdata/walkforward/<name>/。
+    缓存键包含窗口日期、参数空间、目标函数、warmup、version 以及 data 中截至该窗口最后一天的数据指纹，
+    因此追加新行情后重跑只会重算新出现（或数据被修订）的窗口；策略逻辑改动时修改 version 即可全部失效。
+
+    用法：
+        params = SweepRunner.grid({'RSRS_M': [300, 600], 'Threshold': [0.5, 0.7]})
+        wf = WalkForward('kj202536', backtest, data, params, objective='sharpe')
+        res = wf.run(data['returns'].index, train_months=24, test_months=1)
+        res['nav'], res['windows'], res['next_params']
+    """
+
+    CACHE_DIR = os.path.join(LOCAL_DATA_DIR, 'walkforward')
+    OBJECTIVES = ('sharpe', 'ann_return', 'total_return', 'calmar')
+    WARMUP_DAYS = 5                 # 样本外回测提前开始的交易日数，覆盖空仓起步的建仓延迟
+
+    def __init__(self, name: str, backtest, data: dict, params: list, objective: str = 'sharpe',
+                 workers: int = None, version: str = '1'):
+        if objective not in self.OBJECTIVES:
+            raise ValueError(f"objective 只能是 {self.OBJECTIVES}，收到 {objective!r}")
+        self.name = name
+        self.backtest = backtest
+        self.data = data
+        self.params = list(params)
+        self.objective = objective
+        self.workers = workers
+        self.version = str(version)
+        self.root = os.path.join(self.CACHE_DIR, name)
+
+    @staticmethod
+    def objective_value(stats: dict, objective: str) -> float:
+        if objective == 'calmar':
+            mdd = abs(stats['max_drawdown'])
+            return stats['ann_return'] / mdd if mdd > 0 else float('nan')
+        return stats[objective]
+
+    # ------------------------------------------------------------------ #
+    #  窗口划分
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def windows(dates, train_months: int = 24, test_months: int = 1, anchored: bool = False,
+                test_start=None) -> list:
+        """
+        返回 [(train_start, train_end, test_start, test_end), ...]（都是 dates 中的交易日）。
+        最后一个检验窗口可能不足 test_months 个月。
+        """
+        dates = pd.DatetimeIndex(dates).sort_values()
+        months = dates.to_period('M')
+        uniq = months.unique()
+        first = pd.Timestamp(test_start).to_period('M') if test_start is not None else None
+        out = []
+        for i in range(train_months, len(uniq), test_months):
+            if first is not None and uniq[i] < first:
+                continue
+            lo = uniq[0] if anchored else uniq[i - train_months]
+            hi = uniq[min(i + test_months, len(uniq)) - 1]
+            train = dates[(months >= lo) & (months < uniq[i])]
+            test = dates[(months >= uniq[i]) & (months <= hi)]
+            if len(train) and len(test):
+                out.append((train[0], train[-1], test[0], test[-1]))
+        return out
+
+    # ------------------------------------------------------------------ #
+    #  缓存
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _fingerprint(data: dict, end) -> str:
+        """
+        data 中截至 end 的数据指纹。带日期索引的按 end 截断；不带日期的代码数组（股票池）和
+        以代码为索引的 Series / DataFrame（总股本等）只保留截至 end 已有行情的代码，
+        新上市股票入池、股本变动等不会让早于其上市的窗口失效。其它数组整体参与。
+        """
+        alive = set()
+        for obj in data.values():
+            if isinstance(obj, pd.DataFrame) and isinstance(obj.index, pd.DatetimeIndex):
+                hist = obj.loc[:end]
+                alive.update(hist.columns[hist.notna().any().to_numpy()])
+
+        h = hashlib.md5()
+        for key in sorted(data):
+            obj = data[key]
+            if isinstance(obj, (pd.DataFrame, pd.Series)):
+                if isinstance(obj.index, pd.DatetimeIndex):
+                    obj = obj.loc[:end]
+                elif obj.index.isin(alive).any():
+                    obj = obj[obj.index.isin(alive)]
+                h.update(key.encode())
+                h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+                if isinstance(obj, pd.DataFrame):
+                    h.update(str(list(obj.columns)).encode())
+            elif isinstance(obj, np.ndarray):
+                if obj.dtype.kind in 'OU' and obj.ndim == 1:
+                    obj = np.array([str(s) for s in obj if s in alive])
+                h.update(key.encode())
+                h.update(np.ascontiguousarray(obj).tobytes())
+        return h.hexdigest()
+
+    def _key(self, window, warmup: int) -> str:
+        desc = json.dumps({
+            'window': [str(t) for t in window],
+            'params': self.params,
+            'objective': self.objective,
+            'warmup': warmup,
+            'version': self.version,
+        }, sort_keys=True, default=str)
+        data_end = window[3] if window[3] is not None else window[1]
+        return hashlib.md5((desc + self._fingerprint(self.data, data_end)).encode()).hexdigest()
+
+    def _load(self, key):
+        path = os.path.join(self.root, f'{key}.pkl')
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"--> 读取窗口缓存失败: {e}，将重新计算。")
+            return None
+
+    def _save(self, key, record):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, f'{key}.pkl')
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(record, f)
+        os.replace(path + '.tmp', path)
+
+    # ------------------------------------------------------------------ #
+    #  执行
+    # ------------------------------------------------------------------ #
+    def _train(self, windows: list) -> dict:
+        """一次并行评估所有待算窗口的全部参数组，返回 {窗口序号: 训练结果表}"""
+        spans = {k: (w[0], w[1]) for k, w in enumerate(windows)}
+        tasks = [{**p, '_w': k} for k in spans for p in self.params]
+        fn = functools.partial(_score, self.backtest, self.objective, spans)
+        table = SweepRunner(fn, self.data, workers=self.workers).run_all(tasks)
+        if 'error' in table.columns:
+            failed = table['error'].notna()
+            if failed.any():
+                print(f"--> {failed.sum()} 组训练回测失败，例如: {table.loc[failed, 'error'].iloc[0]}")
+            table = table[~failed]
+        return {k: g.drop(columns=['_w', 'error'], errors='ignore').reset_index(drop=True)
+                for k, g in table.groupby('_w')}
+
+    def _best(self, table: pd.DataFrame) -> dict:
+        """训练得分最高的参数组；整个窗口的训练全部失败时退回第一组参数"""
+        if table is None or table.empty:
+            return dict(self.params[0])
+        pos = int(np.argmax(table['score'].fillna(-np.inf).to_numpy()))
+        best = {k: table[k].iloc[pos] for k in self.params[0]}          # 按列取值，保留整数 / 布尔类型
+        return {k: (v.item() if hasattr(v, 'item') else v) for k, v in best.items()}
+
+    def run(self, dates, train_months: int = 24, test_months: int = 1, anchored: bool = False,
+            test_start=None, capital: float = 1.0, warmup: int = WARMUP_DAYS) -> dict:
+        """
+        warmup: 样本外回测提前开始的交易日数（见类说明），0 表示每个检验窗口从 test_start 当天空仓起步。
+
+        返回 dict：
+          nav         : 样本外拼接净值 Series
+          returns     : 样本外日收益 Series
+          windows     : 各窗口的日期、最优参数、训练得分、样本外收益 DataFrame
+          stats       : 样本外汇总指标（PortfolioSim.stats）
+          next_params : 截至最新交易日训练出的参数
+        """
+        dates = pd.DatetimeIndex(dates).sort_values()
+        windows = self.windows(dates, train_months, test_months, anchored, test_start)
+        if not windows:
+            raise ValueError("交易日不足以划分出训练 / 检验窗口")
+        months = dates.to_period('M').unique()
+        last_train = dates[dates.to_period('M') >= months[max(len(months) - train_months, 0)]]
+        windows.append((dates[0] if anchored else last_train[0], dates[-1], None, None))
+
+        keys = [self._key(w, warmup) for w in windows]
+        records = [self._load(k) for k in keys]
+        pending = [i for i, r in enumerate(records) if r is None]
+        print(f">> 滚动窗口共 {len(windows) - 1} 个（另加 1 个最新训练窗口），"
+              f"缓存命中 {len(windows) - len(pending)} 个，需计算 {len(pending)} 个")
+
+        if pending:
+            tables = self._train([windows[i] for i in pending])
+            for j, i in enumerate(pending):
+                table = tables.get(j)
+                best = self._best(table)
+                oos = None
+                _, _, t0, t1 = windows[i]
+                if t0 is not None:
+                    t_warm = dates[max(dates.get_loc(t0) - warmup, 0)]
+                    oos = self.backtest(best, self.data, t_warm, t1)['returns'].loc[t0:t1]
+                records[i] = {'table': table, 'best': best, 'returns': oos}
+                if table is None or table.empty:
+                    # 训练全部失败多半是回测函数或数据的问题，退回的默认参数不代表真实结果，不写缓存，修好后重跑会重新训练
+                    print(f"!!! 窗口 {windows[i][0].date()} ~ {windows[i][1].date()} 的训练全部失败，"
+                          f"暂用第一组参数 {best}，该窗口不写入缓存")
+                    continue
+                self._save(keys[i], records[i])
+
+        rows, parts = [], []
+        for w, rec in zip(windows[:-1], records[:-1]):
+            r = rec['returns']
+            parts.append(r)
+            table = rec['table']
+            score = float(table['score'].max()) if table is not None and len(table) else float('nan')
+            rows.append({'train_start': w[0].date(), 'train_end': w[1].date(),
+                         'test_start': w[2].date(), 'test_end': w[3].date(),
+                         **rec['best'], 'train_score': score,
+                         'test_return': float((1 + r).prod() - 1)})
+
+        returns = pd.concat(parts).sort_index()
+        returns = returns[~returns.index.duplicated(keep='first')]
+        nav = (1 + returns).cumprod() * capital
+        return {
+            'nav': nav,
+            'returns': returns,
+            'windows': pd.DataFrame(rows),
+            'stats': PortfolioSim.stats(nav.to_numpy()),
+            'next_params': records[-1]['best'],
+        }